@@ -13,11 +13,101 @@ if not BOT_TOKEN:
 # Настройки Supabase
 SUPABASE_URL = "https://kdwiyhxjnuucgpwbzcvz.supabase.co"  # Исправленный URL
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')  # Включаем Supabase обратно
+SUPABASE_PAGE_SIZE = int(os.getenv('SUPABASE_PAGE_SIZE', '1000'))  # Строк на страницу при чтении из Supabase (не больше db-max-rows PostgREST)
 
 # Настройки базы данных
 DATABASE_URL = os.getenv('DATABASE_URL')  # Читаем из переменных окружения
 DATABASE_PATH = "mindflow.db"  # Используем SQLite как fallback
 
 # Настройки логирования
-LOG_LEVEL = "INFO"
-LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s" 
\ No newline at end of file
+LOG_LEVEL = os.getenv('LOG_LEVEL', "INFO")
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_FILE = os.getenv('LOG_FILE', "mindflow_bot.log")
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # Размер файла лога до ротации
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))  # Сколько старых файлов лога хранить
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0.01'))  # Доля обновлений с подробными DEBUG-логами
+
+# Настройки экспорта
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '500'))  # Размер порции при чтении из БД
+EXPORT_SPOOL_MAX_SIZE = int(os.getenv('EXPORT_SPOOL_MAX_SIZE', str(1024 * 1024)))  # Сколько байт держать в памяти до сброса на диск
+
+# Настройки /today
+TODAY_ENTRIES_LIMIT = int(os.getenv('TODAY_ENTRIES_LIMIT', '200'))  # Сколько последних записей показывать в /today (счетчики - по всем)
+
+# Настройки хранения записей
+ARCHIVE_DATABASE_PATH = os.getenv('ARCHIVE_DATABASE_PATH', "mindflow_archive.db")  # Архив старых месяцев для SQLite
+ARCHIVE_AFTER_MONTHS = int(os.getenv('ARCHIVE_AFTER_MONTHS', '3'))  # Сколько месяцев держать в основной базе SQLite
+SQLITE_READ_CONNECTIONS = int(os.getenv('SQLITE_READ_CONNECTIONS', '4'))  # Соединений SQLite только для чтения; 0 - чтение через соединение записи
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', '3'))  # На сколько месяцев вперед создавать секции PostgreSQL
+MAINTENANCE_INTERVAL = int(os.getenv('MAINTENANCE_INTERVAL', str(6 * 3600)))  # Период обслуживания хранилища, секунды
+
+# Резервное копирование SQLite (онлайн, без остановки бота)
+BACKUP_DIR = os.getenv('BACKUP_DIR', "backups")  # Каталог для резервных копий
+BACKUP_INTERVAL = int(os.getenv('BACKUP_INTERVAL', str(24 * 3600)))  # Период резервного копирования, секунды; 0 - отключено
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))  # Сколько последних копий хранить; 0 - все
+BACKUP_COMPRESS = os.getenv('BACKUP_COMPRESS', "1") == "1"  # Сжимать копии gzip
+BACKUP_PAGES = int(os.getenv('BACKUP_PAGES', '256'))  # Страниц базы за один шаг копирования
+BACKUP_STEP_SLEEP = float(os.getenv('BACKUP_STEP_SLEEP', '0.01'))  # Пауза между шагами (записи бота проходят), секунды
+
+# Настройки метрик (Prometheus)
+METRICS_HOST = os.getenv('METRICS_HOST', "127.0.0.1")  # Адрес HTTP-сервера метрик
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))  # Порт /metrics; 0 - не запускать сервер
+
+# Журнал запросов к базе данных
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '200'))  # Запросы дольше порога пишутся в лог
+QUERY_LOG_TOP_N = int(os.getenv('QUERY_LOG_TOP_N', '20'))  # Размер таблицы самых дорогих запросов
+QUERY_LOG_WINDOW = int(os.getenv('QUERY_LOG_WINDOW', '3600'))  # Окно статистики запросов, секунды
+
+# Режим получения обновлений
+BOT_MODE = os.getenv('BOT_MODE', "polling")  # polling - long polling; webhook - HTTP-сервер вебхука
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Публичный адрес (https://bot.example.com) для setWebhook; пусто - не регистрировать
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', "/webhook")  # Путь, на который Telegram присылает обновления
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', "0.0.0.0")  # Адрес, на котором слушает сервер вебхука
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))  # Порт сервера вебхука
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Секрет из заголовка X-Telegram-Bot-Api-Secret-Token (обязателен для webhook)
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))  # Сколько обновлений держать в очереди до ответа 503
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '32'))  # Число одновременно обрабатываемых обновлений
+BACKGROUND_JOBS = os.getenv('BACKGROUND_JOBS', "1") == "1"  # Напоминания и обслуживание хранилища; при нескольких экземплярах - только в одном
+
+# Состояния диалогов (FSM) в базе данных
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', str(24 * 3600)))  # Сколько хранить состояние после последнего изменения, секунды
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '10000'))  # Сколько состояний держать в локальном кэше
+FSM_CACHE_TTL = float(os.getenv('FSM_CACHE_TTL', '0'))  # Сколько секунд доверять кэшу; 0 - читать из базы каждый раз (безопасно при нескольких экземплярах), 30 - только для одного экземпляра
+
+# Ограничение частоты сообщений от одного пользователя
+THROTTLE_MODE = os.getenv('THROTTLE_MODE', "queue")  # queue - ждать, coalesce - объединять тексты, reject - отклонять, off - без ограничения
+THROTTLE_RATE = float(os.getenv('THROTTLE_RATE', '1'))  # Сколько обновлений в секунду восстанавливается
+THROTTLE_BURST = int(os.getenv('THROTTLE_BURST', '10'))  # Сколько обновлений подряд можно отправить без ожидания
+THROTTLE_MAX_USERS = int(os.getenv('THROTTLE_MAX_USERS', '10000'))  # Сколько пользователей помнить (остальные вытесняются)
+THROTTLE_MAX_WAIT = float(os.getenv('THROTTLE_MAX_WAIT', '10'))  # Дольше этого обновление не ждет, а отклоняется, секунды
+
+# Исходящие сообщения (лимиты Telegram: около 30 сообщений в секунду на бота и 1 в секунду на чат)
+SENDER_GLOBAL_RATE = float(os.getenv('SENDER_GLOBAL_RATE', '30'))  # Сообщений в секунду на весь бот; 0 - без ограничения
+SENDER_CHAT_RATE = float(os.getenv('SENDER_CHAT_RATE', '1'))  # Сообщений в секунду в один чат; 0 - без ограничения
+SENDER_CHAT_BURST = int(os.getenv('SENDER_CHAT_BURST', '5'))  # Сколько сообщений подряд можно отправить в чат без ожидания
+SENDER_WORKERS = int(os.getenv('SENDER_WORKERS', '8'))  # Число одновременных запросов к Bot API на отправку
+SENDER_MAX_RETRIES = int(os.getenv('SENDER_MAX_RETRIES', '3'))  # Повторы после 429 и сетевых ошибок
+
+# Еженедельная сводка (/digest)
+DIGEST_HOUR = int(os.getenv('DIGEST_HOUR', '4'))  # С какого часа понедельника рассылать сводку за прошлую неделю
+DIGEST_CONCURRENCY = int(os.getenv('DIGEST_CONCURRENCY', '20'))  # Сколько сводок одновременно ждут отправки в очереди
+DIGEST_CHECK_INTERVAL = int(os.getenv('DIGEST_CHECK_INTERVAL', '600'))  # Как часто проверять, не пора ли рассылать, секунды
+
+# Поиск похожих записей (/similar)
+SIMILAR_INDEX_DIR = os.getenv('SIMILAR_INDEX_DIR', "similar_index")  # Каталог TF-IDF индексов пользователей; пусто - команда отключена
+SIMILAR_CACHE_USERS = int(os.getenv('SIMILAR_CACHE_USERS', '100'))  # Сколько индексов пользователей держать открытыми
+SIMILAR_RESULTS = int(os.getenv('SIMILAR_RESULTS', '5'))  # Сколько похожих записей показывать
+
+# Обучаемая категоризация (наивный Байес по записям пользователя, после ключевых слов)
+CATEGORY_MODEL = os.getenv('CATEGORY_MODEL', "0") == "1"  # Подсказывать категорию для текстов без ключевых слов
+CATEGORY_MODEL_VOCAB_SIZE = int(os.getenv('CATEGORY_MODEL_VOCAB_SIZE', '5000'))  # Сколько терминов помнить для одного пользователя
+CATEGORY_MODEL_MIN_CONFIDENCE = float(os.getenv('CATEGORY_MODEL_MIN_CONFIDENCE', '0.8'))  # Ниже этой вероятности - "Прочее"
+CATEGORY_MODEL_MIN_EVIDENCE = float(os.getenv('CATEGORY_MODEL_MIN_EVIDENCE', '2.0'))  # Логарифм отношения правдоподобия категории против остальных записей, ниже - "Прочее"
+CATEGORY_MODEL_MIN_EXAMPLES = int(os.getenv('CATEGORY_MODEL_MIN_EXAMPLES', '20'))  # Сколько записей с ключевыми словами нужно для подсказок
+CATEGORY_MODEL_CACHE_USERS = int(os.getenv('CATEGORY_MODEL_CACHE_USERS', '1000'))  # Сколько моделей пользователей держать в памяти
+CATEGORY_MODEL_DIR = os.getenv('CATEGORY_MODEL_DIR', "category_model")  # Каталог сохраненных счетчиков моделей; пусто - строить по всей истории при каждой загрузке
+
+# Пакетное сохранение (списки, альбомы, серии пересылок)
+BULK_INGEST = os.getenv('BULK_INGEST', "0") == "1"  # Делить многострочные сообщения и списки на отдельные записи
+BULK_MAX_ENTRIES = int(os.getenv('BULK_MAX_ENTRIES', '50'))  # Больше строк - сообщение сохраняется одной записью
+BULK_COALESCE_DELAY = float(os.getenv('BULK_COALESCE_DELAY', '1.0'))  # Сколько ждать следующего сообщения альбома или пересылки, секунды
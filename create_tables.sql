@@ -1,15 +1,115 @@
--- Создание таблицы записей
-CREATE TABLE IF NOT EXISTS entries (
+-- Справочник категорий: системные (user_id = 0) и пользовательские. Записи хранят только id категории
+CREATE TABLE IF NOT EXISTS categories (
     id SERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL DEFAULT 0,
+    name TEXT NOT NULL,
+    UNIQUE(user_id, name)
+);
+
+INSERT INTO categories (user_id, name)
+SELECT 0, name FROM unnest(ARRAY['Задачи', 'Идеи', 'Вопросы', 'Тревоги', 'Факты', 'Планы', 'Напоминания', 'Прочее']) AS name
+ON CONFLICT (user_id, name) DO NOTHING;
+
+-- id категории по имени (системная важнее пользовательской); новая пользовательская категория добавляется в справочник
+CREATE OR REPLACE FUNCTION resolve_category_id(p_user_id BIGINT, p_name TEXT) RETURNS INTEGER AS $$
+DECLARE
+    result INTEGER;
+BEGIN
+    SELECT id INTO result FROM categories
+    WHERE name = p_name AND user_id IN (0, p_user_id)
+    ORDER BY user_id LIMIT 1;
+    IF result IS NULL THEN
+        INSERT INTO categories (user_id, name) VALUES (p_user_id, p_name)
+        ON CONFLICT (user_id, name) DO NOTHING
+        RETURNING id INTO result;
+    END IF;
+    IF result IS NULL THEN
+        SELECT id INTO result FROM categories WHERE user_id = p_user_id AND name = p_name;
+    END IF;
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Создание таблицы записей (помесячные секции по datetime)
+CREATE TABLE IF NOT EXISTS entries (
+    id SERIAL,
     user_id BIGINT NOT NULL,
     text TEXT NOT NULL,
-    datetime TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    category TEXT NOT NULL
-);
+    datetime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    category_id INTEGER NOT NULL REFERENCES categories(id),
+    PRIMARY KEY (id, datetime)
+) PARTITION BY RANGE (datetime);
 
--- Создание индекса для записей
+-- Создание индекса для записей (наследуется всеми секциями)
 CREATE INDEX IF NOT EXISTS idx_entries_user_datetime ON entries(user_id, datetime);
 
+-- Функция создания секций entries на текущий и ближайшие месяцы.
+-- Бот вызывает её через RPC при обслуживании; можно также повесить на pg_cron.
+CREATE OR REPLACE FUNCTION create_entries_partitions(months_ahead INTEGER DEFAULT 3)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    month_start DATE;
+BEGIN
+    FOR i IN -1..months_ahead LOOP
+        month_start := (date_trunc('month', CURRENT_DATE) + make_interval(months => i))::DATE;
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF entries FOR VALUES FROM (%L) TO (%L)',
+            'entries_' || to_char(month_start, 'YYYY_MM'),
+            month_start,
+            (month_start + INTERVAL '1 month')::DATE
+        );
+    END LOOP;
+    EXECUTE 'CREATE TABLE IF NOT EXISTS entries_default PARTITION OF entries DEFAULT';
+END;
+$$;
+
+SELECT create_entries_partitions(3);
+
+-- Сводная таблица: количество записей по дням и категориям (для /stats)
+CREATE TABLE IF NOT EXISTS daily_category_counts (
+    user_id BIGINT NOT NULL,
+    day DATE NOT NULL,
+    category_id INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, category_id)
+);
+
+-- Триггер поддерживает сводную таблицу при каждой вставке в entries
+CREATE OR REPLACE FUNCTION increment_daily_category_count() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO daily_category_counts (user_id, day, category_id, count)
+    VALUES (NEW.user_id, NEW.datetime::date, NEW.category_id, 1)
+    ON CONFLICT (user_id, day, category_id) DO UPDATE SET count = daily_category_counts.count + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_entries_daily_category_counts ON entries;
+CREATE TRIGGER trg_entries_daily_category_counts
+AFTER INSERT ON entries
+FOR EACH ROW EXECUTE FUNCTION increment_daily_category_count();
+
+-- Разовый пересчет сводной таблицы по существующим записям (вызывается через RPC)
+CREATE OR REPLACE FUNCTION backfill_daily_category_counts()
+RETURNS VOID
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+    INSERT INTO daily_category_counts (user_id, day, category_id, count)
+    SELECT user_id, datetime::date, category_id, COUNT(*) FROM entries
+    GROUP BY user_id, datetime::date, category_id
+    ON CONFLICT (user_id, day, category_id) DO UPDATE SET count = EXCLUDED.count;
+$$;
+
+-- Сводная таблица с именами категорий (чтение через API)
+CREATE OR REPLACE VIEW daily_category_counts_view AS
+SELECT d.user_id, d.day, c.name AS category, d.count
+FROM daily_category_counts d
+JOIN categories c ON c.id = d.category_id;
+
 -- Создание таблицы пользовательских категорий
 CREATE TABLE IF NOT EXISTS custom_categories (
     id SERIAL PRIMARY KEY,
@@ -24,7 +124,6 @@ CREATE TABLE IF NOT EXISTS reminders (
     id SERIAL PRIMARY KEY,
     user_id BIGINT NOT NULL,
     entry_id INTEGER NOT NULL,
-    text TEXT NOT NULL,
     reminder_time TIMESTAMP NOT NULL,
     is_sent BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -33,9 +132,266 @@ CREATE TABLE IF NOT EXISTS reminders (
 -- Создание индекса для напоминаний
 CREATE INDEX IF NOT EXISTS idx_reminders_user_time ON reminders(user_id, reminder_time);
 
+-- Частичный индекс ожидающих напоминаний (выборка и подсчет наступивших)
+CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(reminder_time) WHERE is_sent = FALSE;
+
+-- Записи и напоминания с именем категории и текстом записи (чтение через API; фильтры API
+-- применяются к базовым таблицам и используют их индексы)
+CREATE OR REPLACE VIEW entries_view AS
+SELECT e.id, e.user_id, e.text, c.name AS category, e.datetime
+FROM entries e
+JOIN categories c ON c.id = e.category_id;
+
+CREATE OR REPLACE VIEW reminders_view AS
+SELECT r.id, r.user_id, r.entry_id, e.text, r.reminder_time, r.is_sent
+FROM reminders r
+JOIN entries e ON e.id = r.entry_id;
+
+-- Состояния диалогов бота (FSM): общие для всех экземпляров бота, expires_at - время Unix в секундах
+CREATE TABLE IF NOT EXISTS fsm_states (
+    storage_key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    expires_at DOUBLE PRECISION NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_fsm_states_expires ON fsm_states(expires_at);
+
+-- Запись и (если задано время) напоминание к ней одним вызовом RPC, в одной транзакции
+CREATE OR REPLACE FUNCTION ingest_entry(
+    p_user_id BIGINT,
+    p_text TEXT,
+    p_category TEXT,
+    p_datetime TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    p_reminder_time TIMESTAMP DEFAULT NULL
+)
+RETURNS INTEGER
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+    WITH new_entry AS (
+        INSERT INTO entries (user_id, text, category_id, datetime)
+        VALUES (p_user_id, p_text, resolve_category_id(p_user_id, p_category), p_datetime)
+        RETURNING id
+    ), new_reminder AS (
+        INSERT INTO reminders (user_id, entry_id, reminder_time)
+        SELECT p_user_id, id, p_reminder_time FROM new_entry WHERE p_reminder_time IS NOT NULL
+    )
+    SELECT id FROM new_entry;
+$$;
+
+-- Несколько записей и их напоминаний одним вызовом RPC, в одной транзакции; id - в порядке массивов
+CREATE OR REPLACE FUNCTION ingest_entries(
+    p_user_id BIGINT,
+    p_texts TEXT[],
+    p_categories TEXT[],
+    p_reminder_times TIMESTAMP[],
+    p_datetime TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+RETURNS INTEGER[]
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+    WITH items AS (
+        SELECT nextval(pg_get_serial_sequence('entries', 'id'))::integer AS id, t.text, t.category, t.reminder_time, t.position
+        FROM unnest(p_texts, p_categories, p_reminder_times) WITH ORDINALITY AS t(text, category, reminder_time, position)
+    ), new_entries AS (
+        INSERT INTO entries (id, user_id, text, category_id, datetime)
+        SELECT id, p_user_id, text, resolve_category_id(p_user_id, category), p_datetime FROM items
+    ), new_reminders AS (
+        INSERT INTO reminders (user_id, entry_id, reminder_time)
+        SELECT p_user_id, id, reminder_time FROM items WHERE reminder_time IS NOT NULL
+    )
+    SELECT array_agg(id ORDER BY position) FROM items;
+$$;
+
+-- /today одним вызовом: последние p_limit записей за день и число записей по категориям
+CREATE OR REPLACE FUNCTION today_view(
+    p_user_id BIGINT,
+    p_day DATE DEFAULT CURRENT_DATE,
+    p_limit INTEGER DEFAULT 200
+)
+RETURNS JSON
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+    SELECT json_build_object(
+        'entries', COALESCE((
+            SELECT json_agg(e ORDER BY e.datetime DESC)
+            FROM (
+                SELECT e.text, c.name AS category, e.datetime
+                FROM entries e
+                JOIN categories c ON c.id = e.category_id
+                WHERE e.user_id = p_user_id AND e.datetime >= p_day AND e.datetime < p_day + 1
+                ORDER BY e.datetime DESC
+                LIMIT p_limit
+            ) e
+        ), '[]'::json),
+        'counts', COALESCE((
+            SELECT json_agg(c ORDER BY c.count DESC, c.category)
+            FROM (
+                SELECT cat.name AS category, t.count
+                FROM (
+                    SELECT category_id, COUNT(*) AS count
+                    FROM entries
+                    WHERE user_id = p_user_id AND datetime >= p_day AND datetime < p_day + 1
+                    GROUP BY category_id
+                ) t
+                JOIN categories cat ON cat.id = t.category_id
+            ) c
+        ), '[]'::json)
+    );
+$$;
+
+-- Наступившие напоминания с одновременной отметкой is_sent: параллельные вызовы получают разные строки
+CREATE OR REPLACE FUNCTION claim_due_reminders(
+    p_now TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    p_limit INTEGER DEFAULT 100
+)
+RETURNS TABLE (id INTEGER, user_id BIGINT, text TEXT, reminder_time TIMESTAMP)
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+    UPDATE reminders r SET is_sent = TRUE
+    FROM (
+        SELECT id FROM reminders
+        WHERE reminder_time <= p_now AND is_sent = FALSE
+        ORDER BY reminder_time ASC
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ) due, entries e
+    WHERE r.id = due.id AND e.id = r.entry_id
+    RETURNING r.id, r.user_id, e.text, r.reminder_time;
+$$;
+
+-- Еженедельная сводка: подписки пользователей и контрольные точки рассылки
+CREATE TABLE IF NOT EXISTS digest_subscriptions (
+    user_id BIGINT PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS digest_runs (
+    period TEXT PRIMARY KEY,
+    last_user_id BIGINT NOT NULL DEFAULT 0,
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Записи подписчиков за неделю одним упорядоченным проходом, порциями (keyset по user_id, id)
+CREATE OR REPLACE FUNCTION digest_entries(
+    p_since TIMESTAMP,
+    p_until TIMESTAMP,
+    p_after_user_id BIGINT DEFAULT 0,
+    p_after_id INTEGER DEFAULT 0,
+    p_limit INTEGER DEFAULT 500
+)
+RETURNS TABLE (id INTEGER, user_id BIGINT, text TEXT, category TEXT)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+    SELECT e.id, e.user_id, e.text, c.name
+    FROM digest_subscriptions s
+    JOIN entries e ON e.user_id = s.user_id
+    JOIN categories c ON c.id = e.category_id
+    WHERE (e.user_id, e.id) > (p_after_user_id, p_after_id)
+        AND e.datetime >= p_since AND e.datetime < p_until
+    ORDER BY e.user_id, e.id
+    LIMIT p_limit;
+$$;
+
+-- Неотправленные напоминания подписчиков на ближайшую неделю, порциями (keyset по user_id, id)
+CREATE OR REPLACE FUNCTION digest_reminders(
+    p_since TIMESTAMP,
+    p_until TIMESTAMP,
+    p_after_user_id BIGINT DEFAULT 0,
+    p_after_id INTEGER DEFAULT 0,
+    p_limit INTEGER DEFAULT 500
+)
+RETURNS TABLE (id INTEGER, user_id BIGINT, text TEXT, reminder_time TIMESTAMP)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+    SELECT r.id, r.user_id, e.text, r.reminder_time
+    FROM digest_subscriptions s
+    JOIN reminders r ON r.user_id = s.user_id
+    JOIN entries e ON e.id = r.entry_id
+    WHERE (r.user_id, r.id) > (p_after_user_id, p_after_id)
+        AND r.is_sent = FALSE AND r.reminder_time >= p_since AND r.reminder_time < p_until
+    ORDER BY r.user_id, r.id
+    LIMIT p_limit;
+$$;
+
+-- Перенос записей из другого бэкенда (python -m tools.migrate): id сохраняются, имя категории
+-- переводится в id справочника (системная важнее пользовательской), уже перенесенные записи
+-- пропускаются. Перед вставкой создаются секции entries на месяцы записей порции (иначе старые
+-- записи попали бы в entries_default, и секцию за их месяц потом нельзя было бы создать).
+-- Возвращает число новых записей
+CREATE OR REPLACE FUNCTION import_entries(p_rows JSON)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    inserted INTEGER;
+    month_start DATE;
+BEGIN
+    FOR month_start IN
+        SELECT DISTINCT date_trunc('month', r.datetime)::DATE
+        FROM json_to_recordset(p_rows) AS r(datetime TIMESTAMP)
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF entries FOR VALUES FROM (%L) TO (%L)',
+            'entries_' || to_char(month_start, 'YYYY_MM'),
+            month_start,
+            (month_start + INTERVAL '1 month')::DATE
+        );
+    END LOOP;
+
+    INSERT INTO categories (user_id, name)
+    SELECT DISTINCT r.user_id, r.category
+    FROM json_to_recordset(p_rows) AS r(user_id BIGINT, category TEXT)
+    WHERE NOT EXISTS (SELECT 1 FROM categories c WHERE c.name = r.category AND c.user_id IN (0, r.user_id))
+    ON CONFLICT (user_id, name) DO NOTHING;
+
+    INSERT INTO entries (id, user_id, text, category_id, datetime)
+    SELECT r.id, r.user_id, r.text, COALESCE(system_category.id, user_category.id), r.datetime
+    FROM json_to_recordset(p_rows) AS r(id INTEGER, user_id BIGINT, text TEXT, category TEXT, datetime TIMESTAMP)
+    LEFT JOIN categories system_category ON system_category.user_id = 0 AND system_category.name = r.category
+    LEFT JOIN categories user_category ON user_category.user_id = r.user_id AND user_category.name = r.category
+    ON CONFLICT DO NOTHING;
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$;
+
+-- После переноса с явными id последовательности SERIAL продолжают с максимального id
+CREATE OR REPLACE FUNCTION reset_id_sequences()
+RETURNS VOID
+LANGUAGE sql
+SECURITY DEFINER
+AS $$
+    SELECT
+        setval(pg_get_serial_sequence('custom_categories', 'id'), COALESCE((SELECT MAX(id) FROM custom_categories), 0) + 1, false),
+        setval(pg_get_serial_sequence('entries', 'id'), COALESCE((SELECT MAX(id) FROM entries), 0) + 1, false),
+        setval(pg_get_serial_sequence('reminders', 'id'), COALESCE((SELECT MAX(id) FROM reminders), 0) + 1, false);
+$$;
+
 -- Проверка создания таблиц
+SELECT 'categories' as table_name, COUNT(*) as row_count FROM categories
+UNION ALL
 SELECT 'entries' as table_name, COUNT(*) as row_count FROM entries
 UNION ALL
 SELECT 'custom_categories' as table_name, COUNT(*) as row_count FROM custom_categories
 UNION ALL
-SELECT 'reminders' as table_name, COUNT(*) as row_count FROM reminders; 
\ No newline at end of file
+SELECT 'reminders' as table_name, COUNT(*) as row_count FROM reminders
+UNION ALL
+SELECT 'daily_category_counts' as table_name, COUNT(*) as row_count FROM daily_category_counts
+UNION ALL
+SELECT 'fsm_states' as table_name, COUNT(*) as row_count FROM fsm_states
+UNION ALL
+SELECT 'digest_subscriptions' as table_name, COUNT(*) as row_count FROM digest_subscriptions
+UNION ALL
+SELECT 'digest_runs' as table_name, COUNT(*) as row_count FROM digest_runs; 
\ No newline at end of file
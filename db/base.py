@@ -0,0 +1,126 @@
+"""
+Общий интерфейс бэкендов базы данных MindFlow Journal
+"""
+
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Protocol, Tuple, runtime_checkable
+
+# Единый формат дат во всех значениях, которые возвращают бэкенды
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def format_timestamp(value) -> str:
+    """Приведение datetime или строки (ISO, str(datetime)) к виду 'ГГГГ-ММ-ДД ЧЧ:ММ:СС'"""
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    return str(value).replace("T", " ")[:19]
+
+
+@runtime_checkable
+class JournalDatabase(Protocol):
+    """
+    Интерфейс, который реализуют Database, PostgresDatabase, SupabaseDatabase и MemoryDatabase
+
+    Все даты возвращаются строками в формате TIMESTAMP_FORMAT, флаги - как bool.
+    Методы чтения при ошибке возвращают пустой список, методы записи - None/False.
+    """
+
+    async def connect(self) -> None: ...
+
+    async def disconnect(self) -> None: ...
+
+    async def run_maintenance(self) -> None: ...
+
+    async def add_entry(self, user_id: int, text: str, category: str) -> Optional[int]: ...
+
+    async def add_entry_with_reminder(self, user_id: int, text: str, category: str,
+                                      reminder_time: Optional[str] = None) -> Optional[int]: ...
+
+    async def add_entries_with_reminders(self, user_id: int,
+                                         items: List[Tuple[str, str, Optional[str]]]) -> Optional[List[int]]: ...
+
+    async def get_today_entries(self, user_id: int) -> List[Tuple[str, str, str]]: ...
+
+    async def get_today_view(self, user_id: int,
+                             limit: int = 200) -> Tuple[List[Tuple[str, str, str]], List[Tuple[str, int]]]: ...
+
+    async def get_entries_by_date(self, user_id: int, date: str) -> List[Tuple[str, str, str]]: ...
+
+    async def search_entries(self, user_id: int, search_term: str) -> List[Tuple[str, str, str]]: ...
+
+    async def get_entries_by_ids(self, user_id: int, entry_ids: List[int]) -> List[Tuple[int, str, str, str]]: ...
+
+    async def get_daily_category_counts(self, user_id: int, since: str) -> List[Tuple[str, str, int]]: ...
+
+    async def backfill_daily_category_counts(self) -> bool: ...
+
+    async def add_custom_category(self, user_id: int, name: str, keywords: str) -> bool: ...
+
+    async def get_custom_categories(self, user_id: int) -> List[Tuple[str, str]]: ...
+
+    async def get_all_custom_categories(self) -> List[Tuple[int, str, str]]: ...
+
+    async def add_reminder(self, user_id: int, entry_id: int, reminder_time: str) -> bool: ...
+
+    async def get_pending_reminders(self) -> List[Tuple[int, int, str, str]]: ...
+
+    async def mark_reminder_sent(self, reminder_id: int) -> bool: ...
+
+    async def claim_due_reminders(self, limit: int = 100) -> List[Tuple[int, int, str, str]]: ...
+
+    async def release_reminder(self, reminder_id: int) -> bool: ...
+
+    async def count_due_reminders(self) -> Optional[int]: ...
+
+    async def get_user_reminders(self, user_id: int) -> List[Tuple[int, str, str, bool]]: ...
+
+    async def get_fsm_record(self, storage_key: str, now: float) -> Optional[Tuple[Optional[str], str]]: ...
+
+    async def set_fsm_record(self, storage_key: str, state: Optional[str], data: str, expires_at: float) -> bool: ...
+
+    async def delete_fsm_record(self, storage_key: str) -> bool: ...
+
+    async def delete_expired_fsm_records(self, now: float) -> int: ...
+
+    async def set_digest_subscription(self, user_id: int, subscribed: bool) -> bool: ...
+
+    async def is_digest_subscribed(self, user_id: int) -> bool: ...
+
+    async def get_digest_checkpoint(self, period: str) -> Optional[Tuple[int, bool]]: ...
+
+    async def set_digest_checkpoint(self, period: str, last_user_id: int, completed: bool) -> bool: ...
+
+    def iter_digest_entries(self, since: str, until: str, after_user_id: int = 0,
+                            batch_size: int = 500) -> AsyncIterator[Tuple[int, str, str]]: ...
+
+    def iter_digest_reminders(self, since: str, until: str, after_user_id: int = 0,
+                              batch_size: int = 500) -> AsyncIterator[Tuple[int, str, str]]: ...
+
+    def iter_entries(self, user_id: int, batch_size: int = 500,
+                     after_id: int = 0) -> AsyncIterator[Tuple[int, str, str, str]]: ...
+
+    def iter_reminders(self, user_id: int, batch_size: int = 500) -> AsyncIterator[Tuple[int, int, str, str, bool]]: ...
+
+
+# Таблицы, которые переносит tools.migrate, в порядке переноса (напоминания ссылаются на записи)
+MIGRATION_TABLES = ("custom_categories", "entries", "reminders")
+
+
+@runtime_checkable
+class MigratableDatabase(Protocol):
+    """
+    Перенос данных между бэкендами (tools.migrate): реализуют Database, PostgresDatabase и SupabaseDatabase
+
+    Строки таблиц MIGRATION_TABLES передаются кортежами в едином виде:
+    custom_categories - (id, user_id, name, keywords);
+    entries - (id, user_id, text, category, datetime), категория - имя, а не id справочника;
+    reminders - (id, user_id, entry_id, reminder_time, is_sent).
+    В отличие от методов JournalDatabase ошибки не перехватываются: пустая страница
+    означает конец таблицы, а не сбой.
+    """
+
+    async def export_rows(self, table: str, after_id: int, limit: int) -> List[tuple]: ...
+
+    async def import_rows(self, table: str, rows: List[tuple]) -> int: ...
+
+    async def finish_import(self) -> None: ...
@@ -3,45 +3,260 @@
 """
 
 import aiosqlite
+import asyncio
+import json
 import logging
-from typing import List, Tuple, Optional
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import AsyncIterator, List, Tuple, Optional
+from urllib.parse import quote
+from .base import MIGRATION_TABLES, format_timestamp
 from .models import *
+from .partitions import add_months
+from .query_log import QUERY_LOG
 
 logger = logging.getLogger(__name__)
 
+# Наибольший возможный rowid SQLite
+MAX_ROWID = 2 ** 63 - 1
+
+
+def _unicode_lower(value):
+    """Перевод в нижний регистр с поддержкой кириллицы (встроенный lower() в SQLite - только ASCII)"""
+    return value.lower() if isinstance(value, str) else value
+
+
+def _read_only_uri(path: str) -> str:
+    """URI файла базы для открытия только на чтение"""
+    return f"file:{quote(os.path.abspath(path))}?mode=ro"
+
 
 class Database:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, archive_path: Optional[str] = None, archive_after_months: int = 3,
+                 read_connections: int = 4):
         self.db_path = db_path
+        self.archive_path = archive_path
+        self.archive_after_months = archive_after_months
+        # Соединение для записи одно на все задачи: без блокировки COMMIT одной задачи
+        # зафиксировал бы половину транзакции другой
         self._connection = None
+        self._write_lock = asyncio.Lock()
+        # Соединения только для чтения (у каждого свой поток aiosqlite): долгий поиск
+        # или выгрузка не задерживают запись. База в памяти общих соединений не допускает
+        self.read_connections = 0 if db_path == ":memory:" else read_connections
+        self._readers: Optional[asyncio.Queue] = None
+        self._reader_connections: List[aiosqlite.Connection] = []
 
     async def connect(self):
         """Создание соединения с базой данных"""
         try:
             self._connection = await aiosqlite.connect(self.db_path)
             await self._connection.execute("PRAGMA foreign_keys = ON")
-            await self._create_tables()
-            logger.info(f"База данных успешно подключена: {self.db_path}")
+            await self._connection.create_function("unicode_lower", 1, _unicode_lower, deterministic=True)
+            if self.archive_path:
+                await self._connection.execute(ATTACH_ARCHIVE, (self.archive_path,))
+            # WAL: чтения и резервная копия (backup) видят зафиксированный снимок, не останавливая запись
+            cursor = await self._connection.execute("PRAGMA journal_mode = WAL")
+            journal_mode = (await cursor.fetchone())[0]
+            if journal_mode != "wal":
+                logger.warning(f"Режим WAL недоступен (journal_mode={journal_mode}): чтение идет через соединение записи, "
+                               f"резервная копия может перезапускаться при записи")
+                self.read_connections = 0
+            await self._ensure_schema()
+            await self._open_readers()
+            logger.info(f"База данных успешно подключена: {self.db_path} (соединений для чтения: {self.read_connections})")
         except Exception as e:
             logger.error(f"Ошибка подключения к базе данных: {e}")
             raise
 
+    async def _open_readers(self):
+        """Пул соединений только для чтения: в режиме WAL каждое читает последний зафиксированный снимок"""
+        if not self.read_connections:
+            return
+        self._readers = asyncio.Queue()
+        for _ in range(self.read_connections):
+            connection = await aiosqlite.connect(_read_only_uri(self.db_path), uri=True)
+            await connection.execute("PRAGMA query_only = ON")
+            await connection.create_function("unicode_lower", 1, _unicode_lower, deterministic=True)
+            if self.archive_path:
+                await connection.execute(ATTACH_ARCHIVE, (_read_only_uri(self.archive_path),))
+            self._reader_connections.append(connection)
+            self._readers.put_nowait(connection)
+
+    @asynccontextmanager
+    async def _reader(self):
+        """Соединение для чтения из пула (без пула - основное соединение)"""
+        if self._readers is None:
+            yield self._connection
+            return
+        connection = await self._readers.get()
+        try:
+            yield connection
+        finally:
+            self._readers.put_nowait(connection)
+
     async def disconnect(self):
         """Закрытие соединения с базой данных"""
+        for connection in self._reader_connections:
+            await connection.close()
+        self._reader_connections = []
+        self._readers = None
         if self._connection:
             await self._connection.close()
             logger.info("Соединение с базой данных закрыто")
 
-    async def _create_tables(self):
-        """Создание таблиц в базе данных"""
-        try:
-            await self._connection.execute(CREATE_ENTRIES_TABLE)
-            await self._connection.execute(CREATE_CUSTOM_CATEGORIES_TABLE)
-            await self._connection.execute(CREATE_REMINDERS_TABLE)
-            await self._connection.execute(CREATE_ENTRIES_INDEX)
-            await self._connection.execute(CREATE_REMINDERS_INDEX)
+    async def _execute(self, query: str, params=()):
+        """Выполнение запроса с замером в журнале запросов"""
+        with QUERY_LOG.track("sqlite", query) as trace:
+            cursor = await self._connection.execute(query, params)
+            trace.rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        return cursor
+
+    async def _executemany(self, query: str, params_seq):
+        """Выполнение запроса для каждого набора параметров с замером в журнале запросов"""
+        with QUERY_LOG.track("sqlite", query) as trace:
+            cursor = await self._connection.executemany(query, params_seq)
+            trace.rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        return cursor
+
+    async def _fetchall(self, query: str, params=()) -> list:
+        """Чтение всех строк через соединение для чтения с замером в журнале запросов"""
+        async with self._reader() as connection:
+            with QUERY_LOG.track("sqlite", query) as trace:
+                cursor = await connection.execute(query, params)
+                rows = await cursor.fetchall()
+                trace.rows = len(rows)
+        return rows
+
+    async def _fetchone(self, query: str, params=()):
+        """Чтение одной строки через соединение для чтения с замером в журнале запросов"""
+        async with self._reader() as connection:
+            with QUERY_LOG.track("sqlite", query) as trace:
+                cursor = await connection.execute(query, params)
+                row = await cursor.fetchone()
+                trace.rows = 0 if row is None else 1
+        return row
+
+    async def _commit(self):
+        """Фиксация транзакции (в SQLite здесь происходит запись на диск)"""
+        with QUERY_LOG.track("sqlite", "COMMIT", normalized=True):
             await self._connection.commit()
-            logger.info("Таблицы базы данных созданы/проверены")
+
+    @asynccontextmanager
+    async def _transaction(self):
+        """Транзакция записи под блокировкой: фиксируется целиком или откатывается"""
+        async with self._write_lock:
+            try:
+                yield
+            except BaseException:
+                await self._connection.rollback()
+                raise
+            await self._commit()
+
+    async def _get_schema_version(self, schema: str) -> int:
+        """Версия схемы основной (main) или архивной (archive) базы; 0, если таблицы версии нет"""
+        try:
+            # Без журнала запросов: на новой базе отсутствие таблицы - ожидаемая ситуация
+            cursor = await self._connection.execute(GET_SCHEMA_VERSION.format(schema=schema))
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+        except aiosqlite.OperationalError:
+            return 0
+
+    async def _set_schema_version(self, schema: str):
+        """Сохранение текущей версии схемы"""
+        await self._execute(CREATE_SCHEMA_VERSION_TABLE.format(schema=schema))
+        await self._execute(SET_SCHEMA_VERSION.format(schema=schema), (SCHEMA_VERSION,))
+
+    async def _ensure_schema(self):
+        """Создание таблиц, только если сохраненная версия схемы устарела"""
+        schemas = ["main", "archive"] if self.archive_path else ["main"]
+        rebuild_counts = False
+        for schema in schemas:
+            version = await self._get_schema_version(schema)
+            if version >= SCHEMA_VERSION:
+                logger.info(f"Схема {schema} актуальна (версия {version}), создание таблиц пропущено")
+                continue
+            rebuild_counts |= await self._create_tables(schema)
+        if rebuild_counts:
+            # Сводная таблица пересчитывается, когда записи и архива, и основной базы уже переведены
+            await self.backfill_daily_category_counts()
+
+    async def _columns(self, schema: str, table: str) -> List[str]:
+        cursor = await self._connection.execute(GET_TABLE_COLUMNS, (table, schema))
+        return [name for (name,) in await cursor.fetchall()]
+
+    async def _migrate_categories(self, schema: str, batch_size: int = 5000) -> bool:
+        """
+        Переход на схему 4: категория записи - id из справочника, у напоминаний нет копии текста
+
+        Записи переводятся порциями по диапазонам id (своя транзакция на порцию). Возвращает True,
+        если старая сводная таблица удалена и ее нужно пересчитать.
+        """
+        if "category" in await self._columns(schema, "entries"):
+            logger.info(f"Перевод записей ({schema}) на справочник категорий")
+            await self._execute(FILL_USER_CATEGORIES.format(schema=schema))
+            if "category_id" not in await self._columns(schema, "entries"):
+                await self._execute(ADD_ENTRIES_CATEGORY_ID.format(schema=schema))
+            await self._commit()
+
+            cursor = await self._execute(GET_ENTRIES_ID_RANGE.format(schema=schema))
+            first_id, last_id = await cursor.fetchone()
+            if first_id is not None:
+                for start in range(first_id, last_id + 1, batch_size):
+                    await self._execute(FILL_ENTRIES_CATEGORY_ID.format(schema=schema), (start, start + batch_size - 1))
+                    await self._commit()
+                    logger.info(f"Записи ({schema}): переведено до id {min(start + batch_size - 1, last_id)} из {last_id}")
+            await self._execute(DROP_ENTRIES_CATEGORY.format(schema=schema))
+            await self._commit()
+
+        if schema != "main":
+            return False
+        if "text" in await self._columns("main", "reminders"):
+            await self._execute(DROP_REMINDERS_TEXT)
+        if "category" in await self._columns("main", "daily_category_counts"):
+            await self._execute(DROP_DAILY_CATEGORY_COUNTS)
+            await self._commit()
+            return True
+        await self._commit()
+        return False
+
+    async def _create_tables(self, schema: str = "main") -> bool:
+        """Создание таблиц в базе данных; True - сводную таблицу нужно пересчитать после перехода на новую схему"""
+        try:
+            rebuild_counts = False
+            if schema == "main":
+                await self._execute(CREATE_CATEGORIES_TABLE)
+                for name in SYSTEM_CATEGORIES:
+                    await self._execute(INSERT_SYSTEM_CATEGORY, (name,))
+                rebuild_counts = await self._migrate_categories(schema)
+                # Сводная таблица появляется в базе, созданной раньше нее: заполняем по имеющимся записям
+                if not await self._columns("main", "daily_category_counts"):
+                    rebuild_counts = True
+                await self._execute(CREATE_ENTRIES_TABLE)
+                await self._execute(CREATE_CUSTOM_CATEGORIES_TABLE)
+                await self._execute(CREATE_REMINDERS_TABLE)
+                await self._execute(CREATE_ENTRIES_INDEX)
+                await self._execute(CREATE_ENTRIES_USER_ID_INDEX)
+                await self._execute(CREATE_REMINDERS_INDEX)
+                await self._execute(CREATE_DUE_REMINDERS_INDEX)
+                await self._execute(CREATE_DAILY_CATEGORY_COUNTS_TABLE)
+                await self._execute(CREATE_FSM_STATES_TABLE)
+                await self._execute(CREATE_FSM_STATES_EXPIRES_INDEX)
+                await self._execute(CREATE_DIGEST_SUBSCRIPTIONS_TABLE)
+                await self._execute(CREATE_DIGEST_RUNS_TABLE)
+            else:
+                await self._execute(CREATE_ARCHIVE_ENTRIES_TABLE)
+                await self._execute(CREATE_ARCHIVE_ENTRIES_INDEX)
+                await self._execute(CREATE_ARCHIVE_ENTRIES_USER_ID_INDEX)
+                rebuild_counts = await self._migrate_categories(schema)
+            await self._set_schema_version(schema)
+            await self._commit()
+            logger.info(f"Таблицы базы данных ({schema}) созданы/проверены, версия схемы {SCHEMA_VERSION}")
+            return rebuild_counts
         except Exception as e:
             logger.error(f"Ошибка создания таблиц: {e}")
             raise
@@ -49,28 +264,74 @@ class Database:
     async def add_entry(self, user_id: int, text: str, category: str) -> int:
         """Добавление новой записи"""
         try:
-            logger.info(f"=== ДОБАВЛЕНИЕ ЗАПИСИ В БАЗУ ДАННЫХ ===")
-            logger.info(f"user_id={user_id}, category={category}, text_length={len(text)}")
-            logger.info(f"text='{text[:100]}...' if len(text) > 100 else text")
-            logger.info(f"Соединение с БД: {'Есть' if self._connection else 'Нет'}")
+            logger.debug(f"=== ДОБАВЛЕНИЕ ЗАПИСИ В БАЗУ ДАННЫХ ===")
+            logger.debug(f"user_id={user_id}, category={category}, text_length={len(text)}")
+            logger.debug(f"text='{text[:100]}...' if len(text) > 100 else text")
+            logger.debug(f"Соединение с БД: {'Есть' if self._connection else 'Нет'}")
             
-            cursor = await self._connection.execute(INSERT_ENTRY, (user_id, text, category))
-            await self._connection.commit()
-            entry_id = cursor.lastrowid
-            logger.info(f"✅ Запись добавлена для пользователя {user_id}, ID: {entry_id}")
+            async with self._transaction():
+                entry_id = await self._insert_entry(user_id, text, category)
+            logger.debug(f"✅ Запись добавлена для пользователя {user_id}, ID: {entry_id}")
             return entry_id
         except Exception as e:
             logger.error(f"❌ Ошибка добавления записи: {e}")
             logger.error(f"Тип ошибки: {type(e)}")
             return None
 
+    async def _insert_entry(self, user_id: int, text: str, category: str) -> int:
+        params = {"user_id": user_id, "text": text, "category": category}
+        await self._execute(ENSURE_CATEGORY, params)
+        cursor = await self._execute(INSERT_ENTRY, params)
+        entry_id = cursor.lastrowid
+        # Сводная таблица обновляется в той же транзакции, что и запись
+        await self._execute(INCREMENT_DAILY_CATEGORY_COUNT, (entry_id,))
+        return entry_id
+
+    async def add_entry_with_reminder(self, user_id: int, text: str, category: str,
+                                      reminder_time: Optional[str] = None) -> Optional[int]:
+        """Добавление записи и напоминания к ней (если задано время) в одной транзакции"""
+        try:
+            async with self._transaction():
+                entry_id = await self._insert_entry(user_id, text, category)
+                if reminder_time:
+                    await self._execute(INSERT_REMINDER, (user_id, entry_id, reminder_time))
+            logger.debug(f"Запись {entry_id} добавлена для пользователя {user_id}, напоминание: {reminder_time}")
+            return entry_id
+        except Exception as e:
+            logger.error(f"Ошибка добавления записи с напоминанием: {e}")
+            return None
+
+    async def add_entries_with_reminders(self, user_id: int,
+                                         items: List[Tuple[str, str, Optional[str]]]) -> Optional[List[int]]:
+        """
+        Добавление нескольких записей (text, category, reminder_time) в одной транзакции
+
+        Записи и напоминания пишутся многострочными INSERT; возвращает id записей в порядке items.
+        """
+        try:
+            async with self._transaction():
+                for category in dict.fromkeys(category for _, category, _ in items):
+                    await self._execute(ENSURE_CATEGORY, {"user_id": user_id, "category": category})
+                cursor = await self._execute(INSERT_ENTRIES, {
+                    "user_id": user_id, "items": json.dumps([[text, category] for text, category, _ in items]),
+                })
+                entry_ids = sorted(entry_id for (entry_id,) in await cursor.fetchall())
+                await self._execute(INCREMENT_DAILY_CATEGORY_COUNTS, (json.dumps(entry_ids),))
+                reminders = [[entry_id, reminder_time] for entry_id, (_, _, reminder_time) in zip(entry_ids, items) if reminder_time]
+                if reminders:
+                    await self._execute(INSERT_REMINDERS, {"user_id": user_id, "items": json.dumps(reminders)})
+            logger.debug(f"Добавлено {len(entry_ids)} записей для пользователя {user_id}, напоминаний: {len(reminders)}")
+            return entry_ids
+        except Exception as e:
+            logger.error(f"Ошибка добавления записей: {e}")
+            return None
+
     async def get_today_entries(self, user_id: int) -> List[Tuple[str, str, str]]:
         """Получение записей за сегодня"""
         try:
-            logger.info(f"Запрос записей за сегодня для пользователя {user_id}")
-            cursor = await self._connection.execute(GET_TODAY_ENTRIES, (user_id,))
-            entries = await cursor.fetchall()
-            logger.info(f"Получено {len(entries)} записей за сегодня для пользователя {user_id}")
+            logger.debug(f"Запрос записей за сегодня для пользователя {user_id}")
+            entries = await self._fetchall(GET_TODAY_ENTRIES, (user_id,))
+            logger.debug(f"Получено {len(entries)} записей за сегодня для пользователя {user_id}")
             for entry in entries:
                 logger.debug(f"Запись: {entry}")
             return entries
@@ -78,12 +339,23 @@ class Database:
             logger.error(f"Ошибка получения записей за сегодня: {e}")
             return []
 
+    async def get_today_view(self, user_id: int,
+                             limit: int = 200) -> Tuple[List[Tuple[str, str, str]], List[Tuple[str, int]]]:
+        """Последние limit записей за сегодня и число записей по категориям за весь день"""
+        try:
+            entries = await self._fetchall(GET_TODAY_VIEW_ENTRIES, (user_id, limit))
+            counts = await self._fetchall(GET_TODAY_CATEGORY_COUNTS, (user_id,))
+            return entries, counts
+        except Exception as e:
+            logger.error(f"Ошибка получения записей за сегодня: {e}")
+            return [], []
+
     async def get_entries_by_date(self, user_id: int, date: str) -> List[Tuple[str, str, str]]:
         """Получение записей за конкретную дату"""
         try:
-            cursor = await self._connection.execute(GET_ENTRIES_BY_DATE, (user_id, date))
-            entries = await cursor.fetchall()
-            logger.info(f"Получено {len(entries)} записей за {date} для пользователя {user_id}")
+            query = GET_ENTRIES_BY_DATE_WITH_ARCHIVE if self.archive_path else GET_ENTRIES_BY_DATE
+            entries = await self._fetchall(query, {"user_id": user_id, "day": date})
+            logger.debug(f"Получено {len(entries)} записей за {date} для пользователя {user_id}")
             return entries
         except Exception as e:
             logger.error(f"Ошибка получения записей за дату: {e}")
@@ -92,21 +364,54 @@ class Database:
     async def search_entries(self, user_id: int, search_term: str) -> List[Tuple[str, str, str]]:
         """Поиск записей по ключевому слову"""
         try:
-            search_pattern = f"%{search_term}%"
-            cursor = await self._connection.execute(SEARCH_ENTRIES, (user_id, search_pattern))
-            entries = await cursor.fetchall()
-            logger.info(f"Найдено {len(entries)} записей по запросу '{search_term}' для пользователя {user_id}")
+            search_pattern = f"%{search_term.lower()}%"
+            query = SEARCH_ENTRIES_WITH_ARCHIVE if self.archive_path else SEARCH_ENTRIES
+            entries = await self._fetchall(query, {"user_id": user_id, "pattern": search_pattern})
+            logger.debug(f"Найдено {len(entries)} записей по запросу '{search_term}' для пользователя {user_id}")
             return entries
         except Exception as e:
             logger.error(f"Ошибка поиска записей: {e}")
             return []
 
+    async def get_entries_by_ids(self, user_id: int, entry_ids: List[int]) -> List[Tuple[int, str, str, str]]:
+        """Записи пользователя (id, text, category, datetime) по списку id, в произвольном порядке"""
+        if not entry_ids:
+            return []
+        try:
+            query = GET_ENTRIES_BY_IDS_WITH_ARCHIVE if self.archive_path else GET_ENTRIES_BY_IDS
+            return await self._fetchall(query, {"user_id": user_id, "ids": json.dumps(list(entry_ids))})
+        except Exception as e:
+            logger.error(f"Ошибка получения записей по id: {e}")
+            return []
+
+    async def get_daily_category_counts(self, user_id: int, since: str) -> List[Tuple[str, str, int]]:
+        """Получение количества записей по дням и категориям начиная с даты since"""
+        try:
+            rows = await self._fetchall(GET_DAILY_CATEGORY_COUNTS, (user_id, since))
+            logger.debug(f"Получено {len(rows)} строк статистики с {since} для пользователя {user_id}")
+            return rows
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики по категориям: {e}")
+            return []
+
+    async def backfill_daily_category_counts(self) -> bool:
+        """Пересчет сводной таблицы по всем существующим записям (разовая операция)"""
+        try:
+            query = BACKFILL_DAILY_CATEGORY_COUNTS_WITH_ARCHIVE if self.archive_path else BACKFILL_DAILY_CATEGORY_COUNTS
+            async with self._transaction():
+                await self._execute(query)
+            logger.info("Сводная таблица daily_category_counts пересчитана")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка пересчета сводной таблицы: {e}")
+            return False
+
     async def add_custom_category(self, user_id: int, name: str, keywords: str) -> bool:
         """Добавление пользовательской категории"""
         try:
-            await self._connection.execute(INSERT_CUSTOM_CATEGORY, (user_id, name, keywords))
-            await self._connection.commit()
-            logger.info(f"Пользовательская категория '{name}' добавлена для пользователя {user_id}")
+            async with self._transaction():
+                await self._execute(INSERT_CUSTOM_CATEGORY, (user_id, name, keywords))
+            logger.debug(f"Пользовательская категория '{name}' добавлена для пользователя {user_id}")
             return True
         except Exception as e:
             logger.error(f"Ошибка добавления пользовательской категории: {e}")
@@ -115,9 +420,8 @@ class Database:
     async def get_custom_categories(self, user_id: int) -> List[Tuple[str, str]]:
         """Получение пользовательских категорий пользователя"""
         try:
-            cursor = await self._connection.execute(GET_CUSTOM_CATEGORIES, (user_id,))
-            categories = await cursor.fetchall()
-            logger.info(f"Получено {len(categories)} пользовательских категорий для пользователя {user_id}")
+            categories = await self._fetchall(GET_CUSTOM_CATEGORIES, (user_id,))
+            logger.debug(f"Получено {len(categories)} пользовательских категорий для пользователя {user_id}")
             return categories
         except Exception as e:
             logger.error(f"Ошибка получения пользовательских категорий: {e}")
@@ -126,19 +430,18 @@ class Database:
     async def get_all_custom_categories(self) -> List[Tuple[int, str, str]]:
         """Получение всех пользовательских категорий (для категоризатора)"""
         try:
-            cursor = await self._connection.execute(GET_ALL_CUSTOM_CATEGORIES)
-            categories = await cursor.fetchall()
+            categories = await self._fetchall(GET_ALL_CUSTOM_CATEGORIES)
             return categories
         except Exception as e:
             logger.error(f"Ошибка получения всех пользовательских категорий: {e}")
             return []
 
-    async def add_reminder(self, user_id: int, entry_id: int, text: str, reminder_time: str) -> bool:
-        """Добавление напоминания"""
+    async def add_reminder(self, user_id: int, entry_id: int, reminder_time: str) -> bool:
+        """Добавление напоминания к записи entry_id (текст напоминания - текст записи)"""
         try:
-            await self._connection.execute(INSERT_REMINDER, (user_id, entry_id, text, reminder_time))
-            await self._connection.commit()
-            logger.info(f"Напоминание добавлено для пользователя {user_id} на {reminder_time}")
+            async with self._transaction():
+                await self._execute(INSERT_REMINDER, (user_id, entry_id, reminder_time))
+            logger.debug(f"Напоминание добавлено для пользователя {user_id} на {reminder_time}")
             return True
         except Exception as e:
             logger.error(f"Ошибка добавления напоминания: {e}")
@@ -147,8 +450,7 @@ class Database:
     async def get_pending_reminders(self) -> List[Tuple[int, int, str, str]]:
         """Получение всех ожидающих напоминаний"""
         try:
-            cursor = await self._connection.execute(GET_PENDING_REMINDERS)
-            reminders = await cursor.fetchall()
+            reminders = await self._fetchall(GET_PENDING_REMINDERS)
             return reminders
         except Exception as e:
             logger.error(f"Ошибка получения напоминаний: {e}")
@@ -157,21 +459,315 @@ class Database:
     async def mark_reminder_sent(self, reminder_id: int) -> bool:
         """Отметить напоминание как отправленное"""
         try:
-            await self._connection.execute(MARK_REMINDER_SENT, (reminder_id,))
-            await self._connection.commit()
-            logger.info(f"Напоминание {reminder_id} отмечено как отправленное")
+            async with self._transaction():
+                await self._execute(MARK_REMINDER_SENT, (reminder_id,))
+            logger.debug(f"Напоминание {reminder_id} отмечено как отправленное")
             return True
         except Exception as e:
             logger.error(f"Ошибка отметки напоминания: {e}")
             return False
 
+    async def claim_due_reminders(self, limit: int = 100) -> List[Tuple[int, int, str, str]]:
+        """Наступившие напоминания (не больше limit), сразу отмеченные как отправленные"""
+        try:
+            async with self._transaction():
+                cursor = await self._execute(CLAIM_DUE_REMINDERS, (limit,))
+                reminders = await cursor.fetchall()
+            return sorted(reminders, key=lambda reminder: reminder[3])
+        except Exception as e:
+            logger.error(f"Ошибка выборки напоминаний: {e}")
+            return []
+
+    async def count_due_reminders(self) -> Optional[int]:
+        """Число наступивших, но еще не выбранных для отправки напоминаний (None - ошибка)"""
+        try:
+            row = await self._fetchone(COUNT_DUE_REMINDERS)
+            return row[0]
+        except Exception as e:
+            logger.error(f"Ошибка подсчета напоминаний: {e}")
+            return None
+
+    async def release_reminder(self, reminder_id: int) -> bool:
+        """Вернуть напоминание в ожидающие (отправка не удалась)"""
+        try:
+            async with self._transaction():
+                await self._execute(RELEASE_REMINDER, (reminder_id,))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка возврата напоминания {reminder_id}: {e}")
+            return False
+
     async def get_user_reminders(self, user_id: int) -> List[Tuple[int, str, str, bool]]:
         """Получение напоминаний пользователя"""
         try:
-            cursor = await self._connection.execute(GET_USER_REMINDERS, (user_id,))
-            reminders = await cursor.fetchall()
-            logger.info(f"Получено {len(reminders)} напоминаний для пользователя {user_id}")
+            reminders = [
+                (reminder_id, text, reminder_time, bool(is_sent))
+                for reminder_id, text, reminder_time, is_sent in await self._fetchall(GET_USER_REMINDERS, (user_id,))
+            ]
+            logger.debug(f"Получено {len(reminders)} напоминаний для пользователя {user_id}")
             return reminders
         except Exception as e:
             logger.error(f"Ошибка получения напоминаний пользователя: {e}")
-            return [] 
\ No newline at end of file
+            return [] 
+
+    async def get_fsm_record(self, storage_key: str, now: float) -> Optional[Tuple[Optional[str], str]]:
+        """Состояние диалога и его данные (JSON); None - записи нет или срок ее хранения истек"""
+        try:
+            row = await self._fetchone(GET_FSM_RECORD, (storage_key, now))
+            return (row[0], row[1]) if row else None
+        except Exception as e:
+            logger.error(f"Ошибка получения состояния диалога: {e}")
+            return None
+
+    async def set_fsm_record(self, storage_key: str, state: Optional[str], data: str, expires_at: float) -> bool:
+        """Сохранение состояния диалога и его данных до expires_at"""
+        try:
+            async with self._transaction():
+                await self._execute(SET_FSM_RECORD, (storage_key, state, data, expires_at))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния диалога: {e}")
+            return False
+
+    async def delete_fsm_record(self, storage_key: str) -> bool:
+        """Удаление состояния диалога"""
+        try:
+            async with self._transaction():
+                await self._execute(DELETE_FSM_RECORD, (storage_key,))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка удаления состояния диалога: {e}")
+            return False
+
+    async def delete_expired_fsm_records(self, now: float) -> int:
+        """Удаление состояний диалогов с истекшим сроком хранения"""
+        try:
+            async with self._transaction():
+                cursor = await self._execute(DELETE_EXPIRED_FSM_RECORDS, (now,))
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Ошибка удаления устаревших состояний диалогов: {e}")
+            return 0
+
+    async def set_digest_subscription(self, user_id: int, subscribed: bool) -> bool:
+        """Подписка на еженедельную сводку или отказ от нее"""
+        try:
+            async with self._transaction():
+                await self._execute(SUBSCRIBE_DIGEST if subscribed else UNSUBSCRIBE_DIGEST, (user_id,))
+            logger.debug(f"Подписка пользователя {user_id} на сводку: {subscribed}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка изменения подписки на сводку: {e}")
+            return False
+
+    async def is_digest_subscribed(self, user_id: int) -> bool:
+        """Подписан ли пользователь на еженедельную сводку"""
+        try:
+            return await self._fetchone(IS_DIGEST_SUBSCRIBED, (user_id,)) is not None
+        except Exception as e:
+            logger.error(f"Ошибка проверки подписки на сводку: {e}")
+            return False
+
+    async def get_digest_checkpoint(self, period: str) -> Optional[Tuple[int, bool]]:
+        """Контрольная точка рассылки сводки: (последний обработанный пользователь, рассылка завершена)"""
+        try:
+            row = await self._fetchone(GET_DIGEST_CHECKPOINT, (period,))
+            return (row[0], bool(row[1])) if row else None
+        except Exception as e:
+            logger.error(f"Ошибка получения контрольной точки сводки: {e}")
+            return None
+
+    async def set_digest_checkpoint(self, period: str, last_user_id: int, completed: bool) -> bool:
+        """Сохранение контрольной точки рассылки сводки"""
+        try:
+            async with self._transaction():
+                await self._execute(SET_DIGEST_CHECKPOINT, (period, last_user_id, completed))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения контрольной точки сводки: {e}")
+            return False
+
+    async def _iter_id_pages(self, query: str, user_id: int, batch_size: int, after_id: int = 0):
+        """
+        Постраничное чтение строк пользователя по возрастанию id (keyset-пагинация)
+
+        Соединение для чтения возвращается в пул между страницами, поэтому медленный
+        потребитель (например, отправка большого экспорта) не занимает его надолго.
+        Первый столбец строк - id.
+        """
+        params = {"user_id": user_id, "after_id": after_id, "limit": batch_size}
+        while True:
+            rows = await self._fetchall(query, params)
+            for row in rows:
+                yield row
+            if len(rows) < batch_size:
+                break
+            params["after_id"] = rows[-1][0]
+
+    async def _iter_keyset_pages(self, query: str, since: str, until: str, after_user_id: int, batch_size: int):
+        """
+        Постраничное чтение сводки по возрастанию (user_id, id) (keyset-пагинация)
+
+        Каждая страница - отдельный короткий запрос: соединение для чтения возвращается в пул
+        между страницами и не удерживает снимок WAL на всю рассылку. Первый столбец строк - id.
+        """
+        # Строки самого after_user_id пропускаются: курсор стоит после его последнего возможного id
+        params = {"since": since, "until": until, "after_user_id": after_user_id,
+                  "after_id": MAX_ROWID, "limit": batch_size}
+        while True:
+            rows = await self._fetchall(query, params)
+            for row in rows:
+                yield row[1:]
+            if len(rows) < batch_size:
+                break
+            params["after_id"], params["after_user_id"] = rows[-1][0], rows[-1][1]
+
+    async def iter_digest_entries(self, since: str, until: str, after_user_id: int = 0,
+                                  batch_size: int = 500) -> AsyncIterator[Tuple[int, str, str]]:
+        """Записи подписчиков сводки за [since, until) по возрастанию user_id: (user_id, text, category)"""
+        async for row in self._iter_keyset_pages(ITER_DIGEST_ENTRIES, since, until, after_user_id, batch_size):
+            yield row
+
+    async def iter_digest_reminders(self, since: str, until: str, after_user_id: int = 0,
+                                    batch_size: int = 500) -> AsyncIterator[Tuple[int, str, str]]:
+        """Неотправленные напоминания подписчиков на [since, until) по возрастанию user_id: (user_id, text, reminder_time)"""
+        async for row in self._iter_keyset_pages(ITER_DIGEST_REMINDERS, since, until, after_user_id, batch_size):
+            yield row
+
+    async def iter_entries(self, user_id: int, batch_size: int = 500,
+                           after_id: int = 0) -> AsyncIterator[Tuple[int, str, str, str]]:
+        """Потоковое чтение записей пользователя с id > after_id порциями по возрастанию id (для экспорта)"""
+        query = EXPORT_ENTRIES_WITH_ARCHIVE if self.archive_path else EXPORT_ENTRIES
+        async for row in self._iter_id_pages(query, user_id, batch_size, after_id):
+            yield row
+
+    async def iter_reminders(self, user_id: int, batch_size: int = 500) -> AsyncIterator[Tuple[int, int, str, str, bool]]:
+        """Потоковое чтение всех напоминаний пользователя порциями (для экспорта)"""
+        async for reminder_id, entry_id, text, reminder_time, is_sent in self._iter_id_pages(EXPORT_REMINDERS, user_id, batch_size):
+            yield reminder_id, entry_id, text, reminder_time, bool(is_sent)
+
+    async def export_rows(self, table: str, after_id: int, limit: int) -> List[tuple]:
+        """Страница строк таблицы для переноса в другой бэкенд: id > after_id по возрастанию, не больше limit"""
+        if table not in MIGRATION_TABLES:
+            raise ValueError(f"Таблица {table} не переносится")
+        params = {"after_id": after_id, "limit": limit}
+        if table == "custom_categories":
+            return [tuple(row) for row in await self._fetchall(MIGRATE_EXPORT_CUSTOM_CATEGORIES, params)]
+        if table == "entries":
+            query = MIGRATE_EXPORT_ENTRIES_WITH_ARCHIVE if self.archive_path else MIGRATE_EXPORT_ENTRIES
+            return [
+                (entry_id, user_id, text, category, format_timestamp(timestamp))
+                for entry_id, user_id, text, category, timestamp in await self._fetchall(query, params)
+            ]
+        return [
+            (reminder_id, user_id, entry_id, format_timestamp(reminder_time), bool(is_sent))
+            for reminder_id, user_id, entry_id, reminder_time, is_sent in await self._fetchall(MIGRATE_EXPORT_REMINDERS, params)
+        ]
+
+    async def import_rows(self, table: str, rows: List[tuple]) -> int:
+        """
+        Вставка порции строк из другого бэкенда с исходными id одной транзакцией (executemany)
+
+        Строки с уже существующими id пропускаются, поэтому порцию можно повторить после сбоя.
+        Сводная таблица не обновляется - ее пересчитывает finish_import. Возвращает число новых строк.
+        """
+        if table not in MIGRATION_TABLES:
+            raise ValueError(f"Таблица {table} не переносится")
+        async with self._transaction():
+            if table == "custom_categories":
+                cursor = await self._executemany(MIGRATE_IMPORT_CUSTOM_CATEGORY, rows)
+            elif table == "entries":
+                categories = dict.fromkeys((user_id, category) for _, user_id, _, category, _ in rows)
+                await self._executemany(ENSURE_CATEGORY, [{"user_id": user_id, "category": category} for user_id, category in categories])
+                query = MIGRATE_IMPORT_ENTRY_WITH_ARCHIVE if self.archive_path else MIGRATE_IMPORT_ENTRY
+                cursor = await self._executemany(query, [
+                    {"id": entry_id, "user_id": user_id, "text": text, "category": category, "datetime": timestamp}
+                    for entry_id, user_id, text, category, timestamp in rows
+                ])
+            else:
+                cursor = await self._executemany(MIGRATE_IMPORT_REMINDER, [
+                    {"id": reminder_id, "user_id": user_id, "entry_id": entry_id, "reminder_time": reminder_time, "is_sent": is_sent}
+                    for reminder_id, user_id, entry_id, reminder_time, is_sent in rows
+                ])
+        return cursor.rowcount
+
+    async def finish_import(self):
+        """Завершение переноса: пересчет сводной таблицы (AUTOINCREMENT сам продолжает id с максимального)"""
+        if not await self.backfill_daily_category_counts():
+            raise RuntimeError("Не удалось пересчитать сводную таблицу daily_category_counts")
+
+    async def run_maintenance(self):
+        """Периодическое обслуживание: удаление устаревших состояний диалогов, перенос старых месяцев в архивную базу"""
+        expired = await self.delete_expired_fsm_records(time.time())
+        if expired:
+            logger.info(f"Удалено устаревших состояний диалогов: {expired}")
+
+        if not self.archive_path:
+            return
+
+        cutoff = add_months(date.today(), -self.archive_after_months).isoformat()
+        moved = await self.archive_entries_before(cutoff)
+        if moved:
+            logger.info(f"В архив перенесено {moved} записей старше {cutoff}")
+
+    async def backup(self, target_path: str, schema: str = "main", pages: int = 256, step_sleep: float = 0.01) -> bool:
+        """
+        Онлайн-копия основной (main) или архивной (archive) базы без остановки бота
+
+        Копирование идет через backup API SQLite в отдельном соединении и потоке, по pages
+        страниц за шаг с паузой step_sleep между шагами. В режиме WAL копия читается
+        из одного снимка (открытая транзакция чтения), а записи бота при этом не ждут;
+        без WAL SQLite начинает копирование заново, если база изменилась между шагами.
+        Файл появляется под именем target_path только целиком.
+        """
+        source_path = self.db_path if schema == "main" else self.archive_path
+        if not source_path or not os.path.exists(source_path):
+            logger.error(f"Нет файла базы для резервной копии: {schema}")
+            return False
+
+        def copy():
+            temp_path = target_path + ".tmp"
+            source = sqlite3.connect(source_path, isolation_level=None)
+            try:
+                snapshot = source.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+                if snapshot:
+                    source.execute("BEGIN")
+                    source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                target = sqlite3.connect(temp_path)
+                try:
+                    source.backup(target, pages=pages, progress=lambda *_: time.sleep(step_sleep))
+                finally:
+                    target.close()
+                if snapshot:
+                    source.execute("ROLLBACK")
+                os.replace(temp_path, target_path)
+            finally:
+                source.close()
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        try:
+            await asyncio.to_thread(copy)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка резервного копирования базы {schema}: {e}")
+            return False
+
+    async def archive_entries_before(self, cutoff: str, batch_size: int = 5000) -> int:
+        """Перенос записей старше cutoff в архивную базу небольшими транзакциями"""
+        moved = 0
+        try:
+            while True:
+                params = {"cutoff": cutoff, "batch_size": batch_size}
+                row = await self._fetchone(GET_ARCHIVE_BATCH_MAX_ID, params)
+                if not row or row[0] is None:
+                    break
+
+                params["max_id"] = row[0]
+                async with self._transaction():
+                    await self._execute(COPY_ENTRIES_TO_ARCHIVE, params)
+                    cursor = await self._execute(DELETE_ARCHIVED_ENTRIES, params)
+                moved += cursor.rowcount
+        except Exception as e:
+            logger.error(f"Ошибка переноса записей в архив: {e}")
+        return moved
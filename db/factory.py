@@ -0,0 +1,36 @@
+"""
+Выбор бэкенда базы данных по настройкам из config
+"""
+
+import logging
+
+import config
+from db.query_log import QUERY_LOG
+
+logger = logging.getLogger(__name__)
+
+
+def create_database():
+    """
+    Создание бэкенда базы данных: Supabase, затем PostgreSQL, иначе SQLite
+
+    Модуль драйвера импортируется только для выбранного бэкенда, чтобы запуск на SQLite
+    не загружал supabase и asyncpg.
+    """
+    QUERY_LOG.configure(config.SLOW_QUERY_THRESHOLD_MS, config.QUERY_LOG_TOP_N, config.QUERY_LOG_WINDOW)
+
+    if config.SUPABASE_KEY and config.SUPABASE_KEY.strip():
+        from db.supabase_database import SupabaseDatabase
+        logger.info("Используется Supabase API")
+        return SupabaseDatabase(config.SUPABASE_URL, config.SUPABASE_KEY, config.PARTITION_MONTHS_AHEAD,
+                                config.SUPABASE_PAGE_SIZE)
+
+    if config.DATABASE_URL and config.DATABASE_URL.strip():
+        from db.postgres_database import PostgresDatabase
+        logger.info("Используется PostgreSQL база данных")
+        return PostgresDatabase(config.DATABASE_URL, config.PARTITION_MONTHS_AHEAD)
+
+    from db.database import Database
+    logger.info("Используется SQLite база данных (fallback)")
+    return Database(config.DATABASE_PATH, config.ARCHIVE_DATABASE_PATH, config.ARCHIVE_AFTER_MONTHS,
+                    config.SQLITE_READ_CONNECTIONS)
@@ -0,0 +1,267 @@
+"""
+Эталонный бэкенд в памяти (для тестов и бенчмарков)
+"""
+
+import bisect
+import logging
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from .base import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self._next_entry_id = 1
+        self._next_reminder_id = 1
+        # user_id -> записи в порядке добавления: (id, text, category, datetime)
+        self._entries: Dict[int, List[Tuple[int, str, str, str]]] = {}
+        # user_id -> datetime записей (для бинарного поиска по дате)
+        self._entry_times: Dict[int, List[str]] = {}
+        # user_id -> {name: keywords}
+        self._custom_categories: Dict[int, Dict[str, str]] = {}
+        # reminder_id -> [id, user_id, entry_id, text, reminder_time, is_sent]
+        self._reminders: Dict[int, list] = {}
+        # user_id -> {(day, category): count}
+        self._daily_counts: Dict[int, Dict[Tuple[str, str], int]] = {}
+        # storage_key -> (state, data, expires_at)
+        self._fsm_records: Dict[str, Tuple[Optional[str], str, float]] = {}
+        # Подписчики еженедельной сводки и контрольные точки рассылки: period -> (last_user_id, completed)
+        self._digest_subscribers: Set[int] = set()
+        self._digest_checkpoints: Dict[str, Tuple[int, bool]] = {}
+
+    async def connect(self):
+        """Создание хранилища в памяти"""
+        logger.info("База данных в памяти подключена")
+
+    async def disconnect(self):
+        """Закрытие хранилища в памяти"""
+        logger.info("База данных в памяти закрыта")
+
+    async def run_maintenance(self):
+        """Обслуживание не требуется"""
+
+    async def add_entry(self, user_id: int, text: str, category: str) -> int:
+        """Добавление новой записи"""
+        entry_id = self._next_entry_id
+        self._next_entry_id += 1
+        timestamp = format_timestamp(datetime.now())
+
+        self._entries.setdefault(user_id, []).append((entry_id, text, category, timestamp))
+        self._entry_times.setdefault(user_id, []).append(timestamp)
+
+        counts = self._daily_counts.setdefault(user_id, {})
+        key = (timestamp[:10], category)
+        counts[key] = counts.get(key, 0) + 1
+        return entry_id
+
+    async def add_entry_with_reminder(self, user_id: int, text: str, category: str,
+                                      reminder_time: Optional[str] = None) -> Optional[int]:
+        """Добавление записи и напоминания к ней (если задано время)"""
+        entry_id = await self.add_entry(user_id, text, category)
+        if reminder_time:
+            await self.add_reminder(user_id, entry_id, reminder_time)
+        return entry_id
+
+    async def add_entries_with_reminders(self, user_id: int,
+                                         items: List[Tuple[str, str, Optional[str]]]) -> Optional[List[int]]:
+        """Добавление нескольких записей (text, category, reminder_time); id в порядке items"""
+        return [await self.add_entry_with_reminder(user_id, text, category, reminder_time)
+                for text, category, reminder_time in items]
+
+    def _entries_for_day(self, user_id: int, day: str) -> List[Tuple[str, str, str]]:
+        """Записи пользователя за день, от новых к старым"""
+        times = self._entry_times.get(user_id, [])
+        start = bisect.bisect_left(times, day)
+        end = bisect.bisect_left(times, day + "\xff")
+        entries = self._entries[user_id][start:end] if end > start else []
+        return [(text, category, timestamp) for _, text, category, timestamp in reversed(entries)]
+
+    async def get_today_entries(self, user_id: int) -> List[Tuple[str, str, str]]:
+        """Получение записей за сегодня"""
+        return self._entries_for_day(user_id, date.today().isoformat())
+
+    async def get_today_view(self, user_id: int,
+                             limit: int = 200) -> Tuple[List[Tuple[str, str, str]], List[Tuple[str, int]]]:
+        """Последние limit записей за сегодня и число записей по категориям за весь день"""
+        entries = self._entries_for_day(user_id, date.today().isoformat())
+        counts: Dict[str, int] = {}
+        for _, category, _ in entries:
+            counts[category] = counts.get(category, 0) + 1
+        return entries[:limit], sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    async def get_entries_by_date(self, user_id: int, date: str) -> List[Tuple[str, str, str]]:
+        """Получение записей за конкретную дату"""
+        return self._entries_for_day(user_id, date)
+
+    async def search_entries(self, user_id: int, search_term: str) -> List[Tuple[str, str, str]]:
+        """Поиск записей по ключевому слову (без учета регистра)"""
+        term = search_term.lower()
+        return [
+            (text, category, timestamp)
+            for _, text, category, timestamp in reversed(self._entries.get(user_id, []))
+            if term in text.lower()
+        ]
+
+    async def get_entries_by_ids(self, user_id: int, entry_ids: List[int]) -> List[Tuple[int, str, str, str]]:
+        """Записи пользователя (id, text, category, datetime) по списку id"""
+        wanted = set(entry_ids)
+        return [entry for entry in self._entries.get(user_id, []) if entry[0] in wanted]
+
+    async def get_daily_category_counts(self, user_id: int, since: str) -> List[Tuple[str, str, int]]:
+        """Получение количества записей по дням и категориям начиная с даты since"""
+        counts = self._daily_counts.get(user_id, {})
+        return sorted((day, category, count) for (day, category), count in counts.items() if day >= since)
+
+    async def backfill_daily_category_counts(self) -> bool:
+        """Пересчет сводной таблицы по всем записям"""
+        self._daily_counts.clear()
+        for user_id, entries in self._entries.items():
+            counts = self._daily_counts.setdefault(user_id, {})
+            for _, _, category, timestamp in entries:
+                key = (timestamp[:10], category)
+                counts[key] = counts.get(key, 0) + 1
+        return True
+
+    async def add_custom_category(self, user_id: int, name: str, keywords: str) -> bool:
+        """Добавление пользовательской категории"""
+        self._custom_categories.setdefault(user_id, {})[name] = keywords
+        return True
+
+    async def get_custom_categories(self, user_id: int) -> List[Tuple[str, str]]:
+        """Получение пользовательских категорий пользователя"""
+        return list(self._custom_categories.get(user_id, {}).items())
+
+    async def get_all_custom_categories(self) -> List[Tuple[int, str, str]]:
+        """Получение всех пользовательских категорий (для категоризатора)"""
+        return [
+            (user_id, name, keywords)
+            for user_id, categories in self._custom_categories.items()
+            for name, keywords in categories.items()
+        ]
+
+    async def add_reminder(self, user_id: int, entry_id: int, reminder_time: str) -> bool:
+        """Добавление напоминания к записи entry_id (текст напоминания - текст записи)"""
+        text = next((text for id_, text, _, _ in self._entries.get(user_id, []) if id_ == entry_id), None)
+        if text is None:
+            return False
+        reminder_id = self._next_reminder_id
+        self._next_reminder_id += 1
+        self._reminders[reminder_id] = [reminder_id, user_id, entry_id, text, format_timestamp(reminder_time), False]
+        return True
+
+    async def get_pending_reminders(self) -> List[Tuple[int, int, str, str]]:
+        """Получение всех ожидающих напоминаний"""
+        now = format_timestamp(datetime.now())
+        due = [r for r in self._reminders.values() if not r[5] and r[4] <= now]
+        due.sort(key=lambda r: r[4])
+        return [(r[0], r[1], r[3], r[4]) for r in due]
+
+    async def mark_reminder_sent(self, reminder_id: int) -> bool:
+        """Отметить напоминание как отправленное"""
+        reminder = self._reminders.get(reminder_id)
+        if reminder is None:
+            return False
+        reminder[5] = True
+        return True
+
+    async def claim_due_reminders(self, limit: int = 100) -> List[Tuple[int, int, str, str]]:
+        """Наступившие напоминания (не больше limit), сразу отмеченные как отправленные"""
+        claimed = (await self.get_pending_reminders())[:limit]
+        for reminder_id, _, _, _ in claimed:
+            self._reminders[reminder_id][5] = True
+        return claimed
+
+    async def count_due_reminders(self) -> Optional[int]:
+        """Число наступивших, но еще не выбранных для отправки напоминаний"""
+        return len(await self.get_pending_reminders())
+
+    async def release_reminder(self, reminder_id: int) -> bool:
+        """Вернуть напоминание в ожидающие (отправка не удалась)"""
+        reminder = self._reminders.get(reminder_id)
+        if reminder is None:
+            return False
+        reminder[5] = False
+        return True
+
+    async def get_user_reminders(self, user_id: int) -> List[Tuple[int, str, str, bool]]:
+        """Получение напоминаний пользователя"""
+        reminders = [r for r in self._reminders.values() if r[1] == user_id]
+        reminders.sort(key=lambda r: r[4], reverse=True)
+        return [(r[0], r[3], r[4], r[5]) for r in reminders]
+
+    async def get_fsm_record(self, storage_key: str, now: float) -> Optional[Tuple[Optional[str], str]]:
+        """Состояние диалога и его данные (JSON); None - записи нет или срок ее хранения истек"""
+        record = self._fsm_records.get(storage_key)
+        if record is None or record[2] <= now:
+            return None
+        return record[0], record[1]
+
+    async def set_fsm_record(self, storage_key: str, state: Optional[str], data: str, expires_at: float) -> bool:
+        """Сохранение состояния диалога и его данных до expires_at"""
+        self._fsm_records[storage_key] = (state, data, expires_at)
+        return True
+
+    async def delete_fsm_record(self, storage_key: str) -> bool:
+        """Удаление состояния диалога"""
+        self._fsm_records.pop(storage_key, None)
+        return True
+
+    async def delete_expired_fsm_records(self, now: float) -> int:
+        """Удаление состояний диалогов с истекшим сроком хранения"""
+        expired = [key for key, record in self._fsm_records.items() if record[2] <= now]
+        for key in expired:
+            del self._fsm_records[key]
+        return len(expired)
+
+    async def set_digest_subscription(self, user_id: int, subscribed: bool) -> bool:
+        """Подписка на еженедельную сводку или отказ от нее"""
+        if subscribed:
+            self._digest_subscribers.add(user_id)
+        else:
+            self._digest_subscribers.discard(user_id)
+        return True
+
+    async def is_digest_subscribed(self, user_id: int) -> bool:
+        """Подписан ли пользователь на еженедельную сводку"""
+        return user_id in self._digest_subscribers
+
+    async def get_digest_checkpoint(self, period: str) -> Optional[Tuple[int, bool]]:
+        """Контрольная точка рассылки сводки: (последний обработанный пользователь, рассылка завершена)"""
+        return self._digest_checkpoints.get(period)
+
+    async def set_digest_checkpoint(self, period: str, last_user_id: int, completed: bool) -> bool:
+        """Сохранение контрольной точки рассылки сводки"""
+        self._digest_checkpoints[period] = (last_user_id, completed)
+        return True
+
+    async def iter_digest_entries(self, since: str, until: str, after_user_id: int = 0,
+                                  batch_size: int = 500) -> AsyncIterator[Tuple[int, str, str]]:
+        """Записи подписчиков сводки за [since, until) по возрастанию user_id: (user_id, text, category)"""
+        for user_id in sorted(u for u in self._digest_subscribers if u > after_user_id):
+            for _, text, category, timestamp in list(self._entries.get(user_id, [])):
+                if since <= timestamp < until:
+                    yield user_id, text, category
+
+    async def iter_digest_reminders(self, since: str, until: str, after_user_id: int = 0,
+                                    batch_size: int = 500) -> AsyncIterator[Tuple[int, str, str]]:
+        """Неотправленные напоминания подписчиков на [since, until) по возрастанию user_id: (user_id, text, reminder_time)"""
+        rows = [
+            (r[1], r[3], r[4]) for r in self._reminders.values()
+            if r[1] in self._digest_subscribers and r[1] > after_user_id and not r[5] and since <= r[4] < until
+        ]
+        for row in sorted(rows, key=lambda row: (row[0], row[2])):
+            yield row
+
+    async def iter_entries(self, user_id: int, batch_size: int = 500,
+                           after_id: int = 0) -> AsyncIterator[Tuple[int, str, str, str]]:
+        """Чтение записей пользователя с id > after_id (для экспорта)"""
+        for entry in [e for e in self._entries.get(user_id, []) if e[0] > after_id]:
+            yield entry
+
+    async def iter_reminders(self, user_id: int, batch_size: int = 500) -> AsyncIterator[Tuple[int, int, str, str, bool]]:
+        """Чтение всех напоминаний пользователя (для экспорта)"""
+        for r in [r for r in self._reminders.values() if r[1] == user_id]:
+            yield r[0], r[2], r[3], r[4], r[5]
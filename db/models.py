@@ -2,14 +2,32 @@
 Модели базы данных для MindFlow Journal
 """
 
+# Системные категории (порядок задает их id в справочнике categories)
+SYSTEM_CATEGORIES = ("Задачи", "Идеи", "Вопросы", "Тревоги", "Факты", "Планы", "Напоминания", "Прочее")
+
 # SQL-запросы для создания таблиц
+# Справочник категорий: системные (user_id = 0) и пользовательские. Записи хранят только id
+# категории, поэтому строки и индексы меньше, а переименование не переписывает историю
+CREATE_CATEGORIES_TABLE = """
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL DEFAULT 0,
+    name TEXT NOT NULL,
+    UNIQUE(user_id, name)
+)
+"""
+
+INSERT_SYSTEM_CATEGORY = """
+INSERT OR IGNORE INTO categories (user_id, name) VALUES (0, ?)
+"""
+
 CREATE_ENTRIES_TABLE = """
 CREATE TABLE IF NOT EXISTS entries (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
     text TEXT NOT NULL,
     datetime TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    category TEXT NOT NULL
+    category_id INTEGER NOT NULL REFERENCES categories(id)
 )
 """
 
@@ -17,6 +35,12 @@ CREATE_ENTRIES_INDEX = """
 CREATE INDEX IF NOT EXISTS idx_entries_user_datetime ON entries(user_id, datetime)
 """
 
+# Записи пользователя по возрастанию id (в индекс SQLite неявно входит rowid): страницы
+# экспорта читаются по индексу без сортировки всех записей пользователя
+CREATE_ENTRIES_USER_ID_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_entries_user_id ON entries(user_id)
+"""
+
 CREATE_CUSTOM_CATEGORIES_TABLE = """
 CREATE TABLE IF NOT EXISTS custom_categories (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -32,7 +56,6 @@ CREATE TABLE IF NOT EXISTS reminders (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
     entry_id INTEGER NOT NULL,
-    text TEXT NOT NULL,
     reminder_time TIMESTAMP NOT NULL,
     is_sent BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -44,32 +67,257 @@ CREATE_REMINDERS_INDEX = """
 CREATE INDEX IF NOT EXISTS idx_reminders_user_time ON reminders(user_id, reminder_time)
 """
 
+# Частичный индекс ожидающих напоминаний: выборка и подсчет наступивших не просматривают отправленные
+CREATE_DUE_REMINDERS_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(reminder_time) WHERE is_sent = FALSE
+"""
+
+# Версия схемы. При изменении DDL ниже увеличьте SCHEMA_VERSION: при подключении таблицы
+# создаются/проверяются, только если сохраненная версия меньше текущей
+SCHEMA_VERSION = 7
+
+# {schema} - main или archive (у архивной базы своя версия)
+CREATE_SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS {schema}.schema_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+GET_SCHEMA_VERSION = """
+SELECT version FROM {schema}.schema_version WHERE id = 1
+"""
+
+SET_SCHEMA_VERSION = """
+INSERT INTO {schema}.schema_version (id, version) VALUES (1, ?)
+ON CONFLICT(id) DO UPDATE SET version = excluded.version, updated_at = CURRENT_TIMESTAMP
+"""
+
 # SQL-запросы для работы с записями
-INSERT_ENTRY = """
-INSERT INTO entries (user_id, text, category) VALUES (?, ?, ?)
+# id категории по имени: системная категория важнее пользовательской с тем же именем
+CATEGORY_ID = "(SELECT id FROM categories WHERE name = :category AND user_id IN (0, :user_id) ORDER BY user_id LIMIT 1)"
+
+# Пользовательская категория попадает в справочник при первой записи с ней
+ENSURE_CATEGORY = """
+INSERT INTO categories (user_id, name)
+SELECT :user_id, :category
+WHERE NOT EXISTS (SELECT 1 FROM categories WHERE name = :category AND user_id IN (0, :user_id))
+"""
+
+INSERT_ENTRY = f"""
+INSERT INTO entries (user_id, text, category_id) VALUES (:user_id, :text, {CATEGORY_ID})
+"""
+
+# Несколько записей одним INSERT: :items - JSON-массив [текст, категория] в порядке добавления
+# (id выдаются по возрастанию в этом же порядке)
+INSERT_ENTRIES = """
+INSERT INTO entries (user_id, text, category_id)
+SELECT :user_id, json_extract(value, '$[0]'),
+       (SELECT id FROM categories WHERE name = json_extract(value, '$[1]') AND user_id IN (0, :user_id) ORDER BY user_id LIMIT 1)
+FROM json_each(:items)
+ORDER BY key
+RETURNING id
+"""
+
+# Сводная таблица: количество записей по дням и категориям (обновляется при добавлении записи)
+CREATE_DAILY_CATEGORY_COUNTS_TABLE = """
+CREATE TABLE IF NOT EXISTS daily_category_counts (
+    user_id INTEGER NOT NULL,
+    day DATE NOT NULL,
+    category_id INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, category_id)
+) WITHOUT ROWID
+"""
+
+INCREMENT_DAILY_CATEGORY_COUNT = """
+INSERT INTO daily_category_counts (user_id, day, category_id, count)
+SELECT user_id, DATE(datetime), category_id, 1 FROM entries WHERE id = ?
+ON CONFLICT (user_id, day, category_id) DO UPDATE SET count = count + 1
+"""
+
+INCREMENT_DAILY_CATEGORY_COUNTS = """
+INSERT INTO daily_category_counts (user_id, day, category_id, count)
+SELECT user_id, DATE(datetime), category_id, COUNT(*) FROM entries
+WHERE id IN (SELECT value FROM json_each(?))
+GROUP BY user_id, DATE(datetime), category_id
+ON CONFLICT (user_id, day, category_id) DO UPDATE SET count = count + excluded.count
+"""
+
+GET_DAILY_CATEGORY_COUNTS = """
+SELECT d.day, c.name, d.count
+FROM daily_category_counts d
+JOIN categories c ON c.id = d.category_id
+WHERE d.user_id = ? AND d.day >= ?
+ORDER BY d.day ASC
 """
 
+BACKFILL_DAILY_CATEGORY_COUNTS = """
+INSERT INTO daily_category_counts (user_id, day, category_id, count)
+SELECT user_id, DATE(datetime), category_id, COUNT(*) FROM entries WHERE TRUE
+GROUP BY user_id, DATE(datetime), category_id
+ON CONFLICT (user_id, day, category_id) DO UPDATE SET count = excluded.count
+"""
+
+BACKFILL_DAILY_CATEGORY_COUNTS_WITH_ARCHIVE = """
+INSERT INTO daily_category_counts (user_id, day, category_id, count)
+SELECT user_id, DATE(datetime), category_id, COUNT(*) FROM (
+    SELECT user_id, datetime, category_id FROM main.entries
+    UNION ALL
+    SELECT user_id, datetime, category_id FROM archive.entries
+) WHERE TRUE
+GROUP BY user_id, DATE(datetime), category_id
+ON CONFLICT (user_id, day, category_id) DO UPDATE SET count = excluded.count
+"""
+
+# Условия по диапазону datetime (а не DATE(datetime) = ...), чтобы работал индекс idx_entries_user_datetime
 GET_TODAY_ENTRIES = """
-SELECT text, category, datetime 
-FROM entries 
-WHERE user_id = ? AND DATE(datetime) = DATE('now', 'localtime')
-ORDER BY datetime DESC
+SELECT e.text, c.name AS category, e.datetime 
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = ? AND e.datetime >= DATE('now', 'localtime') AND e.datetime < DATE('now', 'localtime', '+1 day')
+ORDER BY e.datetime DESC
+"""
+
+# /today: последние записи за день (не больше LIMIT) и полные счетчики по категориям
+GET_TODAY_VIEW_ENTRIES = """
+SELECT e.text, c.name AS category, e.datetime 
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = ? AND e.datetime >= DATE('now', 'localtime') AND e.datetime < DATE('now', 'localtime', '+1 day')
+ORDER BY e.datetime DESC
+LIMIT ?
+"""
+
+# Группировка по целому category_id, имена - только для итоговых строк
+GET_TODAY_CATEGORY_COUNTS = """
+SELECT c.name, t.count
+FROM (
+    SELECT category_id, COUNT(*) AS count 
+    FROM entries 
+    WHERE user_id = ? AND datetime >= DATE('now', 'localtime') AND datetime < DATE('now', 'localtime', '+1 day')
+    GROUP BY category_id
+) t
+JOIN categories c ON c.id = t.category_id
+ORDER BY t.count DESC, c.name
 """
 
 GET_ENTRIES_BY_DATE = """
-SELECT text, category, datetime 
-FROM entries 
-WHERE user_id = ? AND DATE(datetime) = ?
-ORDER BY datetime DESC
+SELECT e.text, c.name AS category, e.datetime 
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = :user_id AND e.datetime >= :day AND e.datetime < DATE(:day, '+1 day')
+ORDER BY e.datetime DESC
 """
 
+# Встроенный LIKE в SQLite не учитывает регистр только для ASCII, поэтому для кириллицы
+# текст приводится к нижнему регистру функцией unicode_lower (регистрируется в Database.connect)
 SEARCH_ENTRIES = """
-SELECT text, category, datetime 
-FROM entries 
-WHERE user_id = ? AND text LIKE ?
+SELECT e.text, c.name AS category, e.datetime 
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = :user_id AND unicode_lower(e.text) LIKE :pattern
+ORDER BY e.datetime DESC
+"""
+
+# Записи по списку id (JSON-массив) - для /similar
+GET_ENTRIES_BY_IDS = """
+SELECT e.id, e.text, c.name AS category, e.datetime
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = :user_id AND e.id IN (SELECT value FROM json_each(:ids))
+"""
+
+# Архивная база (холодные месяцы) подключается через ATTACH под именем archive
+ATTACH_ARCHIVE = """
+ATTACH DATABASE ? AS archive
+"""
+
+CREATE_ARCHIVE_ENTRIES_TABLE = """
+CREATE TABLE IF NOT EXISTS archive.entries (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    category_id INTEGER NOT NULL
+)
+"""
+
+CREATE_ARCHIVE_ENTRIES_INDEX = """
+CREATE INDEX IF NOT EXISTS archive.idx_archive_entries_user_datetime ON entries(user_id, datetime)
+"""
+
+CREATE_ARCHIVE_ENTRIES_USER_ID_INDEX = """
+CREATE INDEX IF NOT EXISTS archive.idx_archive_entries_user_id ON entries(user_id)
+"""
+
+# Справочник категорий один - в основной базе (main.categories)
+GET_ENTRIES_BY_DATE_WITH_ARCHIVE = """
+SELECT e.text, c.name AS category, e.datetime AS datetime
+FROM main.entries e
+JOIN main.categories c ON c.id = e.category_id
+WHERE e.user_id = :user_id AND e.datetime >= :day AND e.datetime < DATE(:day, '+1 day')
+UNION ALL
+SELECT e.text, c.name AS category, e.datetime AS datetime
+FROM archive.entries e
+JOIN main.categories c ON c.id = e.category_id
+WHERE e.user_id = :user_id AND e.datetime >= :day AND e.datetime < DATE(:day, '+1 day')
 ORDER BY datetime DESC
 """
 
+SEARCH_ENTRIES_WITH_ARCHIVE = """
+SELECT e.text, c.name AS category, e.datetime AS datetime
+FROM main.entries e
+JOIN main.categories c ON c.id = e.category_id
+WHERE e.user_id = :user_id AND unicode_lower(e.text) LIKE :pattern
+UNION ALL
+SELECT e.text, c.name AS category, e.datetime AS datetime
+FROM archive.entries e
+JOIN main.categories c ON c.id = e.category_id
+WHERE e.user_id = :user_id AND unicode_lower(e.text) LIKE :pattern
+ORDER BY datetime DESC
+"""
+
+GET_ENTRIES_BY_IDS_WITH_ARCHIVE = """
+SELECT e.id, e.text, c.name AS category, e.datetime
+FROM main.entries e
+JOIN main.categories c ON c.id = e.category_id
+WHERE e.user_id = :user_id AND e.id IN (SELECT value FROM json_each(:ids))
+UNION ALL
+SELECT e.id, e.text, c.name AS category, e.datetime
+FROM archive.entries e
+JOIN main.categories c ON c.id = e.category_id
+WHERE e.user_id = :user_id AND e.id IN (SELECT value FROM json_each(:ids))
+"""
+
+# Перенос старых записей в архив порциями по возрастанию id. Записи, на которые ссылаются
+# напоминания, остаются в основной базе: иначе ON DELETE CASCADE удалил бы и сами напоминания.
+ARCHIVABLE_ENTRIES_CONDITION = (
+    "e.datetime < :cutoff AND NOT EXISTS (SELECT 1 FROM main.reminders r WHERE r.entry_id = e.id)"
+)
+
+GET_ARCHIVE_BATCH_MAX_ID = f"""
+SELECT MAX(id) FROM (
+    SELECT e.id FROM main.entries e
+    WHERE {ARCHIVABLE_ENTRIES_CONDITION}
+    ORDER BY e.id
+    LIMIT :batch_size
+)
+"""
+
+COPY_ENTRIES_TO_ARCHIVE = f"""
+INSERT OR IGNORE INTO archive.entries (id, user_id, text, datetime, category_id)
+SELECT e.id, e.user_id, e.text, e.datetime, e.category_id
+FROM main.entries e
+WHERE e.id <= :max_id AND {ARCHIVABLE_ENTRIES_CONDITION}
+"""
+
+DELETE_ARCHIVED_ENTRIES = f"""
+DELETE FROM main.entries AS e
+WHERE e.id <= :max_id AND {ARCHIVABLE_ENTRIES_CONDITION}
+"""
+
 # SQL-запросы для работы с пользовательскими категориями
 INSERT_CUSTOM_CATEGORY = """
 INSERT OR REPLACE INTO custom_categories (user_id, name, keywords) VALUES (?, ?, ?)
@@ -84,37 +332,377 @@ SELECT user_id, name, keywords FROM custom_categories
 """
 
 # SQL-запросы для работы с напоминаниями
+# Текст напоминания - текст его записи (копия в reminders не хранится). Записи с напоминаниями
+# не переносятся в архив, поэтому соединение всегда с main.entries
 INSERT_REMINDER = """
-INSERT INTO reminders (user_id, entry_id, text, reminder_time) VALUES (?, ?, ?, ?)
+INSERT INTO reminders (user_id, entry_id, reminder_time) VALUES (?, ?, ?)
+"""
+
+# Несколько напоминаний одним INSERT: :items - JSON-массив [id записи, время]
+INSERT_REMINDERS = """
+INSERT INTO reminders (user_id, entry_id, reminder_time)
+SELECT :user_id, json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(:items)
 """
 
 GET_PENDING_REMINDERS = """
-SELECT id, user_id, text, reminder_time 
-FROM reminders 
-WHERE reminder_time <= datetime('now', 'localtime') AND is_sent = FALSE
-ORDER BY reminder_time ASC
+SELECT r.id, r.user_id, e.text, r.reminder_time 
+FROM reminders r
+JOIN entries e ON e.id = r.entry_id
+WHERE r.reminder_time <= datetime('now', 'localtime') AND r.is_sent = FALSE
+ORDER BY r.reminder_time ASC
 """
 
 MARK_REMINDER_SENT = """
 UPDATE reminders SET is_sent = TRUE WHERE id = ?
 """
 
+# Выборка наступивших напоминаний с одновременной отметкой: второй планировщик их уже не получит
+CLAIM_DUE_REMINDERS = """
+UPDATE reminders SET is_sent = TRUE 
+WHERE id IN (
+    SELECT id FROM reminders 
+    WHERE reminder_time <= datetime('now', 'localtime') AND is_sent = FALSE
+    ORDER BY reminder_time ASC
+    LIMIT ?
+)
+RETURNING id, user_id, (SELECT text FROM entries WHERE entries.id = reminders.entry_id), reminder_time
+"""
+
+RELEASE_REMINDER = """
+UPDATE reminders SET is_sent = FALSE WHERE id = ?
+"""
+
+COUNT_DUE_REMINDERS = """
+SELECT COUNT(*) FROM reminders WHERE reminder_time <= datetime('now', 'localtime') AND is_sent = FALSE
+"""
+
 GET_USER_REMINDERS = """
-SELECT id, text, reminder_time, is_sent 
-FROM reminders 
-WHERE user_id = ? 
-ORDER BY reminder_time DESC
-""" 
+SELECT r.id, e.text, r.reminder_time, r.is_sent 
+FROM reminders r
+JOIN entries e ON e.id = r.entry_id
+WHERE r.user_id = ? 
+ORDER BY r.reminder_time DESC
+"""
+
+# Состояния диалогов (FSM aiogram): ключ - StorageKey, data - JSON, expires_at - время в секундах Unix
+CREATE_FSM_STATES_TABLE = """
+CREATE TABLE IF NOT EXISTS fsm_states (
+    storage_key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    expires_at REAL NOT NULL
+)
+"""
+
+CREATE_FSM_STATES_EXPIRES_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_fsm_states_expires ON fsm_states(expires_at)
+"""
+
+GET_FSM_RECORD = """
+SELECT state, data FROM fsm_states WHERE storage_key = ? AND expires_at > ?
+"""
+
+SET_FSM_RECORD = """
+INSERT INTO fsm_states (storage_key, state, data, expires_at) VALUES (?, ?, ?, ?)
+ON CONFLICT(storage_key) DO UPDATE SET state = excluded.state, data = excluded.data, expires_at = excluded.expires_at
+"""
+
+DELETE_FSM_RECORD = """
+DELETE FROM fsm_states WHERE storage_key = ?
+"""
+
+DELETE_EXPIRED_FSM_RECORDS = """
+DELETE FROM fsm_states WHERE expires_at <= ?
+"""
+
+# Еженедельная сводка: подписки пользователей и контрольные точки рассылки
+CREATE_DIGEST_SUBSCRIPTIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS digest_subscriptions (
+    user_id INTEGER PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# period - неделя сводки (ГГГГ-ММ-ДД понедельника), last_user_id - последний обработанный пользователь
+CREATE_DIGEST_RUNS_TABLE = """
+CREATE TABLE IF NOT EXISTS digest_runs (
+    period TEXT PRIMARY KEY,
+    last_user_id INTEGER NOT NULL DEFAULT 0,
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+SUBSCRIBE_DIGEST = """
+INSERT INTO digest_subscriptions (user_id) VALUES (?) ON CONFLICT(user_id) DO NOTHING
+"""
+
+UNSUBSCRIBE_DIGEST = """
+DELETE FROM digest_subscriptions WHERE user_id = ?
+"""
+
+IS_DIGEST_SUBSCRIBED = """
+SELECT 1 FROM digest_subscriptions WHERE user_id = ?
+"""
+
+GET_DIGEST_CHECKPOINT = """
+SELECT last_user_id, completed FROM digest_runs WHERE period = ?
+"""
+
+SET_DIGEST_CHECKPOINT = """
+INSERT INTO digest_runs (period, last_user_id, completed) VALUES (?, ?, ?)
+ON CONFLICT(period) DO UPDATE SET last_user_id = excluded.last_user_id, completed = excluded.completed,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+# Записи недели всех подписчиков по возрастанию (user_id, id), страницами (keyset): каждая
+# страница - короткий запрос, продолжающий после последней строки предыдущей
+# (индекс idx_entries_user_datetime)
+ITER_DIGEST_ENTRIES = """
+SELECT e.id, e.user_id, e.text, c.name
+FROM digest_subscriptions s
+JOIN entries e ON e.user_id = s.user_id
+JOIN categories c ON c.id = e.category_id
+WHERE s.user_id >= :after_user_id AND (e.user_id, e.id) > (:after_user_id, :after_id)
+    AND e.datetime >= :since AND e.datetime < :until
+ORDER BY e.user_id, e.id
+LIMIT :limit
+"""
+
+ITER_DIGEST_REMINDERS = """
+SELECT r.id, r.user_id, e.text, r.reminder_time
+FROM digest_subscriptions s
+JOIN reminders r ON r.user_id = s.user_id
+JOIN entries e ON e.id = r.entry_id
+WHERE s.user_id >= :after_user_id AND (r.user_id, r.id) > (:after_user_id, :after_id)
+    AND r.is_sent = FALSE AND r.reminder_time >= :since AND r.reminder_time < :until
+ORDER BY r.user_id, r.id
+LIMIT :limit
+"""
+
+# SQL-запросы для экспорта (потоковое чтение всех данных пользователя)
+# Страницы по возрастанию id (keyset): каждая страница - отдельный короткий запрос
+EXPORT_ENTRIES = """
+SELECT e.id, e.text, c.name AS category, e.datetime
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = :user_id AND e.id > :after_id
+ORDER BY e.id ASC
+LIMIT :limit
+"""
+
+EXPORT_ENTRIES_WITH_ARCHIVE = """
+SELECT * FROM (
+    SELECT e.id AS id, e.text, c.name AS category, e.datetime
+    FROM main.entries e JOIN main.categories c ON c.id = e.category_id
+    WHERE e.user_id = :user_id AND e.id > :after_id ORDER BY e.id LIMIT :limit
+)
+UNION ALL
+SELECT * FROM (
+    SELECT e.id AS id, e.text, c.name AS category, e.datetime
+    FROM archive.entries e JOIN main.categories c ON c.id = e.category_id
+    WHERE e.user_id = :user_id AND e.id > :after_id ORDER BY e.id LIMIT :limit
+)
+ORDER BY id ASC
+LIMIT :limit
+"""
+
+EXPORT_REMINDERS = """
+SELECT r.id, r.entry_id, e.text, r.reminder_time, r.is_sent
+FROM reminders r
+JOIN entries e ON e.id = r.entry_id
+WHERE r.user_id = :user_id AND r.id > :after_id
+ORDER BY r.id ASC
+LIMIT :limit
+"""
+
+# SQL-запросы для переноса данных между бэкендами (tools.migrate): страницы по возрастанию id
+# (keyset) и вставка с исходными id; уже перенесенные строки пропускаются
+MIGRATE_EXPORT_CUSTOM_CATEGORIES = """
+SELECT id, user_id, name, keywords FROM custom_categories
+WHERE id > :after_id
+ORDER BY id ASC
+LIMIT :limit
+"""
+
+MIGRATE_EXPORT_ENTRIES = """
+SELECT e.id, e.user_id, e.text, c.name AS category, e.datetime
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.id > :after_id
+ORDER BY e.id ASC
+LIMIT :limit
+"""
+
+# Каждая часть берет не больше :limit строк по своему индексу id, затем части сливаются
+MIGRATE_EXPORT_ENTRIES_WITH_ARCHIVE = """
+SELECT * FROM (
+    SELECT e.id AS id, e.user_id, e.text, c.name AS category, e.datetime
+    FROM main.entries e JOIN main.categories c ON c.id = e.category_id
+    WHERE e.id > :after_id ORDER BY e.id LIMIT :limit
+)
+UNION ALL
+SELECT * FROM (
+    SELECT e.id AS id, e.user_id, e.text, c.name AS category, e.datetime
+    FROM archive.entries e JOIN main.categories c ON c.id = e.category_id
+    WHERE e.id > :after_id ORDER BY e.id LIMIT :limit
+)
+ORDER BY id ASC
+LIMIT :limit
+"""
+
+MIGRATE_EXPORT_REMINDERS = """
+SELECT id, user_id, entry_id, reminder_time, is_sent FROM reminders
+WHERE id > :after_id
+ORDER BY id ASC
+LIMIT :limit
+"""
+
+MIGRATE_IMPORT_CUSTOM_CATEGORY = """
+INSERT OR IGNORE INTO custom_categories (id, user_id, name, keywords) VALUES (?, ?, ?, ?)
+"""
+
+MIGRATE_IMPORT_ENTRY = f"""
+INSERT OR IGNORE INTO entries (id, user_id, text, category_id, datetime)
+VALUES (:id, :user_id, :text, {CATEGORY_ID}, :datetime)
+"""
+
+# Запись, уже перенесенная в архив, не возвращается в основную базу
+MIGRATE_IMPORT_ENTRY_WITH_ARCHIVE = f"""
+INSERT OR IGNORE INTO main.entries (id, user_id, text, category_id, datetime)
+SELECT :id, :user_id, :text, {CATEGORY_ID}, :datetime
+WHERE NOT EXISTS (SELECT 1 FROM archive.entries WHERE id = :id)
+"""
+
+# Напоминание без своей записи пропускается (внешний ключ reminders.entry_id)
+MIGRATE_IMPORT_REMINDER = """
+INSERT OR IGNORE INTO reminders (id, user_id, entry_id, reminder_time, is_sent)
+SELECT :id, :user_id, :entry_id, :reminder_time, :is_sent
+WHERE EXISTS (SELECT 1 FROM entries WHERE id = :entry_id)
+"""
+
+# Переход на схему 4: категория записи - id из справочника categories, у напоминаний нет копии текста.
+# {schema} - main или archive; справочник всегда в main. Записи переводятся порциями по диапазонам id,
+# каждая порция - отдельная транзакция
+GET_TABLE_COLUMNS = """
+SELECT name FROM pragma_table_info(?, ?)
+"""
+
+FILL_USER_CATEGORIES = """
+INSERT OR IGNORE INTO main.categories (user_id, name)
+SELECT DISTINCT user_id, category FROM {schema}.entries
+WHERE category NOT IN (SELECT name FROM main.categories WHERE user_id = 0)
+"""
+
+ADD_ENTRIES_CATEGORY_ID = """
+ALTER TABLE {schema}.entries ADD COLUMN category_id INTEGER
+"""
+
+GET_ENTRIES_ID_RANGE = """
+SELECT MIN(id), MAX(id) FROM {schema}.entries
+"""
+
+FILL_ENTRIES_CATEGORY_ID = """
+UPDATE {schema}.entries SET category_id = (
+    SELECT c.id FROM main.categories c
+    WHERE c.name = entries.category AND c.user_id IN (0, entries.user_id)
+    ORDER BY c.user_id LIMIT 1
+)
+WHERE id BETWEEN ? AND ?
+"""
+
+DROP_ENTRIES_CATEGORY = """
+ALTER TABLE {schema}.entries DROP COLUMN category
+"""
+
+DROP_REMINDERS_TEXT = """
+ALTER TABLE main.reminders DROP COLUMN text
+"""
+
+# Сводную таблицу проще пересчитать заново (backfill), чем переводить
+DROP_DAILY_CATEGORY_COUNTS = """
+DROP TABLE main.daily_category_counts
+"""
 
 # PostgreSQL запросы
+CREATE_SCHEMA_VERSION_TABLE_POSTGRES = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+GET_SCHEMA_VERSION_POSTGRES = """
+SELECT version FROM schema_version WHERE id = 1
+"""
+
+SET_SCHEMA_VERSION_POSTGRES = """
+INSERT INTO schema_version (id, version) VALUES (1, $1)
+ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, updated_at = CURRENT_TIMESTAMP
+"""
+
+CREATE_CATEGORIES_TABLE_POSTGRES = """
+CREATE TABLE IF NOT EXISTS categories (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL DEFAULT 0,
+    name TEXT NOT NULL,
+    UNIQUE(user_id, name)
+)
+"""
+
+INSERT_SYSTEM_CATEGORY_POSTGRES = """
+INSERT INTO categories (user_id, name) VALUES (0, $1) ON CONFLICT (user_id, name) DO NOTHING
+"""
+
+# id категории по имени (системная важнее пользовательской); новая пользовательская категория
+# добавляется в справочник. Повторный SELECT после ON CONFLICT видит строку параллельной транзакции
+CREATE_RESOLVE_CATEGORY_ID_FUNCTION_POSTGRES = """
+CREATE OR REPLACE FUNCTION resolve_category_id(p_user_id BIGINT, p_name TEXT) RETURNS INTEGER AS $$
+DECLARE
+    result INTEGER;
+BEGIN
+    SELECT id INTO result FROM categories
+    WHERE name = p_name AND user_id IN (0, p_user_id)
+    ORDER BY user_id LIMIT 1;
+    IF result IS NULL THEN
+        INSERT INTO categories (user_id, name) VALUES (p_user_id, p_name)
+        ON CONFLICT (user_id, name) DO NOTHING
+        RETURNING id INTO result;
+    END IF;
+    IF result IS NULL THEN
+        SELECT id INTO result FROM categories WHERE user_id = p_user_id AND name = p_name;
+    END IF;
+    RETURN result;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# Таблица записей разбита на помесячные секции по datetime. Первичный ключ
+# секционированной таблицы обязан включать ключ секционирования.
 CREATE_ENTRIES_TABLE_POSTGRES = """
 CREATE TABLE IF NOT EXISTS entries (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     user_id BIGINT NOT NULL,
     text TEXT NOT NULL,
-    datetime TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    category TEXT NOT NULL
-)
+    datetime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    category_id INTEGER NOT NULL REFERENCES categories(id),
+    PRIMARY KEY (id, datetime)
+) PARTITION BY RANGE (datetime)
+"""
+
+IS_ENTRIES_PARTITIONED_POSTGRES = """
+SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'entries'::regclass)
+"""
+
+# {parent} - entries или entries_partitioned при переводе старой таблицы на секции
+CREATE_ENTRIES_PARTITION_POSTGRES = """
+CREATE TABLE IF NOT EXISTS entries_{suffix} PARTITION OF {parent}
+FOR VALUES FROM ('{start}') TO ('{end}')
+"""
+
+CREATE_ENTRIES_DEFAULT_PARTITION_POSTGRES = """
+CREATE TABLE IF NOT EXISTS entries_default PARTITION OF {parent} DEFAULT
 """
 
 CREATE_ENTRIES_INDEX_POSTGRES = """
@@ -136,7 +724,6 @@ CREATE TABLE IF NOT EXISTS reminders (
     id SERIAL PRIMARY KEY,
     user_id BIGINT NOT NULL,
     entry_id INTEGER NOT NULL,
-    text TEXT NOT NULL,
     reminder_time TIMESTAMP NOT NULL,
     is_sent BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -147,30 +734,143 @@ CREATE_REMINDERS_INDEX_POSTGRES = """
 CREATE INDEX IF NOT EXISTS idx_reminders_user_time ON reminders(user_id, reminder_time)
 """
 
+CREATE_DUE_REMINDERS_INDEX_POSTGRES = """
+CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(reminder_time) WHERE is_sent = FALSE
+"""
+
+CREATE_DAILY_CATEGORY_COUNTS_TABLE_POSTGRES = """
+CREATE TABLE IF NOT EXISTS daily_category_counts (
+    user_id BIGINT NOT NULL,
+    day DATE NOT NULL,
+    category_id INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, category_id)
+)
+"""
+
+# Сводная таблица обновляется триггером, так что любая вставка в entries учитывается
+CREATE_DAILY_CATEGORY_COUNTS_FUNCTION_POSTGRES = """
+CREATE OR REPLACE FUNCTION increment_daily_category_count() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO daily_category_counts (user_id, day, category_id, count)
+    VALUES (NEW.user_id, NEW.datetime::date, NEW.category_id, 1)
+    ON CONFLICT (user_id, day, category_id) DO UPDATE SET count = daily_category_counts.count + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+CREATE_DAILY_CATEGORY_COUNTS_TRIGGER_POSTGRES = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger
+                   WHERE tgname = 'trg_entries_daily_category_counts' AND tgrelid = 'entries'::regclass) THEN
+        CREATE TRIGGER trg_entries_daily_category_counts
+        AFTER INSERT ON entries
+        FOR EACH ROW EXECUTE FUNCTION increment_daily_category_count();
+    END IF;
+END;
+$$
+"""
+
+GET_DAILY_CATEGORY_COUNTS_POSTGRES = """
+SELECT d.day, c.name AS category, d.count
+FROM daily_category_counts d
+JOIN categories c ON c.id = d.category_id
+WHERE d.user_id = $1 AND d.day >= $2::text::date
+ORDER BY d.day ASC
+"""
+
+BACKFILL_DAILY_CATEGORY_COUNTS_POSTGRES = """
+INSERT INTO daily_category_counts (user_id, day, category_id, count)
+SELECT user_id, datetime::date, category_id, COUNT(*) FROM entries
+GROUP BY user_id, datetime::date, category_id
+ON CONFLICT (user_id, day, category_id) DO UPDATE SET count = EXCLUDED.count
+"""
+
 # PostgreSQL запросы для работы с записями
 INSERT_ENTRY_POSTGRES = """
-INSERT INTO entries (user_id, text, category) VALUES ($1, $2, $3) RETURNING id
+INSERT INTO entries (user_id, text, category_id) VALUES ($1, $2, resolve_category_id($1, $3)) RETURNING id
+"""
+
+# Запись и (если $4 не NULL) напоминание к ней одним запросом: оба INSERT в одной транзакции
+INSERT_ENTRY_WITH_REMINDER_POSTGRES = """
+WITH new_entry AS (
+    INSERT INTO entries (user_id, text, category_id) VALUES ($1, $2, resolve_category_id($1, $3)) RETURNING id
+), new_reminder AS (
+    INSERT INTO reminders (user_id, entry_id, reminder_time)
+    SELECT $1, id, $4::text::timestamp FROM new_entry WHERE $4::text IS NOT NULL
+)
+SELECT id FROM new_entry
+"""
+
+# Несколько записей и их напоминаний одним запросом: $2, $3, $4 - массивы текстов, категорий
+# и времени напоминаний (NULL - без напоминания). id берутся из последовательности заранее,
+# чтобы напоминания ссылались на свои записи; результат - id в порядке массивов
+INSERT_ENTRIES_WITH_REMINDERS_POSTGRES = """
+WITH items AS (
+    SELECT nextval(pg_get_serial_sequence('entries', 'id'))::integer AS id, t.text, t.category, t.reminder_time, t.position
+    FROM unnest($2::text[], $3::text[], $4::text[]) WITH ORDINALITY AS t(text, category, reminder_time, position)
+), new_entries AS (
+    INSERT INTO entries (id, user_id, text, category_id)
+    SELECT id, $1, text, resolve_category_id($1, category) FROM items
+), new_reminders AS (
+    INSERT INTO reminders (user_id, entry_id, reminder_time)
+    SELECT $1, id, reminder_time::timestamp FROM items WHERE reminder_time IS NOT NULL
+)
+SELECT id FROM items ORDER BY position
 """
 
 GET_TODAY_ENTRIES_POSTGRES = """
-SELECT text, category, datetime 
-FROM entries 
-WHERE user_id = $1 AND DATE(datetime) = CURRENT_DATE
-ORDER BY datetime DESC
+SELECT e.text, c.name AS category, e.datetime 
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = $1 AND e.datetime >= CURRENT_DATE AND e.datetime < CURRENT_DATE + 1
+ORDER BY e.datetime DESC
+"""
+
+GET_TODAY_VIEW_ENTRIES_POSTGRES = """
+SELECT e.text, c.name AS category, e.datetime 
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = $1 AND e.datetime >= CURRENT_DATE AND e.datetime < CURRENT_DATE + 1
+ORDER BY e.datetime DESC
+LIMIT $2
+"""
+
+GET_TODAY_CATEGORY_COUNTS_POSTGRES = """
+SELECT c.name AS category, t.count
+FROM (
+    SELECT category_id, COUNT(*) AS count 
+    FROM entries 
+    WHERE user_id = $1 AND datetime >= CURRENT_DATE AND datetime < CURRENT_DATE + 1
+    GROUP BY category_id
+) t
+JOIN categories c ON c.id = t.category_id
+ORDER BY t.count DESC, c.name
 """
 
 GET_ENTRIES_BY_DATE_POSTGRES = """
-SELECT text, category, datetime 
-FROM entries 
-WHERE user_id = $1 AND DATE(datetime) = $2
-ORDER BY datetime DESC
+SELECT e.text, c.name AS category, e.datetime 
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = $1 AND e.datetime >= $2::text::date AND e.datetime < $2::text::date + 1
+ORDER BY e.datetime DESC
 """
 
 SEARCH_ENTRIES_POSTGRES = """
-SELECT text, category, datetime 
-FROM entries 
-WHERE user_id = $1 AND text ILIKE $2
-ORDER BY datetime DESC
+SELECT e.text, c.name AS category, e.datetime 
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = $1 AND e.text ILIKE $2
+ORDER BY e.datetime DESC
+"""
+
+GET_ENTRIES_BY_IDS_POSTGRES = """
+SELECT e.id, e.text, c.name AS category, e.datetime
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = $1 AND e.id = ANY($2::int[])
 """
 
 # PostgreSQL запросы для работы с пользовательскими категориями
@@ -187,25 +887,343 @@ GET_ALL_CUSTOM_CATEGORIES_POSTGRES = """
 SELECT user_id, name, keywords FROM custom_categories
 """
 
-# PostgreSQL запросы для работы с напоминаниями
+# PostgreSQL запросы для работы с напоминаниями (текст - из записи)
 INSERT_REMINDER_POSTGRES = """
-INSERT INTO reminders (user_id, entry_id, text, reminder_time) VALUES ($1, $2, $3, $4)
+INSERT INTO reminders (user_id, entry_id, reminder_time) VALUES ($1, $2, $3::text::timestamp)
 """
 
 GET_PENDING_REMINDERS_POSTGRES = """
-SELECT id, user_id, text, reminder_time 
-FROM reminders 
-WHERE reminder_time <= CURRENT_TIMESTAMP AND is_sent = FALSE
-ORDER BY reminder_time ASC
+SELECT r.id, r.user_id, e.text, r.reminder_time 
+FROM reminders r
+JOIN entries e ON e.id = r.entry_id
+WHERE r.reminder_time <= CURRENT_TIMESTAMP AND r.is_sent = FALSE
+ORDER BY r.reminder_time ASC
 """
 
 MARK_REMINDER_SENT_POSTGRES = """
 UPDATE reminders SET is_sent = TRUE WHERE id = $1
 """
 
+# SKIP LOCKED: параллельные планировщики разбирают разные напоминания, не ожидая друг друга
+CLAIM_DUE_REMINDERS_POSTGRES = """
+UPDATE reminders r SET is_sent = TRUE 
+FROM (
+    SELECT id FROM reminders 
+    WHERE reminder_time <= CURRENT_TIMESTAMP AND is_sent = FALSE
+    ORDER BY reminder_time ASC
+    LIMIT $1
+    FOR UPDATE SKIP LOCKED
+) due, entries e
+WHERE r.id = due.id AND e.id = r.entry_id
+RETURNING r.id, r.user_id, e.text, r.reminder_time
+"""
+
+RELEASE_REMINDER_POSTGRES = """
+UPDATE reminders SET is_sent = FALSE WHERE id = $1
+"""
+
+COUNT_DUE_REMINDERS_POSTGRES = """
+SELECT COUNT(*) FROM reminders WHERE reminder_time <= CURRENT_TIMESTAMP AND is_sent = FALSE
+"""
+
 GET_USER_REMINDERS_POSTGRES = """
-SELECT id, text, reminder_time, is_sent 
-FROM reminders 
-WHERE user_id = $1 
-ORDER BY reminder_time DESC
-""" 
\ No newline at end of file
+SELECT r.id, e.text, r.reminder_time, r.is_sent 
+FROM reminders r
+JOIN entries e ON e.id = r.entry_id
+WHERE r.user_id = $1 
+ORDER BY r.reminder_time DESC
+""" 
+
+# PostgreSQL запросы для состояний диалогов (FSM)
+CREATE_FSM_STATES_TABLE_POSTGRES = """
+CREATE TABLE IF NOT EXISTS fsm_states (
+    storage_key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    expires_at DOUBLE PRECISION NOT NULL
+)
+"""
+
+CREATE_FSM_STATES_EXPIRES_INDEX_POSTGRES = """
+CREATE INDEX IF NOT EXISTS idx_fsm_states_expires ON fsm_states(expires_at)
+"""
+
+GET_FSM_RECORD_POSTGRES = """
+SELECT state, data FROM fsm_states WHERE storage_key = $1 AND expires_at > $2
+"""
+
+SET_FSM_RECORD_POSTGRES = """
+INSERT INTO fsm_states (storage_key, state, data, expires_at) VALUES ($1, $2, $3, $4)
+ON CONFLICT (storage_key) DO UPDATE SET state = EXCLUDED.state, data = EXCLUDED.data, expires_at = EXCLUDED.expires_at
+"""
+
+DELETE_FSM_RECORD_POSTGRES = """
+DELETE FROM fsm_states WHERE storage_key = $1
+"""
+
+DELETE_EXPIRED_FSM_RECORDS_POSTGRES = """
+DELETE FROM fsm_states WHERE expires_at <= $1
+"""
+
+# PostgreSQL запросы для еженедельной сводки
+CREATE_DIGEST_SUBSCRIPTIONS_TABLE_POSTGRES = """
+CREATE TABLE IF NOT EXISTS digest_subscriptions (
+    user_id BIGINT PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+CREATE_DIGEST_RUNS_TABLE_POSTGRES = """
+CREATE TABLE IF NOT EXISTS digest_runs (
+    period TEXT PRIMARY KEY,
+    last_user_id BIGINT NOT NULL DEFAULT 0,
+    completed BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+SUBSCRIBE_DIGEST_POSTGRES = """
+INSERT INTO digest_subscriptions (user_id) VALUES ($1) ON CONFLICT (user_id) DO NOTHING
+"""
+
+UNSUBSCRIBE_DIGEST_POSTGRES = """
+DELETE FROM digest_subscriptions WHERE user_id = $1
+"""
+
+IS_DIGEST_SUBSCRIBED_POSTGRES = """
+SELECT EXISTS (SELECT 1 FROM digest_subscriptions WHERE user_id = $1)
+"""
+
+GET_DIGEST_CHECKPOINT_POSTGRES = """
+SELECT last_user_id, completed FROM digest_runs WHERE period = $1
+"""
+
+SET_DIGEST_CHECKPOINT_POSTGRES = """
+INSERT INTO digest_runs (period, last_user_id, completed) VALUES ($1, $2, $3)
+ON CONFLICT (period) DO UPDATE SET last_user_id = EXCLUDED.last_user_id, completed = EXCLUDED.completed,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+ITER_DIGEST_ENTRIES_POSTGRES = """
+SELECT e.user_id, e.text, c.name AS category
+FROM digest_subscriptions s
+JOIN entries e ON e.user_id = s.user_id
+JOIN categories c ON c.id = e.category_id
+WHERE s.user_id > $1 AND e.datetime >= $2::text::timestamp AND e.datetime < $3::text::timestamp
+ORDER BY e.user_id, e.id
+"""
+
+ITER_DIGEST_REMINDERS_POSTGRES = """
+SELECT r.user_id, e.text, r.reminder_time
+FROM digest_subscriptions s
+JOIN reminders r ON r.user_id = s.user_id
+JOIN entries e ON e.id = r.entry_id
+WHERE s.user_id > $1 AND r.is_sent = FALSE
+    AND r.reminder_time >= $2::text::timestamp AND r.reminder_time < $3::text::timestamp
+ORDER BY r.user_id, r.reminder_time
+"""
+
+# PostgreSQL запросы для экспорта
+EXPORT_ENTRIES_POSTGRES = """
+SELECT e.id, e.text, c.name AS category, e.datetime
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.user_id = $1 AND e.id > $2
+ORDER BY e.id ASC
+"""
+
+EXPORT_REMINDERS_POSTGRES = """
+SELECT r.id, r.entry_id, e.text, r.reminder_time, r.is_sent
+FROM reminders r
+JOIN entries e ON e.id = r.entry_id
+WHERE r.user_id = $1
+ORDER BY r.id ASC
+"""
+
+# PostgreSQL запросы для переноса данных между бэкендами (см. MIGRATE_EXPORT_ENTRIES и далее для SQLite)
+MIGRATE_EXPORT_CUSTOM_CATEGORIES_POSTGRES = """
+SELECT id, user_id, name, keywords FROM custom_categories
+WHERE id > $1
+ORDER BY id ASC
+LIMIT $2
+"""
+
+MIGRATE_EXPORT_ENTRIES_POSTGRES = """
+SELECT e.id, e.user_id, e.text, c.name AS category, e.datetime
+FROM entries e
+JOIN categories c ON c.id = e.category_id
+WHERE e.id > $1
+ORDER BY e.id ASC
+LIMIT $2
+"""
+
+MIGRATE_EXPORT_REMINDERS_POSTGRES = """
+SELECT id, user_id, entry_id, reminder_time, is_sent FROM reminders
+WHERE id > $1
+ORDER BY id ASC
+LIMIT $2
+"""
+
+# Порция загружается COPY во временную таблицу (строки удаляются при COMMIT),
+# затем переносится в основную таблицу одним INSERT ... SELECT
+CREATE_MIGRATE_CUSTOM_CATEGORIES_STAGE_POSTGRES = """
+CREATE TEMP TABLE IF NOT EXISTS migrate_custom_categories (
+    id INTEGER, user_id BIGINT, name TEXT, keywords TEXT
+) ON COMMIT DELETE ROWS
+"""
+
+CREATE_MIGRATE_ENTRIES_STAGE_POSTGRES = """
+CREATE TEMP TABLE IF NOT EXISTS migrate_entries (
+    id INTEGER, user_id BIGINT, text TEXT, category TEXT, datetime TIMESTAMP
+) ON COMMIT DELETE ROWS
+"""
+
+CREATE_MIGRATE_REMINDERS_STAGE_POSTGRES = """
+CREATE TEMP TABLE IF NOT EXISTS migrate_reminders (
+    id INTEGER, user_id BIGINT, entry_id INTEGER, reminder_time TIMESTAMP, is_sent BOOLEAN
+) ON COMMIT DELETE ROWS
+"""
+
+MIGRATE_IMPORT_CUSTOM_CATEGORIES_POSTGRES = """
+INSERT INTO custom_categories (id, user_id, name, keywords)
+SELECT id, user_id, name, keywords FROM migrate_custom_categories
+ON CONFLICT DO NOTHING
+"""
+
+# Категории порции добавляются в справочник одним запросом (а не resolve_category_id на каждую строку)
+MIGRATE_ENSURE_CATEGORIES_POSTGRES = """
+INSERT INTO categories (user_id, name)
+SELECT DISTINCT s.user_id, s.category FROM migrate_entries s
+WHERE NOT EXISTS (SELECT 1 FROM categories c WHERE c.name = s.category AND c.user_id IN (0, s.user_id))
+ON CONFLICT (user_id, name) DO NOTHING
+"""
+
+# Системная категория важнее пользовательской с тем же именем
+MIGRATE_IMPORT_ENTRIES_POSTGRES = """
+INSERT INTO entries (id, user_id, text, category_id, datetime)
+SELECT s.id, s.user_id, s.text, COALESCE(system_category.id, user_category.id), s.datetime
+FROM migrate_entries s
+LEFT JOIN categories system_category ON system_category.user_id = 0 AND system_category.name = s.category
+LEFT JOIN categories user_category ON user_category.user_id = s.user_id AND user_category.name = s.category
+ON CONFLICT DO NOTHING
+"""
+
+MIGRATE_IMPORT_REMINDERS_POSTGRES = """
+INSERT INTO reminders (id, user_id, entry_id, reminder_time, is_sent)
+SELECT id, user_id, entry_id, reminder_time, is_sent FROM migrate_reminders
+ON CONFLICT DO NOTHING
+"""
+
+# После вставки с явными id последовательности SERIAL продолжают с максимального id
+RESET_ID_SEQUENCES_POSTGRES = """
+SELECT
+    setval(pg_get_serial_sequence('custom_categories', 'id'), COALESCE((SELECT MAX(id) FROM custom_categories), 0) + 1, false),
+    setval(pg_get_serial_sequence('entries', 'id'), COALESCE((SELECT MAX(id) FROM entries), 0) + 1, false),
+    setval(pg_get_serial_sequence('reminders', 'id'), COALESCE((SELECT MAX(id) FROM reminders), 0) + 1, false)
+"""
+
+# PostgreSQL: переход на схему 4 (см. GET_TABLE_COLUMNS и далее для SQLite)
+HAS_COLUMN_POSTGRES = """
+SELECT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = $1 AND column_name = $2
+)
+"""
+
+HAS_TABLE_POSTGRES = """
+SELECT to_regclass($1) IS NOT NULL
+"""
+
+FILL_USER_CATEGORIES_POSTGRES = """
+INSERT INTO categories (user_id, name)
+SELECT DISTINCT user_id, category FROM entries
+WHERE category NOT IN (SELECT name FROM categories WHERE user_id = 0)
+ON CONFLICT (user_id, name) DO NOTHING
+"""
+
+ADD_ENTRIES_CATEGORY_ID_POSTGRES = """
+ALTER TABLE entries ADD COLUMN IF NOT EXISTS category_id INTEGER REFERENCES categories(id)
+"""
+
+GET_ENTRIES_ID_RANGE_POSTGRES = """
+SELECT MIN(id), MAX(id) FROM entries
+"""
+
+FILL_ENTRIES_CATEGORY_ID_POSTGRES = """
+UPDATE entries e SET category_id = (
+    SELECT c.id FROM categories c
+    WHERE c.name = e.category AND c.user_id IN (0, e.user_id)
+    ORDER BY c.user_id LIMIT 1
+)
+WHERE e.id BETWEEN $1 AND $2
+"""
+
+FINISH_ENTRIES_CATEGORY_ID_POSTGRES = """
+ALTER TABLE entries ALTER COLUMN category_id SET NOT NULL, DROP COLUMN category
+"""
+
+DROP_REMINDERS_TEXT_POSTGRES = """
+ALTER TABLE IF EXISTS reminders DROP COLUMN IF EXISTS text
+"""
+
+DROP_DAILY_CATEGORY_COUNTS_POSTGRES = """
+DROP TABLE IF EXISTS daily_category_counts
+"""
+
+# PostgreSQL: переход на схему 7 - перевод несекционированной entries на помесячные секции.
+# Записи только добавляются (не изменяются и не удаляются), поэтому копию можно наполнять
+# порциями без блокировки, а при подмене таблиц докопировать строки, добавленные после.
+IS_ENTRIES_UNPARTITIONED_POSTGRES = """
+SELECT to_regclass('entries') IS NOT NULL
+   AND NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('entries'))
+"""
+
+CREATE_ENTRIES_PARTITIONED_POSTGRES = """
+CREATE TABLE IF NOT EXISTS entries_partitioned (
+    id INTEGER NOT NULL,
+    user_id BIGINT NOT NULL,
+    text TEXT NOT NULL,
+    datetime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    category_id INTEGER NOT NULL REFERENCES categories(id),
+    PRIMARY KEY (id, datetime)
+) PARTITION BY RANGE (datetime)
+"""
+
+GET_ENTRIES_DATETIME_RANGE_POSTGRES = """
+SELECT MIN(datetime)::date, MAX(datetime)::date FROM entries
+"""
+
+GET_ENTRIES_PARTITIONED_LAST_ID_POSTGRES = """
+SELECT COALESCE(MAX(id), 0) FROM entries_partitioned
+"""
+
+COPY_ENTRIES_TO_PARTITIONED_POSTGRES = """
+INSERT INTO entries_partitioned (id, user_id, text, datetime, category_id)
+SELECT id, user_id, text, datetime, category_id FROM entries
+WHERE id BETWEEN $1 AND $2
+ON CONFLICT DO NOTHING
+"""
+
+# Подмена одной транзакцией: докопировать новые строки под блокировкой, переименовать таблицы,
+# передать последовательность id новой таблице и удалить старую (вместе с ее триггером
+# сводной таблицы - его и индекс по (user_id, datetime) затем создает _create_tables)
+SWAP_ENTRIES_PARTITIONED_POSTGRES = """
+DO $$
+DECLARE
+    id_sequence TEXT;
+BEGIN
+    LOCK TABLE entries IN ACCESS EXCLUSIVE MODE;
+    INSERT INTO entries_partitioned (id, user_id, text, datetime, category_id)
+    SELECT id, user_id, text, datetime, category_id FROM entries
+    WHERE id > (SELECT COALESCE(MAX(id), 0) FROM entries_partitioned);
+
+    id_sequence := pg_get_serial_sequence('entries', 'id');
+    ALTER TABLE entries RENAME TO entries_unpartitioned;
+    ALTER INDEX IF EXISTS idx_entries_user_datetime RENAME TO idx_entries_unpartitioned_user_datetime;
+    ALTER TABLE entries_partitioned RENAME TO entries;
+    EXECUTE format('ALTER TABLE entries ALTER COLUMN id SET DEFAULT nextval(%L::regclass)', id_sequence);
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY entries.id', id_sequence);
+    DROP TABLE entries_unpartitioned;
+END;
+$$
+"""
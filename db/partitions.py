@@ -0,0 +1,33 @@
+"""
+Вспомогательные функции для помесячного разбиения таблицы записей
+"""
+
+from datetime import date
+from typing import List, Tuple
+
+
+def add_months(day: date, months: int) -> date:
+    """Первое число месяца, отстоящего от day на months месяцев"""
+    month_index = day.year * 12 + (day.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def month_bounds(day: date, months_back: int, months_ahead: int) -> List[Tuple[str, date, date]]:
+    """
+    Границы месяцев от months_back назад до months_ahead вперед
+
+    Returns:
+        List[Tuple[str, date, date]]: (суффикс_имени, начало, конец) для каждого месяца
+    """
+    bounds = []
+    for offset in range(-months_back, months_ahead + 1):
+        start = add_months(day, offset)
+        end = add_months(start, 1)
+        bounds.append((f"{start.year:04d}_{start.month:02d}", start, end))
+    return bounds
+
+
+def months_between(first: date, last: date) -> List[Tuple[str, date, date]]:
+    """Границы всех месяцев от месяца first до месяца last включительно (формат как у month_bounds)"""
+    months = (last.year * 12 + last.month) - (first.year * 12 + first.month)
+    return month_bounds(first, 0, max(months, 0))
@@ -2,24 +2,33 @@
 Модуль для работы с PostgreSQL базой данных
 """
 
+import asyncio
 import asyncpg
 import logging
-from typing import List, Tuple, Optional
+import time
+from datetime import date, datetime
+from typing import AsyncIterator, List, Tuple, Optional
+from .base import MIGRATION_TABLES, TIMESTAMP_FORMAT, format_timestamp
 from .models import *
+from .partitions import month_bounds, months_between
+from .query_log import QUERY_LOG
 
 logger = logging.getLogger(__name__)
 
 
 class PostgresDatabase:
-    def __init__(self, database_url: str):
+    def __init__(self, database_url: str, partition_months_ahead: int = 3):
         self.database_url = database_url
+        self.partition_months_ahead = partition_months_ahead
         self._pool = None
+        # Месяцы (суффиксы секций entries), секции которых уже созданы при переносе
+        self._import_partitions = set()
 
     async def connect(self):
         """Создание соединения с базой данных"""
         try:
             self._pool = await asyncpg.create_pool(self.database_url)
-            await self._create_tables()
+            await self._ensure_schema()
             logger.info("PostgreSQL база данных успешно подключена")
         except Exception as e:
             logger.error(f"Ошибка подключения к PostgreSQL: {e}")
@@ -31,44 +40,240 @@ class PostgresDatabase:
             await self._pool.close()
             logger.info("Соединение с PostgreSQL закрыто")
 
+    # Запросы с замером в журнале запросов (время включает ожидание соединения из пула)
+
+    async def _fetch(self, query: str, *args) -> list:
+        with QUERY_LOG.track("postgres", query) as trace:
+            async with self._pool.acquire() as conn:
+                rows = await conn.fetch(query, *args)
+            trace.rows = len(rows)
+        return rows
+
+    async def _fetchrow(self, query: str, *args):
+        with QUERY_LOG.track("postgres", query) as trace:
+            async with self._pool.acquire() as conn:
+                row = await conn.fetchrow(query, *args)
+            trace.rows = 0 if row is None else 1
+        return row
+
+    async def _fetchval(self, query: str, *args):
+        with QUERY_LOG.track("postgres", query) as trace:
+            async with self._pool.acquire() as conn:
+                value = await conn.fetchval(query, *args)
+            trace.rows = 1
+        return value
+
+    async def _execute(self, query: str, *args) -> str:
+        with QUERY_LOG.track("postgres", query) as trace:
+            async with self._pool.acquire() as conn:
+                status = await conn.execute(query, *args)
+            # Статус вида 'UPDATE 3' / 'INSERT 0 1': последнее число - количество строк
+            last = status.rsplit(" ", 1)[-1]
+            trace.rows = int(last) if last.isdigit() else None
+        return status
+
+    async def _get_schema_version(self) -> int:
+        """Сохраненная версия схемы; 0, если таблицы версии нет"""
+        # Без журнала запросов: на новой базе отсутствие таблицы - ожидаемая ситуация
+        async with self._pool.acquire() as conn:
+            try:
+                return await conn.fetchval(GET_SCHEMA_VERSION_POSTGRES) or 0
+            except asyncpg.UndefinedTableError:
+                return 0
+
+    async def _ensure_schema(self):
+        """
+        Создание таблиц, только если сохраненная версия схемы устарела
+
+        Секции entries на ближайшие месяцы при актуальной схеме создает run_maintenance
+        (StorageMaintenance запускает его сразу после старта), а не connect.
+        """
+        version = await self._get_schema_version()
+        if version >= SCHEMA_VERSION:
+            logger.info(f"Схема PostgreSQL актуальна (версия {version}), создание таблиц пропущено")
+            return
+        await self._create_tables()
+
+    async def _migrate_categories(self, conn, batch_size: int = 10000) -> bool:
+        """
+        Переход на схему 4: категория записи - id из справочника, у напоминаний нет копии текста
+
+        Записи переводятся порциями по диапазонам id (своя транзакция на порцию). Возвращает True,
+        если старая сводная таблица удалена и ее нужно пересчитать.
+        """
+        if await conn.fetchval(HAS_COLUMN_POSTGRES, 'entries', 'category'):
+            logger.info("Перевод записей PostgreSQL на справочник категорий")
+            await conn.execute(FILL_USER_CATEGORIES_POSTGRES)
+            await conn.execute(ADD_ENTRIES_CATEGORY_ID_POSTGRES)
+            first_id, last_id = await conn.fetchrow(GET_ENTRIES_ID_RANGE_POSTGRES)
+            if first_id is not None:
+                for start in range(first_id, last_id + 1, batch_size):
+                    await conn.execute(FILL_ENTRIES_CATEGORY_ID_POSTGRES, start, start + batch_size - 1)
+                    logger.info(f"Записи: переведено до id {min(start + batch_size - 1, last_id)} из {last_id}")
+            await conn.execute(FINISH_ENTRIES_CATEGORY_ID_POSTGRES)
+
+        await conn.execute(DROP_REMINDERS_TEXT_POSTGRES)
+        if await conn.fetchval(HAS_COLUMN_POSTGRES, 'daily_category_counts', 'category'):
+            await conn.execute(DROP_DAILY_CATEGORY_COUNTS_POSTGRES)
+            return True
+        return False
+
+    async def _partition_entries(self, conn, batch_size: int = 10000):
+        """
+        Переход на схему 7: несекционированная entries переводится на помесячные секции
+
+        Строки копируются в секционированную entries_partitioned порциями по диапазонам id
+        (своя транзакция на порцию, после сбоя копирование продолжается с последнего id),
+        затем одной транзакцией докопируются новые строки и таблицы меняются местами.
+        """
+        if not await conn.fetchval(IS_ENTRIES_UNPARTITIONED_POSTGRES):
+            return
+        logger.info("Перевод таблицы entries PostgreSQL на помесячные секции")
+        await conn.execute(CREATE_ENTRIES_PARTITIONED_POSTGRES)
+        first_day, last_day = await conn.fetchrow(GET_ENTRIES_DATETIME_RANGE_POSTGRES)
+        bounds = month_bounds(date.today(), 1, self.partition_months_ahead)
+        if first_day is not None:
+            bounds = months_between(first_day, last_day) + bounds
+        for suffix, start, end in bounds:
+            await conn.execute(CREATE_ENTRIES_PARTITION_POSTGRES.format(
+                parent="entries_partitioned", suffix=suffix, start=start, end=end))
+        await conn.execute(CREATE_ENTRIES_DEFAULT_PARTITION_POSTGRES.format(parent="entries_partitioned"))
+
+        copied_id = await conn.fetchval(GET_ENTRIES_PARTITIONED_LAST_ID_POSTGRES)
+        _, last_id = await conn.fetchrow(GET_ENTRIES_ID_RANGE_POSTGRES)
+        if last_id is not None:
+            for start in range(copied_id + 1, last_id + 1, batch_size):
+                await conn.execute(COPY_ENTRIES_TO_PARTITIONED_POSTGRES, start, start + batch_size - 1)
+                logger.info(f"Записи: скопировано до id {min(start + batch_size - 1, last_id)} из {last_id}")
+        await conn.execute(SWAP_ENTRIES_PARTITIONED_POSTGRES)
+        logger.info("Таблица entries переведена на помесячные секции")
+
     async def _create_tables(self):
         """Создание таблиц в базе данных"""
         try:
             async with self._pool.acquire() as conn:
+                # Справочник категорий и перевод существующих записей на него
+                await conn.execute(CREATE_CATEGORIES_TABLE_POSTGRES)
+                await conn.executemany(INSERT_SYSTEM_CATEGORY_POSTGRES, [(name,) for name in SYSTEM_CATEGORIES])
+                await conn.execute(CREATE_RESOLVE_CATEGORY_ID_FUNCTION_POSTGRES)
+                rebuild_counts = await self._migrate_categories(conn)
+                # Сводная таблица появляется в базе, созданной раньше нее: заполняем по имеющимся записям
+                if not await conn.fetchval(HAS_TABLE_POSTGRES, 'daily_category_counts'):
+                    rebuild_counts = True
+                await self._partition_entries(conn)
+
                 # Создаем таблицы
                 await conn.execute(CREATE_ENTRIES_TABLE_POSTGRES)
                 await conn.execute(CREATE_CUSTOM_CATEGORIES_TABLE_POSTGRES)
                 await conn.execute(CREATE_REMINDERS_TABLE_POSTGRES)
                 await conn.execute(CREATE_ENTRIES_INDEX_POSTGRES)
                 await conn.execute(CREATE_REMINDERS_INDEX_POSTGRES)
-            logger.info("Таблицы PostgreSQL созданы/проверены")
+                await conn.execute(CREATE_DUE_REMINDERS_INDEX_POSTGRES)
+                await conn.execute(CREATE_DAILY_CATEGORY_COUNTS_TABLE_POSTGRES)
+                await conn.execute(CREATE_DAILY_CATEGORY_COUNTS_FUNCTION_POSTGRES)
+                await conn.execute(CREATE_DAILY_CATEGORY_COUNTS_TRIGGER_POSTGRES)
+                await conn.execute(CREATE_FSM_STATES_TABLE_POSTGRES)
+                await conn.execute(CREATE_FSM_STATES_EXPIRES_INDEX_POSTGRES)
+                await conn.execute(CREATE_DIGEST_SUBSCRIPTIONS_TABLE_POSTGRES)
+                await conn.execute(CREATE_DIGEST_RUNS_TABLE_POSTGRES)
+                if rebuild_counts:
+                    await conn.execute(BACKFILL_DAILY_CATEGORY_COUNTS_POSTGRES)
+            await self._ensure_partitions()
+            async with self._pool.acquire() as conn:
+                await conn.execute(CREATE_SCHEMA_VERSION_TABLE_POSTGRES)
+                await conn.execute(SET_SCHEMA_VERSION_POSTGRES, SCHEMA_VERSION)
+            logger.info(f"Таблицы PostgreSQL созданы/проверены, версия схемы {SCHEMA_VERSION}")
         except Exception as e:
             logger.error(f"Ошибка создания таблиц PostgreSQL: {e}")
             raise
 
+    async def _ensure_partitions(self):
+        """Создание секций entries для текущего и ближайших месяцев"""
+        is_partitioned = await self._fetchval(IS_ENTRIES_PARTITIONED_POSTGRES)
+        if not is_partitioned:
+            # Старую таблицу переводит на секции _partition_entries при переходе на схему 7
+            logger.warning("Таблица entries не секционирована, создание секций пропущено: "
+                           "перевод выполняется при запуске (схема 7) или скриптом partition_entries.sql")
+            return
+
+        for suffix, start, end in month_bounds(date.today(), 1, self.partition_months_ahead):
+            try:
+                await self._execute(CREATE_ENTRIES_PARTITION_POSTGRES.format(
+                    parent="entries", suffix=suffix, start=start, end=end))
+            except Exception as e:
+                # Например, в секции по умолчанию уже есть строки за этот месяц
+                logger.error(f"Ошибка создания секции entries_{suffix}: {e}")
+        await self._execute(CREATE_ENTRIES_DEFAULT_PARTITION_POSTGRES.format(parent="entries"))
+        logger.info("Секции таблицы entries созданы/проверены")
+
+    async def _ensure_month_partitions(self, first: date, last: date):
+        """
+        Секции entries на месяцы от first до last: перенесенные старые записи иначе попали бы
+        в секцию по умолчанию, и секцию за их месяц потом нельзя было бы создать
+        """
+        for suffix, start, end in months_between(first, last):
+            if suffix not in self._import_partitions:
+                await self._execute(CREATE_ENTRIES_PARTITION_POSTGRES.format(
+                    parent="entries", suffix=suffix, start=start, end=end))
+                self._import_partitions.add(suffix)
+
+    async def run_maintenance(self):
+        """Периодическое обслуживание: создание секций entries на ближайшие месяцы, удаление устаревших состояний диалогов"""
+        try:
+            await self._ensure_partitions()
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания секций entries: {e}")
+
+        expired = await self.delete_expired_fsm_records(time.time())
+        if expired:
+            logger.info(f"Удалено устаревших состояний диалогов: {expired}")
+
     async def add_entry(self, user_id: int, text: str, category: str) -> int:
         """Добавление новой записи"""
         try:
-            logger.info(f"Попытка добавления записи: user_id={user_id}, category={category}, text_length={len(text)}")
-            async with self._pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    INSERT_ENTRY_POSTGRES, user_id, text, category
-                )
-                entry_id = row['id']
-            logger.info(f"Запись добавлена для пользователя {user_id}, ID: {entry_id}")
+            logger.debug(f"Попытка добавления записи: user_id={user_id}, category={category}, text_length={len(text)}")
+            row = await self._fetchrow(INSERT_ENTRY_POSTGRES, user_id, text, category)
+            entry_id = row['id']
+            logger.debug(f"Запись добавлена для пользователя {user_id}, ID: {entry_id}")
             return entry_id
         except Exception as e:
             logger.error(f"Ошибка добавления записи: {e}")
             return None
 
+    async def add_entry_with_reminder(self, user_id: int, text: str, category: str,
+                                      reminder_time: Optional[str] = None) -> Optional[int]:
+        """Добавление записи и напоминания к ней (если задано время) одним запросом"""
+        try:
+            entry_id = await self._fetchval(INSERT_ENTRY_WITH_REMINDER_POSTGRES, user_id, text, category, reminder_time)
+            logger.debug(f"Запись {entry_id} добавлена для пользователя {user_id}, напоминание: {reminder_time}")
+            return entry_id
+        except Exception as e:
+            logger.error(f"Ошибка добавления записи с напоминанием: {e}")
+            return None
+
+    async def add_entries_with_reminders(self, user_id: int,
+                                         items: List[Tuple[str, str, Optional[str]]]) -> Optional[List[int]]:
+        """Добавление нескольких записей (text, category, reminder_time) и их напоминаний одним запросом"""
+        try:
+            rows = await self._fetch(
+                INSERT_ENTRIES_WITH_REMINDERS_POSTGRES, user_id,
+                [text for text, _, _ in items], [category for _, category, _ in items],
+                [reminder_time for _, _, reminder_time in items],
+            )
+            entry_ids = [row['id'] for row in rows]
+            logger.debug(f"Добавлено {len(entry_ids)} записей для пользователя {user_id}")
+            return entry_ids
+        except Exception as e:
+            logger.error(f"Ошибка добавления записей: {e}")
+            return None
+
     async def get_today_entries(self, user_id: int) -> List[Tuple[str, str, str]]:
         """Получение записей за сегодня"""
         try:
-            logger.info(f"Запрос записей за сегодня для пользователя {user_id}")
-            async with self._pool.acquire() as conn:
-                rows = await conn.fetch(GET_TODAY_ENTRIES_POSTGRES, user_id)
-                entries = [(row['text'], row['category'], str(row['datetime'])) for row in rows]
-            logger.info(f"Получено {len(entries)} записей за сегодня для пользователя {user_id}")
+            logger.debug(f"Запрос записей за сегодня для пользователя {user_id}")
+            rows = await self._fetch(GET_TODAY_ENTRIES_POSTGRES, user_id)
+            entries = [(row['text'], row['category'], format_timestamp(row['datetime'])) for row in rows]
+            logger.debug(f"Получено {len(entries)} записей за сегодня для пользователя {user_id}")
             for entry in entries:
                 logger.debug(f"Запись: {entry}")
             return entries
@@ -76,13 +281,26 @@ class PostgresDatabase:
             logger.error(f"Ошибка получения записей за сегодня: {e}")
             return []
 
+    async def get_today_view(self, user_id: int,
+                             limit: int = 200) -> Tuple[List[Tuple[str, str, str]], List[Tuple[str, int]]]:
+        """Последние limit записей за сегодня и число записей по категориям за весь день"""
+        try:
+            entry_rows, count_rows = await asyncio.gather(
+                self._fetch(GET_TODAY_VIEW_ENTRIES_POSTGRES, user_id, limit),
+                self._fetch(GET_TODAY_CATEGORY_COUNTS_POSTGRES, user_id),
+            )
+            entries = [(row['text'], row['category'], format_timestamp(row['datetime'])) for row in entry_rows]
+            return entries, [(row['category'], row['count']) for row in count_rows]
+        except Exception as e:
+            logger.error(f"Ошибка получения записей за сегодня: {e}")
+            return [], []
+
     async def get_entries_by_date(self, user_id: int, date: str) -> List[Tuple[str, str, str]]:
         """Получение записей за конкретную дату"""
         try:
-            async with self._pool.acquire() as conn:
-                rows = await conn.fetch(GET_ENTRIES_BY_DATE_POSTGRES, user_id, date)
-                entries = [(row['text'], row['category'], str(row['datetime'])) for row in rows]
-            logger.info(f"Получено {len(entries)} записей за {date} для пользователя {user_id}")
+            rows = await self._fetch(GET_ENTRIES_BY_DATE_POSTGRES, user_id, date)
+            entries = [(row['text'], row['category'], format_timestamp(row['datetime'])) for row in rows]
+            logger.debug(f"Получено {len(entries)} записей за {date} для пользователя {user_id}")
             return entries
         except Exception as e:
             logger.error(f"Ошибка получения записей за дату: {e}")
@@ -92,21 +310,51 @@ class PostgresDatabase:
         """Поиск записей по ключевому слову"""
         try:
             search_pattern = f"%{search_term}%"
-            async with self._pool.acquire() as conn:
-                rows = await conn.fetch(SEARCH_ENTRIES_POSTGRES, user_id, search_pattern)
-                entries = [(row['text'], row['category'], str(row['datetime'])) for row in rows]
-            logger.info(f"Найдено {len(entries)} записей по запросу '{search_term}' для пользователя {user_id}")
+            rows = await self._fetch(SEARCH_ENTRIES_POSTGRES, user_id, search_pattern)
+            entries = [(row['text'], row['category'], format_timestamp(row['datetime'])) for row in rows]
+            logger.debug(f"Найдено {len(entries)} записей по запросу '{search_term}' для пользователя {user_id}")
             return entries
         except Exception as e:
             logger.error(f"Ошибка поиска записей: {e}")
             return []
 
+    async def get_entries_by_ids(self, user_id: int, entry_ids: List[int]) -> List[Tuple[int, str, str, str]]:
+        """Записи пользователя (id, text, category, datetime) по списку id, в произвольном порядке"""
+        if not entry_ids:
+            return []
+        try:
+            rows = await self._fetch(GET_ENTRIES_BY_IDS_POSTGRES, user_id, list(entry_ids))
+            return [(row['id'], row['text'], row['category'], format_timestamp(row['datetime'])) for row in rows]
+        except Exception as e:
+            logger.error(f"Ошибка получения записей по id: {e}")
+            return []
+
+    async def get_daily_category_counts(self, user_id: int, since: str) -> List[Tuple[str, str, int]]:
+        """Получение количества записей по дням и категориям начиная с даты since"""
+        try:
+            rows = await self._fetch(GET_DAILY_CATEGORY_COUNTS_POSTGRES, user_id, since)
+            counts = [(str(row['day']), row['category'], row['count']) for row in rows]
+            logger.debug(f"Получено {len(counts)} строк статистики с {since} для пользователя {user_id}")
+            return counts
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики по категориям: {e}")
+            return []
+
+    async def backfill_daily_category_counts(self) -> bool:
+        """Пересчет сводной таблицы по всем существующим записям (разовая операция)"""
+        try:
+            await self._execute(BACKFILL_DAILY_CATEGORY_COUNTS_POSTGRES)
+            logger.info("Сводная таблица daily_category_counts пересчитана")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка пересчета сводной таблицы: {e}")
+            return False
+
     async def add_custom_category(self, user_id: int, name: str, keywords: str) -> bool:
         """Добавление пользовательской категории"""
         try:
-            async with self._pool.acquire() as conn:
-                await conn.execute(INSERT_CUSTOM_CATEGORY_POSTGRES, user_id, name, keywords)
-            logger.info(f"Пользовательская категория '{name}' добавлена для пользователя {user_id}")
+            await self._execute(INSERT_CUSTOM_CATEGORY_POSTGRES, user_id, name, keywords)
+            logger.debug(f"Пользовательская категория '{name}' добавлена для пользователя {user_id}")
             return True
         except Exception as e:
             logger.error(f"Ошибка добавления пользовательской категории: {e}")
@@ -115,10 +363,9 @@ class PostgresDatabase:
     async def get_custom_categories(self, user_id: int) -> List[Tuple[str, str]]:
         """Получение пользовательских категорий пользователя"""
         try:
-            async with self._pool.acquire() as conn:
-                rows = await conn.fetch(GET_CUSTOM_CATEGORIES_POSTGRES, user_id)
-                categories = [(row['name'], row['keywords']) for row in rows]
-            logger.info(f"Получено {len(categories)} пользовательских категорий для пользователя {user_id}")
+            rows = await self._fetch(GET_CUSTOM_CATEGORIES_POSTGRES, user_id)
+            categories = [(row['name'], row['keywords']) for row in rows]
+            logger.debug(f"Получено {len(categories)} пользовательских категорий для пользователя {user_id}")
             return categories
         except Exception as e:
             logger.error(f"Ошибка получения пользовательских категорий: {e}")
@@ -127,20 +374,18 @@ class PostgresDatabase:
     async def get_all_custom_categories(self) -> List[Tuple[int, str, str]]:
         """Получение всех пользовательских категорий (для категоризатора)"""
         try:
-            async with self._pool.acquire() as conn:
-                rows = await conn.fetch(GET_ALL_CUSTOM_CATEGORIES_POSTGRES)
-                categories = [(row['user_id'], row['name'], row['keywords']) for row in rows]
+            rows = await self._fetch(GET_ALL_CUSTOM_CATEGORIES_POSTGRES)
+            categories = [(row['user_id'], row['name'], row['keywords']) for row in rows]
             return categories
         except Exception as e:
             logger.error(f"Ошибка получения всех пользовательских категорий: {e}")
             return []
 
-    async def add_reminder(self, user_id: int, entry_id: int, text: str, reminder_time: str) -> bool:
-        """Добавление напоминания"""
+    async def add_reminder(self, user_id: int, entry_id: int, reminder_time: str) -> bool:
+        """Добавление напоминания к записи entry_id (текст напоминания - текст записи)"""
         try:
-            async with self._pool.acquire() as conn:
-                await conn.execute(INSERT_REMINDER_POSTGRES, user_id, entry_id, text, reminder_time)
-            logger.info(f"Напоминание добавлено для пользователя {user_id} на {reminder_time}")
+            await self._execute(INSERT_REMINDER_POSTGRES, user_id, entry_id, reminder_time)
+            logger.debug(f"Напоминание добавлено для пользователя {user_id} на {reminder_time}")
             return True
         except Exception as e:
             logger.error(f"Ошибка добавления напоминания: {e}")
@@ -149,9 +394,8 @@ class PostgresDatabase:
     async def get_pending_reminders(self) -> List[Tuple[int, int, str, str]]:
         """Получение всех ожидающих напоминаний"""
         try:
-            async with self._pool.acquire() as conn:
-                rows = await conn.fetch(GET_PENDING_REMINDERS_POSTGRES)
-                reminders = [(row['id'], row['user_id'], row['text'], str(row['reminder_time'])) for row in rows]
+            rows = await self._fetch(GET_PENDING_REMINDERS_POSTGRES)
+            reminders = [(row['id'], row['user_id'], row['text'], format_timestamp(row['reminder_time'])) for row in rows]
             return reminders
         except Exception as e:
             logger.error(f"Ошибка получения напоминаний: {e}")
@@ -160,22 +404,205 @@ class PostgresDatabase:
     async def mark_reminder_sent(self, reminder_id: int) -> bool:
         """Отметить напоминание как отправленное"""
         try:
-            async with self._pool.acquire() as conn:
-                await conn.execute(MARK_REMINDER_SENT_POSTGRES, reminder_id)
-            logger.info(f"Напоминание {reminder_id} отмечено как отправленное")
+            await self._execute(MARK_REMINDER_SENT_POSTGRES, reminder_id)
+            logger.debug(f"Напоминание {reminder_id} отмечено как отправленное")
             return True
         except Exception as e:
             logger.error(f"Ошибка отметки напоминания: {e}")
             return False
 
+    async def claim_due_reminders(self, limit: int = 100) -> List[Tuple[int, int, str, str]]:
+        """Наступившие напоминания (не больше limit), сразу отмеченные как отправленные"""
+        try:
+            rows = await self._fetch(CLAIM_DUE_REMINDERS_POSTGRES, limit)
+            reminders = [(row['id'], row['user_id'], row['text'], format_timestamp(row['reminder_time'])) for row in rows]
+            return sorted(reminders, key=lambda reminder: reminder[3])
+        except Exception as e:
+            logger.error(f"Ошибка выборки напоминаний: {e}")
+            return []
+
+    async def count_due_reminders(self) -> Optional[int]:
+        """Число наступивших, но еще не выбранных для отправки напоминаний (None - ошибка)"""
+        try:
+            return await self._fetchval(COUNT_DUE_REMINDERS_POSTGRES)
+        except Exception as e:
+            logger.error(f"Ошибка подсчета напоминаний: {e}")
+            return None
+
+    async def release_reminder(self, reminder_id: int) -> bool:
+        """Вернуть напоминание в ожидающие (отправка не удалась)"""
+        try:
+            await self._execute(RELEASE_REMINDER_POSTGRES, reminder_id)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка возврата напоминания {reminder_id}: {e}")
+            return False
+
     async def get_user_reminders(self, user_id: int) -> List[Tuple[int, str, str, bool]]:
         """Получение напоминаний пользователя"""
         try:
-            async with self._pool.acquire() as conn:
-                rows = await conn.fetch(GET_USER_REMINDERS_POSTGRES, user_id)
-                reminders = [(row['id'], row['text'], str(row['reminder_time']), row['is_sent']) for row in rows]
-            logger.info(f"Получено {len(reminders)} напоминаний для пользователя {user_id}")
+            rows = await self._fetch(GET_USER_REMINDERS_POSTGRES, user_id)
+            reminders = [(row['id'], row['text'], format_timestamp(row['reminder_time']), row['is_sent']) for row in rows]
+            logger.debug(f"Получено {len(reminders)} напоминаний для пользователя {user_id}")
             return reminders
         except Exception as e:
             logger.error(f"Ошибка получения напоминаний пользователя: {e}")
-            return [] 
\ No newline at end of file
+            return [] 
+
+    async def get_fsm_record(self, storage_key: str, now: float) -> Optional[Tuple[Optional[str], str]]:
+        """Состояние диалога и его данные (JSON); None - записи нет или срок ее хранения истек"""
+        try:
+            row = await self._fetchrow(GET_FSM_RECORD_POSTGRES, storage_key, now)
+            return (row['state'], row['data']) if row else None
+        except Exception as e:
+            logger.error(f"Ошибка получения состояния диалога: {e}")
+            return None
+
+    async def set_fsm_record(self, storage_key: str, state: Optional[str], data: str, expires_at: float) -> bool:
+        """Сохранение состояния диалога и его данных до expires_at"""
+        try:
+            await self._execute(SET_FSM_RECORD_POSTGRES, storage_key, state, data, expires_at)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния диалога: {e}")
+            return False
+
+    async def delete_fsm_record(self, storage_key: str) -> bool:
+        """Удаление состояния диалога"""
+        try:
+            await self._execute(DELETE_FSM_RECORD_POSTGRES, storage_key)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка удаления состояния диалога: {e}")
+            return False
+
+    async def delete_expired_fsm_records(self, now: float) -> int:
+        """Удаление состояний диалогов с истекшим сроком хранения"""
+        try:
+            status = await self._execute(DELETE_EXPIRED_FSM_RECORDS_POSTGRES, now)
+            return int(status.rsplit(" ", 1)[-1])
+        except Exception as e:
+            logger.error(f"Ошибка удаления устаревших состояний диалогов: {e}")
+            return 0
+
+    async def set_digest_subscription(self, user_id: int, subscribed: bool) -> bool:
+        """Подписка на еженедельную сводку или отказ от нее"""
+        try:
+            await self._execute(SUBSCRIBE_DIGEST_POSTGRES if subscribed else UNSUBSCRIBE_DIGEST_POSTGRES, user_id)
+            logger.debug(f"Подписка пользователя {user_id} на сводку: {subscribed}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка изменения подписки на сводку: {e}")
+            return False
+
+    async def is_digest_subscribed(self, user_id: int) -> bool:
+        """Подписан ли пользователь на еженедельную сводку"""
+        try:
+            return bool(await self._fetchval(IS_DIGEST_SUBSCRIBED_POSTGRES, user_id))
+        except Exception as e:
+            logger.error(f"Ошибка проверки подписки на сводку: {e}")
+            return False
+
+    async def get_digest_checkpoint(self, period: str) -> Optional[Tuple[int, bool]]:
+        """Контрольная точка рассылки сводки: (последний обработанный пользователь, рассылка завершена)"""
+        try:
+            row = await self._fetchrow(GET_DIGEST_CHECKPOINT_POSTGRES, period)
+            return (row['last_user_id'], row['completed']) if row else None
+        except Exception as e:
+            logger.error(f"Ошибка получения контрольной точки сводки: {e}")
+            return None
+
+    async def set_digest_checkpoint(self, period: str, last_user_id: int, completed: bool) -> bool:
+        """Сохранение контрольной точки рассылки сводки"""
+        try:
+            await self._execute(SET_DIGEST_CHECKPOINT_POSTGRES, period, last_user_id, completed)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения контрольной точки сводки: {e}")
+            return False
+
+    async def iter_digest_entries(self, since: str, until: str, after_user_id: int = 0,
+                                  batch_size: int = 500) -> AsyncIterator[Tuple[int, str, str]]:
+        """Записи подписчиков сводки за [since, until) по возрастанию user_id через серверный курсор"""
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(ITER_DIGEST_ENTRIES_POSTGRES, after_user_id, since, until, prefetch=batch_size):
+                    yield row['user_id'], row['text'], row['category']
+
+    async def iter_digest_reminders(self, since: str, until: str, after_user_id: int = 0,
+                                    batch_size: int = 500) -> AsyncIterator[Tuple[int, str, str]]:
+        """Неотправленные напоминания подписчиков на [since, until) по возрастанию user_id через серверный курсор"""
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(ITER_DIGEST_REMINDERS_POSTGRES, after_user_id, since, until, prefetch=batch_size):
+                    yield row['user_id'], row['text'], format_timestamp(row['reminder_time'])
+
+    async def iter_entries(self, user_id: int, batch_size: int = 500,
+                           after_id: int = 0) -> AsyncIterator[Tuple[int, str, str, str]]:
+        """Потоковое чтение записей пользователя с id > after_id через серверный курсор (для экспорта)"""
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(EXPORT_ENTRIES_POSTGRES, user_id, after_id, prefetch=batch_size):
+                    yield row['id'], row['text'], row['category'], format_timestamp(row['datetime'])
+
+    async def iter_reminders(self, user_id: int, batch_size: int = 500) -> AsyncIterator[Tuple[int, int, str, str, bool]]:
+        """Потоковое чтение всех напоминаний пользователя через серверный курсор (для экспорта)"""
+        async with self._pool.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(EXPORT_REMINDERS_POSTGRES, user_id, prefetch=batch_size):
+                    yield row['id'], row['entry_id'], row['text'], format_timestamp(row['reminder_time']), row['is_sent']
+
+    async def export_rows(self, table: str, after_id: int, limit: int) -> List[tuple]:
+        """Страница строк таблицы для переноса в другой бэкенд: id > after_id по возрастанию, не больше limit"""
+        if table not in MIGRATION_TABLES:
+            raise ValueError(f"Таблица {table} не переносится")
+        if table == "custom_categories":
+            rows = await self._fetch(MIGRATE_EXPORT_CUSTOM_CATEGORIES_POSTGRES, after_id, limit)
+            return [(row['id'], row['user_id'], row['name'], row['keywords']) for row in rows]
+        if table == "entries":
+            rows = await self._fetch(MIGRATE_EXPORT_ENTRIES_POSTGRES, after_id, limit)
+            return [(row['id'], row['user_id'], row['text'], row['category'], format_timestamp(row['datetime'])) for row in rows]
+        rows = await self._fetch(MIGRATE_EXPORT_REMINDERS_POSTGRES, after_id, limit)
+        return [(row['id'], row['user_id'], row['entry_id'], format_timestamp(row['reminder_time']), bool(row['is_sent']))
+                for row in rows]
+
+    async def import_rows(self, table: str, rows: List[tuple]) -> int:
+        """
+        Вставка порции строк из другого бэкенда с исходными id одной транзакцией
+
+        Порция загружается COPY во временную таблицу и переносится одним INSERT ... SELECT;
+        строки с уже существующими id пропускаются, поэтому порцию можно повторить после сбоя.
+        Перед порцией записей создаются секции entries на месяцы, за которые в ней есть записи.
+        Возвращает число новых строк.
+        """
+        if table not in MIGRATION_TABLES:
+            raise ValueError(f"Таблица {table} не переносится")
+        if table == "custom_categories":
+            stage, queries, records = CREATE_MIGRATE_CUSTOM_CATEGORIES_STAGE_POSTGRES, [MIGRATE_IMPORT_CUSTOM_CATEGORIES_POSTGRES], rows
+        elif table == "entries":
+            stage, queries = CREATE_MIGRATE_ENTRIES_STAGE_POSTGRES, [MIGRATE_ENSURE_CATEGORIES_POSTGRES, MIGRATE_IMPORT_ENTRIES_POSTGRES]
+            records = [(entry_id, user_id, text, category, datetime.strptime(timestamp, TIMESTAMP_FORMAT))
+                       for entry_id, user_id, text, category, timestamp in rows]
+            if records:
+                moments = [record[4] for record in records]
+                await self._ensure_month_partitions(min(moments).date(), max(moments).date())
+        else:
+            stage, queries = CREATE_MIGRATE_REMINDERS_STAGE_POSTGRES, [MIGRATE_IMPORT_REMINDERS_POSTGRES]
+            records = [(reminder_id, user_id, entry_id, datetime.strptime(reminder_time, TIMESTAMP_FORMAT), is_sent)
+                       for reminder_id, user_id, entry_id, reminder_time, is_sent in rows]
+
+        with QUERY_LOG.track("postgres", queries[-1]) as trace:
+            async with self._pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute(stage)
+                    await conn.copy_records_to_table(f"migrate_{table}", records=records)
+                    for query in queries:
+                        status = await conn.execute(query)
+            inserted = int(status.rsplit(" ", 1)[-1])
+            trace.rows = inserted
+        return inserted
+
+    async def finish_import(self):
+        """Завершение переноса: последовательности id продолжают с максимального id, сводная таблица пересчитывается"""
+        await self._fetchrow(RESET_ID_SEQUENCES_POSTGRES)
+        await self._execute(BACKFILL_DAILY_CATEGORY_COUNTS_POSTGRES)
@@ -0,0 +1,166 @@
+"""
+Журнал запросов к базе данных: длительность, число строк, медленные запросы и самые дорогие виды запросов
+"""
+
+import logging
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"\$\d+|(?<![:\w]):\w+|\?")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+
+
+def normalize_sql(sql: str) -> str:
+    """Вид запроса: одна строка, литералы и параметры заменены на '?'"""
+    shape = _WHITESPACE_RE.sub(" ", sql).strip()
+    shape = _STRING_RE.sub("?", shape)
+    shape = _PARAM_RE.sub("?", shape)
+    shape = _NUMBER_RE.sub("?", shape)
+    # IN (?, ?, ?) с разным числом значений - один и тот же вид запроса
+    return _IN_LIST_RE.sub("IN (?)", shape)
+
+
+class QueryTrace:
+    """Результат одного запроса; число строк заполняет вызывающий код"""
+
+    __slots__ = ("rows",)
+
+    def __init__(self):
+        self.rows: Optional[int] = None
+
+
+class _ShapeStats:
+    __slots__ = ("count", "errors", "total", "max", "rows")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+    def add(self, other: "_ShapeStats"):
+        self.count += other.count
+        self.errors += other.errors
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.rows += other.rows
+
+
+class QueryLog:
+    """
+    Замер каждого запроса бэкендов
+
+    Статистика по видам запросов (бэкенд + нормализованный SQL или фильтр PostgREST)
+    хранится за два последних окна window_seconds, так что таблица самых дорогих
+    запросов отражает недавнюю нагрузку, а не все время работы процесса.
+    """
+
+    def __init__(self, slow_threshold_ms: float = 200.0, top_n: int = 20, window_seconds: int = 3600):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.top_n = top_n
+        self.window_seconds = window_seconds
+        self._window_started = time.monotonic()
+        self._current: Dict[Tuple[str, str], _ShapeStats] = {}
+        self._previous: Dict[Tuple[str, str], _ShapeStats] = {}
+
+    def configure(self, slow_threshold_ms: float, top_n: int, window_seconds: int):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.top_n = top_n
+        self.window_seconds = window_seconds
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now - self._window_started >= self.window_seconds:
+            # Если окно простояло дольше двух периодов, предыдущие данные уже неактуальны
+            stale = now - self._window_started >= 2 * self.window_seconds
+            self._previous = {} if stale else self._current
+            self._current = {}
+            self._window_started = now
+
+    @contextmanager
+    def track(self, backend: str, statement: str, normalized: bool = False):
+        """
+        Замер запроса: with query_log.track("sqlite", SQL) as trace: ...; trace.rows = len(rows)
+
+        Ошибки (в том числе таймауты) записываются в статистику и в лог с видом запроса
+        и пробрасываются дальше - их по-прежнему обрабатывает сам бэкенд.
+        """
+        trace = QueryTrace()
+        started = time.perf_counter()
+        error = None
+        try:
+            yield trace
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            shape = statement if normalized else normalize_sql(statement)
+            self._record(backend, shape, duration, trace.rows, error)
+
+    def _record(self, backend: str, shape: str, duration: float, rows: Optional[int], error: Optional[BaseException]):
+        self._rotate()
+        stats = self._current.get((backend, shape))
+        if stats is None:
+            stats = self._current[(backend, shape)] = _ShapeStats()
+        stats.count += 1
+        stats.total += duration
+        stats.max = max(stats.max, duration)
+        stats.rows += rows or 0
+
+        duration_ms = duration * 1000
+        if error is not None:
+            stats.errors += 1
+            logger.warning(
+                f"Ошибка запроса [{backend}] через {duration_ms:.1f} мс: {type(error).__name__}: {error} | {shape}"
+            )
+        elif duration_ms >= self.slow_threshold_ms:
+            logger.warning(f"Медленный запрос [{backend}] {duration_ms:.1f} мс, строк: {rows}: {shape}")
+
+    def top(self, n: Optional[int] = None) -> List[dict]:
+        """Самые дорогие виды запросов за последние окна (по суммарному времени)"""
+        self._rotate()
+        merged: Dict[Tuple[str, str], _ShapeStats] = {}
+        for window in (self._previous, self._current):
+            for key, stats in window.items():
+                merged.setdefault(key, _ShapeStats()).add(stats)
+
+        ranked = sorted(merged.items(), key=lambda item: item[1].total, reverse=True)
+        return [
+            {
+                "backend": backend,
+                "query": shape,
+                "count": stats.count,
+                "errors": stats.errors,
+                "total_ms": stats.total * 1000,
+                "avg_ms": stats.total * 1000 / stats.count,
+                "max_ms": stats.max * 1000,
+                "avg_rows": stats.rows / stats.count,
+            }
+            for (backend, shape), stats in ranked[: n or self.top_n]
+        ]
+
+    def format_top(self, n: Optional[int] = None) -> str:
+        """Таблица самых дорогих видов запросов для вывода в лог или по HTTP"""
+        rows = self.top(n)
+        if not rows:
+            return "Запросов пока не было"
+        lines = [f"{'бэкенд':<9} {'кол-во':>7} {'ошибки':>6} {'всего, мс':>10} {'сред, мс':>9} {'макс, мс':>9} {'строк':>7}  запрос"]
+        for row in rows:
+            lines.append(
+                f"{row['backend']:<9} {row['count']:>7} {row['errors']:>6} {row['total_ms']:>10.1f} "
+                f"{row['avg_ms']:>9.2f} {row['max_ms']:>9.2f} {row['avg_rows']:>7.1f}  {row['query']}"
+            )
+        return "\n".join(lines)
+
+
+# Общий журнал запросов процесса (настраивается в db.factory.create_database)
+QUERY_LOG = QueryLog()
@@ -2,18 +2,59 @@
 Модуль для работы с Supabase через API
 """
 
+import asyncio
 import logging
-from typing import List, Tuple, Optional
+import time
+from typing import Any, AsyncIterator, Callable, List, Tuple, Optional
 from supabase import create_client, Client
 from datetime import datetime, date
+from .base import MIGRATION_TABLES, format_timestamp
+from .query_log import QUERY_LOG
 
 logger = logging.getLogger(__name__)
 
+# Параметры PostgREST, значения которых задают вид запроса (остальные - фильтры со значениями)
+_SHAPE_PARAMS = {'select', 'order', 'on_conflict', 'columns'}
+
+
+def _request_shape(request) -> str:
+    """Вид запроса PostgREST для журнала запросов: метод, путь и фильтры без значений"""
+    parts = []
+    for key, value in request.params.multi_items():
+        if key in _SHAPE_PARAMS:
+            parts.append(f"{key}={value.replace(' ', '')}")
+        elif key in ('limit', 'offset'):
+            parts.append(f"{key}=?")
+        else:
+            # Фильтры вида eq.5, not.ilike.%x%, in.(1,2): оставляем только оператор
+            operator = value.split('.', 2)
+            operator = '.'.join(operator[:2]) if operator[0] == 'not' else operator[0]
+            parts.append(f"{key}={operator}.?")
+    query = '&'.join(parts)
+    return f"{request.http_method} {request.path}" + (f"?{query}" if query else "")
+
+
+# Источник чтения и столбцы таблиц при переносе между бэкендами: записи - с именем категории
+_MIGRATION_SOURCES = {
+    'custom_categories': ('custom_categories', 'id, user_id, name, keywords'),
+    'entries': ('entries_view', 'id, user_id, text, category, datetime'),
+    'reminders': ('reminders', 'id, user_id, entry_id, reminder_time, is_sent'),
+}
+
+
+def _newest_first(rows: List[dict], column: str) -> List[dict]:
+    """Строки от новых к старым по column (при равенстве - по id), как ORDER BY column DESC"""
+    return sorted(rows, key=lambda row: (row[column], row['id']), reverse=True)
+
 
 class SupabaseDatabase:
-    def __init__(self, supabase_url: str, supabase_key: str):
+    def __init__(self, supabase_url: str, supabase_key: str, partition_months_ahead: int = 3,
+                 page_size: int = 1000):
         self.supabase_url = supabase_url
         self.supabase_key = supabase_key
+        self.partition_months_ahead = partition_months_ahead
+        # Не больше db-max-rows PostgREST (1000 в Supabase по умолчанию), иначе ответ обрезается молча
+        self.page_size = page_size
         self.client: Client = None
 
     async def connect(self):
@@ -22,8 +63,8 @@ class SupabaseDatabase:
             logger.info(f"Попытка подключения к Supabase: {self.supabase_url}")
             self.client = create_client(self.supabase_url, self.supabase_key)
             
-            # Тестируем подключение
-            test_result = self.client.table('entries').select('count', count='exact').limit(1).execute()
+            # Тестируем подключение: одна строка по первичному ключу, без подсчета всей таблицы
+            await self._execute(self.client.table('entries').select('id').limit(1))
             logger.info("Supabase клиент успешно подключен")
         except Exception as e:
             logger.error(f"Ошибка подключения к Supabase: {e}")
@@ -31,32 +72,116 @@ class SupabaseDatabase:
             logger.error(f"Key length: {len(self.supabase_key) if self.supabase_key else 0}")
             raise
 
+    async def _execute(self, request):
+        """
+        Выполнение запроса PostgREST в отдельном потоке: клиент supabase синхронный,
+        и ожидание ответа в цикле событий задерживало бы остальные обработчики
+        """
+        return await asyncio.to_thread(self._execute_sync, request)
+
+    def _execute_sync(self, request):
+        """Выполнение запроса PostgREST с замером в журнале запросов"""
+        with QUERY_LOG.track("supabase", _request_shape(request), normalized=True) as trace:
+            result = request.execute()
+            trace.rows = len(result.data) if isinstance(result.data, list) else None
+        return result
+
+    async def _paginate(self, build_request: Callable[[], Any], keyset: Optional[str] = 'id',
+                        page_size: Optional[int] = None, prefetch: bool = True) -> AsyncIterator[dict]:
+        """
+        Постраничное чтение результата запроса PostgREST, который может не поместиться в один ответ
+
+        build_request() строит запрос заново для каждой страницы (select и фильтры, без order и limit).
+        С keyset страницы идут по возрастанию этого уникального столбца (фильтр > последнего значения
+        и limit) - новые строки не сдвигают страницы. keyset=None - страницы по диапазону строк .range()
+        в порядке, заданном запросом (порядок должен быть однозначным).
+
+        В памяти не больше двух страниц: при prefetch следующая страница запрашивается в потоке,
+        пока отдаются строки текущей.
+        """
+        page_size = page_size or self.page_size
+
+        def page_request(position):
+            request = build_request()
+            if keyset is None:
+                # range() в postgrest-py 0.11 принимает конец диапазона не включительно
+                return request.range(position, position + page_size)
+            if position is not None:
+                request = request.gt(keyset, position)
+            return request.order(keyset).limit(page_size)
+
+        def next_position(position, rows):
+            return position + len(rows) if keyset is None else rows[-1][keyset]
+
+        position = 0 if keyset is None else None
+        rows = (await self._execute(page_request(position))).data or []
+        pending = None
+        try:
+            while True:
+                full = len(rows) == page_size
+                if full:
+                    position = next_position(position, rows)
+                    if prefetch:
+                        pending = asyncio.ensure_future(self._execute(page_request(position)))
+                for row in rows:
+                    yield row
+                if not full:
+                    break
+                if pending is not None:
+                    result, pending = await pending, None
+                else:
+                    result = await self._execute(page_request(position))
+                rows = result.data or []
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def _fetch_all(self, build_request: Callable[[], Any], keyset: Optional[str] = 'id') -> List[dict]:
+        """
+        Все строки результата запроса PostgREST постранично (см. _paginate)
+
+        Только для результатов, которые нужно отсортировать целиком; строки, которые
+        обрабатываются по одной, читаются напрямую из _paginate.
+        """
+        return [row async for row in self._paginate(build_request, keyset)]
+
     async def disconnect(self):
         """Закрытие соединения с Supabase"""
         if self.client:
             # Supabase клиент не требует явного закрытия
             logger.info("Соединение с Supabase закрыто")
 
+    async def run_maintenance(self):
+        """Периодическое обслуживание: создание секций entries на ближайшие месяцы"""
+        try:
+            await self._execute(self.client.rpc('create_entries_partitions', {'months_ahead': self.partition_months_ahead}))
+            logger.info("Секции таблицы entries созданы/проверены")
+        except Exception as e:
+            # Например, таблица entries создана до секционирования - см. partition_entries.sql
+            logger.error(f"Ошибка обслуживания секций entries: {e}")
+
+        expired = await self.delete_expired_fsm_records(time.time())
+        if expired:
+            logger.info(f"Удалено устаревших состояний диалогов: {expired}")
+
     async def add_entry(self, user_id: int, text: str, category: str) -> int:
-        """Добавление новой записи"""
+        """Добавление новой записи (функция ingest_entry переводит имя категории в id справочника)"""
         try:
-            logger.info(f"Попытка добавления записи: user_id={user_id}, category={category}, text_length={len(text)}")
+            logger.debug(f"Попытка добавления записи: user_id={user_id}, category={category}, text_length={len(text)}")
             
-            data = {
-                'user_id': user_id,
-                'text': text,
-                'category': category,
-                'datetime': datetime.now().isoformat()
+            params = {
+                'p_user_id': user_id,
+                'p_text': text,
+                'p_category': category,
+                'p_datetime': datetime.now().isoformat(),
             }
             
-            logger.info(f"Данные для вставки: {data}")
+            result = await self._execute(self.client.rpc('ingest_entry', params))
+            logger.debug(f"Результат запроса: {result}")
             
-            result = self.client.table('entries').insert(data).execute()
-            logger.info(f"Результат запроса: {result}")
-            
-            if result.data and len(result.data) > 0:
-                entry_id = result.data[0]['id']
-                logger.info(f"Запись добавлена для пользователя {user_id}, ID: {entry_id}")
+            if result.data is not None:
+                entry_id = result.data
+                logger.debug(f"Запись добавлена для пользователя {user_id}, ID: {entry_id}")
                 return entry_id
             else:
                 logger.error("Результат запроса пустой")
@@ -67,16 +192,54 @@ class SupabaseDatabase:
             logger.error(f"Тип ошибки: {type(e)}")
             return None
 
+    async def add_entry_with_reminder(self, user_id: int, text: str, category: str,
+                                      reminder_time: Optional[str] = None) -> Optional[int]:
+        """Добавление записи и напоминания к ней (если задано время) одним вызовом функции ingest_entry"""
+        try:
+            params = {
+                'p_user_id': user_id,
+                'p_text': text,
+                'p_category': category,
+                'p_datetime': datetime.now().isoformat(),
+                'p_reminder_time': reminder_time,
+            }
+            result = await self._execute(self.client.rpc('ingest_entry', params))
+            entry_id = result.data
+            logger.debug(f"Запись {entry_id} добавлена для пользователя {user_id}, напоминание: {reminder_time}")
+            return entry_id
+        except Exception as e:
+            logger.error(f"Ошибка добавления записи с напоминанием: {e}")
+            return None
+
+    async def add_entries_with_reminders(self, user_id: int,
+                                         items: List[Tuple[str, str, Optional[str]]]) -> Optional[List[int]]:
+        """Добавление нескольких записей (text, category, reminder_time) одним вызовом функции ingest_entries"""
+        try:
+            params = {
+                'p_user_id': user_id,
+                'p_texts': [text for text, _, _ in items],
+                'p_categories': [category for _, category, _ in items],
+                'p_reminder_times': [reminder_time for _, _, reminder_time in items],
+                'p_datetime': datetime.now().isoformat(),
+            }
+            result = await self._execute(self.client.rpc('ingest_entries', params))
+            entry_ids = result.data
+            logger.debug(f"Добавлено {len(entry_ids)} записей для пользователя {user_id}")
+            return entry_ids
+        except Exception as e:
+            logger.error(f"Ошибка добавления записей: {e}")
+            return None
+
     async def get_today_entries(self, user_id: int) -> List[Tuple[str, str, str]]:
         """Получение записей за сегодня"""
         try:
-            logger.info(f"Запрос записей за сегодня для пользователя {user_id}")
+            logger.debug(f"Запрос записей за сегодня для пользователя {user_id}")
             
             today = date.today().isoformat()
-            result = self.client.table('entries').select('text, category, datetime').eq('user_id', user_id).gte('datetime', today).lt('datetime', f"{today}T23:59:59").order('datetime', desc=True).execute()
+            rows = await self._fetch_all(lambda: self.client.table('entries_view').select('id, text, category, datetime').eq('user_id', user_id).gte('datetime', today).lt('datetime', f"{today}T23:59:59"))
             
-            entries = [(row['text'], row['category'], row['datetime']) for row in result.data]
-            logger.info(f"Получено {len(entries)} записей за сегодня для пользователя {user_id}")
+            entries = [(row['text'], row['category'], format_timestamp(row['datetime'])) for row in _newest_first(rows, 'datetime')]
+            logger.debug(f"Получено {len(entries)} записей за сегодня для пользователя {user_id}")
             
             for entry in entries:
                 logger.debug(f"Запись: {entry}")
@@ -85,13 +248,26 @@ class SupabaseDatabase:
             logger.error(f"Ошибка получения записей за сегодня: {e}")
             return []
 
+    async def get_today_view(self, user_id: int,
+                             limit: int = 200) -> Tuple[List[Tuple[str, str, str]], List[Tuple[str, int]]]:
+        """Последние limit записей за сегодня и счетчики по категориям одним вызовом функции today_view"""
+        try:
+            params = {'p_user_id': user_id, 'p_day': date.today().isoformat(), 'p_limit': limit}
+            view = (await self._execute(self.client.rpc('today_view', params))).data or {}
+            entries = [(row['text'], row['category'], format_timestamp(row['datetime'])) for row in view.get('entries') or []]
+            counts = [(row['category'], row['count']) for row in view.get('counts') or []]
+            return entries, counts
+        except Exception as e:
+            logger.error(f"Ошибка получения записей за сегодня: {e}")
+            return [], []
+
     async def get_entries_by_date(self, user_id: int, date_str: str) -> List[Tuple[str, str, str]]:
         """Получение записей за конкретную дату"""
         try:
-            result = self.client.table('entries').select('text, category, datetime').eq('user_id', user_id).gte('datetime', date_str).lt('datetime', f"{date_str}T23:59:59").order('datetime', desc=True).execute()
+            rows = await self._fetch_all(lambda: self.client.table('entries_view').select('id, text, category, datetime').eq('user_id', user_id).gte('datetime', date_str).lt('datetime', f"{date_str}T23:59:59"))
             
-            entries = [(row['text'], row['category'], row['datetime']) for row in result.data]
-            logger.info(f"Получено {len(entries)} записей за {date_str} для пользователя {user_id}")
+            entries = [(row['text'], row['category'], format_timestamp(row['datetime'])) for row in _newest_first(rows, 'datetime')]
+            logger.debug(f"Получено {len(entries)} записей за {date_str} для пользователя {user_id}")
             return entries
         except Exception as e:
             logger.error(f"Ошибка получения записей за дату: {e}")
@@ -100,15 +276,49 @@ class SupabaseDatabase:
     async def search_entries(self, user_id: int, search_term: str) -> List[Tuple[str, str, str]]:
         """Поиск записей по ключевому слову"""
         try:
-            result = self.client.table('entries').select('text, category, datetime').eq('user_id', user_id).ilike('text', f'%{search_term}%').order('datetime', desc=True).execute()
+            rows = await self._fetch_all(lambda: self.client.table('entries_view').select('id, text, category, datetime').eq('user_id', user_id).ilike('text', f'%{search_term}%'))
             
-            entries = [(row['text'], row['category'], row['datetime']) for row in result.data]
-            logger.info(f"Найдено {len(entries)} записей по запросу '{search_term}' для пользователя {user_id}")
+            entries = [(row['text'], row['category'], format_timestamp(row['datetime'])) for row in _newest_first(rows, 'datetime')]
+            logger.debug(f"Найдено {len(entries)} записей по запросу '{search_term}' для пользователя {user_id}")
             return entries
         except Exception as e:
             logger.error(f"Ошибка поиска записей: {e}")
             return []
 
+    async def get_entries_by_ids(self, user_id: int, entry_ids: List[int]) -> List[Tuple[int, str, str, str]]:
+        """Записи пользователя (id, text, category, datetime) по списку id, в произвольном порядке"""
+        if not entry_ids:
+            return []
+        try:
+            rows = self._paginate(lambda: self.client.table('entries_view').select('id, text, category, datetime').eq('user_id', user_id).in_('id', list(entry_ids)))
+            return [(row['id'], row['text'], row['category'], format_timestamp(row['datetime'])) async for row in rows]
+        except Exception as e:
+            logger.error(f"Ошибка получения записей по id: {e}")
+            return []
+
+    async def get_daily_category_counts(self, user_id: int, since: str) -> List[Tuple[str, str, int]]:
+        """Получение количества записей по дням и категориям начиная с даты since"""
+        try:
+            # У сводной таблицы нет id: страницы по диапазону строк, (day, category) однозначно задает порядок
+            rows = self._paginate(lambda: self.client.table('daily_category_counts_view').select('day, category, count').eq('user_id', user_id).gte('day', since).order('day,category'), keyset=None)
+
+            counts = [(row['day'], row['category'], row['count']) async for row in rows]
+            logger.debug(f"Получено {len(counts)} строк статистики с {since} для пользователя {user_id}")
+            return counts
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики по категориям: {e}")
+            return []
+
+    async def backfill_daily_category_counts(self) -> bool:
+        """Пересчет сводной таблицы по всем существующим записям (разовая операция)"""
+        try:
+            await self._execute(self.client.rpc('backfill_daily_category_counts', {}))
+            logger.info("Сводная таблица daily_category_counts пересчитана")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка пересчета сводной таблицы: {e}")
+            return False
+
     async def add_custom_category(self, user_id: int, name: str, keywords: str) -> bool:
         """Добавление пользовательской категории"""
         try:
@@ -118,8 +328,8 @@ class SupabaseDatabase:
                 'keywords': keywords
             }
             
-            self.client.table('custom_categories').upsert(data).execute()
-            logger.info(f"Пользовательская категория '{name}' добавлена для пользователя {user_id}")
+            await self._execute(self.client.table('custom_categories').upsert(data, on_conflict='user_id,name'))
+            logger.debug(f"Пользовательская категория '{name}' добавлена для пользователя {user_id}")
             return True
         except Exception as e:
             logger.error(f"Ошибка добавления пользовательской категории: {e}")
@@ -128,10 +338,10 @@ class SupabaseDatabase:
     async def get_custom_categories(self, user_id: int) -> List[Tuple[str, str]]:
         """Получение пользовательских категорий пользователя"""
         try:
-            result = self.client.table('custom_categories').select('name, keywords').eq('user_id', user_id).execute()
+            rows = self._paginate(lambda: self.client.table('custom_categories').select('id, name, keywords').eq('user_id', user_id))
             
-            categories = [(row['name'], row['keywords']) for row in result.data]
-            logger.info(f"Получено {len(categories)} пользовательских категорий для пользователя {user_id}")
+            categories = [(row['name'], row['keywords']) async for row in rows]
+            logger.debug(f"Получено {len(categories)} пользовательских категорий для пользователя {user_id}")
             return categories
         except Exception as e:
             logger.error(f"Ошибка получения пользовательских категорий: {e}")
@@ -140,27 +350,26 @@ class SupabaseDatabase:
     async def get_all_custom_categories(self) -> List[Tuple[int, str, str]]:
         """Получение всех пользовательских категорий (для категоризатора)"""
         try:
-            result = self.client.table('custom_categories').select('user_id, name, keywords').execute()
+            rows = self._paginate(lambda: self.client.table('custom_categories').select('id, user_id, name, keywords'))
             
-            categories = [(row['user_id'], row['name'], row['keywords']) for row in result.data]
+            categories = [(row['user_id'], row['name'], row['keywords']) async for row in rows]
             return categories
         except Exception as e:
             logger.error(f"Ошибка получения всех пользовательских категорий: {e}")
             return []
 
-    async def add_reminder(self, user_id: int, entry_id: int, text: str, reminder_time: str) -> bool:
-        """Добавление напоминания"""
+    async def add_reminder(self, user_id: int, entry_id: int, reminder_time: str) -> bool:
+        """Добавление напоминания к записи entry_id (текст напоминания - текст записи)"""
         try:
             data = {
                 'user_id': user_id,
                 'entry_id': entry_id,
-                'text': text,
                 'reminder_time': reminder_time,
                 'is_sent': False
             }
             
-            self.client.table('reminders').insert(data).execute()
-            logger.info(f"Напоминание добавлено для пользователя {user_id} на {reminder_time}")
+            await self._execute(self.client.table('reminders').insert(data))
+            logger.debug(f"Напоминание добавлено для пользователя {user_id} на {reminder_time}")
             return True
         except Exception as e:
             logger.error(f"Ошибка добавления напоминания: {e}")
@@ -170,9 +379,10 @@ class SupabaseDatabase:
         """Получение всех ожидающих напоминаний"""
         try:
             now = datetime.now().isoformat()
-            result = self.client.table('reminders').select('id, user_id, text, reminder_time').eq('is_sent', False).lte('reminder_time', now).order('reminder_time').execute()
+            rows = await self._fetch_all(lambda: self.client.table('reminders_view').select('id, user_id, text, reminder_time').eq('is_sent', False).lte('reminder_time', now))
+            rows.sort(key=lambda row: (row['reminder_time'], row['id']))
             
-            reminders = [(row['id'], row['user_id'], row['text'], row['reminder_time']) for row in result.data]
+            reminders = [(row['id'], row['user_id'], row['text'], format_timestamp(row['reminder_time'])) for row in rows]
             return reminders
         except Exception as e:
             logger.error(f"Ошибка получения напоминаний: {e}")
@@ -181,21 +391,216 @@ class SupabaseDatabase:
     async def mark_reminder_sent(self, reminder_id: int) -> bool:
         """Отметить напоминание как отправленное"""
         try:
-            self.client.table('reminders').update({'is_sent': True}).eq('id', reminder_id).execute()
-            logger.info(f"Напоминание {reminder_id} отмечено как отправленное")
+            await self._execute(self.client.table('reminders').update({'is_sent': True}).eq('id', reminder_id))
+            logger.debug(f"Напоминание {reminder_id} отмечено как отправленное")
             return True
         except Exception as e:
             logger.error(f"Ошибка отметки напоминания: {e}")
             return False
 
+    async def claim_due_reminders(self, limit: int = 100) -> List[Tuple[int, int, str, str]]:
+        """Наступившие напоминания (не больше limit), отмеченные как отправленные тем же вызовом функции claim_due_reminders"""
+        try:
+            params = {'p_now': datetime.now().isoformat(), 'p_limit': limit}
+            result = await self._execute(self.client.rpc('claim_due_reminders', params))
+            reminders = [(row['id'], row['user_id'], row['text'], format_timestamp(row['reminder_time'])) for row in result.data or []]
+            return sorted(reminders, key=lambda reminder: reminder[3])
+        except Exception as e:
+            logger.error(f"Ошибка выборки напоминаний: {e}")
+            return []
+
+    async def count_due_reminders(self) -> Optional[int]:
+        """Число наступивших, но еще не выбранных для отправки напоминаний (None - ошибка)"""
+        try:
+            now = datetime.now().isoformat()
+            result = await self._execute(self.client.table('reminders').select('id', count='exact').eq('is_sent', False).lte('reminder_time', now).limit(1))
+            return result.count
+        except Exception as e:
+            logger.error(f"Ошибка подсчета напоминаний: {e}")
+            return None
+
+    async def release_reminder(self, reminder_id: int) -> bool:
+        """Вернуть напоминание в ожидающие (отправка не удалась)"""
+        try:
+            await self._execute(self.client.table('reminders').update({'is_sent': False}).eq('id', reminder_id))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка возврата напоминания {reminder_id}: {e}")
+            return False
+
     async def get_user_reminders(self, user_id: int) -> List[Tuple[int, str, str, bool]]:
         """Получение напоминаний пользователя"""
         try:
-            result = self.client.table('reminders').select('id, text, reminder_time, is_sent').eq('user_id', user_id).order('reminder_time', desc=True).execute()
+            rows = await self._fetch_all(lambda: self.client.table('reminders_view').select('id, text, reminder_time, is_sent').eq('user_id', user_id))
             
-            reminders = [(row['id'], row['text'], row['reminder_time'], row['is_sent']) for row in result.data]
-            logger.info(f"Получено {len(reminders)} напоминаний для пользователя {user_id}")
+            reminders = [(row['id'], row['text'], format_timestamp(row['reminder_time']), row['is_sent']) for row in _newest_first(rows, 'reminder_time')]
+            logger.debug(f"Получено {len(reminders)} напоминаний для пользователя {user_id}")
             return reminders
         except Exception as e:
             logger.error(f"Ошибка получения напоминаний пользователя: {e}")
-            return [] 
\ No newline at end of file
+            return [] 
+
+    async def get_fsm_record(self, storage_key: str, now: float) -> Optional[Tuple[Optional[str], str]]:
+        """Состояние диалога и его данные (JSON); None - записи нет или срок ее хранения истек"""
+        try:
+            result = await self._execute(self.client.table('fsm_states').select('state, data').eq('storage_key', storage_key).gt('expires_at', now).limit(1))
+            return (result.data[0]['state'], result.data[0]['data']) if result.data else None
+        except Exception as e:
+            logger.error(f"Ошибка получения состояния диалога: {e}")
+            return None
+
+    async def set_fsm_record(self, storage_key: str, state: Optional[str], data: str, expires_at: float) -> bool:
+        """Сохранение состояния диалога и его данных до expires_at"""
+        try:
+            record = {'storage_key': storage_key, 'state': state, 'data': data, 'expires_at': expires_at}
+            await self._execute(self.client.table('fsm_states').upsert(record, on_conflict='storage_key'))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния диалога: {e}")
+            return False
+
+    async def delete_fsm_record(self, storage_key: str) -> bool:
+        """Удаление состояния диалога"""
+        try:
+            await self._execute(self.client.table('fsm_states').delete().eq('storage_key', storage_key))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка удаления состояния диалога: {e}")
+            return False
+
+    async def delete_expired_fsm_records(self, now: float) -> int:
+        """Удаление состояний диалогов с истекшим сроком хранения"""
+        try:
+            result = await self._execute(self.client.table('fsm_states').delete().lte('expires_at', now))
+            return len(result.data or [])
+        except Exception as e:
+            logger.error(f"Ошибка удаления устаревших состояний диалогов: {e}")
+            return 0
+
+    async def set_digest_subscription(self, user_id: int, subscribed: bool) -> bool:
+        """Подписка на еженедельную сводку или отказ от нее"""
+        try:
+            table = self.client.table('digest_subscriptions')
+            if subscribed:
+                await self._execute(table.upsert({'user_id': user_id}, on_conflict='user_id'))
+            else:
+                await self._execute(table.delete().eq('user_id', user_id))
+            logger.debug(f"Подписка пользователя {user_id} на сводку: {subscribed}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка изменения подписки на сводку: {e}")
+            return False
+
+    async def is_digest_subscribed(self, user_id: int) -> bool:
+        """Подписан ли пользователь на еженедельную сводку"""
+        try:
+            result = await self._execute(self.client.table('digest_subscriptions').select('user_id').eq('user_id', user_id).limit(1))
+            return bool(result.data)
+        except Exception as e:
+            logger.error(f"Ошибка проверки подписки на сводку: {e}")
+            return False
+
+    async def get_digest_checkpoint(self, period: str) -> Optional[Tuple[int, bool]]:
+        """Контрольная точка рассылки сводки: (последний обработанный пользователь, рассылка завершена)"""
+        try:
+            result = await self._execute(self.client.table('digest_runs').select('last_user_id, completed').eq('period', period).limit(1))
+            return (result.data[0]['last_user_id'], result.data[0]['completed']) if result.data else None
+        except Exception as e:
+            logger.error(f"Ошибка получения контрольной точки сводки: {e}")
+            return None
+
+    async def set_digest_checkpoint(self, period: str, last_user_id: int, completed: bool) -> bool:
+        """Сохранение контрольной точки рассылки сводки"""
+        try:
+            record = {'period': period, 'last_user_id': last_user_id, 'completed': completed,
+                      'updated_at': datetime.now().isoformat()}
+            await self._execute(self.client.table('digest_runs').upsert(record, on_conflict='period'))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения контрольной точки сводки: {e}")
+            return False
+
+    async def _iter_rpc_pages(self, function: str, since: str, until: str, after_user_id: int,
+                              batch_size: int) -> AsyncIterator[dict]:
+        """Постраничный вызов RPC сводки по возрастанию (user_id, id) (keyset-пагинация)"""
+        # Строки самого after_user_id пропускаются: курсор стоит после его последнего возможного id
+        after_id = 2147483647
+        while True:
+            params = {'p_since': since, 'p_until': until, 'p_after_user_id': after_user_id,
+                      'p_after_id': after_id, 'p_limit': batch_size}
+            rows = (await self._execute(self.client.rpc(function, params))).data or []
+            for row in rows:
+                yield row
+            if len(rows) < batch_size:
+                break
+            after_user_id, after_id = rows[-1]['user_id'], rows[-1]['id']
+
+    async def iter_digest_entries(self, since: str, until: str, after_user_id: int = 0,
+                                  batch_size: int = 500) -> AsyncIterator[Tuple[int, str, str]]:
+        """Записи подписчиков сводки за [since, until) по возрастанию user_id: (user_id, text, category)"""
+        async for row in self._iter_rpc_pages('digest_entries', since, until, after_user_id, batch_size):
+            yield row['user_id'], row['text'], row['category']
+
+    async def iter_digest_reminders(self, since: str, until: str, after_user_id: int = 0,
+                                    batch_size: int = 500) -> AsyncIterator[Tuple[int, str, str]]:
+        """Неотправленные напоминания подписчиков на [since, until) по возрастанию user_id: (user_id, text, reminder_time)"""
+        async for row in self._iter_rpc_pages('digest_reminders', since, until, after_user_id, batch_size):
+            yield row['user_id'], row['text'], format_timestamp(row['reminder_time'])
+
+    async def iter_entries(self, user_id: int, batch_size: int = 500,
+                           after_id: int = 0) -> AsyncIterator[Tuple[int, str, str, str]]:
+        """Потоковое чтение записей пользователя с id > after_id порциями по возрастанию id (для экспорта)"""
+        async for row in self._paginate(lambda: self.client.table('entries_view').select('id, text, category, datetime').eq('user_id', user_id).gt('id', after_id),
+                                        page_size=min(batch_size, self.page_size)):
+            yield row['id'], row['text'], row['category'], format_timestamp(row['datetime'])
+
+    async def iter_reminders(self, user_id: int, batch_size: int = 500) -> AsyncIterator[Tuple[int, int, str, str, bool]]:
+        """Потоковое чтение всех напоминаний пользователя порциями (для экспорта)"""
+        async for row in self._paginate(lambda: self.client.table('reminders_view').select('id, entry_id, text, reminder_time, is_sent').eq('user_id', user_id),
+                                        page_size=min(batch_size, self.page_size)):
+            yield row['id'], row['entry_id'], row['text'], format_timestamp(row['reminder_time']), row['is_sent']
+
+    async def export_rows(self, table: str, after_id: int, limit: int) -> List[tuple]:
+        """Страница строк таблицы для переноса в другой бэкенд: id > after_id по возрастанию, не больше limit и page_size"""
+        if table not in MIGRATION_TABLES:
+            raise ValueError(f"Таблица {table} не переносится")
+        source, columns = _MIGRATION_SOURCES[table]
+        request = self.client.table(source).select(columns).gt('id', after_id).order('id').limit(min(limit, self.page_size))
+        # Пока страница читается в потоке, tools.migrate записывает предыдущую
+        rows = (await self._execute(request)).data or []
+        if table == 'custom_categories':
+            return [(row['id'], row['user_id'], row['name'], row['keywords']) for row in rows]
+        if table == 'entries':
+            return [(row['id'], row['user_id'], row['text'], row['category'], format_timestamp(row['datetime'])) for row in rows]
+        return [(row['id'], row['user_id'], row['entry_id'], format_timestamp(row['reminder_time']), bool(row['is_sent']))
+                for row in rows]
+
+    async def import_rows(self, table: str, rows: List[tuple]) -> int:
+        """
+        Вставка порции строк из другого бэкенда с исходными id одним запросом
+
+        Записи передаются функции import_entries (имя категории переводится в id справочника),
+        остальные таблицы - upsert с пропуском существующих id, поэтому порцию можно повторить
+        после сбоя. Возвращает число новых строк.
+        """
+        if table not in MIGRATION_TABLES:
+            raise ValueError(f"Таблица {table} не переносится")
+        if table == 'entries':
+            items = [{'id': entry_id, 'user_id': user_id, 'text': text, 'category': category, 'datetime': timestamp}
+                     for entry_id, user_id, text, category, timestamp in rows]
+            request = self.client.rpc('import_entries', {'p_rows': items})
+            return (await self._execute(request)).data or 0
+
+        if table == 'custom_categories':
+            items = [{'id': category_id, 'user_id': user_id, 'name': name, 'keywords': keywords}
+                     for category_id, user_id, name, keywords in rows]
+        else:
+            items = [{'id': reminder_id, 'user_id': user_id, 'entry_id': entry_id, 'reminder_time': reminder_time, 'is_sent': is_sent}
+                     for reminder_id, user_id, entry_id, reminder_time, is_sent in rows]
+        request = self.client.table(table).upsert(items, on_conflict='id', ignore_duplicates=True)
+        return len((await self._execute(request)).data or [])
+
+    async def finish_import(self):
+        """Завершение переноса: последовательности id продолжают с максимального id, сводная таблица пересчитывается"""
+        await self._execute(self.client.rpc('reset_id_sequences', {}))
+        await self._execute(self.client.rpc('backfill_daily_category_counts', {}))
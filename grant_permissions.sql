@@ -1,12 +1,39 @@
 -- Отключение Row Level Security для всех таблиц
+ALTER TABLE categories DISABLE ROW LEVEL SECURITY;
 ALTER TABLE entries DISABLE ROW LEVEL SECURITY;
 ALTER TABLE custom_categories DISABLE ROW LEVEL SECURITY;
 ALTER TABLE reminders DISABLE ROW LEVEL SECURITY;
+ALTER TABLE daily_category_counts DISABLE ROW LEVEL SECURITY;
+ALTER TABLE fsm_states DISABLE ROW LEVEL SECURITY;
+ALTER TABLE digest_subscriptions DISABLE ROW LEVEL SECURITY;
+ALTER TABLE digest_runs DISABLE ROW LEVEL SECURITY;
 
 -- Предоставление всех прав для анонимных пользователей
+GRANT ALL ON categories TO anon;
 GRANT ALL ON entries TO anon;
 GRANT ALL ON custom_categories TO anon;
 GRANT ALL ON reminders TO anon;
+GRANT ALL ON daily_category_counts TO anon;
+GRANT ALL ON fsm_states TO anon;
+GRANT ALL ON digest_subscriptions TO anon;
+GRANT ALL ON digest_runs TO anon;
+
+-- Представления для чтения (имена категорий, текст напоминаний из записей)
+GRANT SELECT ON entries_view TO anon;
+GRANT SELECT ON reminders_view TO anon;
+GRANT SELECT ON daily_category_counts_view TO anon;
+
+-- Право на вызов функции обслуживания секций entries
+GRANT EXECUTE ON FUNCTION create_entries_partitions(INTEGER) TO anon;
+GRANT EXECUTE ON FUNCTION backfill_daily_category_counts() TO anon;
+GRANT EXECUTE ON FUNCTION ingest_entry(BIGINT, TEXT, TEXT, TIMESTAMP, TIMESTAMP) TO anon;
+GRANT EXECUTE ON FUNCTION ingest_entries(BIGINT, TEXT[], TEXT[], TIMESTAMP[], TIMESTAMP) TO anon;
+GRANT EXECUTE ON FUNCTION today_view(BIGINT, DATE, INTEGER) TO anon;
+GRANT EXECUTE ON FUNCTION claim_due_reminders(TIMESTAMP, INTEGER) TO anon;
+GRANT EXECUTE ON FUNCTION digest_entries(TIMESTAMP, TIMESTAMP, BIGINT, INTEGER, INTEGER) TO anon;
+GRANT EXECUTE ON FUNCTION digest_reminders(TIMESTAMP, TIMESTAMP, BIGINT, INTEGER, INTEGER) TO anon;
+GRANT EXECUTE ON FUNCTION import_entries(JSON) TO anon;
+GRANT EXECUTE ON FUNCTION reset_id_sequences() TO anon;
 
 -- Предоставление прав на использование последовательностей (для SERIAL полей)
 GRANT USAGE, SELECT ON ALL SEQUENCES IN SCHEMA public TO anon;
@@ -20,7 +47,7 @@ SELECT
     tablename,
     rowsecurity
 FROM pg_tables 
-WHERE tablename IN ('entries', 'custom_categories', 'reminders');
+WHERE tablename IN ('categories', 'entries', 'custom_categories', 'reminders', 'daily_category_counts', 'fsm_states', 'digest_subscriptions', 'digest_runs');
 
 -- Проверка прав пользователя anon
 SELECT 
@@ -29,4 +56,4 @@ SELECT
     privilege_type
 FROM information_schema.role_table_grants 
 WHERE grantee = 'anon' 
-AND table_name IN ('entries', 'custom_categories', 'reminders'); 
\ No newline at end of file
+AND table_name IN ('categories', 'entries', 'custom_categories', 'reminders', 'daily_category_counts', 'fsm_states', 'digest_subscriptions', 'digest_runs'); 
\ No newline at end of file
@@ -7,6 +7,7 @@ import re
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
+from utils.rendering import escape
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -81,8 +82,8 @@ async def cmd_add_category(message: Message, database, categorizer):
             await categorizer.invalidate_cache()
             
             response = f"✅ Категория '{category_name}' успешно добавлена!\n\n"
-            response += f"🔧 <b>{category_name}</b>\n"
-            response += f"Ключевые слова: {', '.join(keywords_list)}"
+            response += f"🔧 <b>{escape(category_name)}</b>\n"
+            response += f"Ключевые слова: {escape(', '.join(keywords_list))}"
             
             await message.answer(response, parse_mode="HTML")
             logger.info(f"Пользователь {user_id} добавил категорию '{category_name}' с ключевыми словами: {keywords_list}")
@@ -8,21 +8,25 @@ from datetime import datetime
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
-from utils.categorizer import CATEGORY_EMOJIS
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from utils.rendering import render_entries_by_category
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-# Состояния для ожидания даты
-user_states = {}
+
+class ArchiveStates(StatesGroup):
+    # Ожидание даты после команды /archive
+    waiting_date = State()
 
 
 @router.message(Command("archive"))
-async def cmd_archive(message: Message):
+async def cmd_archive(message: Message, state: FSMContext):
     """Обработчик команды /archive - запрос даты"""
     try:
         user_id = message.from_user.id
-        user_states[user_id] = "waiting_date"
+        await state.set_state(ArchiveStates.waiting_date)
         
         response = """📅 <b>Архив записей</b>
 
@@ -35,7 +39,7 @@ async def cmd_archive(message: Message):
 Или отправьте 'сегодня' для просмотра записей за сегодня."""
         
         await message.answer(response, parse_mode="HTML")
-        logger.info(f"Пользователь {user_id} запросил архив")
+        logger.debug(f"Пользователь {user_id} запросил архив")
         
     except Exception as e:
         logger.error(f"Ошибка в обработчике /архив: {e}")
@@ -46,18 +50,14 @@ async def cmd_archive(message: Message):
 state_router = Router()
 
 
-@state_router.message(F.text & ~F.text.startswith('/'))
-async def handle_date_input(message: Message, database):
+@state_router.message(ArchiveStates.waiting_date, F.text & ~F.text.startswith('/'))
+async def handle_date_input(message: Message, state: FSMContext, database):
     """Обработчик ввода даты для архива"""
     try:
         user_id = message.from_user.id
         
-        # Проверяем, ожидаем ли мы дату от этого пользователя
-        if user_id not in user_states or user_states[user_id] != "waiting_date":
-            return
-            
         # Убираем состояние ожидания
-        del user_states[user_id]
+        await state.clear()
         
         date_input = message.text.strip().lower()
         
@@ -85,40 +85,11 @@ async def handle_date_input(message: Message, database):
             await message.answer(f"📅 За {target_date} записей не найдено.")
             return
             
-        # Группируем записи по категориям
-        categories = {}
-        for text, category, datetime_str in entries:
-            if category not in categories:
-                categories[category] = []
-            categories[category].append((text, datetime_str))
-        
-        # Формируем ответ
-        response = f"📅 <b>Записи за {target_date}:</b>\n\n"
-        
-        for category, category_entries in categories.items():
-            emoji = CATEGORY_EMOJIS.get(category, "📝")
-            response += f"{emoji} <b>{category}</b> ({len(category_entries)}):\n"
-            
-            for text, datetime_str in category_entries:
-                # Обрезаем длинный текст
-                display_text = text[:100] + "..." if len(text) > 100 else text
-                time_str = datetime_str.split()[1][:5] if ' ' in datetime_str else datetime_str
-                response += f"• {display_text} <i>({time_str})</i>\n"
-            
-            response += "\n"
-        
-        # Если сообщение слишком длинное, разбиваем на части
-        if len(response) > 4096:
-            parts = [response[i:i+4096] for i in range(0, len(response), 4096)]
-            for i, part in enumerate(parts):
-                if i == 0:
-                    await message.answer(part, parse_mode="HTML")
-                else:
-                    await message.answer(part, parse_mode="HTML")
-        else:
-            await message.answer(response, parse_mode="HTML")
-            
-        logger.info(f"Пользователю {user_id} показаны записи за {target_date} ({len(entries)} записей)")
+        # Записи по категориям; длинный ответ делится на сообщения по границам записей
+        for part in render_entries_by_category(f"📅 <b>Записи за {target_date}:</b>", entries):
+            await message.answer(part, parse_mode="HTML")
+
+        logger.debug(f"Пользователю {user_id} показаны записи за {target_date} ({len(entries)} записей)")
         
     except Exception as e:
         logger.error(f"Ошибка в обработчике ввода даты: {e}")
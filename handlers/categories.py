@@ -7,6 +7,7 @@ from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
 from utils.categorizer import CATEGORIES, CATEGORY_EMOJIS
+from utils.rendering import escape
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -45,8 +46,8 @@ async def cmd_categories(message: Message, database):
                 if len(keywords_list) > 5:
                     keywords_str += "..."
                     
-                response += f"🔧 <b>{name}</b>\n"
-                response += f"   Ключевые слова: {keywords_str}\n\n"
+                response += f"🔧 <b>{escape(name)}</b>\n"
+                response += f"   Ключевые слова: {escape(keywords_str)}\n\n"
         else:
             response += "🔧 <b>Ваши категории:</b>\n"
             response += "   Пока нет пользовательских категорий\n\n"
@@ -56,7 +57,7 @@ async def cmd_categories(message: Message, database):
         response += "Пример: /addcategory Работа:проект,задача,дедлайн"
         
         await message.answer(response, parse_mode="HTML")
-        logger.info(f"Пользователю {user_id} показаны категории")
+        logger.debug(f"Пользователю {user_id} показаны категории")
         
     except Exception as e:
         logger.error(f"Ошибка в обработчике /категории: {e}")
@@ -0,0 +1,48 @@
+"""
+Обработчик команды /digest
+"""
+
+import logging
+from aiogram import Router, F
+from aiogram.types import Message
+from aiogram.filters import Command
+
+logger = logging.getLogger(__name__)
+router = Router()
+
+
+@router.message(Command("digest"))
+async def cmd_digest(message: Message, database):
+    """Обработчик команды /digest - подписка на еженедельную сводку"""
+    try:
+        user_id = message.from_user.id
+        text = message.text.strip()
+
+        # Извлекаем действие
+        action = text[7:].strip().lower()  # Убираем '/digest' из начала
+
+        if action in ("on", "вкл"):
+            if not await database.set_digest_subscription(user_id, True):
+                await message.answer("❌ Не удалось оформить подписку. Попробуйте позже.")
+                return
+            await message.answer(
+                "📬 Готово! Каждый понедельник утром я пришлю сводку за прошлую неделю: "
+                "записи по категориям, частые тревоги, задачи и ближайшие напоминания.\n\nОтписаться: /digest off"
+            )
+            logger.info(f"Пользователь {user_id} подписался на еженедельную сводку")
+        elif action in ("off", "выкл"):
+            if not await database.set_digest_subscription(user_id, False):
+                await message.answer("❌ Не удалось отменить подписку. Попробуйте позже.")
+                return
+            await message.answer("📭 Еженедельная сводка отключена. Включить снова: /digest on")
+            logger.info(f"Пользователь {user_id} отписался от еженедельной сводки")
+        elif action == "":
+            subscribed = await database.is_digest_subscribed(user_id)
+            status = "включена ✅" if subscribed else "выключена"
+            await message.answer(f"📬 Еженедельная сводка {status}\n\nИспользование: /digest on | /digest off")
+        else:
+            await message.answer("📬 Использование: /digest on | /digest off")
+
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /digest: {e}")
+        await message.answer("Произошла ошибка. Попробуйте позже.")
@@ -5,93 +5,121 @@
 import logging
 from aiogram import Router, F
 from aiogram.types import Message
-from aiogram.filters import Command
-from utils.reminder_parser import ReminderParser
+import config
+from utils.ingest import split_entries
+from utils.rendering import render_ingest_summary
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-logger.info("=== РОУТЕР DUMP ЗАГРУЖЕН ===")
-logger.info(f"Роутер: {router}")
-logger.info(f"Обработчики в роутере: {len(router.message.handlers)}")
-
-
-@router.message()
-async def handle_all_messages(message: Message):
-    """Обработчик всех сообщений для отладки"""
-    logger.info(f"=== ПОЛУЧЕНО СООБЩЕНИЕ ===")
-    logger.info(f"Тип: {message.content_type}")
-    logger.info(f"Текст: '{message.text}'")
-    logger.info(f"От пользователя: {message.from_user.id}")
-    
-    # Если это команда, не обрабатываем
-    if message.text and message.text.startswith('/'):
-        logger.info("Это команда, пропускаем")
-        return
-    
-    # Если это не текст, отвечаем
-    if message.content_type != "text":
-        await message.answer("Пожалуйста, отправьте текстовое сообщение.")
-        return
-
 
 @router.message(F.text & ~F.text.startswith('/'))
-async def handle_text_message(message: Message, database, categorizer):
+async def handle_text_message(message: Message, ingest, batcher):
     """Обработчик текстовых сообщений - сохранение мыслей"""
     try:
-        logger.info(f"=== ОБРАБОТЧИК ТЕКСТОВЫХ СООБЩЕНИЙ АКТИВИРОВАН ===")
-        logger.info(f"Тип сообщения: {message.content_type}")
-        logger.info(f"Текст сообщения: '{message.text}'")
-        logger.info(f"Начинается с '/': {message.text.startswith('/') if message.text else 'None'}")
-        
         user_id = message.from_user.id
         text = message.text.strip()
-        
-        logger.info(f"Получено текстовое сообщение от пользователя {user_id}: '{text}'")
-        
+
         if not text:
             await message.answer("Пожалуйста, отправьте непустое сообщение.")
             return
-            
-        # Категоризируем текст
-        category, emoji = await categorizer.categorize(text, user_id)
-        logger.info(f"Текст категоризирован как '{category}' с эмодзи '{emoji}'")
-        
-        # Сохраняем в базу данных
-        logger.info(f"Попытка сохранения записи в базу данных...")
-        entry_id = await database.add_entry(user_id, text, category)
-        logger.info(f"Результат сохранения записи, получен ID: {entry_id}")
-        
-        if entry_id:
-            response = f"✅ Записано!\nКатегория: {emoji} {category}"
-            
-            # Проверяем, нужно ли создать напоминание
-            reminder_parser = ReminderParser()
-            should_create = reminder_parser.should_create_reminder(text, category)
-            logger.info(f"Проверка напоминания: категория='{category}', should_create={should_create}")
-            
-            if should_create:
-                reminder_data = reminder_parser.parse_time_from_text(text)
-                if reminder_data:
-                    reminder_time, description = reminder_data
-                    logger.info(f"Создание напоминания: время='{reminder_time}', описание='{description}'")
-                    success = await database.add_reminder(user_id, entry_id, text, reminder_time)
-                    if success:
-                        response += f"\n⏰ Напоминание создано: {description}"
-                        logger.info(f"Напоминание создано для пользователя {user_id} на {reminder_time}")
-                    else:
-                        response += "\n⚠️ Ошибка создания напоминания"
-                        logger.error(f"Ошибка создания напоминания для пользователя {user_id}")
-                else:
-                    logger.info("Время не найдено в тексте для напоминания")
-            
-            await message.answer(response)
-            logger.info(f"Сообщение пользователя {user_id} сохранено в категорию '{category}'")
-        else:
-            await message.answer("❌ Ошибка при сохранении. Попробуйте позже.")
-            logger.error(f"Ошибка сохранения сообщения пользователя {user_id}")
-            
+
+        # Пакетный режим: список - по записи на пункт, пересылки подряд - одной пачкой
+        if batcher is not None:
+            if message.forward_origin:
+                # Ответит первое сообщение серии, когда серия закончится
+                batcher.add(("forward", user_id), text, lambda texts: _save_forwarded(message, ingest, texts))
+                return
+            texts = split_entries(text, config.BULK_MAX_ENTRIES)
+            if len(texts) > 1:
+                await _save_batch(message, ingest, texts)
+                return
+            text = texts[0]
+
+        await _save_one(message, ingest, text)
+
     except Exception as e:
         logger.error(f"Ошибка в обработчике текстовых сообщений: {e}")
         logger.error(f"Тип ошибки: {type(e)}")
-        await message.answer("Произошла ошибка. Попробуйте позже.") 
\ No newline at end of file
+        await message.answer("Произошла ошибка. Попробуйте позже.")
+
+
+@router.message(F.media_group_id)
+async def handle_media_group(message: Message, ingest, batcher):
+    """Альбом: подписи всех его сообщений сохраняются одной пачкой, с одним ответом на альбом"""
+    try:
+        if batcher is None:
+            await message.answer("Пожалуйста, отправьте текстовое сообщение.")
+            return
+
+        # Ответит первое сообщение альбома, когда придут все его части
+        batcher.add(("album", message.media_group_id), (message.caption or "").strip(),
+                    lambda captions: _save_album(message, ingest, captions))
+
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике альбома: {e}")
+        await message.answer("Произошла ошибка. Попробуйте позже.")
+
+
+async def _save_one(message: Message, ingest, text: str):
+    """Сохранение одной записи (вместе с напоминанием) и ответ"""
+    result = await ingest.ingest(message.from_user.id, text)
+
+    if result:
+        response = f"✅ Записано!\nКатегория: {result.emoji} {result.category}"
+        if result.reminder_description:
+            response += f"\n⏰ Напоминание создано: {result.reminder_description}"
+        await message.answer(response)
+        logger.debug(f"Сообщение пользователя {message.from_user.id} сохранено в категорию '{result.category}'")
+    else:
+        await message.answer("❌ Ошибка при сохранении. Попробуйте позже.")
+
+
+async def _save_forwarded(message: Message, ingest, texts):
+    """Сохранение серии пересылок, собранной MessageBatcher (вызывается после обработчика)"""
+    try:
+        if len(texts) > 1:
+            await _save_batch(message, ingest, texts)
+        else:
+            await _save_one(message, ingest, texts[0])
+    except Exception as e:
+        logger.error(f"Ошибка сохранения пересланных сообщений: {e}")
+        await message.answer("Произошла ошибка. Попробуйте позже.")
+
+
+async def _save_album(message: Message, ingest, captions):
+    """Сохранение подписей альбома, собранных MessageBatcher (вызывается после обработчика)"""
+    try:
+        texts = [caption for caption in captions if caption]
+        if not texts:
+            await message.answer("Пожалуйста, добавьте к альбому подпись или отправьте текстовое сообщение.")
+            return
+        await _save_batch(message, ingest, texts)
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике альбома: {e}")
+        await message.answer("Произошла ошибка. Попробуйте позже.")
+
+
+async def _save_batch(message: Message, ingest, texts):
+    """Сохранение пачки записей и один общий ответ"""
+    results = await ingest.ingest_many(message.from_user.id, texts)
+    if not results:
+        await message.answer("❌ Ошибка при сохранении. Попробуйте позже.")
+        return
+    summary = [
+        (text, result.category, result.emoji, result.reminder_description)
+        for text, result in zip(texts, results)
+    ]
+    for part in render_ingest_summary(summary):
+        await message.answer(part, parse_mode="HTML")
+    logger.debug(f"Пачка из {len(results)} записей пользователя {message.from_user.id} сохранена")
+
+
+@router.message()
+async def handle_other_messages(message: Message):
+    """Сообщения, которые не обработал ни один роутер: неизвестные команды и не текст"""
+    # Неизвестные команды оставляем без ответа
+    if message.text and message.text.startswith('/'):
+        return
+
+    await message.answer("Пожалуйста, отправьте текстовое сообщение.")
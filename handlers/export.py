@@ -0,0 +1,50 @@
+"""
+Обработчик команды /export
+"""
+
+import logging
+from datetime import datetime
+from aiogram import Router, F
+from aiogram.types import Message
+from aiogram.filters import Command
+
+import config
+from utils.exporter import EXPORT_FORMATS, JournalExporter, SpooledInputFile
+
+logger = logging.getLogger(__name__)
+router = Router()
+
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, database):
+    """Обработчик команды /export - выгрузка дневника в файл"""
+    try:
+        user_id = message.from_user.id
+        text = message.text.strip()
+
+        # Извлекаем формат экспорта
+        export_format = text[7:].strip().lower() or "jsonl"  # Убираем '/export' из начала
+
+        if export_format not in EXPORT_FORMATS:
+            await message.answer("📦 Использование: /export [jsonl|csv|md]\n\nПример: /export csv")
+            return
+
+        exporter = JournalExporter(database, config.EXPORT_BATCH_SIZE, config.EXPORT_SPOOL_MAX_SIZE)
+        file, entries_count, reminders_count = await exporter.export(user_id, export_format)
+
+        try:
+            if entries_count == 0 and reminders_count == 0:
+                await message.answer("📦 Экспортировать пока нечего. Отправьте мне свои мысли! ✨")
+                return
+
+            filename = f"mindflow_{datetime.now().strftime('%Y-%m-%d')}.{EXPORT_FORMATS[export_format]}"
+            caption = f"📦 Экспорт дневника: {entries_count} записей, {reminders_count} напоминаний"
+            await message.answer_document(SpooledInputFile(file, filename), caption=caption)
+        finally:
+            file.close()
+
+        logger.info(f"Пользователь {user_id} экспортировал дневник в формате {export_format}")
+
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /export: {e}")
+        await message.answer("Произошла ошибка при экспорте. Попробуйте позже.")
@@ -7,6 +7,7 @@ from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
 from datetime import datetime
+from utils.rendering import escape, shorten
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -37,7 +38,7 @@ async def cmd_reminders(message: Message, database):
                 status = "❓"
             
             # Обрезаем длинный текст
-            display_text = text[:100] + "..." if len(text) > 100 else text
+            display_text = escape(shorten(text, 100))
             
             response += f"{i}. {status} <b>{time_str}</b>\n"
             response += f"   {display_text}\n\n"
@@ -52,7 +53,7 @@ async def cmd_reminders(message: Message, database):
         response += "• через час позвонить маме"
         
         await message.answer(response, parse_mode="HTML")
-        logger.info(f"Пользователю {user_id} показаны напоминания ({len(reminders)} штук)")
+        logger.debug(f"Пользователю {user_id} показаны напоминания ({len(reminders)} штук)")
         
     except Exception as e:
         logger.error(f"Ошибка в обработчике /reminders: {e}")
@@ -6,7 +6,7 @@ import logging
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
-from utils.categorizer import CATEGORY_EMOJIS
+from utils.rendering import render_search_results
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -34,35 +34,11 @@ async def cmd_search(message: Message, database):
             await message.answer(f"🔍 По запросу '{search_term}' ничего не найдено.")
             return
             
-        # Формируем ответ
-        response = f"🔍 <b>Результаты поиска по '{search_term}':</b>\n\n"
-        
-        for i, (text, category, datetime) in enumerate(entries[:20], 1):  # Ограничиваем 20 результатами
-            emoji = CATEGORY_EMOJIS.get(category, "📝")
-            # Обрезаем длинный текст
-            display_text = text[:150] + "..." if len(text) > 150 else text
-            date_str = datetime.split()[0] if ' ' in datetime else datetime
-            time_str = datetime.split()[1][:5] if ' ' in datetime else ""
-            
-            response += f"{i}. {emoji} <b>{category}</b>\n"
-            response += f"   {display_text}\n"
-            response += f"   <i>{date_str} {time_str}</i>\n\n"
-        
-        if len(entries) > 20:
-            response += f"... и ещё {len(entries) - 20} записей"
-        
-        # Если сообщение слишком длинное, разбиваем на части
-        if len(response) > 4096:
-            parts = [response[i:i+4096] for i in range(0, len(response), 4096)]
-            for i, part in enumerate(parts):
-                if i == 0:
-                    await message.answer(part, parse_mode="HTML")
-                else:
-                    await message.answer(part, parse_mode="HTML")
-        else:
-            await message.answer(response, parse_mode="HTML")
-            
-        logger.info(f"Пользователь {user_id} искал '{search_term}', найдено {len(entries)} записей")
+        # Первые 20 результатов; длинный ответ делится на сообщения по границам записей
+        for part in render_search_results(search_term, entries, max_results=20):
+            await message.answer(part, parse_mode="HTML")
+
+        logger.debug(f"Пользователь {user_id} искал '{search_term}', найдено {len(entries)} записей")
         
     except Exception as e:
         logger.error(f"Ошибка в обработчике /поиск: {e}")
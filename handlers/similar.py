@@ -0,0 +1,58 @@
+"""
+Обработчик команды /similar
+"""
+
+import logging
+from aiogram import Router
+from aiogram.types import Message
+from aiogram.filters import Command
+import config
+from utils.rendering import render_similar_results
+
+logger = logging.getLogger(__name__)
+router = Router()
+
+
+@router.message(Command("similar"))
+async def cmd_similar(message: Message, database, similarity):
+    """Обработчик команды /similar - записи, похожие на текст команды или на сообщение, на которое она отвечает"""
+    try:
+        if similarity is None:
+            await message.answer("🔗 Поиск похожих записей отключен.")
+            return
+
+        user_id = message.from_user.id
+        query = message.text[8:].strip()  # Убираем '/similar' из начала
+        reply = message.reply_to_message
+        if not query and reply:
+            query = (reply.text or reply.caption or "").strip()
+
+        if not query:
+            await message.answer(
+                "🔗 Использование: /similar <текст>\n"
+                "или ответьте командой /similar на свое сообщение.\n\n"
+                "Пример: /similar идея для проекта"
+            )
+            return
+
+        # С запасом на саму запись, если ищем по ее тексту
+        matches = await similarity.search(user_id, query, config.SIMILAR_RESULTS + 1)
+        scores = dict(matches)
+        rows = {row[0]: row for row in await database.get_entries_by_ids(user_id, list(scores))}
+        entries = [
+            (rows[entry_id][1], rows[entry_id][2], rows[entry_id][3], score)
+            for entry_id, score in matches
+            if entry_id in rows and rows[entry_id][1].strip() != query
+        ][:config.SIMILAR_RESULTS]
+
+        if not entries:
+            await message.answer("🔗 Похожих записей не найдено.")
+            return
+
+        for part in render_similar_results(query, entries):
+            await message.answer(part, parse_mode="HTML")
+        logger.debug(f"Пользователь {user_id}: найдено {len(entries)} похожих записей")
+
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /similar: {e}")
+        await message.answer("Произошла ошибка при поиске похожих записей. Попробуйте позже.")
@@ -44,10 +44,13 @@ async def cmd_start(message: Message):
 🔧 **Доступные команды:**
 /today — записи за сегодня
 /search слово — найти записи по ключевому слову
+/similar текст — похожие записи (или ответом на сообщение)
 /categories — все ваши категории
 /addcategory Название:ключ1,ключ2 — создать свою категорию
 /archive — записи за конкретную дату
 /reminders — все активные напоминания
+/export — выгрузить дневник в файл (jsonl, csv, md)
+/stats — статистика по категориям (week, month)
 
 💡 **Примеры использования:**
 • "Нужно купить хлеб" → 📋 Задачи
@@ -59,7 +62,7 @@ async def cmd_start(message: Message):
 ✨ **Просто напишите мне что угодно, и я всё организую!**"""
 
         await message.answer(welcome_text, parse_mode="HTML")
-        logger.info(f"Пользователь {message.from_user.id} запустил бота")
+        logger.debug(f"Пользователь {message.from_user.id} запустил бота")
         
     except Exception as e:
         logger.error(f"Ошибка в обработчике /start: {e}")
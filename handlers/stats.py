@@ -0,0 +1,90 @@
+"""
+Обработчик команды /stats
+"""
+
+import logging
+from datetime import date, timedelta
+from aiogram import Router, F
+from aiogram.types import Message
+from aiogram.filters import Command
+from db.partitions import add_months
+from utils.categorizer import CATEGORY_EMOJIS
+from utils.rendering import escape
+
+logger = logging.getLogger(__name__)
+router = Router()
+
+# Сколько периодов показывать
+STATS_WEEKS = 8
+STATS_MONTHS = 12
+
+MONTH_NAMES = [
+    "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь",
+]
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message, database):
+    """Обработчик команды /stats - статистика записей по категориям за недели или месяцы"""
+    try:
+        user_id = message.from_user.id
+        text = message.text.strip()
+
+        # Извлекаем период
+        period = text[6:].strip().lower()  # Убираем '/stats' из начала
+
+        if period in ("", "week", "неделя"):
+            weekly = True
+        elif period in ("month", "месяц"):
+            weekly = False
+        else:
+            await message.answer("📊 Использование: /stats [week|month]\n\nПример: /stats month")
+            return
+
+        today = date.today()
+        if weekly:
+            since = today - timedelta(days=today.weekday() + 7 * (STATS_WEEKS - 1))
+        else:
+            since = add_months(today, -(STATS_MONTHS - 1))
+
+        # Читаем только сводную таблицу, а не сами записи
+        rows = await database.get_daily_category_counts(user_id, since.isoformat())
+
+        if not rows:
+            await message.answer("📊 Пока нет статистики. Отправьте мне свои мысли! ✨")
+            return
+
+        # Группируем по неделям или месяцам
+        periods = {}
+        for day_str, category, count in rows:
+            day = date.fromisoformat(str(day_str)[:10])
+            period_start = day - timedelta(days=day.weekday()) if weekly else day.replace(day=1)
+            period_counts = periods.setdefault(period_start, {})
+            period_counts[category] = period_counts.get(category, 0) + count
+
+        # Формируем ответ
+        title = "по неделям" if weekly else "по месяцам"
+        lines = [f"📊 <b>Статистика {title}:</b>\n"]
+
+        for period_start in sorted(periods, reverse=True):
+            period_counts = periods[period_start]
+            if weekly:
+                period_end = period_start + timedelta(days=6)
+                label = f"{period_start.strftime('%d.%m')}–{period_end.strftime('%d.%m')}"
+            else:
+                label = f"{MONTH_NAMES[period_start.month - 1]} {period_start.year}"
+
+            total = sum(period_counts.values())
+            breakdown = " · ".join(
+                f"{CATEGORY_EMOJIS.get(category, '🔧')} {escape(category)} {count}"
+                for category, count in sorted(period_counts.items(), key=lambda item: -item[1])
+            )
+            lines.append(f"<b>{label}</b> (всего {total})\n{breakdown}\n")
+
+        await message.answer("\n".join(lines), parse_mode="HTML")
+        logger.debug(f"Пользователю {user_id} показана статистика {title}")
+
+    except Exception as e:
+        logger.error(f"Ошибка в обработчике /stats: {e}")
+        await message.answer("Произошла ошибка при получении статистики. Попробуйте позже.")
@@ -4,18 +4,24 @@ MindFlow Journal - Telegram бот для ведения дневника мыс
 
 import asyncio
 import logging
+import signal
 import sys
-from aiogram import Bot, Dispatcher, F
-from aiogram.fsm.storage.memory import MemoryStorage
+import time
+
+# Момент старта процесса - от него отсчитывается импорт модулей в отчете о запуске
+STARTED_AT = time.perf_counter()
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
 from aiogram.types import BotCommand, Message
 from aiogram.utils.i18n import I18nMiddleware
 
 # Импорты конфигурации и компонентов
 import config
-from db.database import Database
-from db.postgres_database import PostgresDatabase
-from db.supabase_database import SupabaseDatabase
+from db.factory import create_database
+from db.query_log import QUERY_LOG
 from utils.categorizer import Categorizer
+from utils.fsm_storage import DatabaseStorage
+from utils.ingest import IngestService, MessageBatcher
 
 # Импорты обработчиков
 from handlers.start import router as start_router
@@ -26,19 +32,22 @@ from handlers.categories import router as categories_router
 from handlers.archive import router as archive_router, state_router as archive_state_router
 from handlers.add_category import router as add_category_router
 from handlers.reminders import router as reminders_router
+from handlers.export import router as export_router
+from handlers.stats import router as stats_router
+from handlers.digest import router as digest_router
+from handlers.similar import router as similar_router
 
 # Импорты утилит
+from utils.backup import SQLiteBackup
+from utils.digest import DigestScheduler
 from utils.reminder_scheduler import ReminderScheduler
-
-# Настройка логирования
-logging.basicConfig(
-    level=getattr(logging, config.LOG_LEVEL),
-    format=config.LOG_FORMAT,
-    handlers=[
-        logging.FileHandler('mindflow_bot.log'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+from utils.sender import OutboundSender
+from utils.storage_maintenance import StorageMaintenance
+from utils.startup_timer import StartupTimer
+from utils.throttling import ThrottlingMiddleware
+from utils.logging_setup import sample_debug, setup_logging
+from utils.metrics import REGISTRY, InstrumentedDatabase, MetricsMiddleware, MetricsServer, TelegramRequestMetrics
+from utils.webhook_server import WebhookServer
 
 logger = logging.getLogger(__name__)
 
@@ -49,23 +58,198 @@ async def set_commands(bot: Bot):
         BotCommand(command="start", description="Запустить бота"),
         BotCommand(command="today", description="Записи за сегодня"),
         BotCommand(command="search", description="Поиск по записям"),
+        BotCommand(command="similar", description="Похожие записи"),
         BotCommand(command="categories", description="Все категории"),
         BotCommand(command="addcategory", description="Добавить свою категорию"),
         BotCommand(command="archive", description="Записи за конкретную дату"),
         BotCommand(command="reminders", description="Мои напоминания"),
+        BotCommand(command="export", description="Выгрузить дневник в файл"),
+        BotCommand(command="stats", description="Статистика по категориям"),
+        BotCommand(command="digest", description="Еженедельная сводка (on/off)"),
     ]
     await bot.set_my_commands(commands)
 
 
+class DependencyMiddleware(BaseMiddleware):
+    """
+    Внедрение зависимостей (база данных, категоризатор, сохранение записей) в обработчики
+
+    Также решает, попадет ли обновление в выборку DEBUG-логов, и пишет по каждому
+    обновлению одну итоговую строку INFO.
+    """
+
+    def __init__(self, database, categorizer, ingest, similarity=None, batcher=None, debug_sample_rate: float = 1.0):
+        super().__init__()
+        self.database = database
+        self.categorizer = categorizer
+        self.ingest = ingest
+        self.similarity = similarity
+        self.batcher = batcher
+        self.debug_sample_rate = debug_sample_rate
+    
+    async def __call__(self, handler, event, data):
+        sample_debug(self.debug_sample_rate)
+        data["database"] = self.database
+        data["categorizer"] = self.categorizer
+        data["ingest"] = self.ingest
+        data["similarity"] = self.similarity
+        data["batcher"] = self.batcher
+
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            handler_object = data.get("handler")
+            logger.info(
+                "update type=%s user=%s kind=%s handler=%s status=%s duration_ms=%.1f",
+                type(event).__name__.lower(),
+                event.from_user.id if event.from_user else None,
+                _event_kind(event),
+                handler_object.callback.__name__ if handler_object else None,
+                status,
+                (time.perf_counter() - started) * 1000,
+            )
+
+
+def _event_kind(event) -> str:
+    """Краткое описание обновления для итоговой строки лога (без текста сообщения)"""
+    if isinstance(event, Message):
+        if event.text and event.text.startswith('/'):
+            return event.text.split(maxsplit=1)[0]
+        return event.content_type
+    return "callback"
+
+
+def create_similarity_index(database):
+    """
+    Индекс похожих записей для /similar или None, если он отключен
+
+    numpy импортируется только при включенном индексе, как драйверы в db.factory.
+    """
+    if not config.SIMILAR_INDEX_DIR:
+        logger.info("Поиск похожих записей отключен (SIMILAR_INDEX_DIR пуст)")
+        return None
+    from utils.similarity import SimilarityIndex
+    return SimilarityIndex(database, config.SIMILAR_INDEX_DIR, config.SIMILAR_CACHE_USERS)
+
+
+def create_category_model():
+    """Обучаемые подсказки категорий или None, если они отключены (numpy загружается только при включенных)"""
+    if not config.CATEGORY_MODEL:
+        return None
+    from utils.category_model import CategoryModel
+    logger.info("Обучаемая категоризация включена")
+    return CategoryModel(config.CATEGORY_MODEL_VOCAB_SIZE, config.CATEGORY_MODEL_MIN_CONFIDENCE,
+                         config.CATEGORY_MODEL_MIN_EXAMPLES, config.CATEGORY_MODEL_CACHE_USERS,
+                         min_evidence=config.CATEGORY_MODEL_MIN_EVIDENCE, model_dir=config.CATEGORY_MODEL_DIR)
+
+
+def build_dispatcher(database, categorizer, similarity=None) -> Dispatcher:
+    """Создание диспетчера с middleware и всеми роутерами (используется также нагрузочным тестом)"""
+    # Состояния диалогов хранятся в базе данных и общие для всех экземпляров бота
+    storage = DatabaseStorage(database, config.FSM_STATE_TTL, config.FSM_CACHE_SIZE, config.FSM_CACHE_TTL)
+    dp = Dispatcher(storage=storage)
+    
+    # Метрики по всем обновлениям, включая не дошедшие до обработчиков
+    dp.update.outer_middleware(MetricsMiddleware())
+    
+    # Ограничение частоты: до фильтров и обработчиков, чтобы лишние обновления не нагружали базу
+    if config.THROTTLE_MODE != "off":
+        throttling = ThrottlingMiddleware(
+            config.THROTTLE_RATE, config.THROTTLE_BURST, config.THROTTLE_MODE,
+            config.THROTTLE_MAX_USERS, config.THROTTLE_MAX_WAIT,
+        )
+        dp.message.outer_middleware(throttling)
+        dp.callback_query.outer_middleware(throttling)
+        dp.shutdown.register(throttling.shutdown)
+    
+    # Применяем middleware ко всем роутерам
+    ingest = IngestService(database, categorizer, similarity=similarity)
+    # Пакетный режим: альбомы и серии пересылок собираются в одну пачку записей
+    batcher = MessageBatcher(config.BULK_COALESCE_DELAY, max_items=config.BULK_MAX_ENTRIES) if config.BULK_INGEST else None
+    if batcher is not None:
+        dp.shutdown.register(batcher.shutdown)
+    middleware = DependencyMiddleware(database, categorizer, ingest, similarity, batcher, config.LOG_DEBUG_SAMPLE_RATE)
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+    
+    # Регистрация роутеров
+    logger.info("=== РЕГИСТРАЦИЯ РОУТЕРОВ ===")
+    dp.include_router(start_router)
+    logger.info("start_router зарегистрирован")
+    dp.include_router(today_router)
+    logger.info("today_router зарегистрирован")
+    dp.include_router(search_router)
+    logger.info("search_router зарегистрирован")
+    dp.include_router(similar_router)
+    logger.info("similar_router зарегистрирован")
+    dp.include_router(categories_router)
+    logger.info("categories_router зарегистрирован")
+    dp.include_router(archive_router)
+    logger.info("archive_router зарегистрирован")
+    dp.include_router(archive_state_router)  # Роутер для состояний архива
+    logger.info("archive_state_router зарегистрирован")
+    dp.include_router(add_category_router)
+    logger.info("add_category_router зарегистрирован")
+    dp.include_router(reminders_router)
+    logger.info("reminders_router зарегистрирован")
+    dp.include_router(export_router)
+    logger.info("export_router зарегистрирован")
+    dp.include_router(stats_router)
+    logger.info("stats_router зарегистрирован")
+    dp.include_router(digest_router)
+    logger.info("digest_router зарегистрирован")
+    dp.include_router(dump_router)  # Должен быть последним: сохраняет текст, не обработанный другими роутерами
+    logger.info("dump_router зарегистрирован")
+    logger.info(f"Всего обработчиков в диспетчере: {len(dp.message.handlers)}")
+    
+    return dp
+
+
+def create_sender() -> OutboundSender:
+    """Очередь исходящих сообщений с лимитами из конфигурации (используется также нагрузочным тестом)"""
+    return OutboundSender(
+        config.SENDER_GLOBAL_RATE, config.SENDER_CHAT_RATE, config.SENDER_CHAT_BURST,
+        workers=config.SENDER_WORKERS, max_retries=config.SENDER_MAX_RETRIES,
+    )
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Прием обновлений через вебхук до SIGTERM/SIGINT"""
+    if not config.WEBHOOK_SECRET:
+        raise ValueError("WEBHOOK_SECRET не задан: без него вебхук принимал бы обновления от кого угодно")
+    
+    server = WebhookServer(
+        dp, bot, config.WEBHOOK_PATH, config.WEBHOOK_SECRET,
+        host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT,
+        queue_size=config.WEBHOOK_QUEUE_SIZE, workers=config.WEBHOOK_WORKERS,
+        webhook_url=config.WEBHOOK_URL,
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, server.request_stop)
+    await server.run_forever()
+
+
 async def main():
     """Главная функция запуска бота"""
+    timer = StartupTimer(STARTED_AT)
+    timer.mark("импорт модулей")
     try:
         logger.info("Запуск MindFlow Journal бота...")
         
-        # Инициализация бота и диспетчера
+        # Инициализация бота
         bot = Bot(token=config.BOT_TOKEN)
-        storage = MemoryStorage()
-        dp = Dispatcher(storage=storage)
+        # Очередь исходящих сообщений - снаружи метрик, чтобы в них попадала каждая попытка отправки
+        sender = create_sender()
+        bot.session.middleware(sender)
+        bot.session.middleware(TelegramRequestMetrics())
+        await sender.start()
+        timer.mark("создание бота")
         
         # Инициализация базы данных
         logger.info(f"Проверка настроек базы данных:")
@@ -73,148 +257,83 @@ async def main():
         logger.info(f"DATABASE_URL: {'Есть' if config.DATABASE_URL and config.DATABASE_URL.strip() else 'Нет'}")
         logger.info(f"DATABASE_PATH: {config.DATABASE_PATH}")
         
-        if config.SUPABASE_KEY and config.SUPABASE_KEY.strip():
-            database = SupabaseDatabase(config.SUPABASE_URL, config.SUPABASE_KEY)
-            logger.info("Используется Supabase API")
-        elif config.DATABASE_URL and config.DATABASE_URL.strip():
-            database = PostgresDatabase(config.DATABASE_URL)
-            logger.info("Используется PostgreSQL база данных")
-        else:
-            database = Database(config.DATABASE_PATH)
-            logger.info("Используется SQLite база данных (fallback)")
+        database = InstrumentedDatabase(create_database())
+        timer.mark("выбор бэкенда базы данных")
         
         await database.connect()
         logger.info("База данных подключена")
+        timer.mark("подключение к базе данных")
         
         # Инициализация категоризатора
-        categorizer = Categorizer(database)
+        categorizer = Categorizer(database, create_category_model())
         logger.info("Категоризатор инициализирован")
         
-        # Внедрение зависимостей через middleware
-        from aiogram.fsm.middleware import BaseMiddleware
-        
-        class DependencyMiddleware(BaseMiddleware):
-            def __init__(self, database, categorizer):
-                super().__init__()
-                self.database = database
-                self.categorizer = categorizer
-            
-            async def __call__(self, handler, event, data):
-                logger.info(f"=== MIDDLEWARE СРАБОТАЛ ===")
-                logger.info(f"Тип события: {type(event)}")
-                if hasattr(event, 'text'):
-                    logger.info(f"Текст события: '{event.text}'")
-                data["database"] = self.database
-                data["categorizer"] = self.categorizer
-                logger.info("Зависимости добавлены в data")
-                return await handler(event, data)
-        
-        # Применяем middleware ко всем роутерам
-        middleware = DependencyMiddleware(database, categorizer)
-        dp.message.middleware(middleware)
-        dp.callback_query.middleware(middleware)
-        
-        # Регистрация роутеров
-        logger.info("=== РЕГИСТРАЦИЯ РОУТЕРОВ ===")
-        dp.include_router(start_router)
-        logger.info("start_router зарегистрирован")
-        dp.include_router(today_router)
-        logger.info("today_router зарегистрирован")
-        dp.include_router(search_router)
-        logger.info("search_router зарегистрирован")
-        dp.include_router(categories_router)
-        logger.info("categories_router зарегистрирован")
-        dp.include_router(archive_router)
-        logger.info("archive_router зарегистрирован")
-        dp.include_router(archive_state_router)  # Роутер для состояний архива
-        logger.info("archive_state_router зарегистрирован")
-        dp.include_router(add_category_router)
-        logger.info("add_category_router зарегистрирован")
-        dp.include_router(reminders_router)
-        logger.info("reminders_router зарегистрирован")
-        dp.include_router(dump_router)  # Должен быть последним для обработки текста
-        logger.info("dump_router зарегистрирован")
-        logger.info(f"Всего обработчиков в диспетчере: {len(dp.message.handlers)}")
-        
-        # Добавляем обработчик прямо в диспетчер для отладки
-        @dp.message(F.text & ~F.text.startswith('/'))
-        async def debug_text_handler(message: Message, database, categorizer):
-            logger.info(f"=== ОБРАБОТЧИК ТЕКСТОВЫХ СООБЩЕНИЙ СРАБОТАЛ ===")
-            logger.info(f"Текст: '{message.text}'")
-            
-            try:
-                user_id = message.from_user.id
-                text = message.text.strip()
-                
-                if not text:
-                    await message.answer("Пожалуйста, отправьте непустое сообщение.")
-                    return
-                    
-                # Категоризируем текст
-                category, emoji = await categorizer.categorize(text, user_id)
-                logger.info(f"Текст категоризирован как '{category}' с эмодзи '{emoji}'")
-                
-                # Сохраняем в базу данных
-                logger.info(f"Попытка сохранения записи в базу данных...")
-                entry_id = await database.add_entry(user_id, text, category)
-                logger.info(f"Результат сохранения записи, получен ID: {entry_id}")
-                
-                if entry_id:
-                    response = f"✅ Записано!\nКатегория: {emoji} {category}"
-                    
-                    # Проверяем, нужно ли создать напоминание
-                    from utils.reminder_parser import ReminderParser
-                    reminder_parser = ReminderParser()
-                    should_create = reminder_parser.should_create_reminder(text, category)
-                    logger.info(f"Проверка напоминания: категория='{category}', should_create={should_create}")
-                    
-                    if should_create:
-                        reminder_data = reminder_parser.parse_time_from_text(text)
-                        if reminder_data:
-                            reminder_time, description = reminder_data
-                            logger.info(f"Создание напоминания: время='{reminder_time}', описание='{description}'")
-                            success = await database.add_reminder(user_id, entry_id, text, reminder_time)
-                            if success:
-                                response += f"\n⏰ Напоминание создано: {description}"
-                                logger.info(f"Напоминание создано для пользователя {user_id} на {reminder_time}")
-                            else:
-                                response += "\n⚠️ Ошибка создания напоминания"
-                                logger.error(f"Ошибка создания напоминания для пользователя {user_id}")
-                        else:
-                            logger.info("Время не найдено в тексте для напоминания")
-                    
-                    await message.answer(response)
-                    logger.info(f"Сообщение пользователя {user_id} сохранено в категорию '{category}'")
-                else:
-                    await message.answer("❌ Ошибка при сохранении. Попробуйте позже.")
-                    logger.error(f"Ошибка сохранения сообщения пользователя {user_id}")
-                    
-            except Exception as e:
-                logger.error(f"Ошибка в обработчике текстовых сообщений: {e}")
-                logger.error(f"Тип ошибки: {type(e)}")
-                await message.answer("Произошла ошибка. Попробуйте позже.")
-        
-        logger.info("Обработчик текстовых сообщений добавлен")
+        # Инициализация диспетчера с роутерами и middleware
+        dp = build_dispatcher(database, categorizer, create_similarity_index(database))
+        timer.mark("диспетчер и роутеры")
         
         # Установка команд бота
         await set_commands(bot)
         logger.info("Команды бота установлены")
+        timer.mark("установка команд бота")
         
-        # Запуск планировщика напоминаний
-        scheduler = ReminderScheduler(bot, database)
-        asyncio.create_task(scheduler.start())
-        logger.info("Планировщик напоминаний запущен")
+        # Фоновые задачи; при нескольких экземплярах за балансировщиком их запускает только один
+        if config.BACKGROUND_JOBS:
+            # Запуск планировщика напоминаний
+            scheduler = ReminderScheduler(bot, database)
+            asyncio.create_task(scheduler.start())
+            logger.info("Планировщик напоминаний запущен")
+            
+            # Запуск обслуживания хранилища (секции PostgreSQL, архив SQLite)
+            maintenance = StorageMaintenance(database, config.MAINTENANCE_INTERVAL)
+            asyncio.create_task(maintenance.start())
+            
+            # Запуск резервного копирования (только SQLite; копия снимается без остановки бота)
+            if config.BACKUP_INTERVAL:
+                backup = SQLiteBackup(database, config.BACKUP_DIR, config.BACKUP_KEEP, config.BACKUP_COMPRESS,
+                                      config.BACKUP_PAGES, config.BACKUP_STEP_SLEEP, config.BACKUP_INTERVAL)
+                asyncio.create_task(backup.start())
+            
+            # Запуск еженедельной сводки (рассылка в ночь на понедельник, через очередь исходящих сообщений)
+            digest_scheduler = DigestScheduler(bot, database, config.DIGEST_HOUR, config.DIGEST_CONCURRENCY,
+                                               config.DIGEST_CHECK_INTERVAL)
+            asyncio.create_task(digest_scheduler.start())
+        else:
+            logger.info("Фоновые задачи отключены (BACKGROUND_JOBS=0)")
         
+        # Запуск HTTP-сервера метрик
+        if config.METRICS_PORT:
+            metrics_server = MetricsServer(REGISTRY, config.METRICS_HOST, config.METRICS_PORT)
+            metrics_server.add_text_route("/queries", QUERY_LOG.format_top)
+            await metrics_server.start()
+        
+        # kill -USR1 <pid> выводит в лог самые дорогие запросы к базе данных
+        if hasattr(signal, "SIGUSR1"):
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGUSR1, lambda: logger.info("Самые дорогие запросы:\n" + QUERY_LOG.format_top())
+            )
+        
+        timer.mark("фоновые задачи")
+        timer.log_report()
         logger.info("MindFlow Journal бот запущен и готов к работе!")
         
         # Запуск бота
-        await dp.start_polling(bot)
+        if config.BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # Вебхук, оставшийся от режима webhook, не дал бы получать обновления через getUpdates
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
         
     except Exception as e:
         logger.error(f"Критическая ошибка при запуске бота: {e}")
         raise
     finally:
         # Закрытие соединений
+        if 'metrics_server' in locals():
+            await metrics_server.stop()
+        if 'sender' in locals():
+            await sender.stop()
         if 'database' in locals():
             await database.disconnect()
         if 'bot' in locals():
@@ -223,10 +342,16 @@ async def main():
 
 
 if __name__ == "__main__":
+    log_listener = setup_logging(
+        config.LOG_LEVEL, config.LOG_FORMAT, config.LOG_FILE, config.LOG_MAX_BYTES, config.LOG_BACKUP_COUNT
+    )
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
     except Exception as e:
         logger.error(f"Неожиданная ошибка: {e}")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
+    finally:
+        # Дописываем оставшиеся в очереди записи
+        log_listener.stop() 
\ No newline at end of file
@@ -0,0 +1,58 @@
+-- Перевод существующей базы Supabase на справочник категорий (схема 4):
+-- entries.category (TEXT) -> entries.category_id, у напоминаний удаляется копия текста записи.
+-- Порядок (бот остановлен), каждый шаг - отдельным запуском в SQL-редакторе:
+-- 1. этот скрипт - справочник, столбец category_id и процедура переноса;
+-- 2. отдельный запрос CALL migrate_entries_category_id(); - процедура фиксирует каждую порцию
+--    (COMMIT), а внутри многооператорного запроса редактора это ошибка
+--    "invalid transaction termination", поэтому CALL нельзя выполнять вместе с другими операторами;
+-- 3. migrate_categories_finish.sql;
+-- 4. create_tables.sql и grant_permissions.sql, затем SELECT backfill_daily_category_counts();
+--    и запуск бота.
+-- Через psql шаги 1-3 можно выполнить подряд: psql -f migrate_categories.sql -c "CALL migrate_entries_category_id();" -f migrate_categories_finish.sql
+
+CREATE TABLE IF NOT EXISTS categories (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL DEFAULT 0,
+    name TEXT NOT NULL,
+    UNIQUE(user_id, name)
+);
+
+INSERT INTO categories (user_id, name)
+SELECT 0, name FROM unnest(ARRAY['Задачи', 'Идеи', 'Вопросы', 'Тревоги', 'Факты', 'Планы', 'Напоминания', 'Прочее']) AS name
+ON CONFLICT (user_id, name) DO NOTHING;
+
+-- Пользовательские категории, встречающиеся в записях
+INSERT INTO categories (user_id, name)
+SELECT DISTINCT user_id, category FROM entries
+WHERE category NOT IN (SELECT name FROM categories WHERE user_id = 0)
+ON CONFLICT (user_id, name) DO NOTHING;
+
+ALTER TABLE entries ADD COLUMN IF NOT EXISTS category_id INTEGER REFERENCES categories(id);
+
+-- Заполнение category_id порциями по диапазонам id: каждая порция фиксируется отдельно,
+-- без одной долгой транзакции на всю таблицу
+CREATE OR REPLACE PROCEDURE migrate_entries_category_id(batch_size INTEGER DEFAULT 10000)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    first_id INTEGER;
+    last_id INTEGER;
+    start_id INTEGER;
+BEGIN
+    SELECT MIN(id), MAX(id) INTO first_id, last_id FROM entries;
+    IF first_id IS NULL THEN
+        RETURN;
+    END IF;
+    start_id := first_id;
+    WHILE start_id <= last_id LOOP
+        UPDATE entries e SET category_id = (
+            SELECT c.id FROM categories c
+            WHERE c.name = e.category AND c.user_id IN (0, e.user_id)
+            ORDER BY c.user_id LIMIT 1
+        )
+        WHERE e.id BETWEEN start_id AND start_id + batch_size - 1 AND e.category_id IS NULL;
+        COMMIT;
+        start_id := start_id + batch_size;
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,17 @@
+-- Завершение перевода на справочник категорий (шаг 3, см. migrate_categories.sql): выполняется
+-- после CALL migrate_entries_category_id(); если у каких-то записей category_id не заполнен,
+-- SET NOT NULL завершится ошибкой и столбец category не будет удален
+
+DROP PROCEDURE IF EXISTS migrate_entries_category_id(INTEGER);
+
+-- Функции и представления со старыми столбцами пересоздает create_tables.sql
+DROP FUNCTION IF EXISTS today_view(BIGINT, DATE, INTEGER);
+DROP FUNCTION IF EXISTS claim_due_reminders(TIMESTAMP, INTEGER);
+DROP FUNCTION IF EXISTS digest_entries(TIMESTAMP, TIMESTAMP, BIGINT, INTEGER, INTEGER);
+DROP FUNCTION IF EXISTS digest_reminders(TIMESTAMP, TIMESTAMP, BIGINT, INTEGER, INTEGER);
+
+ALTER TABLE entries ALTER COLUMN category_id SET NOT NULL, DROP COLUMN category;
+ALTER TABLE reminders DROP COLUMN IF EXISTS text;
+
+-- Сводная таблица пересоздается с category_id и пересчитывается (backfill_daily_category_counts)
+DROP TABLE IF EXISTS daily_category_counts;
@@ -0,0 +1,64 @@
+-- Перевод существующей несекционированной таблицы entries в Supabase на помесячные секции
+-- (для PostgreSQL бот выполняет тот же перевод сам при запуске - переход на схему 7).
+-- Записи только добавляются, поэтому шаги 1-2 можно выполнять при работающем боте:
+-- 1. этот скрипт - секционированная копия entries_partitioned, секции на все месяцы с записями
+--    и процедура копирования;
+-- 2. отдельный запрос CALL copy_entries_to_partitioned(); - процедура фиксирует каждую порцию
+--    (COMMIT), поэтому CALL нельзя выполнять вместе с другими операторами; после сбоя
+--    повторный CALL продолжает с последнего скопированного id;
+-- 3. partition_entries_finish.sql - докопирование новых строк и подмена таблиц одной транзакцией
+--    (entries на это время блокируется);
+-- 4. create_tables.sql и grant_permissions.sql - индекс, триггер сводной таблицы и представления
+--    (сразу после шага 3: до этого представления entries_view и reminders_view отсутствуют).
+-- Через psql шаги 1-3 можно выполнить подряд: psql -f partition_entries.sql -c "CALL copy_entries_to_partitioned();" -f partition_entries_finish.sql
+
+CREATE TABLE IF NOT EXISTS entries_partitioned (
+    id INTEGER NOT NULL,
+    user_id BIGINT NOT NULL,
+    text TEXT NOT NULL,
+    datetime TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    category_id INTEGER NOT NULL REFERENCES categories(id),
+    PRIMARY KEY (id, datetime)
+) PARTITION BY RANGE (datetime);
+
+-- Секции от месяца самой старой записи до трех месяцев вперед и секция по умолчанию
+DO $$
+DECLARE
+    month_start DATE;
+    last_month DATE;
+BEGIN
+    SELECT date_trunc('month', COALESCE(MIN(datetime), CURRENT_DATE))::DATE INTO month_start FROM entries;
+    last_month := (date_trunc('month', CURRENT_DATE) + INTERVAL '3 months')::DATE;
+    WHILE month_start <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF entries_partitioned FOR VALUES FROM (%L) TO (%L)',
+            'entries_' || to_char(month_start, 'YYYY_MM'),
+            month_start,
+            (month_start + INTERVAL '1 month')::DATE
+        );
+        month_start := (month_start + INTERVAL '1 month')::DATE;
+    END LOOP;
+    EXECUTE 'CREATE TABLE IF NOT EXISTS entries_default PARTITION OF entries_partitioned DEFAULT';
+END;
+$$;
+
+-- Копирование порциями по диапазонам id: каждая порция фиксируется отдельно
+CREATE OR REPLACE PROCEDURE copy_entries_to_partitioned(batch_size INTEGER DEFAULT 10000)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    start_id INTEGER;
+    last_id INTEGER;
+BEGIN
+    SELECT COALESCE(MAX(id), 0) + 1 INTO start_id FROM entries_partitioned;
+    SELECT MAX(id) INTO last_id FROM entries;
+    WHILE start_id <= last_id LOOP
+        INSERT INTO entries_partitioned (id, user_id, text, datetime, category_id)
+        SELECT id, user_id, text, datetime, category_id FROM entries
+        WHERE id BETWEEN start_id AND start_id + batch_size - 1
+        ON CONFLICT DO NOTHING;
+        COMMIT;
+        start_id := start_id + batch_size;
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,32 @@
+-- Завершение перевода entries на секции (шаг 3, см. partition_entries.sql): выполняется после
+-- CALL copy_entries_to_partitioned(); одной транзакцией. Строки, добавленные после копирования,
+-- докопируются под блокировкой, последовательность id переходит к новой таблице, старая удаляется.
+
+BEGIN;
+
+DROP PROCEDURE IF EXISTS copy_entries_to_partitioned(INTEGER);
+
+-- Представления над старой таблицей пересоздает create_tables.sql
+DROP VIEW IF EXISTS entries_view;
+DROP VIEW IF EXISTS reminders_view;
+
+DO $$
+DECLARE
+    id_sequence TEXT;
+BEGIN
+    LOCK TABLE entries IN ACCESS EXCLUSIVE MODE;
+    INSERT INTO entries_partitioned (id, user_id, text, datetime, category_id)
+    SELECT id, user_id, text, datetime, category_id FROM entries
+    WHERE id > (SELECT COALESCE(MAX(id), 0) FROM entries_partitioned);
+
+    id_sequence := pg_get_serial_sequence('entries', 'id');
+    ALTER TABLE entries RENAME TO entries_unpartitioned;
+    ALTER INDEX IF EXISTS idx_entries_user_datetime RENAME TO idx_entries_unpartitioned_user_datetime;
+    ALTER TABLE entries_partitioned RENAME TO entries;
+    EXECUTE format('ALTER TABLE entries ALTER COLUMN id SET DEFAULT nextval(%L::regclass)', id_sequence);
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY entries.id', id_sequence);
+    DROP TABLE entries_unpartitioned;
+END;
+$$;
+
+COMMIT;
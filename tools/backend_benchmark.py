@@ -0,0 +1,420 @@
+"""
+Проверка соответствия бэкендов общему интерфейсу и замер их пропускной способности
+
+Один и тот же сценарий (сохранение, /today, /archive, /search, напоминания) выполняется
+для каждого бэкенда; выводятся ошибки соответствия, ops/sec и p50/p99 по операциям.
+Каждый бэкенд подключается к пустой базе (новые файлы SQLite, новая схема PostgreSQL,
+удаляемая после проверки), поэтому создание схемы с нуля проверяется при каждом запуске.
+
+Запуск:
+    python -m tools.backend_benchmark
+    python -m tools.backend_benchmark --backends memory,sqlite --ops 2000
+    python -m tools.backend_benchmark --postgres-dsn postgresql://localhost/mindflow_bench
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+
+from db.base import JournalDatabase
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_RE = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$")
+
+SAMPLE_TEXTS = [
+    "нужно купить хлеб и молоко",
+    "идея для нового проекта: бот для заметок",
+    "почему небо голубое?",
+    "боюсь не успеть к дедлайну",
+    "прочитал интересный факт про осьминогов",
+    "планирую пробежать марафон",
+    "через 10 минут позвонить маме",
+    "просто хороший день",
+]
+
+
+# --- соответствие интерфейсу ---
+
+def _check(failures: List[str], condition: bool, message: str):
+    if not condition:
+        failures.append(message)
+
+
+def _check_entries(failures: List[str], name: str, entries):
+    _check(failures, isinstance(entries, list), f"{name}: ожидался list, получен {type(entries).__name__}")
+    for entry in entries:
+        ok = (
+            isinstance(entry, tuple) and len(entry) == 3
+            and isinstance(entry[0], str) and isinstance(entry[1], str)
+            and isinstance(entry[2], str) and TIMESTAMP_RE.match(entry[2])
+        )
+        _check(failures, bool(ok), f"{name}: неверный формат записи {entry!r}")
+
+
+async def check_conformance(database: JournalDatabase) -> List[str]:
+    """Проверка типов и семантики ответов бэкенда. Возвращает список нарушений."""
+    failures: List[str] = []
+    user_id = random.randint(10**12, 10**13)
+    today = date.today().isoformat()
+
+    _check(failures, isinstance(database, JournalDatabase), "бэкенд не реализует JournalDatabase")
+
+    entry_id = await database.add_entry(user_id, "Проверка соответствия: купить хлеб", "Задачи")
+    _check(failures, isinstance(entry_id, int), f"add_entry: ожидался int, получен {entry_id!r}")
+    await database.add_entry(user_id, "вторая запись", "Прочее")
+
+    today_entries = await database.get_today_entries(user_id)
+    _check_entries(failures, "get_today_entries", today_entries)
+    _check(failures, len(today_entries) == 2, f"get_today_entries: ожидалось 2 записи, получено {len(today_entries)}")
+    if len(today_entries) == 2:
+        _check(failures, today_entries[0][2] >= today_entries[1][2], "get_today_entries: порядок не по убыванию времени")
+
+    view_entries, view_counts = await database.get_today_view(user_id, 1)
+    _check_entries(failures, "get_today_view", view_entries)
+    _check(failures, view_entries == today_entries[:1], f"get_today_view: ожидалась последняя запись, получено {view_entries!r}")
+    _check(failures, list(view_counts) == [("Задачи", 1), ("Прочее", 1)], f"get_today_view: неверные счетчики {view_counts!r}")
+
+    by_date = await database.get_entries_by_date(user_id, today)
+    _check_entries(failures, "get_entries_by_date", by_date)
+    _check(failures, len(by_date) == 2, f"get_entries_by_date: ожидалось 2 записи, получено {len(by_date)}")
+
+    found = await database.search_entries(user_id, "ХЛЕБ")
+    _check_entries(failures, "search_entries", found)
+    _check(failures, len(found) == 1, f"search_entries: поиск без учета регистра нашел {len(found)} записей")
+
+    counts = await database.get_daily_category_counts(user_id, today)
+    _check(failures, sorted((c, n) for _, c, n in counts) == [("Задачи", 1), ("Прочее", 1)],
+           f"get_daily_category_counts: неверные счетчики {counts!r}")
+    for day, _, _ in counts:
+        _check(failures, isinstance(day, str) and len(day) == 10, f"get_daily_category_counts: неверный день {day!r}")
+
+    _check(failures, await database.add_custom_category(user_id, "Работа", "проект") is True, "add_custom_category: ожидался True")
+    _check(failures, await database.add_custom_category(user_id, "Работа", "проект,дедлайн") is True,
+           "add_custom_category: повторное добавление должно обновлять ключевые слова")
+    custom = await database.get_custom_categories(user_id)
+    _check(failures, custom == [("Работа", "проект,дедлайн")], f"get_custom_categories: {custom!r}")
+    all_custom = await database.get_all_custom_categories()
+    _check(failures, (user_id, "Работа", "проект,дедлайн") in all_custom, "get_all_custom_categories: категория не найдена")
+
+    past = (datetime.now() - timedelta(minutes=5)).strftime("%Y-%m-%d %H:%M:%S")
+    future = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    _check(failures, await database.add_reminder(user_id, entry_id, past) is True, "add_reminder: ожидался True")
+    await database.add_reminder(user_id, entry_id, future)
+
+    pending = [r for r in await database.get_pending_reminders() if r[1] == user_id]
+    _check(failures, len(pending) == 1, f"get_pending_reminders: ожидалось 1 напоминание, получено {len(pending)}")
+    for reminder_id, _, text, reminder_time in pending:
+        _check(failures, isinstance(reminder_id, int) and TIMESTAMP_RE.match(reminder_time) is not None,
+               f"get_pending_reminders: неверный формат {(reminder_id, reminder_time)!r}")
+        _check(failures, await database.mark_reminder_sent(reminder_id) is True, "mark_reminder_sent: ожидался True")
+    pending = [r for r in await database.get_pending_reminders() if r[1] == user_id]
+    _check(failures, not pending, "mark_reminder_sent: напоминание осталось в ожидающих")
+
+    # Выборка с отметкой: напоминание выдается один раз, после release_reminder - снова
+    claim_user_id = user_id + 3
+    claim_entry_id = await database.add_entry(claim_user_id, "позвонить", "Задачи")
+    await database.add_reminder(claim_user_id, claim_entry_id, past)
+    await database.add_reminder(claim_user_id, claim_entry_id, future)
+    claimed = [r for r in await database.claim_due_reminders() if r[1] == claim_user_id]
+    _check(failures, [r[2:] for r in claimed] == [("позвонить", past)], f"claim_due_reminders: {claimed!r}")
+    _check(failures, all(isinstance(r[0], int) for r in claimed), f"claim_due_reminders: неверный id {claimed!r}")
+    again = [r for r in await database.claim_due_reminders() if r[1] == claim_user_id]
+    _check(failures, not again, f"claim_due_reminders: напоминание выдано повторно {again!r}")
+    if claimed:
+        due_before = await database.count_due_reminders()
+        _check(failures, await database.release_reminder(claimed[0][0]) is True, "release_reminder: ожидался True")
+        due_after = await database.count_due_reminders()
+        _check(failures, isinstance(due_before, int) and due_after == due_before + 1,
+               f"count_due_reminders: {due_before!r} -> {due_after!r} после release_reminder")
+        released = [r for r in await database.claim_due_reminders() if r[1] == claim_user_id]
+        _check(failures, released == claimed, f"release_reminder: напоминание не вернулось в ожидающие {released!r}")
+
+    reminders = await database.get_user_reminders(user_id)
+    _check(failures, len(reminders) == 2, f"get_user_reminders: ожидалось 2, получено {len(reminders)}")
+    for reminder in reminders:
+        ok = (
+            isinstance(reminder, tuple) and len(reminder) == 4 and isinstance(reminder[0], int)
+            and TIMESTAMP_RE.match(reminder[2]) is not None and isinstance(reminder[3], bool)
+        )
+        _check(failures, bool(ok), f"get_user_reminders: неверный формат {reminder!r}")
+    if len(reminders) == 2:
+        _check(failures, reminders[0][2] > reminders[1][2], "get_user_reminders: порядок не по убыванию времени")
+        _check(failures, [r[3] for r in reminders] == [False, True], f"get_user_reminders: флаги is_sent {reminders!r}")
+    _check(failures, all(r[1] == "Проверка соответствия: купить хлеб" for r in reminders),
+           f"get_user_reminders: текст напоминания не совпадает с текстом записи {reminders!r}")
+
+    exported = [entry async for entry in database.iter_entries(user_id, 1)]
+    _check(failures, [e[0] for e in exported][:1] == [entry_id] and len(exported) == 2, f"iter_entries: {exported!r}")
+    for entry in exported:
+        _check(failures, TIMESTAMP_RE.match(entry[3]) is not None, f"iter_entries: неверная дата {entry!r}")
+    after = [entry async for entry in database.iter_entries(user_id, 1, after_id=entry_id)]
+    _check(failures, after == exported[1:], f"iter_entries после id {entry_id}: {after!r}")
+    # Записи по id: только свои, с тем же форматом, что у iter_entries
+    by_ids = await database.get_entries_by_ids(user_id, [entry_id, claim_entry_id])
+    _check(failures, [tuple(e) for e in by_ids] == [tuple(e) for e in exported[:1]], f"get_entries_by_ids: {by_ids!r}")
+    _check(failures, await database.get_entries_by_ids(user_id, []) == [], "get_entries_by_ids: пустой список id")
+    exported_reminders = [r async for r in database.iter_reminders(user_id, 1)]
+    _check(failures, len(exported_reminders) == 2 and all(isinstance(r[4], bool) for r in exported_reminders),
+           f"iter_reminders: {exported_reminders!r}")
+
+    # Запись вместе с напоминанием и без него (отдельный пользователь, чтобы не менять счетчики выше)
+    ingest_user_id = user_id + 1
+    with_reminder = await database.add_entry_with_reminder(ingest_user_id, "позвонить маме", "Задачи", future)
+    _check(failures, isinstance(with_reminder, int), f"add_entry_with_reminder: ожидался int, получен {with_reminder!r}")
+    without_reminder = await database.add_entry_with_reminder(ingest_user_id, "просто запись", "Прочее")
+    _check(failures, isinstance(without_reminder, int), f"add_entry_with_reminder без времени: получен {without_reminder!r}")
+    ingested = [r async for r in database.iter_reminders(ingest_user_id)]
+    _check(failures, [(r[1], r[2]) for r in ingested] == [(with_reminder, "позвонить маме")],
+           f"add_entry_with_reminder: напоминания {ingested!r}")
+    _check(failures, len(await database.get_today_entries(ingest_user_id)) == 2, "add_entry_with_reminder: записи не найдены")
+
+    # Состояния диалогов (FSM): чтение, перезапись, истечение срока и удаление
+    now = time.time()
+    storage_key = f"conformance:{user_id}"
+    _check(failures, await database.get_fsm_record(storage_key, now) is None, "get_fsm_record: ожидался None для нового ключа")
+    _check(failures, await database.set_fsm_record(storage_key, "Archive:waiting", '{"a": 1}', now + 60) is True,
+           "set_fsm_record: ожидался True")
+    await database.set_fsm_record(storage_key, "Archive:done", "{}", now + 60)
+    record = await database.get_fsm_record(storage_key, now)
+    _check(failures, record == ("Archive:done", "{}"), f"get_fsm_record: {record!r}")
+    _check(failures, await database.get_fsm_record(storage_key, now + 120) is None, "get_fsm_record: вернул запись с истекшим сроком")
+    _check(failures, await database.delete_fsm_record(storage_key) is True, "delete_fsm_record: ожидался True")
+    _check(failures, await database.get_fsm_record(storage_key, now) is None, "delete_fsm_record: запись осталась")
+    await database.set_fsm_record(storage_key, None, '{"a": 1}', now - 1)
+    _check(failures, await database.delete_expired_fsm_records(now) >= 1, "delete_expired_fsm_records: запись не удалена")
+
+    # Еженедельная сводка: подписка, потоковое чтение по подписчикам и контрольная точка
+    digest_user_id = user_id + 2
+    await database.add_entry(digest_user_id, "боюсь не успеть", "Тревоги")
+    await database.add_entry_with_reminder(digest_user_id, "позвонить в банк", "Задачи", future)
+    _check(failures, await database.is_digest_subscribed(digest_user_id) is False, "is_digest_subscribed: ожидался False")
+    _check(failures, await database.set_digest_subscription(digest_user_id, True) is True, "set_digest_subscription: ожидался True")
+    _check(failures, await database.set_digest_subscription(digest_user_id, True) is True,
+           "set_digest_subscription: повторная подписка должна быть успешной")
+    _check(failures, await database.is_digest_subscribed(digest_user_id) is True, "is_digest_subscribed: ожидался True")
+
+    since = (datetime.now() - timedelta(days=2)).strftime("%Y-%m-%d %H:%M:%S")
+    until = (datetime.now() + timedelta(days=2)).strftime("%Y-%m-%d %H:%M:%S")
+    digest_rows = [row async for row in database.iter_digest_entries(since, until, 0, 1)]
+    user_ids = [row[0] for row in digest_rows]
+    _check(failures, user_ids == sorted(user_ids), f"iter_digest_entries: порядок не по user_id {user_ids!r}")
+    _check(failures, user_id not in user_ids, "iter_digest_entries: вернул записи пользователя без подписки")
+    mine = sorted(row for row in digest_rows if row[0] == digest_user_id)
+    _check(failures, mine == [(digest_user_id, "боюсь не успеть", "Тревоги"), (digest_user_id, "позвонить в банк", "Задачи")],
+           f"iter_digest_entries: {mine!r}")
+    after = [row async for row in database.iter_digest_entries(since, until, digest_user_id)]
+    _check(failures, all(row[0] > digest_user_id for row in after), "iter_digest_entries: after_user_id не учтен")
+    digest_reminders = [row async for row in database.iter_digest_reminders(since, until, digest_user_id - 1)]
+    _check(failures, (digest_user_id, "позвонить в банк", future) in digest_reminders,
+           f"iter_digest_reminders: {digest_reminders!r}")
+
+    # Пользовательская категория в записях: имя возвращается во всех выборках и счетчиках
+    custom_user_id = user_id + 4
+    await database.add_entry(custom_user_id, "созвон по проекту", "Работа")
+    await database.add_entry_with_reminder(custom_user_id, "сдать отчет", "Работа", future)
+    _check(failures, [e[1] for e in await database.get_today_entries(custom_user_id)] == ["Работа", "Работа"],
+           "add_entry: пользовательская категория не сохранилась")
+    custom_counts = await database.get_daily_category_counts(custom_user_id, today)
+    _check(failures, [(c, n) for _, c, n in custom_counts] == [("Работа", 2)], f"get_daily_category_counts: {custom_counts!r}")
+    _check(failures, [r[1] for r in await database.get_user_reminders(custom_user_id)] == ["сдать отчет"],
+           "get_user_reminders: текст напоминания не совпадает с текстом записи")
+
+    # Несколько записей одним обращением: id по порядку, напоминания у своих записей, счетчики
+    bulk_user_id = user_id + 5
+    bulk_items = [("купить хлеб", "Задачи", None), ("совещание", "Работа", future), ("купить молоко", "Задачи", past)]
+    bulk_ids = await database.add_entries_with_reminders(bulk_user_id, bulk_items)
+    _check(failures, isinstance(bulk_ids, list) and len(bulk_ids) == 3 and bulk_ids == sorted(bulk_ids),
+           f"add_entries_with_reminders: {bulk_ids!r}")
+    if bulk_ids and len(bulk_ids) == 3:
+        bulk_entries = [e async for e in database.iter_entries(bulk_user_id)]
+        _check(failures, [(e[0], e[1], e[2]) for e in bulk_entries] == [(i, t, c) for i, (t, c, _) in zip(bulk_ids, bulk_items)],
+               f"add_entries_with_reminders: записи {bulk_entries!r}")
+        bulk_reminders = sorted((r[1], r[2], r[3]) for r in [r async for r in database.iter_reminders(bulk_user_id)])
+        _check(failures, bulk_reminders == [(bulk_ids[1], "совещание", future), (bulk_ids[2], "купить молоко", past)],
+               f"add_entries_with_reminders: напоминания {bulk_reminders!r}")
+    bulk_counts = sorted((c, n) for _, c, n in await database.get_daily_category_counts(bulk_user_id, today))
+    _check(failures, bulk_counts == [("Задачи", 2), ("Работа", 1)], f"add_entries_with_reminders: счетчики {bulk_counts!r}")
+
+    period =f"conformance-{user_id}"
+    _check(failures, await database.get_digest_checkpoint(period) is None, "get_digest_checkpoint: ожидался None")
+    _check(failures, await database.set_digest_checkpoint(period, digest_user_id, False) is True, "set_digest_checkpoint: ожидался True")
+    await database.set_digest_checkpoint(period, digest_user_id + 1, True)
+    checkpoint = await database.get_digest_checkpoint(period)
+    _check(failures, checkpoint == (digest_user_id + 1, True), f"get_digest_checkpoint: {checkpoint!r}")
+    await database.set_digest_subscription(digest_user_id, False)
+    _check(failures, await database.is_digest_subscribed(digest_user_id) is False, "set_digest_subscription: отписка не сработала")
+
+    return failures
+
+
+# --- пропускная способность ---
+
+class OperationStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _timed(stats: Dict[str, OperationStats], name: str, call: Callable):
+    started = time.perf_counter()
+    try:
+        result = await call()
+        if result is None or result is False:
+            stats[name].errors += 1
+    except Exception:
+        stats[name].errors += 1
+    stats[name].latencies.append(time.perf_counter() - started)
+
+
+async def run_workload(database: JournalDatabase, ops: int, users: int, reminder_ratio: float) -> Dict[str, OperationStats]:
+    """Смешанная нагрузка: на каждое сохранение приходятся чтения /today, /archive, /search и напоминаний"""
+    operations = ["ingest", "today", "archive", "search", "reminders", "claim"]
+    stats = {name: OperationStats() for name in operations}
+    user_ids = [random.randint(10**12, 10**13) for _ in range(users)]
+    today = date.today().isoformat()
+    future = (datetime.now() + timedelta(hours=1)).strftime("%Y-%m-%d %H:%M:%S")
+
+    for i in range(ops):
+        user_id = user_ids[i % users]
+        text = random.choice(SAMPLE_TEXTS)
+
+        started = time.perf_counter()
+        try:
+            reminder_time = future if random.random() < reminder_ratio else None
+            entry_id = await database.add_entry_with_reminder(user_id, text, "Прочее", reminder_time)
+            if not entry_id:
+                stats["ingest"].errors += 1
+        except Exception:
+            stats["ingest"].errors += 1
+        stats["ingest"].latencies.append(time.perf_counter() - started)
+
+        await _timed(stats, "today", lambda: database.get_today_view(user_id))
+        await _timed(stats, "archive", lambda: database.get_entries_by_date(user_id, today))
+        if i % 4 == 0:
+            await _timed(stats, "search", lambda: database.search_entries(user_id, "проект"))
+            await _timed(stats, "reminders", lambda: database.get_user_reminders(user_id))
+        if i % 20 == 0:
+            await _timed(stats, "claim", database.claim_due_reminders)
+
+    return stats
+
+
+def format_report(backend: str, stats: Dict[str, OperationStats]) -> str:
+    lines = [f"\n== {backend} ==", f"{'операция':<10} {'кол-во':>7} {'ops/sec':>10} {'p50, мс':>9} {'p99, мс':>9} {'ошибки':>7}"]
+    for name, op in stats.items():
+        total = sum(op.latencies)
+        rate = len(op.latencies) / total if total else 0.0
+        lines.append(
+            f"{name:<10} {len(op.latencies):>7} {rate:>10.0f} "
+            f"{op.percentile(0.50) * 1000:>9.2f} {op.percentile(0.99) * 1000:>9.2f} {op.errors:>7}"
+        )
+    return "\n".join(lines)
+
+
+# --- бэкенды ---
+
+async def _open_backend(name: str, args, workdir: str):
+    """Создание бэкенда по имени; возвращает (database, функция_очистки)"""
+    if name == "memory":
+        from db.memory_database import MemoryDatabase
+        return MemoryDatabase(), None
+
+    if name == "sqlite":
+        from db.database import Database
+        return Database(os.path.join(workdir, "bench.db"), os.path.join(workdir, "bench_archive.db")), None
+
+    if name == "postgres":
+        # Каждый запуск - в новой пустой схеме: проверяется подключение к чистой базе
+        import asyncpg
+        from db.postgres_database import PostgresDatabase
+        schema = f"bench_{os.getpid()}_{int(time.time())}"
+        conn = await asyncpg.connect(args.postgres_dsn)
+        try:
+            await conn.execute(f"CREATE SCHEMA {schema}")
+        finally:
+            await conn.close()
+
+        async def drop_schema():
+            conn = await asyncpg.connect(args.postgres_dsn)
+            try:
+                await conn.execute(f"DROP SCHEMA {schema} CASCADE")
+            finally:
+                await conn.close()
+
+        # Неизвестные asyncpg параметры DSN передаются серверу как настройки сеанса
+        separator = "&" if "?" in args.postgres_dsn else "?"
+        return PostgresDatabase(f"{args.postgres_dsn}{separator}search_path={schema}"), drop_schema
+
+    if name == "supabase":
+        from db.supabase_database import SupabaseDatabase
+        from tools.fake_postgrest import FAKE_SUPABASE_KEY, FakePostgRESTServer
+        server = FakePostgRESTServer()
+        url = server.start()
+        return SupabaseDatabase(url, FAKE_SUPABASE_KEY), server.stop
+
+    raise ValueError(f"Неизвестный бэкенд: {name}")
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Соответствие и производительность бэкендов базы данных")
+    parser.add_argument("--backends", default="memory,sqlite,supabase,postgres")
+    parser.add_argument("--ops", type=int, default=1000, help="количество сохранений в сценарии")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--reminder-ratio", type=float, default=0.2)
+    parser.add_argument("--postgres-dsn", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--queries", action="store_true", help="вывести самые дорогие виды запросов из журнала запросов")
+    args = parser.parse_args(argv)
+
+    exit_code = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in [b.strip() for b in args.backends.split(",") if b.strip()]:
+            if name == "postgres" and not args.postgres_dsn:
+                print(f"\n== {name} ==\nпропущен: не задан --postgres-dsn (или BENCH_DATABASE_URL)")
+                continue
+
+            database, cleanup = await _open_backend(name, args, workdir)
+            try:
+                await database.connect()
+                failures = await check_conformance(database)
+                stats = await run_workload(database, args.ops, args.users, args.reminder_ratio)
+                print(format_report(name, stats))
+                if failures:
+                    exit_code = 1
+                    print(f"нарушения интерфейса ({len(failures)}):")
+                    for failure in failures:
+                        print(f"  - {failure}")
+                else:
+                    print("соответствие интерфейсу: OK")
+            finally:
+                await database.disconnect()
+                if cleanup:
+                    result = cleanup()
+                    if asyncio.iscoroutine(result):
+                        await result
+
+    if args.queries:
+        from db.query_log import QUERY_LOG
+        print("\n== самые дорогие запросы ==")
+        print(QUERY_LOG.format_top())
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,43 @@
+"""
+Разовый пересчет сводной таблицы daily_category_counts по существующим записям
+
+Бэкенд выбирается так же, как при запуске бота (config / .env). SQLite и PostgreSQL
+пересчитывают таблицу сами при переходе на новую схему; вручную пересчет нужен
+для Supabase или после правки записей в обход бота.
+
+Запуск: python -m tools.backfill_stats
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+async def backfill() -> bool:
+    """Подключение к выбранному бэкенду и пересчет сводной таблицы"""
+    from db.factory import create_database
+
+    database = create_database()
+    await database.connect()
+    try:
+        return await database.backfill_daily_category_counts()
+    finally:
+        await database.disconnect()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Пересчет сводной таблицы daily_category_counts для бэкенда из настроек бота")
+    parser.parse_args(argv)
+
+    # config читается после разбора аргументов: --help не требует BOT_TOKEN и не открывает базу
+    import config
+    logging.basicConfig(level=getattr(logging, config.LOG_LEVEL), format=config.LOG_FORMAT)
+    return 0 if asyncio.run(backfill()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
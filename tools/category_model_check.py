@@ -0,0 +1,67 @@
+"""
+Проверка подсказок обучаемой категоризации (utils.category_model) на синтетических записях
+
+Каждый сценарий обучает модель одного пользователя и сравнивает подсказку для текста
+с ожидаемой: категория или None (запись уйдет в «Прочее»). Среди сценариев - случаи,
+когда подсказку давала одна доля категории среди записей или служебные слова.
+
+Запуск:
+    python -m tools.category_model_check
+"""
+
+import sys
+from typing import List, Optional, Sequence, Tuple
+
+from utils.category_model import CategoryModel
+
+# (название, обучающие записи (текст, категория), текст, ожидаемая подсказка)
+Scenario = Tuple[str, Sequence[Tuple[str, str]], str, Optional[str]]
+
+_TASKS = ["купить молоко и хлеб", "купить подарок маме", "оплатить счет за свет",
+          "сделать отчет по проекту", "купить билеты в кино", "оплатить интернет"]
+_IDEAS = ["придумать приложение для заметок", "идея стартапа доставка цветов", "написать книгу про путешествия"]
+_WORRIES = ["переживаю из-за экзамена", "страшно что не успею к дедлайну", "тревожно за здоровье"]
+_OTHER = ["хороший день", "погода отличная", "сегодня гулял в парке", "смотрел фильм вечером"]
+
+_MIXED = ([(text, "Задачи") for text in _TASKS] * 5 + [(text, "Идеи") for text in _IDEAS] * 5
+          + [(text, "Тревоги") for text in _WORRIES] * 5 + [(text, "Прочее") for text in _OTHER])
+
+# Почти все записи - «Задачи», и во всех есть служебное слово
+_SKEWED = ([(f"что нужно сделать задание номер {i}", "Задачи") for i in range(18)]
+           + [(f"что если придумать идею {i}", "Идеи") for i in range(2)])
+
+SCENARIOS: List[Scenario] = [
+    ("доля категории и служебное слово", _SKEWED, "что за погода сегодня", None),
+    ("один слабый термин", _SKEWED, "какое сегодня задание", None),
+    ("характерное слово задачи", _MIXED, "купить хлеба", "Задачи"),
+    ("характерные слова задачи", _MIXED, "оплатить счет", "Задачи"),
+    ("характерные слова идеи", _MIXED, "придумать приложение", "Идеи"),
+    ("характерные слова тревоги", _MIXED, "переживаю из-за дедлайна", "Тревоги"),
+    ("текст как у «Прочее»", _MIXED, "что за погода сегодня", None),
+    ("мало записей", _MIXED[:10], "купить хлеба", None),
+]
+
+
+def run_scenario(training: Sequence[Tuple[str, str]], text: str) -> Optional[str]:
+    model = CategoryModel(min_examples=20)
+    user_model = model.new_user_model()
+    for entry_text, category in training:
+        user_model.learn(entry_text, category)
+    model.put(1, user_model)
+    return model.predict(1, text)
+
+
+def main() -> int:
+    failures = 0
+    for name, training, text, expected in SCENARIOS:
+        predicted = run_scenario(training, text)
+        if predicted == expected:
+            print(f"OK: {name}: {text!r} -> {predicted}")
+        else:
+            failures += 1
+            print(f"ОШИБКА: {name}: {text!r} -> {predicted}, ожидалось {expected}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,511 @@
+"""
+Локальная замена Supabase (PostgREST) для бенчмарков и проверки SupabaseDatabase без сети
+
+Поддерживается подмножество PostgREST, которое использует SupabaseDatabase:
+select/order/limit/Range, фильтры eq, neq, gt, gte, lt, lte, like, ilike, is, in,
+вставка, upsert (on_conflict), update, delete и вызов функций через /rpc.
+Данные хранятся в SQLite в памяти, схема берется из db/models.py.
+Как и PostgREST с db-max-rows, select возвращает не больше max_rows строк.
+"""
+
+import asyncio
+import logging
+import re
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from db.models import (
+    CATEGORY_ID,
+    CREATE_CATEGORIES_TABLE,
+    CREATE_CUSTOM_CATEGORIES_TABLE,
+    CREATE_DAILY_CATEGORY_COUNTS_TABLE,
+    CREATE_DIGEST_RUNS_TABLE,
+    CREATE_DIGEST_SUBSCRIPTIONS_TABLE,
+    CREATE_ENTRIES_INDEX,
+    CREATE_ENTRIES_TABLE,
+    CREATE_FSM_STATES_TABLE,
+    CREATE_REMINDERS_INDEX,
+    CREATE_REMINDERS_TABLE,
+    ENSURE_CATEGORY,
+    INSERT_SYSTEM_CATEGORY,
+    SYSTEM_CATEGORIES,
+)
+
+logger = logging.getLogger(__name__)
+
+# Аналог триггера trg_entries_daily_category_counts из create_tables.sql
+CREATE_DAILY_CATEGORY_COUNTS_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS trg_entries_daily_category_counts
+AFTER INSERT ON entries
+BEGIN
+    INSERT INTO daily_category_counts (user_id, day, category_id, count)
+    VALUES (NEW.user_id, DATE(NEW.datetime), NEW.category_id, 1)
+    ON CONFLICT (user_id, day, category_id) DO UPDATE SET count = count + 1;
+END
+"""
+
+# Представления для чтения из create_tables.sql
+CREATE_ENTRIES_VIEW = """
+CREATE VIEW IF NOT EXISTS entries_view AS
+SELECT e.id, e.user_id, e.text, c.name AS category, e.datetime
+FROM entries e JOIN categories c ON c.id = e.category_id
+"""
+
+CREATE_REMINDERS_VIEW = """
+CREATE VIEW IF NOT EXISTS reminders_view AS
+SELECT r.id, r.user_id, r.entry_id, e.text, r.reminder_time, r.is_sent
+FROM reminders r JOIN entries e ON e.id = r.entry_id
+"""
+
+CREATE_DAILY_CATEGORY_COUNTS_VIEW = """
+CREATE VIEW IF NOT EXISTS daily_category_counts_view AS
+SELECT d.user_id, d.day, c.name AS category, d.count
+FROM daily_category_counts d JOIN categories c ON c.id = d.category_id
+"""
+
+TIMESTAMP_RE = re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?$")
+IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+FILTER_OPERATORS = {
+    "eq": "=",
+    "neq": "!=",
+    "gt": ">",
+    "gte": ">=",
+    "lt": "<",
+    "lte": "<=",
+    "like": "LIKE",
+    "ilike": "LIKE",
+}
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+class PostgRESTError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _normalize_value(value: Any) -> Any:
+    """Приведение значений к виду, в котором PostgreSQL сравнивал бы их как timestamp/boolean"""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str):
+        if TIMESTAMP_RE.match(value):
+            return value.replace(" ", "T")
+        if value.lower() in ("true", "false"):
+            return int(value.lower() == "true")
+    return value
+
+
+def _identifier(name: str) -> str:
+    if not IDENTIFIER_RE.match(name):
+        raise PostgRESTError(400, f"Недопустимое имя: {name}")
+    return name
+
+
+class FakePostgREST:
+    def __init__(self, max_rows: Optional[int] = 1000):
+        self.max_rows = max_rows
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.conn.create_function("unicode_lower", 1, lambda value: value.lower() if isinstance(value, str) else value, deterministic=True)
+        self.lock = threading.Lock()
+        self.rpc_functions: Dict[str, Callable[["FakePostgREST", dict], Any]] = {}
+        self.request_count = 0
+        for statement in (
+            CREATE_CATEGORIES_TABLE,
+            CREATE_ENTRIES_TABLE,
+            CREATE_CUSTOM_CATEGORIES_TABLE,
+            CREATE_REMINDERS_TABLE,
+            CREATE_ENTRIES_INDEX,
+            CREATE_REMINDERS_INDEX,
+            CREATE_DAILY_CATEGORY_COUNTS_TABLE,
+            CREATE_DAILY_CATEGORY_COUNTS_TRIGGER,
+            CREATE_FSM_STATES_TABLE,
+            CREATE_DIGEST_SUBSCRIPTIONS_TABLE,
+            CREATE_DIGEST_RUNS_TABLE,
+            CREATE_ENTRIES_VIEW,
+            CREATE_REMINDERS_VIEW,
+            CREATE_DAILY_CATEGORY_COUNTS_VIEW,
+        ):
+            self.conn.execute(statement)
+        self.conn.executemany(INSERT_SYSTEM_CATEGORY, [(name,) for name in SYSTEM_CATEGORIES])
+        self.conn.commit()
+        self._columns = {table: self._table_columns(table) for table in self._tables()}
+        self.register_rpc("create_entries_partitions", lambda db, args: None)
+        self.register_rpc("backfill_daily_category_counts", _rpc_backfill_daily_category_counts)
+        self.register_rpc("ingest_entry", _rpc_ingest_entry)
+        self.register_rpc("ingest_entries", _rpc_ingest_entries)
+        self.register_rpc("import_entries", _rpc_import_entries)
+        # AUTOINCREMENT в SQLite сам продолжает id с максимального вставленного
+        self.register_rpc("reset_id_sequences", lambda db, args: None)
+        self.register_rpc("today_view", _rpc_today_view)
+        self.register_rpc("claim_due_reminders", _rpc_claim_due_reminders)
+        self.register_rpc("digest_entries", _rpc_digest_page(
+            "SELECT e.id, e.user_id, e.text, c.name AS category FROM digest_subscriptions s JOIN entries e ON e.user_id = s.user_id "
+            "JOIN categories c ON c.id = e.category_id WHERE (e.user_id, e.id) > (?, ?) AND e.datetime >= ? AND e.datetime < ? ORDER BY e.user_id, e.id LIMIT ?"
+        ))
+        self.register_rpc("digest_reminders", _rpc_digest_page(
+            "SELECT r.id, r.user_id, e.text, r.reminder_time FROM digest_subscriptions s JOIN reminders r ON r.user_id = s.user_id "
+            "JOIN entries e ON e.id = r.entry_id WHERE (r.user_id, r.id) > (?, ?) AND r.is_sent = FALSE AND r.reminder_time >= ? AND r.reminder_time < ? "
+            "ORDER BY r.user_id, r.id LIMIT ?"
+        ))
+
+    def _tables(self) -> List[str]:
+        rows = self.conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')").fetchall()
+        return [name for (name,) in rows if not name.startswith("sqlite_")]
+
+    def _table_columns(self, table: str) -> Dict[str, str]:
+        return {row[1]: (row[2] or "").upper() for row in self.conn.execute(f"PRAGMA table_info({table})")}
+
+    def register_rpc(self, name: str, func: Callable[["FakePostgREST", dict], Any]):
+        """Регистрация функции, доступной через POST /rpc/<name>"""
+        self.rpc_functions[name] = func
+
+    def rows_to_json(self, table: str, cursor: sqlite3.Cursor) -> List[dict]:
+        """Строки SQLite -> JSON как у PostgREST (boolean как true/false)"""
+        names = [column[0] for column in cursor.description]
+        types = self._columns.get(table, {})
+        result = []
+        for row in cursor.fetchall():
+            item = {}
+            for name, value in zip(names, row):
+                if types.get(name) == "BOOLEAN" and value is not None:
+                    value = bool(value)
+                item[name] = value
+            result.append(item)
+        return result
+
+    # --- разбор запроса ---
+
+    def _check_table(self, table: str) -> Dict[str, str]:
+        if table not in self._columns:
+            raise PostgRESTError(404, f"relation \"{table}\" does not exist")
+        return self._columns[table]
+
+    def _where(self, table: str, params) -> Tuple[str, list]:
+        columns = self._check_table(table)
+        clauses, values = [], []
+        for key, raw in params.items():
+            if key in RESERVED_PARAMS:
+                continue
+            if key not in columns:
+                raise PostgRESTError(400, f"column {table}.{key} does not exist")
+            negate = raw.startswith("not.")
+            if negate:
+                raw = raw[4:]
+            operator, _, operand = raw.partition(".")
+            if operator in FILTER_OPERATORS:
+                if operator in ("like", "ilike"):
+                    operand = operand.replace("*", "%")
+                if operator == "ilike":
+                    # LIKE в SQLite не учитывает регистр только для ASCII, ILIKE в PostgreSQL - для любых букв
+                    clause = f"unicode_lower({key}) LIKE unicode_lower(?)"
+                else:
+                    clause = f"{key} {FILTER_OPERATORS[operator]} ?"
+                values.append(_normalize_value(operand))
+            elif operator == "is":
+                operand = operand.lower()
+                clause = f"{key} IS {'NULL' if operand == 'null' else int(operand == 'true')}"
+            elif operator == "in":
+                items = [item.strip().strip('"') for item in operand.strip("()").split(",") if item.strip()]
+                clause = f"{key} IN ({', '.join('?' for _ in items)})" if items else "0"
+                values.extend(_normalize_value(item) for item in items)
+            else:
+                raise PostgRESTError(400, f"Неподдерживаемый оператор: {operator}")
+            clauses.append(f"NOT ({clause})" if negate else clause)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", values
+
+    def _order(self, params) -> str:
+        order = params.get("order")
+        if not order:
+            return ""
+        parts = []
+        for item in order.split(","):
+            pieces = item.split(".")
+            direction = "DESC" if "desc" in pieces[1:] else "ASC"
+            parts.append(f"{_identifier(pieces[0])} {direction}")
+        return " ORDER BY " + ", ".join(parts)
+
+    def _paging(self, params, headers) -> Tuple[str, int]:
+        limit = params.get("limit")
+        offset = int(params.get("offset", 0))
+        range_header = headers.get("Range")
+        if range_header:
+            start, _, end = range_header.partition("-")
+            offset = int(start)
+            limit = int(end) - int(start) + 1
+        if self.max_rows is not None:
+            limit = self.max_rows if limit is None else min(int(limit), self.max_rows)
+        if limit is None:
+            return (f" LIMIT -1 OFFSET {offset}" if offset else ""), offset
+        return f" LIMIT {int(limit)} OFFSET {offset}", offset
+
+    # --- операции ---
+
+    def select(self, table: str, params, headers) -> Tuple[List[dict], str]:
+        columns = self._check_table(table)
+        select = params.get("select", "*")
+        where, values = self._where(table, params)
+
+        if select.replace(" ", "") in ("count", "count()"):
+            count = self.conn.execute(f"SELECT COUNT(*) FROM {table}{where}", values).fetchone()[0]
+            return [{"count": count}], f"0-0/{count}"
+
+        names = [name.strip() for name in select.split(",") if name.strip()]
+        if names != ["*"]:
+            for name in names:
+                if name not in columns:
+                    raise PostgRESTError(400, f"column {table}.{name} does not exist")
+        column_sql = "*" if names == ["*"] else ", ".join(names)
+        paging, offset = self._paging(params, headers)
+        cursor = self.conn.execute(f"SELECT {column_sql} FROM {table}{where}{self._order(params)}{paging}", values)
+        rows = self.rows_to_json(table, cursor)
+
+        total = "*"
+        if "count=exact" in headers.get("Prefer", ""):
+            total = str(self.conn.execute(f"SELECT COUNT(*) FROM {table}{where}", values).fetchone()[0])
+        content_range = f"{offset}-{offset + len(rows) - 1}/{total}" if rows else f"*/{total}"
+        return rows, content_range
+
+    def insert(self, table: str, params, headers, body) -> List[dict]:
+        columns = self._check_table(table)
+        rows = body if isinstance(body, list) else [body]
+        prefer = headers.get("Prefer", "")
+        conflict = params.get("on_conflict")
+        inserted = []
+        for row in rows:
+            names = list(row.keys())
+            for name in names:
+                if name not in columns:
+                    raise PostgRESTError(400, f"column {table}.{name} does not exist")
+            sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})"
+            if "resolution=merge-duplicates" in prefer:
+                target = ", ".join(_identifier(c.strip()) for c in (conflict or "id").split(","))
+                updates = ", ".join(f"{name} = excluded.{name}" for name in names) or "id = id"
+                sql += f" ON CONFLICT ({target}) DO UPDATE SET {updates}"
+            elif "resolution=ignore-duplicates" in prefer:
+                sql = sql.replace("INSERT INTO", "INSERT OR IGNORE INTO", 1)
+            sql += " RETURNING *"
+            try:
+                cursor = self.conn.execute(sql, [_normalize_value(row[name]) for name in names])
+            except sqlite3.IntegrityError as e:
+                raise PostgRESTError(409, str(e))
+            inserted.extend(self.rows_to_json(table, cursor))
+        return inserted
+
+    def update(self, table: str, params, body) -> List[dict]:
+        columns = self._check_table(table)
+        for name in body:
+            if name not in columns:
+                raise PostgRESTError(400, f"column {table}.{name} does not exist")
+        where, values = self._where(table, params)
+        assignments = ", ".join(f"{name} = ?" for name in body)
+        cursor = self.conn.execute(
+            f"UPDATE {table} SET {assignments}{where} RETURNING *",
+            [_normalize_value(value) for value in body.values()] + values,
+        )
+        return self.rows_to_json(table, cursor)
+
+    def delete(self, table: str, params) -> List[dict]:
+        where, values = self._where(table, params)
+        cursor = self.conn.execute(f"DELETE FROM {table}{where} RETURNING *", values)
+        return self.rows_to_json(table, cursor)
+
+    # --- HTTP ---
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.request_count += 1
+        path = request.match_info["path"]
+        params = request.rel_url.query
+        headers = request.headers
+        body = await request.json() if request.can_read_body else None
+
+        try:
+            with self.lock:
+                if path.startswith("rpc/"):
+                    func = self.rpc_functions.get(path[4:])
+                    if func is None:
+                        raise PostgRESTError(404, f"function {path[4:]} does not exist")
+                    result = func(self, body or {})
+                    self.conn.commit()
+                    return web.json_response(result)
+
+                if request.method == "GET":
+                    rows, content_range = self.select(path, params, headers)
+                    return web.json_response(rows, headers={"Content-Range": content_range})
+                if request.method == "POST":
+                    rows = self.insert(path, params, headers, body)
+                    status = 201
+                elif request.method == "PATCH":
+                    rows = self.update(path, params, body or {})
+                    status = 200
+                elif request.method == "DELETE":
+                    rows = self.delete(path, params)
+                    status = 200
+                else:
+                    raise PostgRESTError(405, "Method not allowed")
+                self.conn.commit()
+        except PostgRESTError as e:
+            self.conn.rollback()
+            return web.json_response({"message": e.message, "code": str(e.status), "hint": None, "details": None}, status=e.status)
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            return web.json_response({"message": str(e), "code": "500", "hint": None, "details": None}, status=500)
+
+        if "return=representation" in headers.get("Prefer", ""):
+            return web.json_response(rows, status=status)
+        return web.Response(status=204 if status == 200 else status)
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/rest/v1/{path:.*}", self.handle)
+        return app
+
+
+def _rpc_backfill_daily_category_counts(db: FakePostgREST, args: dict):
+    db.conn.execute(
+        "INSERT INTO daily_category_counts (user_id, day, category_id, count) "
+        "SELECT user_id, DATE(datetime), category_id, COUNT(*) FROM entries WHERE TRUE "
+        "GROUP BY user_id, DATE(datetime), category_id "
+        "ON CONFLICT (user_id, day, category_id) DO UPDATE SET count = excluded.count"
+    )
+    return None
+
+
+def _rpc_ingest_entry(db: FakePostgREST, args: dict):
+    # Выполняется под db.lock и фиксируется одним commit в handle - как функция в одной транзакции
+    # Имя категории переводится в id справочника, как resolve_category_id
+    params = {"user_id": args["p_user_id"], "text": args["p_text"], "category": args["p_category"],
+              "datetime": _normalize_value(args["p_datetime"])}
+    db.conn.execute(ENSURE_CATEGORY, params)
+    cursor = db.conn.execute(
+        f"INSERT INTO entries (user_id, text, category_id, datetime) VALUES (:user_id, :text, {CATEGORY_ID}, :datetime)",
+        params,
+    )
+    entry_id = cursor.lastrowid
+    if args.get("p_reminder_time"):
+        db.conn.execute(
+            "INSERT INTO reminders (user_id, entry_id, reminder_time) VALUES (?, ?, ?)",
+            (args["p_user_id"], entry_id, _normalize_value(args["p_reminder_time"])),
+        )
+    return entry_id
+
+
+def _rpc_ingest_entries(db: FakePostgREST, args: dict):
+    # Массивы одинаковой длины, как unnest в функции ingest_entries
+    entry_ids = []
+    for text, category, reminder_time in zip(args["p_texts"], args["p_categories"], args["p_reminder_times"]):
+        entry_ids.append(_rpc_ingest_entry(db, {
+            "p_user_id": args["p_user_id"], "p_text": text, "p_category": category,
+            "p_datetime": args["p_datetime"], "p_reminder_time": reminder_time,
+        }))
+    return entry_ids
+
+
+def _rpc_import_entries(db: FakePostgREST, args: dict):
+    # Как функция import_entries: исходные id, категории по имени, существующие id пропускаются
+    rows = [{"id": row["id"], "user_id": row["user_id"], "text": row["text"], "category": row["category"],
+             "datetime": _normalize_value(row["datetime"])} for row in args["p_rows"]]
+    db.conn.executemany(ENSURE_CATEGORY, rows)
+    cursor = db.conn.executemany(
+        f"INSERT OR IGNORE INTO entries (id, user_id, text, category_id, datetime) VALUES (:id, :user_id, :text, {CATEGORY_ID}, :datetime)",
+        rows,
+    )
+    return cursor.rowcount
+
+
+def _rpc_today_view(db: FakePostgREST, args: dict):
+    day = args["p_day"]
+    bounds = (args["p_user_id"], f"{day}T00:00:00", f"{day}T\uffff")
+    entries = db.conn.execute(
+        "SELECT text, category, datetime FROM entries_view WHERE user_id = ? AND datetime >= ? AND datetime < ? "
+        "ORDER BY datetime DESC LIMIT ?", bounds + (args.get("p_limit", 200),),
+    ).fetchall()
+    counts = db.conn.execute(
+        "SELECT c.name, t.count FROM (SELECT category_id, COUNT(*) AS count FROM entries "
+        "WHERE user_id = ? AND datetime >= ? AND datetime < ? GROUP BY category_id) t "
+        "JOIN categories c ON c.id = t.category_id ORDER BY t.count DESC, c.name", bounds,
+    ).fetchall()
+    return {
+        "entries": [{"text": text, "category": category, "datetime": value} for text, category, value in entries],
+        "counts": [{"category": category, "count": count} for category, count in counts],
+    }
+
+
+def _rpc_claim_due_reminders(db: FakePostgREST, args: dict):
+    # Под db.lock, как UPDATE ... FOR UPDATE SKIP LOCKED в одной транзакции
+    cursor = db.conn.execute(
+        "UPDATE reminders SET is_sent = TRUE WHERE id IN (SELECT id FROM reminders WHERE reminder_time <= ? "
+        "AND is_sent = FALSE ORDER BY reminder_time LIMIT ?) "
+        "RETURNING id, user_id, (SELECT text FROM entries WHERE entries.id = reminders.entry_id), reminder_time",
+        (_normalize_value(args["p_now"]), args.get("p_limit", 100)),
+    )
+    return [
+        {"id": reminder_id, "user_id": user_id, "text": text, "reminder_time": reminder_time}
+        for reminder_id, user_id, text, reminder_time in cursor.fetchall()
+    ]
+
+
+def _rpc_digest_page(query: str):
+    """Функции digest_entries/digest_reminders: страница строк подписчиков по возрастанию (user_id, id)"""
+    def rpc(db: FakePostgREST, args: dict):
+        cursor = db.conn.execute(query, (
+            args.get("p_after_user_id", 0), args.get("p_after_id", 0),
+            _normalize_value(args["p_since"]), _normalize_value(args["p_until"]), args.get("p_limit", 500),
+        ))
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+    return rpc
+
+
+class FakePostgRESTServer:
+    """Запуск FakePostgREST в отдельном потоке (клиент supabase синхронный и блокирует свой цикл событий)"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, max_rows: Optional[int] = 1000):
+        self.host = host
+        self.port = port
+        self.backend = FakePostgREST(max_rows)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> str:
+        """Запуск сервера, возвращает базовый URL для create_client"""
+        self._thread = threading.Thread(target=self._run, name="fake-postgrest", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        logger.info(f"Локальный PostgREST запущен: {self.url}")
+        return self.url
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.backend.make_app(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def stop(self):
+        """Остановка сервера"""
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+
+# Ключ в формате JWT: create_client проверяет только формат
+FAKE_SUPABASE_KEY = "fake.supabase.key"
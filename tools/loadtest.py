@@ -0,0 +1,486 @@
+"""
+Сквозной нагрузочный тест бота с локальным фейковым Telegram Bot API
+
+Запускает локальный сервер с методами getUpdates/sendMessage/..., направляет на него Bot,
+собирает диспетчер так же, как main.py (middleware, роутеры, база данных), и генерирует
+синтетический трафик. Выводит задержку update -> ответ (p50/p90/p99), пропускную
+способность и задержку цикла событий. Работает полностью офлайн.
+
+В режиме --mode webhook обновления не отдаются через getUpdates, а отправляются
+POST-запросами на локальный WebhookServer бота, как это делает Telegram; ответы 503
+(очередь заполнена) повторяются и учитываются в отчете.
+
+--flood-users добавляет пользователей, которые шлют сообщения без пауз, не дожидаясь ответов;
+задержка в отчете считается только по обычным пользователям - так видно, мешает ли
+ограничение частоты флудеров остальным.
+
+Запуск:
+    python -m tools.loadtest --users 200 --duration 30
+    python -m tools.loadtest --users 50 --command-ratio 0.3 --reminder-ratio 0.2 --backend memory
+    python -m tools.loadtest --users 500 --mode webhook --webhook-queue-size 200 --webhook-workers 16
+    python -m tools.loadtest --users 1 --flood-users 1 --mode webhook --throttle-mode queue
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from aiohttp import web
+
+os.environ.setdefault("BOT_TOKEN", "123456:LOADTEST")
+
+logger = logging.getLogger(__name__)
+
+FAKE_BOT_TOKEN = "123456:LOADTEST"
+FAKE_WEBHOOK_SECRET = "loadtest-secret"
+
+TEXT_MESSAGES = [
+    "нужно купить хлеб и молоко",
+    "идея для нового проекта: бот для заметок",
+    "почему небо голубое?",
+    "боюсь не успеть к дедлайну",
+    "прочитал интересный факт про осьминогов",
+    "планирую пробежать марафон",
+    "просто хороший день",
+]
+
+REMINDER_MESSAGES = [
+    "через 10 минут позвонить маме",
+    "завтра в 9:00 совещание",
+    "через 2 часа забрать посылку",
+    "в 18:30 тренировка",
+]
+
+COMMANDS = ["/today", "/search проект", "/categories", "/reminders", "/stats"]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class FakeBotAPI:
+    """Минимальный Telegram Bot API: отдает обновления через getUpdates и принимает ответы бота"""
+
+    def __init__(self, flood_limit: int = 0):
+        self.updates: Deque[dict] = deque()
+        self.updates_available = asyncio.Event()
+        self.next_update_id = 1
+        self.next_message_id = 1
+        # chat_id -> время отправки ожидающего ответа обновления
+        self.pending: Dict[int, float] = {}
+        self.reply_waiters: Dict[int, asyncio.Future] = {}
+        self.latencies: List[float] = []
+        self.extra_replies = 0
+        # Пользователи, шлющие сообщения без ожидания ответа; их ответы считаются отдельно
+        self.flood_users: Set[int] = set()
+        self.flood_replies = 0
+        self.method_calls: Dict[str, int] = {}
+        # Сколько сообщений в секунду принимать, остальным отвечать 429 (0 - без ограничения)
+        self.flood_limit = flood_limit
+        self.flood_window = 0
+        self.flood_window_count = 0
+        self.flood_rejected = 0
+
+    def prepare_message(self, user_id: int, text: str) -> Tuple[dict, asyncio.Future]:
+        """Обновление с сообщением пользователя и future, который завершается первым ответом бота"""
+        update = {
+            "update_id": self.next_update_id,
+            "message": {
+                "message_id": self.next_message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Load", "language_code": "ru"},
+                "text": text,
+            },
+        }
+        if text.startswith("/"):
+            command_length = len(text.split()[0])
+            update["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": command_length}]
+        self.next_update_id += 1
+        self.next_message_id += 1
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.pending[user_id] = time.perf_counter()
+        self.reply_waiters[user_id] = waiter
+        return update, waiter
+
+    def push_message(self, user_id: int, text: str) -> asyncio.Future:
+        """Поставить сообщение пользователя в очередь getUpdates"""
+        update, waiter = self.prepare_message(user_id, text)
+        self.updates.append(update)
+        self.updates_available.set()
+        return waiter
+
+    def _record_reply(self, chat_id: int):
+        if chat_id in self.flood_users:
+            self.flood_replies += 1
+            return
+        started = self.pending.pop(chat_id, None)
+        if started is None:
+            self.extra_replies += 1
+            return
+        self.latencies.append(time.perf_counter() - started)
+        waiter = self.reply_waiters.pop(chat_id, None)
+        if waiter and not waiter.done():
+            waiter.set_result(None)
+
+    def _message(self, chat_id: int, text: Optional[str] = None) -> dict:
+        message = {
+            "message_id": self.next_message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if text is not None:
+            message["text"] = text
+        self.next_message_id += 1
+        return message
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.method_calls[method] = self.method_calls.get(method, 0) + 1
+        params = dict(await request.post())
+
+        if method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "MindFlow", "username": "mindflow_loadtest_bot"}
+        elif method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method in ("sendMessage", "sendDocument"):
+            if self._flooded():
+                self.flood_rejected += 1
+                return web.json_response({
+                    "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                })
+            chat_id = int(params["chat_id"])
+            self._record_reply(chat_id)
+            result = self._message(chat_id, params.get("text"))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def _flooded(self) -> bool:
+        if not self.flood_limit:
+            return False
+        window = int(time.monotonic())
+        if window != self.flood_window:
+            self.flood_window, self.flood_window_count = window, 0
+        self.flood_window_count += 1
+        return self.flood_window_count > self.flood_limit
+
+    async def _get_updates(self, params: dict) -> List[dict]:
+        offset = int(params.get("offset", 0) or 0)
+        timeout = float(params.get("timeout", 0) or 0)
+        limit = int(params.get("limit", 100) or 100)
+
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates and timeout:
+            self.updates_available.clear()
+            try:
+                await asyncio.wait_for(self.updates_available.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return [update for _, update in zip(range(limit), self.updates)]
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        return app
+
+
+class WebhookPoster:
+    """Доставка обновлений на вебхук бота, как это делает Telegram: при ответе не 200 - повтор"""
+
+    def __init__(self, url: str, secret_token: str, retry_delay: float = 0.05):
+        self.url = url
+        self.secret_token = secret_token
+        self.retry_delay = retry_delay
+        self.rejected = 0
+        self._session = None
+
+    async def start(self):
+        import aiohttp
+        self._session = aiohttp.ClientSession()
+
+    async def deliver(self, update: dict):
+        from utils.webhook_server import SECRET_HEADER
+
+        while True:
+            async with self._session.post(self.url, json=update, headers={SECRET_HEADER: self.secret_token}) as response:
+                if response.status == 200:
+                    return
+                if response.status != 503:
+                    raise RuntimeError(f"Вебхук ответил {response.status}")
+            self.rejected += 1
+            await asyncio.sleep(self.retry_delay)
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+
+
+class LoopLagMonitor:
+    """Измерение задержки цикла событий: насколько позже запланированного просыпается sleep"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+
+def pick_message(args) -> str:
+    if random.random() < args.command_ratio:
+        return random.choice(COMMANDS)
+    if random.random() < args.reminder_ratio:
+        return random.choice(REMINDER_MESSAGES)
+    return random.choice(TEXT_MESSAGES)
+
+
+async def virtual_user(api: FakeBotAPI, user_id: int, args, deadline: float, stats: dict,
+                       poster: Optional[WebhookPoster] = None):
+    """Виртуальный пользователь: отправляет сообщение, ждет ответа, делает паузу"""
+    while time.perf_counter() < deadline:
+        if poster:
+            update, waiter = api.prepare_message(user_id, pick_message(args))
+            await poster.deliver(update)
+        else:
+            waiter = api.push_message(user_id, pick_message(args))
+        stats["sent"] += 1
+        try:
+            await asyncio.wait_for(waiter, args.reply_timeout)
+        except asyncio.TimeoutError:
+            api.pending.pop(user_id, None)
+            api.reply_waiters.pop(user_id, None)
+            stats["timeouts"] += 1
+        if args.think_time:
+            await asyncio.sleep(random.expovariate(1.0 / args.think_time))
+
+
+async def flood_user(api: FakeBotAPI, user_id: int, args, deadline: float, stats: dict,
+                     poster: Optional[WebhookPoster] = None):
+    """Флудер: отправляет текстовые сообщения каждые flood_interval секунд, не дожидаясь ответов"""
+    api.flood_users.add(user_id)
+    while time.perf_counter() < deadline:
+        if poster:
+            update, _ = api.prepare_message(user_id, random.choice(TEXT_MESSAGES))
+            await poster.deliver(update)
+        else:
+            api.push_message(user_id, random.choice(TEXT_MESSAGES))
+        api.pending.pop(user_id, None)
+        api.reply_waiters.pop(user_id, None)
+        stats["flood_sent"] += 1
+        await asyncio.sleep(args.flood_interval)
+
+
+async def create_backend(name: str, workdir: str):
+    if name == "memory":
+        from db.memory_database import MemoryDatabase
+        return MemoryDatabase()
+    if name == "sqlite":
+        from db.database import Database
+        return Database(os.path.join(workdir, "loadtest.db"), os.path.join(workdir, "loadtest_archive.db"))
+    if name == "config":
+        from db.factory import create_database
+        return create_database()
+    raise ValueError(f"Неизвестный бэкенд: {name}")
+
+
+async def run(args) -> dict:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    from main import build_dispatcher, create_sender
+    from utils.categorizer import Categorizer
+    from utils.metrics import InstrumentedDatabase, TelegramRequestMetrics
+    from utils.webhook_server import WebhookServer
+
+    api = FakeBotAPI(args.api_flood_limit)
+    runner = web.AppRunner(api.make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(base_url))
+    bot = Bot(token=FAKE_BOT_TOKEN, session=session)
+    sender = create_sender()
+    bot.session.middleware(sender)
+    bot.session.middleware(TelegramRequestMetrics())
+    await sender.start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InstrumentedDatabase(await create_backend(args.backend, workdir))
+        await database.connect()
+        categorizer = Categorizer(database)
+        dp = build_dispatcher(database, categorizer)
+
+        poster = None
+        if args.mode == "webhook":
+            webhook = WebhookServer(
+                dp, bot, "/webhook", FAKE_WEBHOOK_SECRET, host="127.0.0.1", port=0,
+                queue_size=args.webhook_queue_size, workers=args.webhook_workers,
+            )
+            await webhook.start()
+            poster = WebhookPoster(f"http://127.0.0.1:{webhook.port}/webhook", FAKE_WEBHOOK_SECRET)
+            await poster.start()
+        else:
+            polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+        monitor = LoopLagMonitor()
+        monitor.start()
+
+        stats = {"sent": 0, "timeouts": 0, "flood_sent": 0}
+        started = time.perf_counter()
+        deadline = started + args.duration
+        user_ids = [10_000_000 + i for i in range(args.users)]
+        flood_ids = [20_000_000 + i for i in range(args.flood_users)]
+        await asyncio.gather(
+            *(virtual_user(api, user_id, args, deadline, stats, poster) for user_id in user_ids),
+            *(flood_user(api, user_id, args, deadline, stats, poster) for user_id in flood_ids),
+        )
+        elapsed = time.perf_counter() - started
+
+        monitor.stop()
+        if poster:
+            await poster.close()
+            await webhook.stop()
+        else:
+            await dp.stop_polling()
+            await polling
+        await sender.stop()
+        await database.disconnect()
+        await bot.session.close()
+    await runner.cleanup()
+
+    return {
+        "users": args.users,
+        "backend": args.backend,
+        "mode": args.mode,
+        "duration_s": round(elapsed, 2),
+        "updates_sent": stats["sent"],
+        "replies": len(api.latencies),
+        "timeouts": stats["timeouts"],
+        "extra_replies": api.extra_replies,
+        "flood_users": args.flood_users,
+        "flood_sent": stats["flood_sent"],
+        "flood_replies": api.flood_replies,
+        "webhook_rejected": poster.rejected if poster else 0,
+        "api_flood_rejected": api.flood_rejected,
+        "throughput_rps": round(len(api.latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(api.latencies, 0.50) * 1000, 2),
+            "p90": round(percentile(api.latencies, 0.90) * 1000, 2),
+            "p99": round(percentile(api.latencies, 0.99) * 1000, 2),
+            "max": round(max(api.latencies, default=0.0) * 1000, 2),
+        },
+        "loop_lag_ms": {
+            "p50": round(percentile(monitor.samples, 0.50) * 1000, 2),
+            "p99": round(percentile(monitor.samples, 0.99) * 1000, 2),
+            "max": round(max(monitor.samples, default=0.0) * 1000, 2),
+        },
+        "api_calls": api.method_calls,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Сквозной нагрузочный тест MindFlow Journal")
+    parser.add_argument("--users", type=int, default=100, help="количество виртуальных пользователей")
+    parser.add_argument("--duration", type=float, default=20.0, help="длительность, секунды")
+    parser.add_argument("--think-time", type=float, default=0.0, help="средняя пауза пользователя между сообщениями, секунды")
+    parser.add_argument("--command-ratio", type=float, default=0.2, help="доля команд среди сообщений")
+    parser.add_argument("--reminder-ratio", type=float, default=0.1, help="доля текстов с указанием времени")
+    parser.add_argument("--flood-users", type=int, default=0,
+                        help="дополнительные пользователи, шлющие сообщения без пауз и не ждущие ответа")
+    parser.add_argument("--flood-interval", type=float, default=0.01, help="пауза флудера между сообщениями, секунды")
+    parser.add_argument("--reply-timeout", type=float, default=10.0, help="сколько ждать ответа бота, секунды")
+    parser.add_argument("--backend", choices=["memory", "sqlite", "config"], default="sqlite",
+                        help="config - бэкенд из настроек бота (DATABASE_URL/SUPABASE_KEY)")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling", help="способ получения обновлений ботом")
+    parser.add_argument("--throttle-mode", choices=["off", "queue", "coalesce", "reject"], default="off",
+                        help="ограничение частоты сообщений пользователя (по умолчанию выключено, чтобы мерить сам бот)")
+    parser.add_argument("--send-rate", type=float, default=0,
+                        help="лимит исходящих сообщений в секунду на бот (по умолчанию без лимита, чтобы мерить сам бот)")
+    parser.add_argument("--chat-send-rate", type=float, default=0, help="лимит исходящих сообщений в секунду на чат (0 - без лимита)")
+    parser.add_argument("--api-flood-limit", type=int, default=0,
+                        help="фейковый Bot API отвечает 429 на сообщения сверх этого числа в секунду (0 - никогда)")
+    parser.add_argument("--webhook-queue-size", type=int, default=1000, help="размер очереди вебхука (режим webhook)")
+    parser.add_argument("--webhook-workers", type=int, default=32, help="число обработчиков очереди вебхука (режим webhook)")
+    parser.add_argument("--log-level", default="WARNING", help="уровень логирования бота во время теста")
+    parser.add_argument("--log-file", help="писать лог в файл через фоновую очередь, как бот в продакшене")
+    parser.add_argument("--json", action="store_true", help="вывести отчет в JSON")
+    parser.add_argument("--metrics-out", help="сохранить метрики бота (формат Prometheus) в файл после теста")
+    args = parser.parse_args(argv)
+
+    # Ограничения частоты читаются из конфигурации при сборке диспетчера и очереди исходящих сообщений
+    os.environ["THROTTLE_MODE"] = args.throttle_mode
+    os.environ["SENDER_GLOBAL_RATE"] = str(args.send_rate)
+    os.environ["SENDER_CHAT_RATE"] = str(args.chat_send_rate)
+    import config
+    from utils.logging_setup import setup_logging
+
+    log_listener = None
+    if args.log_file:
+        log_listener = setup_logging(
+            args.log_level, config.LOG_FORMAT, args.log_file, config.LOG_MAX_BYTES, config.LOG_BACKUP_COUNT, console=False
+        )
+    else:
+        logging.basicConfig(level=getattr(logging, args.log_level.upper()), format=config.LOG_FORMAT)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if log_listener:
+            log_listener.stop()
+
+    if args.metrics_out:
+        from utils.metrics import REGISTRY
+        with open(args.metrics_out, "w", encoding="utf-8") as f:
+            f.write(REGISTRY.render())
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        latency, lag = report["latency_ms"], report["loop_lag_ms"]
+        print(f"пользователей: {report['users']}, бэкенд: {report['backend']}, режим: {report['mode']}, "
+              f"длительность: {report['duration_s']} с")
+        print(f"отправлено обновлений: {report['updates_sent']}, ответов: {report['replies']}, "
+              f"таймаутов: {report['timeouts']}, лишних ответов: {report['extra_replies']}")
+        if report["flood_users"]:
+            print(f"флудеров: {report['flood_users']}, отправлено ими: {report['flood_sent']}, "
+                  f"ответов им: {report['flood_replies']}")
+        if report["mode"] == "webhook":
+            print(f"отклонено вебхуком (503, доставлено повторно): {report['webhook_rejected']}")
+        if report["api_flood_rejected"]:
+            print(f"ответов 429 от Bot API (отправлено повторно): {report['api_flood_rejected']}")
+        print(f"пропускная способность: {report['throughput_rps']} ответов/с")
+        print(f"задержка update -> ответ, мс: p50={latency['p50']} p90={latency['p90']} p99={latency['p99']} max={latency['max']}")
+        print(f"задержка цикла событий, мс: p50={lag['p50']} p99={lag['p99']} max={lag['max']}")
+    return 0 if report["timeouts"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Замер оформления ответов /today и /search: время, число сообщений и корректность HTML
+
+Сравнивает utils.rendering со старым способом (склейка строк и нарезка по 4096 символов).
+Для каждого сообщения проверяется лимит длины Telegram и парность тегов; число сообщений
+сравнивается с нижней границей ceil(общая длина / лимит).
+
+Запуск:
+    python -m tools.render_benchmark
+    python -m tools.render_benchmark --entries 50,200,1000 --repeat 200
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from html.parser import HTMLParser
+from typing import Callable, List, Sequence, Tuple
+
+from utils.categorizer import CATEGORY_EMOJIS
+from utils.rendering import MESSAGE_LIMIT, message_length, render_entries_by_category, render_search_results
+
+SAMPLE_TEXTS = [
+    "нужно купить хлеб и молоко",
+    "идея для нового проекта: бот для заметок",
+    "почему небо голубое?",
+    "сравнить a < b && b > c в коде",
+    "прочитал интересный факт про осьминогов 🐙",
+    "<b>не жирный</b> текст & прочие символы",
+    "планирую пробежать марафон " * 8,
+]
+
+
+def make_entries(count: int, seed: int = 1) -> List[Tuple[str, str, str]]:
+    rng = random.Random(seed)
+    categories = list(CATEGORY_EMOJIS) + ["Работа <моя>"]
+    return [
+        (rng.choice(SAMPLE_TEXTS), rng.choice(categories), f"2024-01-15 {i // 60 % 24:02d}:{i % 60:02d}:00")
+        for i in range(count)
+    ]
+
+
+def legacy_today(entries: Sequence[Tuple[str, str, str]]) -> List[str]:
+    """Прежнее оформление /today: без экранирования, нарезка по 4096 символов"""
+    categories = {}
+    for text, category, datetime_str in entries:
+        categories.setdefault(category, []).append((text, datetime_str))
+    response = "📅 <b>Записи за сегодня:</b>\n\n"
+    for category, category_entries in categories.items():
+        emoji = CATEGORY_EMOJIS.get(category, "📝")
+        response += f"{emoji} <b>{category}</b> ({len(category_entries)}):\n"
+        for text, datetime_str in category_entries:
+            display_text = text[:100] + "..." if len(text) > 100 else text
+            response += f"• {display_text} <i>({datetime_str.split()[1][:5]})</i>\n"
+        response += "\n"
+    return [response[i:i + 4096] for i in range(0, len(response), 4096)]
+
+
+class _TagChecker(HTMLParser):
+    """Проверка, что сообщение разбирается как HTML Telegram: теги парные и не перекрываются"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack: List[str] = []
+        self.valid = True
+
+    def handle_starttag(self, tag, attrs):
+        self.stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.stack or self.stack.pop() != tag:
+            self.valid = False
+
+
+def is_valid_message(message: str) -> bool:
+    if message_length(message) > MESSAGE_LIMIT:
+        return False
+    checker = _TagChecker()
+    checker.feed(message)
+    checker.close()
+    return checker.valid and not checker.stack
+
+
+def measure(name: str, render: Callable[[], List[str]], repeat: int) -> Tuple[str, int]:
+    """Строка отчета и число некорректных сообщений"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        messages = render()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    total_length = sum(message_length(message) for message in messages)
+    lower_bound = max(1, math.ceil(total_length / MESSAGE_LIMIT))
+    invalid = sum(1 for message in messages if not is_valid_message(message))
+    line = (
+        f"{name:<18} {timings[len(timings) // 2] * 1000:>9.3f} {timings[int(len(timings) * 0.99)] * 1000:>9.3f} "
+        f"{len(messages):>9} {lower_bound:>9} {invalid:>11}"
+    )
+    return line, invalid
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Производительность и корректность оформления ответов")
+    parser.add_argument("--entries", default="10,100,500,2000", help="размеры выборок через запятую")
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    exit_code = 0
+    header = f"{'рендер':<18} {'p50, мс':>9} {'p99, мс':>9} {'сообщ.':>9} {'минимум':>9} {'битых HTML':>11}"
+    for count in [int(n) for n in args.entries.split(",") if n.strip()]:
+        entries = make_entries(count)
+        print(f"\n== {count} записей ==\n{header}")
+        print(measure("today (старый)", lambda: legacy_today(entries), args.repeat)[0])
+        renders = [
+            ("today", lambda: render_entries_by_category("📅 <b>Записи за сегодня:</b>", entries)),
+            ("search", lambda: render_search_results("проект", entries)),
+        ]
+        for name, render in renders:
+            line, invalid = measure(name, render, args.repeat)
+            print(line)
+            # Новый рендер не должен давать некорректных сообщений
+            if invalid:
+                exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""
+Проверка функций create_tables.sql на настоящем PostgreSQL
+
+tools.backend_benchmark проверяет SupabaseDatabase через tools/fake_postgrest.py, где функции
+RPC повторены на Python поверх SQLite, - тела функций из create_tables.sql там не выполняются.
+Эта проверка применяет create_tables.sql в новой схеме базы из --postgres-dsn (схема удаляется
+после проверки) и вызывает функции с теми же параметрами, что SupabaseDatabase через RPC:
+ingest_entry/ingest_entries с триггером сводной таблицы, today_view, claim_due_reminders
+(в том числе параллельные вызовы и строки, заблокированные другой транзакцией, - SKIP LOCKED),
+digest_entries, import_entries (секции на месяцы старых записей) с reset_id_sequences,
+backfill_daily_category_counts и create_entries_partitions.
+
+Запуск:
+    python -m tools.supabase_sql_check --postgres-dsn postgresql://localhost/mindflow_bench
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+
+import asyncpg
+
+from tools.backend_benchmark import _check
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLES_SQL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "create_tables.sql")
+
+# Параметры-строки приводятся к типам функций так же, как PostgREST приводит значения JSON
+INGEST_ENTRY = """
+SELECT ingest_entry(p_user_id => $1, p_text => $2, p_category => $3,
+                    p_datetime => $4::text::timestamp, p_reminder_time => $5::text::timestamp)
+"""
+
+INGEST_ENTRIES = """
+SELECT ingest_entries(p_user_id => $1, p_texts => $2, p_categories => $3,
+                      p_reminder_times => $4::text[]::timestamp[], p_datetime => $5::text::timestamp)
+"""
+
+CLAIM_DUE_REMINDERS = """
+SELECT id FROM claim_due_reminders(p_now => $1::text::timestamp, p_limit => $2)
+"""
+
+
+def _timestamp(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+async def _claim(pool: asyncpg.Pool, now: str, limit: int) -> List[int]:
+    return [row['id'] for row in await pool.fetch(CLAIM_DUE_REMINDERS, now, limit)]
+
+
+async def check_ingest(pool: asyncpg.Pool, failures: List[str]):
+    now = datetime.now()
+    entry_id = await pool.fetchval(INGEST_ENTRY, 1, "купить хлеб", "Задачи", _timestamp(now), _timestamp(now))
+    _check(failures, isinstance(entry_id, int), f"ingest_entry: ожидался id записи, получено {entry_id!r}")
+    row = await pool.fetchrow("SELECT category FROM entries_view WHERE id = $1", entry_id)
+    _check(failures, row is not None and row['category'] == "Задачи", f"ingest_entry: запись в entries_view {row!r}")
+    reminders = await pool.fetchval("SELECT COUNT(*) FROM reminders WHERE entry_id = $1", entry_id)
+    _check(failures, reminders == 1, f"ingest_entry: ожидалось 1 напоминание, найдено {reminders}")
+
+    entry_ids = await pool.fetchval(INGEST_ENTRIES, 1, ["идея", "просто день"], ["Идеи", "Мое"],
+                                    [_timestamp(now), None], _timestamp(now))
+    _check(failures, isinstance(entry_ids, list) and len(entry_ids) == 2 and entry_ids[0] < entry_ids[1],
+           f"ingest_entries: ожидались 2 id по порядку, получено {entry_ids!r}")
+    reminders = await pool.fetchval("SELECT COUNT(*) FROM reminders WHERE entry_id = ANY($1::integer[])", entry_ids)
+    _check(failures, reminders == 1, f"ingest_entries: ожидалось 1 напоминание, найдено {reminders}")
+    custom = await pool.fetchval("SELECT COUNT(*) FROM categories WHERE user_id = 1 AND name = 'Мое'")
+    _check(failures, custom == 1, "ingest_entries: пользовательская категория не создана")
+
+    counts = await pool.fetch(
+        "SELECT category, count FROM daily_category_counts_view WHERE user_id = 1 AND day = $1 ORDER BY category",
+        now.date())
+    _check(failures, [tuple(row) for row in counts] == [("Задачи", 1), ("Идеи", 1), ("Мое", 1)],
+           f"триггер сводной таблицы: {[tuple(row) for row in counts]!r}")
+
+    view = json.loads(await pool.fetchval("SELECT today_view(p_user_id => 1, p_day => $1, p_limit => 2)", now.date()))
+    _check(failures, len(view.get("entries", [])) == 2, f"today_view: ожидалось 2 записи, получено {view!r}")
+    _check(failures, sum(item["count"] for item in view.get("counts", [])) == 3, f"today_view: неверные счетчики {view!r}")
+
+
+async def check_claim(pool: asyncpg.Pool, failures: List[str]):
+    await pool.execute("UPDATE reminders SET is_sent = TRUE")
+    past = datetime.now() - timedelta(minutes=5)
+    for i in range(40):
+        await pool.fetchval(INGEST_ENTRY, 2, f"напоминание {i}", "Напоминания", _timestamp(past), _timestamp(past))
+    now = _timestamp(datetime.now())
+
+    # Строки, заблокированные незавершенной транзакцией, пропускаются, а не ждут ее завершения
+    async with pool.acquire() as holder:
+        transaction = holder.transaction()
+        await transaction.start()
+        held = [row['id'] for row in await holder.fetch(CLAIM_DUE_REMINDERS, now, 10)]
+        try:
+            others = await asyncio.wait_for(_claim(pool, now, 15), timeout=5)
+        except asyncio.TimeoutError:
+            others = None
+            failures.append("claim_due_reminders: вызов ждал строки, заблокированные другой транзакцией")
+        await transaction.commit()
+    if others is not None:
+        _check(failures, len(held) == 10 and len(others) == 15 and not set(held) & set(others),
+               f"claim_due_reminders: пересечение при блокировке {sorted(set(held) & set(others))}")
+
+    # Параллельные вызовы получают разные строки, вместе - все оставшиеся
+    batches = await asyncio.gather(*(_claim(pool, now, 3) for _ in range(8)))
+    claimed = [reminder_id for batch in batches for reminder_id in batch]
+    _check(failures, len(claimed) == len(set(claimed)), "claim_due_reminders: одна строка выдана дважды")
+    _check(failures, len(claimed) == 15, f"claim_due_reminders: параллельно выдано {len(claimed)} из 15")
+    left = await _claim(pool, now, 100)
+    _check(failures, left == [], f"claim_due_reminders: повторно выданы {left}")
+
+
+async def check_digest(pool: asyncpg.Pool, failures: List[str]):
+    await pool.execute("INSERT INTO digest_subscriptions (user_id) VALUES (1), (2) ON CONFLICT DO NOTHING")
+    since = _timestamp(datetime.now() - timedelta(days=1))
+    until = _timestamp(datetime.now() + timedelta(days=1))
+    expected = [tuple(row) for row in await pool.fetch(
+        "SELECT user_id, id FROM entries WHERE user_id IN (1, 2) ORDER BY user_id, id")]
+    seen, after_user_id, after_id = [], 0, 0
+    while True:
+        rows = await pool.fetch(
+            "SELECT * FROM digest_entries(p_since => $1::text::timestamp, p_until => $2::text::timestamp, "
+            "p_after_user_id => $3, p_after_id => $4, p_limit => 7)", since, until, after_user_id, after_id)
+        if not rows:
+            break
+        seen.extend((row['user_id'], row['id']) for row in rows)
+        after_user_id, after_id = rows[-1]['user_id'], rows[-1]['id']
+    _check(failures, seen == expected, f"digest_entries: страницами получено {len(seen)} из {len(expected)} записей")
+
+
+async def check_import(pool: asyncpg.Pool, failures: List[str]):
+    last_id = await pool.fetchval("SELECT MAX(id) FROM entries")
+    rows = [{"id": last_id + 100 + i, "user_id": 3, "text": f"перенесенная {i}", "category": "Факты",
+             "datetime": "2020-03-15 10:00:00"} for i in range(2)]
+    inserted = await pool.fetchval("SELECT import_entries(p_rows => $1::json)", json.dumps(rows))
+    _check(failures, inserted == 2, f"import_entries: ожидалось 2 новых записи, получено {inserted}")
+    inserted = await pool.fetchval("SELECT import_entries(p_rows => $1::json)", json.dumps(rows))
+    _check(failures, inserted == 0, f"import_entries: повтор порции вставил {inserted} записей")
+    in_default = await pool.fetchval("SELECT COUNT(*) FROM entries_default")
+    _check(failures, in_default == 0, f"import_entries: {in_default} старых записей попали в entries_default")
+
+    await pool.execute("SELECT reset_id_sequences()")
+    entry_id = await pool.fetchval(INGEST_ENTRY, 3, "после переноса", "Прочее", _timestamp(datetime.now()), None)
+    _check(failures, entry_id == last_id + 102, f"reset_id_sequences: следующий id {entry_id}, ожидался {last_id + 102}")
+
+
+async def check_maintenance(pool: asyncpg.Pool, failures: List[str]):
+    expected = [tuple(row) for row in await pool.fetch(
+        "SELECT user_id, datetime::date, category_id, COUNT(*) FROM entries "
+        "GROUP BY user_id, datetime::date, category_id ORDER BY 1, 2, 3")]
+    await pool.execute("TRUNCATE daily_category_counts")
+    await pool.execute("SELECT backfill_daily_category_counts()")
+    counts = [tuple(row) for row in await pool.fetch(
+        "SELECT user_id, day, category_id, count FROM daily_category_counts ORDER BY 1, 2, 3")]
+    _check(failures, counts == expected, "backfill_daily_category_counts: сводная таблица не совпадает с записями")
+
+    await pool.execute("SELECT create_entries_partitions(months_ahead => 6)")
+    last_month = date.today().replace(day=1) + timedelta(days=6 * 31)
+    name = f"entries_{last_month.year:04d}_{last_month.month:02d}"
+    exists = await pool.fetchval("SELECT to_regclass($1) IS NOT NULL", name)
+    _check(failures, exists, f"create_entries_partitions: секция {name} не создана")
+
+
+async def run_checks(dsn: str) -> List[str]:
+    """Применение create_tables.sql в новой схеме и проверка функций. Возвращает список нарушений."""
+    failures: List[str] = []
+    schema = f"sqlcheck_{os.getpid()}_{int(time.time())}"
+    with open(CREATE_TABLES_SQL, encoding="utf-8") as f:
+        script = f.read()
+
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute(f"CREATE SCHEMA {schema}")
+    finally:
+        await conn.close()
+    try:
+        # Неизвестные asyncpg параметры DSN передаются серверу как настройки сеанса
+        separator = "&" if "?" in dsn else "?"
+        pool = await asyncpg.create_pool(f"{dsn}{separator}search_path={schema}", min_size=2, max_size=12)
+        try:
+            await pool.execute(script)
+            for check in (check_ingest, check_claim, check_digest, check_import, check_maintenance):
+                try:
+                    await check(pool, failures)
+                except Exception as e:
+                    failures.append(f"{check.__name__}: {e}")
+        finally:
+            await pool.close()
+    finally:
+        conn = await asyncpg.connect(dsn)
+        try:
+            await conn.execute(f"DROP SCHEMA {schema} CASCADE")
+        finally:
+            await conn.close()
+    return failures
+
+
+async def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Проверка функций create_tables.sql на PostgreSQL")
+    parser.add_argument("--postgres-dsn", default=os.getenv("BENCH_DATABASE_URL"))
+    args = parser.parse_args(argv)
+    if not args.postgres_dsn:
+        parser.error("не задан --postgres-dsn (или BENCH_DATABASE_URL)")
+
+    failures = await run_checks(args.postgres_dsn)
+    if failures:
+        print(f"нарушения ({len(failures)}):")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+    print("функции create_tables.sql: OK")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(main()))
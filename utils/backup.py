@@ -0,0 +1,146 @@
+"""
+Модуль для периодического резервного копирования базы SQLite без остановки бота
+"""
+
+import asyncio
+import glob
+import gzip
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BACKUPS_TOTAL = REGISTRY.counter("mindflow_backups_total", "Резервные копии базы по результату", ["status"])
+BACKUP_DURATION = REGISTRY.histogram(
+    "mindflow_backup_duration_seconds", "Длительность резервного копирования (копия и сжатие)",
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900),
+)
+BACKUP_SIZE = REGISTRY.gauge("mindflow_backup_size_bytes", "Размер последней резервной копии на диске", ["schema"])
+BACKUP_LAST_SUCCESS = REGISTRY.gauge("mindflow_backup_last_success_timestamp", "Время последней успешной копии (unix)")
+
+# Метка времени в имени файла: сортировка имен совпадает с порядком создания
+STAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+
+def _compress(path: str) -> str:
+    """Сжатие файла в path.gz с удалением исходного (выполняется в потоке)"""
+    compressed_path = path + ".gz"
+    with open(path, "rb") as source, gzip.open(compressed_path + ".tmp", "wb", compresslevel=6) as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    os.replace(compressed_path + ".tmp", compressed_path)
+    os.remove(path)
+    return compressed_path
+
+
+class SQLiteBackup:
+    """
+    Резервные копии базы SQLite (и архивной базы, если она есть) в каталог backup_dir
+
+    Копия снимается онлайн (Database.backup) небольшими шагами, бот продолжает работать.
+    Файлы называются <имя базы>-ГГГГММДД-ЧЧММСС.db[.gz]; хранятся последние keep копий
+    каждой базы, более старые удаляются. Сжатие выполняется в потоке, не блокируя цикл событий.
+    """
+
+    def __init__(self, database, backup_dir: str, keep: int = 7, compress: bool = True,
+                 pages: int = 256, step_sleep: float = 0.01, interval: int = 24 * 3600):
+        self.database = database
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.compress = compress
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self.interval = interval
+        self.is_running = False
+
+    def _sources(self) -> List[Tuple[str, str]]:
+        """(схема, путь к файлу) баз, которые нужно копировать"""
+        sources = [("main", self.database.db_path)]
+        if self.database.archive_path:
+            sources.append(("archive", self.database.archive_path))
+        return sources
+
+    def _snapshots(self, source_path: str) -> List[str]:
+        """Копии базы source_path от старых к новым"""
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        paths = glob.glob(os.path.join(glob.escape(self.backup_dir), f"{glob.escape(name)}-*.db*"))
+        return sorted(path for path in paths if not path.endswith(".tmp"))
+
+    def _last_backup_time(self) -> Optional[float]:
+        snapshots = self._snapshots(self.database.db_path)
+        return os.path.getmtime(snapshots[-1]) if snapshots else None
+
+    async def start(self):
+        """Запуск периодического резервного копирования"""
+        if not hasattr(self.database, "backup"):
+            logger.info("Бэкенд базы данных не поддерживает резервное копирование (только SQLite)")
+            return
+
+        self.is_running = True
+        logger.info(f"Резервное копирование запущено: каждые {self.interval} с в {self.backup_dir}, хранится {self.keep} копий")
+
+        # После перезапуска не копируем раньше срока
+        last = self._last_backup_time()
+        if last is not None:
+            await asyncio.sleep(max(0.0, last + self.interval - time.time()))
+
+        while self.is_running:
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error(f"Ошибка резервного копирования: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        """Остановка резервного копирования"""
+        self.is_running = False
+        logger.info("Резервное копирование остановлено")
+
+    async def run(self) -> List[Tuple[str, int]]:
+        """Одна резервная копия каждой базы; возвращает (путь, размер в байтах) созданных файлов"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        stamp = datetime.now().strftime(STAMP_FORMAT)
+        created = []
+        for schema, source_path in self._sources():
+            started = time.perf_counter()
+            name = os.path.splitext(os.path.basename(source_path))[0]
+            path = os.path.join(self.backup_dir, f"{name}-{stamp}.db")
+
+            if not await self.database.backup(path, schema, self.pages, self.step_sleep):
+                BACKUPS_TOTAL.inc(status="error")
+                continue
+            copied = time.perf_counter() - started
+            size = os.path.getsize(path)
+            if self.compress:
+                path = await asyncio.to_thread(_compress, path)
+            compressed_size = os.path.getsize(path)
+
+            duration = time.perf_counter() - started
+            BACKUP_DURATION.observe(duration)
+            BACKUP_SIZE.set(compressed_size, schema=schema)
+            BACKUPS_TOTAL.inc(status="ok")
+            logger.info(
+                f"Резервная копия {schema}: {path}, {size / 1024 / 1024:.1f} МБ"
+                + (f" (сжато до {compressed_size / 1024 / 1024:.1f} МБ)" if self.compress else "")
+                + f", копирование {copied:.2f} с, всего {duration:.2f} с"
+            )
+            created.append((path, compressed_size))
+            self._apply_retention(source_path)
+
+        if len(created) == len(self._sources()):
+            BACKUP_LAST_SUCCESS.set(time.time())
+        return created
+
+    def _apply_retention(self, source_path: str):
+        """Удаление копий сверх keep самых новых"""
+        snapshots = self._snapshots(source_path)
+        for path in snapshots[:-self.keep] if self.keep > 0 else []:
+            try:
+                os.remove(path)
+                logger.info(f"Удалена старая резервная копия: {path}")
+            except OSError as e:
+                logger.error(f"Не удалось удалить резервную копию {path}: {e}")
@@ -2,8 +2,10 @@
 Модуль для автоматической категоризации текста
 """
 
+import asyncio
 import logging
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from utils.metrics import timed
 
 logger = logging.getLogger(__name__)
 
@@ -33,10 +35,14 @@ CATEGORY_EMOJIS = {
 
 
 class Categorizer:
-    def __init__(self, database=None):
+    def __init__(self, database=None, model=None):
         self.database = database
         self._custom_categories_cache = {}
         self._cache_updated = False
+        # Обучаемые подсказки (utils.category_model.CategoryModel) для текстов без ключевых слов
+        self.model = model
+        # Модели пользователей, которые сейчас строятся по базе
+        self._loading: Dict[int, asyncio.Task] = {}
 
     async def _load_custom_categories(self):
         """Загрузка пользовательских категорий из базы данных"""
@@ -64,6 +70,7 @@ class Categorizer:
         text_lower = text.lower()
         return any(keyword.lower() in text_lower for keyword in keywords)
 
+    @timed("categorize")
     async def categorize(self, text: str, user_id: int = None) -> Tuple[str, str]:
         """
         Категоризация текста
@@ -76,27 +83,85 @@ class Categorizer:
             Tuple[str, str]: (название_категории, эмодзи_категории)
         """
         await self._load_custom_categories()
-        
-        # Сначала проверяем пользовательские категории
+
+        matched = self._match_keywords(text, user_id)
+        if matched:
+            logger.debug(f"Текст категоризирован как '{matched[0]}'")
+            return matched
+
+        # Ключевые слова не подошли - подсказка модели, обученной на записях пользователя
+        if self.model is not None and user_id:
+            category_name = self._predict(user_id, text)
+            if category_name:
+                logger.debug(f"Текст категоризирован моделью как '{category_name}'")
+                return category_name, CATEGORY_EMOJIS.get(category_name, "🔧")
+
+        # Если ничего не найдено, возвращаем "Прочее"
+        logger.debug("Текст категоризирован как 'Прочее'")
+        return "Прочее", CATEGORY_EMOJIS["Прочее"]
+
+    def _match_keywords(self, text: str, user_id: int = None) -> Optional[Tuple[str, str]]:
+        """Категория по ключевым словам: сначала пользовательские, затем системные; None - не найдена"""
         if user_id and user_id in self._custom_categories_cache:
             for category_name, keywords in self._custom_categories_cache[user_id].items():
                 if self._check_keywords(text, keywords):
-                    logger.info(f"Текст категоризирован как пользовательская категория '{category_name}'")
                     return category_name, "🔧"  # Эмодзи для пользовательских категорий
 
-        # Затем проверяем системные категории
         for category_name, keywords in CATEGORIES.items():
             if category_name == "Прочее":
                 continue  # Пропускаем "Прочее" - это категория по умолчанию
                 
             if self._check_keywords(text, keywords):
-                emoji = CATEGORY_EMOJIS.get(category_name, "📝")
-                logger.info(f"Текст категоризирован как '{category_name}'")
-                return category_name, emoji
+                return category_name, CATEGORY_EMOJIS.get(category_name, "📝")
+        return None
 
-        # Если ничего не найдено, возвращаем "Прочее"
-        logger.info("Текст категоризирован как 'Прочее'")
-        return "Прочее", CATEGORY_EMOJIS["Прочее"]
+    def _predict(self, user_id: int, text: str) -> Optional[str]:
+        """Подсказка модели; пока модель пользователя строится по базе, подсказки нет"""
+        if not self.model.has_user(user_id):
+            if self.database and user_id not in self._loading:
+                self._loading[user_id] = asyncio.create_task(self._load_user_model(user_id))
+            return None
+        return self.model.predict(user_id, text)
+
+    async def _load_user_model(self, user_id: int):
+        """
+        Загрузка модели пользователя (в фоне, не задерживая ответ): сохраненные счетчики
+        дополняются записями новее сохраненных, без сохранения - строятся по всем записям
+
+        Сохраняется только то, что прочитано из базы: записи, учтенные learn после загрузки,
+        при следующей загрузке снова придут из базы и не будут посчитаны дважды.
+        """
+        try:
+            user_model = await self.model.load_saved(user_id) or self.model.new_user_model()
+            saved_id = user_model.last_id
+            async for entry_id, text, category, _ in self.database.iter_entries(user_id, after_id=saved_id):
+                if self._is_training_label(text, category, user_id):
+                    user_model.learn(text, category)
+                user_model.last_id = entry_id
+            if user_model.last_id != saved_id:
+                await self.model.save(user_id, user_model)
+            self.model.put(user_id, user_model)
+            logger.debug(f"Модель категорий пользователя {user_id} загружена: {user_model.examples} записей, "
+                         f"из базы прочитаны записи после id {saved_id}")
+        except Exception as e:
+            logger.error(f"Ошибка построения модели категорий пользователя {user_id}: {e}")
+        finally:
+            self._loading.pop(user_id, None)
+
+    def _is_training_label(self, text: str, category: str, user_id: int) -> bool:
+        """
+        Категорию записи определили ключевые слова, либо это "Прочее", к которому ключевые слова
+        не подошли (фоновый класс модели); на своих подсказках модель не учится
+        """
+        matched = self._match_keywords(text, user_id)
+        if matched is None:
+            return category == "Прочее"
+        return matched[0] == category
+
+    async def learn(self, user_id: int, text: str, category: str):
+        """Учет сохраненной записи в модели пользователя"""
+        if self.model is not None and self.model.has_user(user_id) and self._is_training_label(text, category, user_id):
+            self.model.learn(user_id, text, category)
 
     def get_all_categories(self) -> Dict[str, List[str]]:
         """Получение всех системных категорий"""
@@ -0,0 +1,245 @@
+"""
+Модуль для обучаемой категоризации: наивный байесовский классификатор по записям каждого пользователя
+"""
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.metrics import REGISTRY
+from utils.similarity import STEM_LENGTH, tokenize
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_MODEL_PREDICTIONS = REGISTRY.counter(
+    "mindflow_category_model_predictions_total", "Подсказки обучаемой категоризации по результату", ["result"]
+)
+
+# Начальное число столбцов таблицы счетчиков; растет вдвое до vocab_size
+_INITIAL_COLUMNS = 64
+
+# Фоновый класс: записи, которые не распознали ключевые слова. Модель сравнивает с ним,
+# но сама его не подсказывает
+BACKGROUND = "Прочее"
+
+# Служебные слова встречаются в записях любой категории и ничего не говорят о ней
+STOPWORDS = frozenset(word[:STEM_LENGTH] for word in (
+    "что", "чтобы", "как", "так", "это", "этот", "эта", "эти", "этого", "этой", "того", "тот", "там", "тут",
+    "где", "когда", "кто", "чем", "чего", "его", "она", "они", "оно", "меня", "мне", "мной", "тебя", "тебе",
+    "себя", "себе", "нас", "вас", "них", "ему", "ней", "нее", "для", "при", "про", "без", "над", "под", "через",
+    "после", "перед", "между", "или", "если", "уже", "еще", "все", "вот", "нет", "тоже", "также",
+    "только", "очень", "был", "была", "было", "были", "быть", "будет", "есть", "может", "можно", "надо",
+    "даже", "ведь", "потом", "затем", "либо", "хотя", "пока", "вообще", "просто", "какой", "какая", "какие",
+))
+
+
+def terms(text: str) -> List[str]:
+    """Термины текста для модели: как в поиске похожих записей, но без служебных слов"""
+    return [term for term in tokenize(text) if term not in STOPWORDS]
+
+
+class UserCategoryModel:
+    """
+    Мультиномиальная модель одного пользователя: счетчики терминов по категориям
+
+    counts[категория, термин] - сколько раз термин встретился в записях категории;
+    обучение - только прибавление к счетчикам, без повторных проходов. Словарь
+    ограничен vocab_size терминами: после заполнения новые термины не учитываются.
+    Записи «Прочее» учитываются как фоновый класс BACKGROUND. last_id - id последней записи
+    из базы, учтенной при построении: сохраненные счетчики дополняются только более новыми.
+    """
+
+    def __init__(self, vocab_size: int):
+        self.vocab_size = vocab_size
+        self.vocab: Dict[str, int] = {}
+        self.categories: Dict[str, int] = {}
+        self.names = []
+        self.counts = np.zeros((0, _INITIAL_COLUMNS), dtype=np.int32)
+        self.totals = np.zeros(0, dtype=np.int64)     # терминов в записях категории
+        self.documents = np.zeros(0, dtype=np.int64)  # записей категории
+        self.last_id = 0
+
+    @property
+    def examples(self) -> int:
+        """Записи с категорией от ключевых слов (без фоновых)"""
+        background = self.categories.get(BACKGROUND)
+        return int(self.documents.sum()) - (int(self.documents[background]) if background is not None else 0)
+
+    def _category(self, category: str) -> int:
+        number = self.categories.get(category)
+        if number is None:
+            number = self.categories[category] = len(self.names)
+            self.names.append(category)
+            self.counts = np.vstack([self.counts, np.zeros((1, self.counts.shape[1]), dtype=np.int32)])
+            self.totals = np.append(self.totals, 0)
+            self.documents = np.append(self.documents, 0)
+        return number
+
+    def _term(self, term: str) -> Optional[int]:
+        number = self.vocab.get(term)
+        if number is None and len(self.vocab) < self.vocab_size:
+            number = self.vocab[term] = len(self.vocab)
+            if number >= self.counts.shape[1]:
+                columns = min(self.counts.shape[1] * 2, self.vocab_size)
+                self.counts = np.hstack([self.counts, np.zeros((len(self.names), columns - self.counts.shape[1]), dtype=np.int32)])
+        return number
+
+    def learn(self, text: str, category: str):
+        """Учет одной записи в счетчиках"""
+        row = self._category(category)
+        numbers = [number for number in map(self._term, terms(text)) if number is not None]
+        if numbers:
+            np.add.at(self.counts[row], numbers, 1)
+        self.totals[row] += len(numbers)
+        self.documents[row] += 1
+
+    def save(self, path: str):
+        """Сохранение счетчиков в файл .npz (через временный файл, чтобы не оставить половину)"""
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, vocab=np.array(list(self.vocab), dtype=str), names=np.array(self.names, dtype=str),
+                     counts=self.counts, totals=self.totals, documents=self.documents, last_id=self.last_id)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str, vocab_size: int) -> "UserCategoryModel":
+        """Счетчики, сохраненные save"""
+        model = cls(vocab_size)
+        with np.load(path, allow_pickle=False) as data:
+            model.vocab = {term: number for number, term in enumerate(data["vocab"].tolist())}
+            model.names = data["names"].tolist()
+            model.categories = {name: number for number, name in enumerate(model.names)}
+            model.counts = data["counts"]
+            model.totals = data["totals"]
+            model.documents = data["documents"]
+            model.last_id = int(data["last_id"])
+        if model.counts.shape[0] != len(model.names) or model.counts.shape[1] < len(model.vocab):
+            raise ValueError(f"файл {path} поврежден: размеры таблицы счетчиков не совпадают со словарем")
+        return model
+
+    def predict(self, text: str, alpha: float = 1.0) -> Optional[Tuple[str, float, float]]:
+        """
+        Самая вероятная категория, ее апостериорная вероятность и свидетельство текста в ее пользу
+
+        Свидетельство - логарифм отношения правдоподобия текста в этой категории и во всех
+        остальных записях вместе (включая фоновые): его дают только термины, характерные для
+        категории, а не доля категории среди записей. None - в тексте нет известных терминов.
+        """
+        numbers = [self.vocab[term] for term in terms(text) if term in self.vocab]
+        if not numbers or not self.names:
+            return None
+
+        # Логарифм правдоподобия сразу по всем категориям: строки - категории, столбцы - термины текста
+        vocabulary = len(self.vocab)
+        counts = self.counts[:, numbers]
+        likelihood = np.log(counts + alpha).sum(axis=1) - len(numbers) * np.log(self.totals + alpha * vocabulary)
+        scores = np.log(self.documents / self.documents.sum()) + likelihood
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(probabilities.argmax())
+
+        rest_counts = counts.sum(axis=0) - counts[best]
+        rest_total = self.totals.sum() - self.totals[best]
+        rest_likelihood = np.log(rest_counts + alpha).sum() - len(numbers) * np.log(rest_total + alpha * vocabulary)
+        return self.names[best], float(probabilities[best]), float(likelihood[best] - rest_likelihood)
+
+
+class CategoryModel:
+    """
+    Обучаемые подсказки категорий для записей, которые не распознали ключевые слова
+
+    Модели пользователей хранятся в памяти, не больше cache_users (давно не использованные
+    вытесняются). Построенные по базе счетчики сохраняются в model_dir (файл на пользователя),
+    поэтому после вытеснения или перезапуска из базы читаются только записи новее
+    сохраненных; пустой model_dir - модели каждый раз строятся по всей истории. Подсказка выдается, если у пользователя не меньше
+    min_examples обучающих записей, самая вероятная категория - не фоновая, ее вероятность
+    не ниже min_confidence, а логарифм отношения правдоподобия против остальных записей -
+    не ниже min_evidence (одна доля категории среди записей подсказку не дает).
+    """
+
+    def __init__(self, vocab_size: int = 5000, min_confidence: float = 0.8, min_examples: int = 20,
+                 cache_users: int = 1000, alpha: float = 1.0, min_evidence: float = 2.0,
+                 model_dir: str = ""):
+        self.vocab_size = vocab_size
+        self.model_dir = model_dir
+        self.min_confidence = min_confidence
+        self.min_examples = min_examples
+        self.min_evidence = min_evidence
+        self.cache_users = cache_users
+        self.alpha = alpha
+        self._users: "OrderedDict[int, UserCategoryModel]" = OrderedDict()
+
+    def new_user_model(self) -> UserCategoryModel:
+        return UserCategoryModel(self.vocab_size)
+
+    def _path(self, user_id: int) -> str:
+        return os.path.join(self.model_dir, f"{user_id}.npz")
+
+    async def load_saved(self, user_id: int) -> Optional[UserCategoryModel]:
+        """Сохраненные счетчики пользователя; None - их нет, хранение отключено или файл поврежден"""
+        if not self.model_dir or not os.path.exists(self._path(user_id)):
+            return None
+        try:
+            return await asyncio.to_thread(UserCategoryModel.load, self._path(user_id), self.vocab_size)
+        except Exception as e:
+            logger.error(f"Модель категорий пользователя {user_id} будет построена заново: {e}")
+            return None
+
+    async def save(self, user_id: int, model: UserCategoryModel) -> bool:
+        """Сохранение счетчиков пользователя в model_dir (в потоке, не блокируя цикл событий)"""
+        if not self.model_dir:
+            return False
+        try:
+            await asyncio.to_thread(os.makedirs, self.model_dir, exist_ok=True)
+            await asyncio.to_thread(model.save, self._path(user_id))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения модели категорий пользователя {user_id}: {e}")
+            return False
+
+    def has_user(self, user_id: int) -> bool:
+        return user_id in self._users
+
+    def put(self, user_id: int, model: UserCategoryModel):
+        """Сохранение модели пользователя (после построения по базе)"""
+        self._users[user_id] = model
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.cache_users:
+            self._users.popitem(last=False)
+
+    def learn(self, user_id: int, text: str, category: str):
+        """Учет новой записи, если модель пользователя уже в памяти"""
+        model = self._users.get(user_id)
+        if model is not None:
+            model.learn(text, category)
+
+    def predict(self, user_id: int, text: str) -> Optional[str]:
+        """Категория для текста или None, если модель не уверена"""
+        model = self._users.get(user_id)
+        if model is None:
+            return None
+        self._users.move_to_end(user_id)
+        if model.examples < self.min_examples:
+            CATEGORY_MODEL_PREDICTIONS.inc(result="few_examples")
+            return None
+
+        prediction = model.predict(text, self.alpha)
+        if prediction is None:
+            CATEGORY_MODEL_PREDICTIONS.inc(result="unknown_terms")
+            return None
+        category, confidence, evidence = prediction
+        if category == BACKGROUND:
+            CATEGORY_MODEL_PREDICTIONS.inc(result="background")
+            return None
+        if confidence < self.min_confidence:
+            CATEGORY_MODEL_PREDICTIONS.inc(result="low_confidence")
+            return None
+        if evidence < self.min_evidence:
+            CATEGORY_MODEL_PREDICTIONS.inc(result="weak_evidence")
+            return None
+        CATEGORY_MODEL_PREDICTIONS.inc(result="accepted")
+        return category
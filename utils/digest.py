@@ -0,0 +1,264 @@
+"""
+Модуль для еженедельной сводки: пакетная обработка записей всех подписчиков одним потоком
+"""
+
+import asyncio
+import heapq
+import logging
+import re
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+from aiogram import Bot
+from db.base import TIMESTAMP_FORMAT, JournalDatabase
+from utils.categorizer import CATEGORY_EMOJIS
+from utils.metrics import REGISTRY
+from utils.rendering import escape, pack_blocks, shorten
+from utils.sender import BULK, send_priority
+
+logger = logging.getLogger(__name__)
+
+DIGESTS_SENT = REGISTRY.counter("mindflow_digests_sent_total", "Отправленные еженедельные сводки по результату", ["status"])
+DIGEST_RUN_DURATION = REGISTRY.histogram(
+    "mindflow_digest_run_duration_seconds", "Длительность прохода рассылки еженедельной сводки",
+    buckets=(1, 5, 15, 60, 300, 900, 1800, 3600, 7200),
+)
+
+# Сколько элементов каждого раздела показывать
+TOP_WORRIES = 3
+WORRY_SLOTS = 20  # Счетчиков для поиска частых тревог (space-saving): память не зависит от числа записей
+LAST_TASKS = 5
+NEXT_REMINDERS = 5
+
+# Контрольная точка пишется не после каждого пользователя, а раз в столько пользователей
+CHECKPOINT_EVERY = 50
+
+_WORRY_STRIP_RE = re.compile(r"[^\w\s]+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def week_bounds(now: datetime) -> Tuple[str, datetime, datetime]:
+    """Прошлая календарная неделя: (период - дата ее понедельника, начало, конец)"""
+    this_monday = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    start = this_monday - timedelta(days=7)
+    return start.strftime("%Y-%m-%d"), start, this_monday
+
+
+class UserDigest:
+    """
+    Сводка одного пользователя, собираемая за один проход по его записям
+
+    Память ограничена независимо от числа записей: счетчики категорий (их немного),
+    WORRY_SLOTS счетчиков тревог, LAST_TASKS последних задач и NEXT_REMINDERS ближайших напоминаний.
+    """
+
+    __slots__ = ("user_id", "category_counts", "worries", "tasks", "reminders")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.category_counts: Dict[str, int] = {}
+        # Нормализованный текст -> [счетчик, текст для показа]
+        self.worries: Dict[str, list] = {}
+        self.tasks: Deque[str] = deque(maxlen=LAST_TASKS)
+        self.reminders: List[Tuple[str, str]] = []
+
+    def add_entry(self, text: str, category: str):
+        self.category_counts[category] = self.category_counts.get(category, 0) + 1
+        if category == "Тревоги":
+            self._count_worry(text)
+        elif category == "Задачи":
+            self.tasks.append(text)
+
+    def _count_worry(self, text: str):
+        """Алгоритм space-saving: при заполнении вытесняется самый редкий счетчик, новый наследует его значение"""
+        key = _SPACES_RE.sub(" ", _WORRY_STRIP_RE.sub(" ", text.lower())).strip() or text
+        slot = self.worries.get(key)
+        if slot is not None:
+            slot[0] += 1
+            return
+        count = 0
+        if len(self.worries) >= WORRY_SLOTS:
+            rarest = min(self.worries, key=lambda k: self.worries[k][0])
+            count = self.worries.pop(rarest)[0]
+        self.worries[key] = [count + 1, text]
+
+    def add_reminder(self, text: str, reminder_time: str):
+        # Куча с обратным порядком: на вершине самое позднее из оставленных напоминаний
+        item = (_negate_time(reminder_time), text)
+        if len(self.reminders) < NEXT_REMINDERS:
+            heapq.heappush(self.reminders, item)
+        elif item > self.reminders[0]:
+            heapq.heapreplace(self.reminders, item)
+
+    def render(self, start: datetime, end: datetime) -> List[str]:
+        """Сообщения сводки (HTML)"""
+        last_day = (end - timedelta(days=1)).strftime("%d.%m")
+        blocks = [f"📬 <b>Итоги недели {start.strftime('%d.%m')} — {last_day}</b>\n\n"]
+
+        if self.category_counts:
+            total = sum(self.category_counts.values())
+            lines = [f"📊 <b>Записи по категориям</b> (всего {total}):\n"]
+            for category, count in sorted(self.category_counts.items(), key=lambda item: -item[1]):
+                lines.append(f"{CATEGORY_EMOJIS.get(category, '📝')} {escape(category)}: {count}\n")
+            blocks.append("".join(lines) + "\n")
+
+        if self.worries:
+            top = sorted(self.worries.values(), key=lambda slot: -slot[0])[:TOP_WORRIES]
+            lines = ["😰 <b>Чаще всего тревожило:</b>\n"]
+            lines.extend(f"• {escape(shorten(text, 100))} (×{count})\n" for count, text in top)
+            blocks.append("".join(lines) + "\n")
+
+        if self.tasks:
+            lines = ["✅ <b>Последние задачи недели:</b>\n"]
+            lines.extend(f"• {escape(shorten(text, 100))}\n" for text in reversed(self.tasks))
+            blocks.append("".join(lines) + "\n")
+
+        if self.reminders:
+            lines = ["⏰ <b>Ближайшие напоминания:</b>\n"]
+            for negated, text in sorted(self.reminders, reverse=True):
+                when = datetime.strptime(_negate_time(negated), TIMESTAMP_FORMAT).strftime("%d.%m %H:%M")
+                lines.append(f"• <i>{when}</i> {escape(shorten(text, 100))}\n")
+            blocks.append("".join(lines))
+
+        blocks.append("\nОтписаться: /digest off")
+        return pack_blocks(blocks)
+
+
+_DIGIT_NEGATION = str.maketrans("0123456789", "9876543210")
+
+
+def _negate_time(timestamp: str) -> str:
+    """Время 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' с цифрами 9-d: обратный порядок строк (операция обратима)"""
+    return timestamp.translate(_DIGIT_NEGATION)
+
+
+async def _next_row(rows: AsyncIterator[tuple]) -> Optional[tuple]:
+    try:
+        return await rows.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class DigestScheduler:
+    """
+    Еженедельная рассылка сводки подписчикам (/digest on)
+
+    После наступления часа hour в понедельник обрабатывается прошлая неделя: записи
+    и напоминания всех подписчиков читаются двумя потоками, упорядоченными по user_id,
+    и сливаются; сводка пользователя собирается за один проход и сразу отдается
+    в очередь исходящих сообщений с приоритетом BULK (одновременно не больше concurrency
+    отправок). Последний пользователь, до которого все сводки отправлены, сохраняется
+    в контрольной точке - после перезапуска рассылка продолжается с него.
+    """
+
+    def __init__(self, bot: Bot, database: JournalDatabase, hour: int = 4, concurrency: int = 20,
+                 interval: int = 600):
+        self.bot = bot
+        self.database = database
+        self.hour = hour
+        self.concurrency = concurrency
+        self.interval = interval
+        self.is_running = False
+
+    async def start(self):
+        """Запуск планировщика еженедельной сводки"""
+        self.is_running = True
+        logger.info(f"Планировщик еженедельной сводки запущен: понедельник, {self.hour:02d}:00")
+
+        while self.is_running:
+            try:
+                await self.run_if_due(datetime.now())
+            except Exception as e:
+                logger.error(f"Ошибка рассылки еженедельной сводки: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        """Остановка планировщика еженедельной сводки"""
+        self.is_running = False
+        logger.info("Планировщик еженедельной сводки остановлен")
+
+    async def run_if_due(self, now: datetime) -> int:
+        """Рассылка за прошлую неделю, если ее время пришло и она еще не завершена; возвращает число сводок"""
+        period, start, end = week_bounds(now)
+        if now < end + timedelta(hours=self.hour):
+            return 0
+        checkpoint = await self.database.get_digest_checkpoint(period)
+        if checkpoint and checkpoint[1]:
+            return 0
+        after_user_id = checkpoint[0] if checkpoint else 0
+        if after_user_id:
+            logger.info(f"Продолжение рассылки сводки за неделю {period} после пользователя {after_user_id}")
+        return await self.run(period, start, end, now, after_user_id)
+
+    async def run(self, period: str, start: datetime, end: datetime, now: datetime, after_user_id: int = 0) -> int:
+        """Один проход рассылки: пользователи после after_user_id по возрастанию id"""
+        started = time.perf_counter()
+        since, until = start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT)
+        horizon = (now + timedelta(days=7)).strftime(TIMESTAMP_FORMAT)
+        # Отправки в порядке user_id; контрольная точка - последний пользователь, до которого все завершены
+        in_flight: Deque[Tuple[int, asyncio.Task]] = deque()
+        done_user_id = after_user_id
+        sent = 0
+
+        async def complete_head():
+            nonlocal done_user_id, sent
+            user_id, task = in_flight.popleft()
+            await task
+            done_user_id = user_id
+            sent += 1
+            if sent % CHECKPOINT_EVERY == 0:
+                await self.database.set_digest_checkpoint(period, done_user_id, False)
+
+        try:
+            with send_priority(BULK):
+                async for digest in self._user_digests(since, until, now.strftime(TIMESTAMP_FORMAT), horizon, after_user_id):
+                    if len(in_flight) >= self.concurrency:
+                        await complete_head()
+                    messages = digest.render(start, end)
+                    in_flight.append((digest.user_id, asyncio.create_task(self._send(digest.user_id, messages))))
+                while in_flight:
+                    await complete_head()
+        except BaseException:
+            # Незавершенные отправки не теряются: продолжение начнется с done_user_id
+            for _, task in in_flight:
+                task.cancel()
+            await self.database.set_digest_checkpoint(period, done_user_id, False)
+            raise
+        finally:
+            DIGEST_RUN_DURATION.observe(time.perf_counter() - started)
+
+        await self.database.set_digest_checkpoint(period, done_user_id, True)
+        logger.info(f"Сводка за неделю {period} разослана: {sent} пользователей за {time.perf_counter() - started:.1f} с")
+        return sent
+
+    async def _user_digests(self, since: str, until: str, reminders_since: str, reminders_until: str,
+                            after_user_id: int) -> AsyncIterator[UserDigest]:
+        """Слияние двух потоков, упорядоченных по user_id, в сводки по пользователям"""
+        entries = self.database.iter_digest_entries(since, until, after_user_id)
+        reminders = self.database.iter_digest_reminders(reminders_since, reminders_until, after_user_id)
+        try:
+            entry, reminder = await _next_row(entries), await _next_row(reminders)
+            while entry is not None or reminder is not None:
+                user_id = min(row[0] for row in (entry, reminder) if row is not None)
+                digest = UserDigest(user_id)
+                while entry is not None and entry[0] == user_id:
+                    digest.add_entry(entry[1], entry[2])
+                    entry = await _next_row(entries)
+                while reminder is not None and reminder[0] == user_id:
+                    digest.add_reminder(reminder[1], reminder[2])
+                    reminder = await _next_row(reminders)
+                yield digest
+        finally:
+            await entries.aclose()
+            await reminders.aclose()
+
+    async def _send(self, user_id: int, messages: List[str]):
+        """Отправка сводки; ошибка (например, пользователь заблокировал бота) не останавливает рассылку"""
+        try:
+            for message in messages:
+                await self.bot.send_message(user_id, message, parse_mode="HTML")
+            DIGESTS_SENT.inc(status="ok")
+        except Exception as e:
+            DIGESTS_SENT.inc(status="failed")
+            logger.error(f"Ошибка отправки сводки пользователю {user_id}: {e}")
@@ -0,0 +1,156 @@
+"""
+Модуль для потокового экспорта дневника пользователя в файл
+"""
+
+import csv
+import json
+import logging
+import tempfile
+from typing import AsyncGenerator, BinaryIO, Optional, Tuple
+
+from aiogram.types.input_file import DEFAULT_CHUNK_SIZE, InputFile
+
+logger = logging.getLogger(__name__)
+
+# Поддерживаемые форматы экспорта: формат -> расширение файла
+EXPORT_FORMATS = {
+    "jsonl": "jsonl",
+    "csv": "csv",
+    "md": "md",
+}
+
+
+def _md_item(text: str) -> str:
+    """Текст пункта списка Markdown: строки многострочной записи с отступом остаются внутри пункта"""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join([lines[0]] + [f"  {line}" if line.strip() else "" for line in lines[1:]])
+
+
+class _Utf8Writer:
+    """Обертка над бинарным файлом, кодирующая строки в UTF-8 (нужна для csv.writer)"""
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+
+    def write(self, text: str) -> int:
+        return self.file.write(text.encode("utf-8"))
+
+
+class SpooledInputFile(InputFile):
+    """Файл для отправки в Telegram, читаемый порциями из временного файла"""
+
+    def __init__(self, file: BinaryIO, filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
+
+
+class JournalExporter:
+    def __init__(self, database, batch_size: int = 500, spool_max_size: int = 1024 * 1024):
+        self.database = database
+        self.batch_size = batch_size
+        self.spool_max_size = spool_max_size
+
+    async def export(self, user_id: int, export_format: str) -> Tuple[BinaryIO, int, int]:
+        """
+        Потоковый экспорт записей и напоминаний пользователя во временный файл
+
+        Файл держится в памяти до spool_max_size байт, дальше сбрасывается на диск,
+        поэтому потребление памяти не зависит от размера дневника.
+
+        Args:
+            user_id: ID пользователя
+            export_format: Формат экспорта (jsonl, csv, md)
+
+        Returns:
+            Tuple[BinaryIO, int, int]: (файл, количество_записей, количество_напоминаний)
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат экспорта: {export_format}")
+
+        file = tempfile.SpooledTemporaryFile(max_size=self.spool_max_size, mode="w+b")
+        try:
+            writer = getattr(self, f"_write_{export_format}")
+            entries_count, reminders_count = await writer(file, user_id)
+            file.flush()
+        except Exception:
+            file.close()
+            raise
+
+        logger.info(
+            f"Экспорт для пользователя {user_id} ({export_format}): "
+            f"{entries_count} записей, {reminders_count} напоминаний"
+        )
+        return file, entries_count, reminders_count
+
+    async def _write_jsonl(self, file: BinaryIO, user_id: int) -> Tuple[int, int]:
+        """Экспорт в JSON Lines: одна строка на запись или напоминание"""
+        entries_count = 0
+        async for entry_id, text, category, datetime_str in self.database.iter_entries(user_id, self.batch_size):
+            record = {"type": "entry", "id": entry_id, "datetime": str(datetime_str), "category": category, "text": text}
+            file.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            entries_count += 1
+
+        reminders_count = 0
+        async for reminder_id, entry_id, text, reminder_time, is_sent in self.database.iter_reminders(user_id, self.batch_size):
+            record = {
+                "type": "reminder",
+                "id": reminder_id,
+                "entry_id": entry_id,
+                "reminder_time": str(reminder_time),
+                "is_sent": bool(is_sent),
+                "text": text,
+            }
+            file.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            reminders_count += 1
+
+        return entries_count, reminders_count
+
+    async def _write_csv(self, file: BinaryIO, user_id: int) -> Tuple[int, int]:
+        """Экспорт в CSV: общая таблица для записей и напоминаний"""
+        # BOM, чтобы Excel корректно открывал кириллицу
+        file.write("\ufeff".encode("utf-8"))
+        writer = csv.writer(_Utf8Writer(file))
+        writer.writerow(["type", "id", "entry_id", "datetime", "category", "is_sent", "text"])
+
+        entries_count = 0
+        async for entry_id, text, category, datetime_str in self.database.iter_entries(user_id, self.batch_size):
+            writer.writerow(["entry", entry_id, "", str(datetime_str), category, "", text])
+            entries_count += 1
+
+        reminders_count = 0
+        async for reminder_id, entry_id, text, reminder_time, is_sent in self.database.iter_reminders(user_id, self.batch_size):
+            writer.writerow(["reminder", reminder_id, entry_id, str(reminder_time), "", int(bool(is_sent)), text])
+            reminders_count += 1
+
+        return entries_count, reminders_count
+
+    async def _write_md(self, file: BinaryIO, user_id: int) -> Tuple[int, int]:
+        """Экспорт в Markdown: записи сгруппированы по дням"""
+        out = _Utf8Writer(file)
+        out.write("# MindFlow Journal\n")
+
+        entries_count = 0
+        current_day: Optional[str] = None
+        async for entry_id, text, category, datetime_str in self.database.iter_entries(user_id, self.batch_size):
+            datetime_str = str(datetime_str).replace("T", " ")
+            day, _, time_part = datetime_str.partition(" ")
+            if day != current_day:
+                current_day = day
+                out.write(f"\n## {day}\n\n")
+            out.write(f"- **{time_part[:5]}** [{category}] {_md_item(text)}\n")
+            entries_count += 1
+
+        reminders_count = 0
+        async for reminder_id, entry_id, text, reminder_time, is_sent in self.database.iter_reminders(user_id, self.batch_size):
+            if reminders_count == 0:
+                out.write("\n## Напоминания\n\n")
+            mark = "x" if is_sent else " "
+            out.write(f"- [{mark}] {str(reminder_time)[:16]} — {_md_item(text)}\n")
+            reminders_count += 1
+
+        return entries_count, reminders_count
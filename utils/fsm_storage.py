@@ -0,0 +1,102 @@
+"""
+Модуль для хранения состояний диалогов (FSM aiogram) в базе данных бота
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from db.base import JournalDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseStorage(BaseStorage):
+    """
+    Хранилище FSM в таблице fsm_states
+
+    Состояния переживают перезапуск и общие для всех экземпляров бота, работающих
+    с одной базой. Каждая запись хранится ttl секунд с последнего изменения,
+    устаревшие удаляет run_maintenance бэкенда.
+
+    aiogram читает состояние на каждое обновление, поэтому для одного экземпляра бота перед
+    базой можно поставить небольшой локальный кэш (LRU на cache_size ключей): запись идет
+    сразу в базу и в кэш, а прочитанное значение считается актуальным cache_ttl секунд.
+    По умолчанию (cache_ttl=0) кэша нет: при нескольких экземплярах закэшированное
+    «состояния нет» пропустило бы состояние, установленное другим экземпляром.
+    """
+
+    def __init__(self, database: JournalDatabase, ttl: int = 86400, cache_size: int = 10000, cache_ttl: float = 0.0):
+        self.database = database
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        # storage_key -> (state, data, время помещения в кэш)
+        self._cache: "OrderedDict[str, Tuple[Optional[str], Dict[str, Any], float]]" = OrderedDict()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _remember(self, storage_key: str, state: Optional[str], data: Dict[str, Any]):
+        if self.cache_ttl <= 0:
+            return
+        self._cache[storage_key] = (state, data, time.monotonic())
+        self._cache.move_to_end(storage_key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, storage_key: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        cached = self._cache.get(storage_key)
+        if cached is not None and time.monotonic() - cached[2] < self.cache_ttl:
+            self._cache.move_to_end(storage_key)
+            return cached[0], cached[1]
+
+        record = await self.database.get_fsm_record(storage_key, time.time())
+        if record is None:
+            state, data = None, {}
+        else:
+            state, data = record[0], json.loads(record[1])
+        self._remember(storage_key, state, data)
+        return state, data
+
+    async def _save(self, storage_key: str, state: Optional[str], data: Dict[str, Any]):
+        if state is None and not data:
+            saved = await self.database.delete_fsm_record(storage_key)
+        else:
+            saved = await self.database.set_fsm_record(
+                storage_key, state, json.dumps(data, ensure_ascii=False), time.time() + self.ttl
+            )
+        if saved:
+            self._remember(storage_key, state, data)
+        else:
+            # Запись не удалась - значение в кэше могло разойтись с базой
+            self._cache.pop(storage_key, None)
+            logger.error(f"Не удалось сохранить состояние диалога {storage_key}")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self._key(key)
+        _, data = await self._load(storage_key)
+        await self._save(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self._key(key)
+        state, _ = await self._load(storage_key)
+        await self._save(storage_key, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return data.copy()
+
+    async def close(self) -> None:
+        # Соединение с базой закрывает main вместе с остальными компонентами
+        self._cache.clear()
@@ -0,0 +1,174 @@
+"""
+Модуль для сохранения мыслей: категоризация, поиск времени напоминания и атомарная запись в базу
+"""
+
+import asyncio
+import logging
+import re
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, NamedTuple, Optional, Set
+
+from db.base import JournalDatabase
+from utils.categorizer import Categorizer
+from utils.reminder_parser import ReminderParser
+
+logger = logging.getLogger(__name__)
+
+
+class IngestResult(NamedTuple):
+    entry_id: int
+    category: str
+    emoji: str
+    # Описание напоминания ("через 10 минут"), если оно создано вместе с записью
+    reminder_description: Optional[str] = None
+
+
+# Маркер пункта списка в начале строки: "-", "*", "•", "—", "1.", "2)", "[ ]", "[x]"
+_BULLET_RE = re.compile(r"^\s*(?:(?:[-*•—–]|\d{1,3}[.)]|\[[ xX]?\])\s*)+")
+
+
+def split_entries(text: str, max_entries: int = 50) -> List[str]:
+    """
+    Разбиение вставленного списка на отдельные записи: по строке на запись, без маркеров пунктов
+
+    Пустые строки пропускаются. Текст из одной строки или длиннее max_entries строк
+    (скорее заметка, чем список) остается одной записью.
+    """
+    items = [_BULLET_RE.sub("", line).strip() for line in text.splitlines()]
+    items = [item for item in items if item]
+    if len(items) < 2 or len(items) > max_entries:
+        return [text.strip()]
+    return items
+
+
+class _Batch:
+    __slots__ = ("items", "updated")
+
+    def __init__(self, item):
+        self.items = [item]
+        self.updated = time.monotonic()
+
+
+class MessageBatcher:
+    """
+    Объединение сообщений, пришедших подряд (альбом, серия пересылок), в одну пачку
+
+    Первое сообщение с данным ключом открывает пачку и запускает таймер, остальные только
+    добавляют в нее текст. Когда delay секунд нет новых сообщений (но не позже max_delay
+    от первого), все тексты пачки передаются в flush первого сообщения. Ожидание идет
+    в отдельной задаче: обработчик сообщения сразу возвращается и не занимает
+    обработчик очереди вебхука.
+    """
+
+    def __init__(self, delay: float = 1.0, max_delay: float = 5.0, max_items: int = 50):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.max_items = max_items
+        self._batches: Dict[Hashable, _Batch] = {}
+        self._timers: Set[asyncio.Task] = set()
+
+    def add(self, key: Hashable, item, flush: Callable[[list], Awaitable]):
+        """Добавление в пачку с ключом key; если пачки нет (или она заполнена) - новая с этим flush"""
+        batch = self._batches.get(key)
+        if batch is not None and len(batch.items) < self.max_items:
+            batch.items.append(item)
+            batch.updated = time.monotonic()
+            return
+
+        batch = self._batches[key] = _Batch(item)
+        timer = asyncio.create_task(self._flush_later(key, batch, flush))
+        self._timers.add(timer)
+        timer.add_done_callback(self._timers.discard)
+
+    async def _flush_later(self, key: Hashable, batch: _Batch, flush: Callable[[list], Awaitable]):
+        started = batch.updated
+        while True:
+            remaining = min(batch.updated + self.delay, started + self.max_delay) - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        # Заполненную пачку могла заменить новая с тем же ключом
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+        try:
+            await flush(batch.items)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения пачки сообщений: {e}")
+
+    async def shutdown(self, timeout: float = 10.0):
+        """Дождаться открытых пачек (не дольше max_delay + timeout секунд), оставшиеся отменить"""
+        if not self._timers:
+            return
+        _, pending = await asyncio.wait(set(self._timers), timeout=self.max_delay + timeout)
+        for timer in pending:
+            timer.cancel()
+        if pending:
+            logger.warning(f"Остановка: не сохранено пачек сообщений: {len(pending)}")
+
+
+class IngestService:
+    def __init__(self, database: JournalDatabase, categorizer: Categorizer,
+                 reminder_parser: Optional[ReminderParser] = None, similarity=None):
+        self.database = database
+        self.categorizer = categorizer
+        self.reminder_parser = reminder_parser or ReminderParser()
+        # Индекс похожих записей (utils.similarity.SimilarityIndex), если /similar включен
+        self.similarity = similarity
+
+    async def _prepare(self, user_id: int, text: str):
+        """Категория, эмодзи и (если в тексте найдено время) напоминание для текста"""
+        category, emoji = await self.categorizer.categorize(text, user_id)
+
+        # Напоминание создается для любой категории, если в тексте есть указание времени
+        reminder_time = description = None
+        reminder_data = self.reminder_parser.parse_time_from_text(text)
+        if reminder_data:
+            reminder_time, description = reminder_data
+        return category, emoji, reminder_time, description
+
+    async def ingest(self, user_id: int, text: str) -> Optional[IngestResult]:
+        """
+        Сохранение текста пользователя
+
+        Запись и напоминание (если в тексте найдено время) пишутся одним обращением
+        к базе данных: либо сохраняется и то и другое, либо ничего. None - ошибка записи.
+        """
+        category, emoji, reminder_time, description = await self._prepare(user_id, text)
+
+        entry_id = await self.database.add_entry_with_reminder(user_id, text, category, reminder_time)
+        if not entry_id:
+            logger.error(f"Ошибка сохранения записи пользователя {user_id}")
+            return None
+
+        await self.categorizer.learn(user_id, text, category)
+        if self.similarity is not None:
+            await self.similarity.add(user_id, entry_id, text)
+
+        logger.debug(f"Запись {entry_id} пользователя {user_id}: категория '{category}', напоминание: {reminder_time}")
+        return IngestResult(entry_id, category, emoji, description)
+
+    async def ingest_many(self, user_id: int, texts: List[str]) -> Optional[List[IngestResult]]:
+        """
+        Сохранение нескольких текстов (пункты списка, альбом, серия пересылок) одной пачкой
+
+        Все записи и напоминания пишутся одним обращением к базе данных: либо сохраняется
+        вся пачка, либо ничего. Результаты - в порядке texts; None - ошибка записи.
+        """
+        prepared = [await self._prepare(user_id, text) for text in texts]
+        entry_ids = await self.database.add_entries_with_reminders(
+            user_id, [(text, category, reminder_time) for text, (category, _, reminder_time, _) in zip(texts, prepared)]
+        )
+        if not entry_ids or len(entry_ids) != len(texts):
+            logger.error(f"Ошибка сохранения {len(texts)} записей пользователя {user_id}")
+            return None
+
+        for text, (category, _, _, _) in zip(texts, prepared):
+            await self.categorizer.learn(user_id, text, category)
+        if self.similarity is not None:
+            await self.similarity.add_many(user_id, list(zip(entry_ids, texts)))
+
+        logger.debug(f"Пачка из {len(entry_ids)} записей пользователя {user_id} сохранена")
+        return [
+            IngestResult(entry_id, category, emoji, description)
+            for entry_id, (category, emoji, _, description) in zip(entry_ids, prepared)
+        ]
@@ -0,0 +1,66 @@
+"""
+Модуль для настройки логирования: запись в файл и консоль в фоновом потоке
+"""
+
+import logging
+import random
+import sys
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+
+# Попало ли текущее обновление в выборку DEBUG-логов (вне обработки обновлений - всегда да)
+_debug_sampled: ContextVar[bool] = ContextVar("debug_sampled", default=True)
+
+
+def sample_debug(rate: float) -> bool:
+    """Решение для текущего обновления: писать ли его DEBUG-записи (с вероятностью rate)"""
+    sampled = rate >= 1.0 or random.random() < rate
+    _debug_sampled.set(sampled)
+    return sampled
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Пропускает DEBUG-записи только для обновлений, попавших в выборку; INFO и выше - всегда"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or _debug_sampled.get()
+
+
+def setup_logging(level: str, log_format: str, log_file: str, max_bytes: int, backup_count: int,
+                  console: bool = True) -> QueueListener:
+    """
+    Настройка логирования через очередь
+
+    В цикле событий запись лишь кладется в очередь (QueueHandler), а форматирование
+    вывода, запись в файл с ротацией по размеру и в консоль выполняет QueueListener
+    в отдельном потоке. Возвращает запущенный listener; при остановке вызовите listener.stop(),
+    чтобы дописать оставшиеся записи.
+    """
+    formatter = logging.Formatter(log_format)
+
+    file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    file_handler.setFormatter(formatter)
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    queue = SimpleQueue()
+    queue_handler = QueueHandler(queue)
+    queue_handler.addFilter(DebugSamplingFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level.upper()))
+    # aiogram пишет свою строку INFO на каждое обновление; ее заменяет итоговая строка DependencyMiddleware.
+    # aiosqlite пишет DEBUG на каждый запрос из своего потока, где выборка обновлений не действует.
+    logging.getLogger("aiogram.event").setLevel(max(root.level, logging.WARNING))
+    logging.getLogger("aiosqlite").setLevel(max(root.level, logging.INFO))
+
+    listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,389 @@
+"""
+Модуль для сбора метрик бота (счетчики, значения, гистограммы) в формате Prometheus
+"""
+
+import bisect
+import functools
+import inspect
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels_text(self, key: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        # Метрика без меток видна в выводе сразу, со значением 0
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{self._labels_text(key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Текущее значение (может расти и уменьшаться)"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        # Метрика без меток видна в выводе сразу, со значением 0
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0.0}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{self._labels_text(key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (накопительно, как в Prometheus)"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # метки -> [счетчики по корзинам (не накопительные), сумма, количество]
+        self._values: Dict[LabelValues, list] = {}
+        if not self.labelnames:
+            self._values[()] = [[0] * len(self.buckets), 0.0, 0]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер длительности блока кода"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def _samples(self):
+        for key, (bucket_counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{self._labels_text(key, ('le', _format_value(bound)))} {cumulative}"
+            yield f"{self.name}_sum{self._labels_text(key)} {_format_value(total)}"
+            yield f"{self.name}_count{self._labels_text(key)} {count}"
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована с другим типом или метками")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (exposition format 0.0.4)"""
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+# Общий реестр процесса
+REGISTRY = MetricsRegistry()
+
+UPDATES_TOTAL = REGISTRY.counter("mindflow_updates_total", "Обработанные обновления Telegram", ["type", "status"])
+UPDATE_DURATION = REGISTRY.histogram("mindflow_update_duration_seconds", "Время обработки обновления", ["type"])
+UPDATES_IN_PROGRESS = REGISTRY.gauge("mindflow_updates_in_progress", "Обновления в обработке")
+
+FUNCTION_DURATION = REGISTRY.histogram("mindflow_function_duration_seconds", "Время выполнения функций", ["function"])
+
+DB_CALLS_TOTAL = REGISTRY.counter("mindflow_db_calls_total", "Вызовы методов бэкенда базы данных", ["backend", "method", "status"])
+DB_CALL_DURATION = REGISTRY.histogram("mindflow_db_call_duration_seconds", "Время вызова метода бэкенда базы данных", ["backend", "method"])
+
+TELEGRAM_REQUESTS_TOTAL = REGISTRY.counter("mindflow_telegram_requests_total", "Запросы к Telegram Bot API", ["method", "status"])
+TELEGRAM_REQUEST_DURATION = REGISTRY.histogram("mindflow_telegram_request_duration_seconds", "Время запроса к Telegram Bot API", ["method"])
+
+
+def timed(function_name: str):
+    """Декоратор: время выполнения функции (обычной или async) в mindflow_function_duration_seconds"""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with FUNCTION_DURATION.time(function=function_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with FUNCTION_DURATION.time(function=function_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+# Методы бэкенда, которые ничего не возвращают (None для них - не ошибка)
+_NO_RESULT_METHODS = {"connect", "disconnect", "run_maintenance"}
+# Методы чтения, для которых None/False - обычный ответ ("нет записи", "не подписан")
+_OPTIONAL_RESULT_METHODS = {"get_fsm_record", "get_digest_checkpoint", "is_digest_subscribed"}
+
+
+class InstrumentedDatabase:
+    """
+    Обертка бэкенда базы данных: время и результат каждого async-метода
+
+    Методы, вернувшие None или False (так бэкенды сообщают об ошибке записи), считаются
+    со статусом error, как и выброшенные исключения. У потоковых методов (iter_*) замеряется
+    весь обход - от первого запроса до последней строки или закрытия генератора.
+    """
+
+    def __init__(self, database):
+        self._database = database
+        self._backend = type(database).__name__
+        self._wrapped: Dict[str, object] = {}
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._database, name)
+        if name.startswith("_"):
+            return attribute
+        if inspect.isasyncgenfunction(attribute):
+            wrap = self._wrap_stream
+        elif inspect.iscoroutinefunction(attribute):
+            wrap = self._wrap
+        else:
+            return attribute
+
+        wrapper = self._wrapped.get(name)
+        if wrapper is None:
+            wrapper = self._wrapped[name] = wrap(name)
+        return wrapper
+
+    def _wrap(self, name: str):
+        backend = self._backend
+
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                result = await getattr(self._database, name)(*args, **kwargs)
+                failed = result is False or (result is None and name not in _NO_RESULT_METHODS)
+                if failed and name not in _OPTIONAL_RESULT_METHODS:
+                    status = "error"
+                return result
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                DB_CALL_DURATION.observe(time.perf_counter() - started, backend=backend, method=name)
+                DB_CALLS_TOTAL.inc(backend=backend, method=name, status=status)
+
+        wrapper.__name__ = name
+        return wrapper
+
+    def _wrap_stream(self, name: str):
+        backend = self._backend
+
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                async for row in getattr(self._database, name)(*args, **kwargs):
+                    yield row
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                DB_CALL_DURATION.observe(time.perf_counter() - started, backend=backend, method=name)
+                DB_CALLS_TOTAL.inc(backend=backend, method=name, status=status)
+
+        wrapper.__name__ = name
+        return wrapper
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: количество, длительность и число обновлений в обработке"""
+
+    async def __call__(self, handler, event, data):
+        update_type = event.event_type
+        UPDATES_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            UPDATES_IN_PROGRESS.dec()
+            UPDATE_DURATION.observe(time.perf_counter() - started, type=update_type)
+            UPDATES_TOTAL.inc(type=update_type, status=status)
+
+
+class TelegramRequestMetrics(BaseRequestMiddleware):
+    """Middleware сессии бота: время и результат каждого запроса к Bot API (sendMessage и др.)"""
+
+    async def __call__(self, make_request, bot, method):
+        api_method = type(method).__api_method__
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            TELEGRAM_REQUEST_DURATION.observe(time.perf_counter() - started, method=api_method)
+            TELEGRAM_REQUESTS_TOTAL.inc(method=api_method, status=status)
+
+
+class MetricsServer:
+    """Локальный HTTP-сервер: GET /metrics отдает метрики в текстовом формате Prometheus"""
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9108):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+        self._text_routes: Dict[str, Callable[[], str]] = {}
+
+    def add_text_route(self, path: str, render: Callable[[], str]):
+        """Дополнительная текстовая страница (например, /queries - самые дорогие запросы к базе)"""
+        self._text_routes[path] = render
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    @staticmethod
+    def _text_handler(render: Callable[[], str]):
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+        return handle
+
+    async def start(self):
+        """Запуск HTTP-сервера метрик"""
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        for path, render in self._text_routes.items():
+            app.router.add_get(path, self._text_handler(render))
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        """Остановка HTTP-сервера метрик"""
+        if self._runner:
+            await self._runner.cleanup()
+            logger.info("Сервер метрик остановлен")
@@ -6,6 +6,7 @@ import re
 import logging
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
+from utils.metrics import timed
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +40,7 @@ class ReminderParser:
     def __init__(self):
         self.patterns = TIME_PATTERNS
 
+    @timed("parse_time_from_text")
     def parse_time_from_text(self, text: str) -> Optional[Tuple[str, str]]:
         """
         Извлекает время из текста
@@ -50,26 +52,21 @@ class ReminderParser:
             Tuple[str, str]: (время_напоминания, описание) или None
         """
         text_lower = text.lower()
-        logger.info(f"parse_time_from_text: анализирую текст '{text_lower}'")
         
-        for i, (pattern, pattern_type) in enumerate(self.patterns):
-            logger.info(f"Проверяю паттерн {i+1}: {pattern_type} = '{pattern}'")
+        for pattern, pattern_type in self.patterns:
             match = re.search(pattern, text_lower)
             if match:
-                logger.info(f"✅ Найден паттерн: {pattern_type}, match: {match.groups()}")
                 try:
                     reminder_time = self._calculate_time(match, pattern_type)
                     if reminder_time:
                         description = self._create_description(match, pattern_type)
-                        logger.info(f"Успешно извлечено время: {reminder_time}, описание: {description}")
+                        logger.debug(f"Найден паттерн {pattern_type}: время {reminder_time}, описание: {description}")
                         return reminder_time, description
                 except Exception as e:
                     logger.error(f"Ошибка парсинга времени: {e}")
                     continue
-            else:
-                logger.info(f"❌ Паттерн {pattern_type} не найден")
         
-        logger.info(f"Время не найдено в тексте '{text_lower}'")
+        logger.debug("Время в тексте не найдено")
         return None
 
     def _calculate_time(self, match, pattern_type: str) -> Optional[str]:
@@ -248,13 +245,13 @@ class ReminderParser:
         # Проверяем наличие временных указаний в любом тексте
         has_time = self.parse_time_from_text(text) is not None
         
-        logger.info(f"should_create_reminder: text='{text}', category='{category}'")
-        logger.info(f"parse_time_from_text результат: {has_time}")
+        logger.debug(f"should_create_reminder: text='{text}', category='{category}'")
+        logger.debug(f"parse_time_from_text результат: {has_time}")
         
         # Создаем напоминания для всех категорий, если есть временные указания
         if has_time:
-            logger.info(f"Создание напоминания для категории '{category}' с временным указанием")
+            logger.debug(f"Создание напоминания для категории '{category}' с временным указанием")
             return True
             
-        logger.info(f"Напоминание НЕ создается для категории '{category}' - нет временного указания")
+        logger.debug(f"Напоминание НЕ создается для категории '{category}' - нет временного указания")
         return False 
\ No newline at end of file
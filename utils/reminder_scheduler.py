@@ -4,15 +4,34 @@
 
 import asyncio
 import logging
+import time
 from datetime import datetime
 from aiogram import Bot
-from db.database import Database
+from db.base import TIMESTAMP_FORMAT, JournalDatabase
+from utils.metrics import REGISTRY
+from utils.rendering import escape
+from utils.sender import BULK, send_priority
 
 logger = logging.getLogger(__name__)
 
+REMINDERS_SENT = REGISTRY.counter("mindflow_reminders_sent_total", "Отправленные напоминания")
+REMINDERS_FAILED = REGISTRY.counter("mindflow_reminders_failed_total", "Ошибки отправки напоминаний")
+REMINDERS_BACKLOG = REGISTRY.gauge("mindflow_reminders_pending", "Напоминания, время которых наступило, но которые еще не отправлены")
+REMINDER_DELIVERY_LAG = REGISTRY.histogram(
+    "mindflow_reminder_delivery_lag_seconds",
+    "Задержка доставки напоминания: время отправки минус назначенное время",
+    buckets=(1, 5, 15, 30, 60, 90, 120, 300, 600, 1800, 3600),
+)
+SCHEDULER_CHECK_DURATION = REGISTRY.histogram(
+    "mindflow_reminder_check_duration_seconds", "Длительность одного прохода планировщика напоминаний"
+)
+
+# Сколько наступивших напоминаний выбирать за один запрос
+CLAIM_BATCH_SIZE = 500
+
 
 class ReminderScheduler:
-    def __init__(self, bot: Bot, database: Database):
+    def __init__(self, bot: Bot, database: JournalDatabase):
         self.bot = bot
         self.database = database
         self.is_running = False
@@ -37,25 +56,52 @@ class ReminderScheduler:
 
     async def _check_and_send_reminders(self):
         """Проверка и отправка напоминаний"""
+        started = time.perf_counter()
         try:
-            # Получаем все ожидающие напоминания
-            pending_reminders = await self.database.get_pending_reminders()
-            
-            for reminder_id, user_id, text, reminder_time in pending_reminders:
-                try:
-                    # Отправляем напоминание
-                    message = f"⏰ <b>Напоминание!</b>\n\n{text}"
-                    await self.bot.send_message(user_id, message, parse_mode="HTML")
-                    
-                    # Отмечаем как отправленное
-                    await self.database.mark_reminder_sent(reminder_id)
-                    
-                    logger.info(f"Напоминание {reminder_id} отправлено пользователю {user_id}")
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка отправки напоминания {reminder_id}: {e}")
-                    # Если не удалось отправить, оставляем для повторной попытки
-                    continue
+            await self._update_backlog()
+            while True:
+                # Наступившие напоминания выбираются и сразу отмечаются одним запросом:
+                # отдельная отметка после каждой отправки не нужна, а второй экземпляр их не получит
+                claimed = await self.database.claim_due_reminders(CLAIM_BATCH_SIZE)
+                
+                # Все напоминания ставятся в очередь исходящих сообщений сразу, темп задает очередь;
+                # приоритет BULK пропускает вперед ответы пользователям
+                with send_priority(BULK):
+                    delivered = await asyncio.gather(*(self._send_reminder(*reminder) for reminder in claimed))
+                # Неотправленные возвращены в ожидающие - их повторим на следующей проверке, а не сразу
+                if len(claimed) < CLAIM_BATCH_SIZE or not all(delivered):
+                    break
+            # Остаток: не поместившиеся в проход и возвращенные после ошибки отправки
+            await self._update_backlog()
                     
         except Exception as e:
-            logger.error(f"Ошибка проверки напоминаний: {e}") 
\ No newline at end of file
+            logger.error(f"Ошибка проверки напоминаний: {e}")
+        finally:
+            SCHEDULER_CHECK_DURATION.observe(time.perf_counter() - started)
+
+    async def _update_backlog(self):
+        """Наступившие, но не отправленные напоминания - по счетчику в базе, а не по размеру выборки"""
+        due = await self.database.count_due_reminders()
+        if due is not None:
+            REMINDERS_BACKLOG.set(due)
+
+    async def _send_reminder(self, reminder_id: int, user_id: int, text: str, reminder_time: str) -> bool:
+        """Отправка одного напоминания (уже отмеченного как отправленное)"""
+        try:
+            # Отправляем напоминание
+            message = f"⏰ <b>Напоминание!</b>\n\n{escape(text)}"
+            await self.bot.send_message(user_id, message, parse_mode="HTML")
+            
+            lag = (datetime.now() - datetime.strptime(reminder_time, TIMESTAMP_FORMAT)).total_seconds()
+            REMINDER_DELIVERY_LAG.observe(max(0.0, lag))
+            REMINDERS_SENT.inc()
+            REMINDERS_BACKLOG.dec()
+            logger.info(f"Напоминание {reminder_id} отправлено пользователю {user_id}")
+            return True
+            
+        except Exception as e:
+            REMINDERS_FAILED.inc()
+            # Если не удалось отправить, возвращаем в ожидающие для повторной попытки
+            logger.error(f"Ошибка отправки напоминания {reminder_id}: {e}")
+            await self.database.release_reminder(reminder_id)
+            return False 
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""
+Модуль для оформления ответов бота: экранирование HTML и разбиение на сообщения по границам записей
+"""
+
+import html
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.categorizer import CATEGORY_EMOJIS
+
+# Максимальная длина сообщения Telegram (в UTF-16 единицах)
+MESSAGE_LIMIT = 4096
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def escape(text: str) -> str:
+    """Экранирование пользовательского текста для parse_mode=HTML"""
+    return html.escape(text, quote=False)
+
+
+def shorten(text: str, limit: int) -> str:
+    """Обрезка текста до limit символов (до экранирования, чтобы не разрезать &amp; и т.п.)"""
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+def message_length(text: str) -> int:
+    """Длина так, как ее считает Telegram: символы вне BMP (многие эмодзи) занимают две единицы"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _split_oversized(block: str, limit: int) -> List[str]:
+    """Блок длиннее лимита: делим по строкам, а слишком длинную строку - как простой текст без тегов"""
+    parts = []
+    for line in block.splitlines(keepends=True):
+        if message_length(line) <= limit:
+            parts.append(line)
+            continue
+        plain = html.unescape(_TAG_RE.sub("", line))
+        step = limit // 6  # С запасом на экранирование (&amp; - 5 символов вместо одного) и эмодзи
+        parts.extend(escape(plain[i:i + step]) for i in range(0, len(plain), step))
+    return parts
+
+
+def pack_blocks(blocks: Iterable[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """
+    Упаковка блоков в минимальное число сообщений
+
+    Блок (запись, заголовок) - законченный фрагмент HTML с закрытыми тегами; блоки
+    не разрезаются, поэтому каждое сообщение остается корректным HTML. Блоки идут
+    по порядку, и жадное заполнение дает наименьшее возможное число сообщений.
+    """
+    messages: List[str] = []
+    current: List[str] = []
+    current_length = 0
+    for block in blocks:
+        length = message_length(block)
+        if length > limit:
+            pieces = _split_oversized(block, limit)
+        else:
+            pieces = [block]
+        for piece in pieces:
+            piece_length = length if len(pieces) == 1 else message_length(piece)
+            if current and current_length + piece_length > limit:
+                messages.append("".join(current).strip())
+                current, current_length = [], 0
+            current.append(piece)
+            current_length += piece_length
+    if current:
+        messages.append("".join(current).strip())
+    return [message for message in messages if message]
+
+
+def _time_of(datetime_str: str) -> str:
+    return datetime_str.split()[1][:5] if ' ' in datetime_str else datetime_str
+
+
+def render_entries_by_category(title: str, entries: Sequence[Tuple[str, str, str]], text_limit: int = 100,
+                               counts: Optional[Dict[str, int]] = None) -> List[str]:
+    """
+    Записи (text, category, datetime), сгруппированные по категориям - для /today и /archive
+
+    Заголовок категории идет в одном блоке с ее первой записью, чтобы не оказаться
+    в конце сообщения отдельно от записей. counts - полное число записей по категориям,
+    если entries - только последние из них (остальные упоминаются в конце).
+    """
+    categories: Dict[str, List[Tuple[str, str]]] = {}
+    for text, category, datetime_str in entries:
+        categories.setdefault(category, []).append((text, datetime_str))
+
+    blocks = [f"{title}\n\n"]
+    for category, category_entries in categories.items():
+        emoji = CATEGORY_EMOJIS.get(category, "📝")
+        count = counts.get(category, len(category_entries)) if counts else len(category_entries)
+        lines = [
+            f"• {escape(shorten(text, text_limit))} <i>({_time_of(datetime_str)})</i>\n"
+            for text, datetime_str in category_entries
+        ]
+        lines[0] = f"{emoji} <b>{escape(category)}</b> ({count}):\n" + lines[0]
+        lines[-1] += "\n"
+        blocks.extend(lines)
+    hidden = sum(counts.values()) - len(entries) if counts else 0
+    if hidden > 0:
+        blocks.append(f"... и ещё {hidden} записей (полностью - /export)")
+    return pack_blocks(blocks)
+
+
+def render_search_results(search_term: str, entries: Sequence[Tuple[str, str, str]], max_results: int = 20,
+                          text_limit: int = 150) -> List[str]:
+    """Результаты поиска (text, category, datetime): не больше max_results записей"""
+    blocks = [f"🔍 <b>Результаты поиска по '{escape(search_term)}':</b>\n\n"]
+    for i, (text, category, datetime_str) in enumerate(entries[:max_results], 1):
+        emoji = CATEGORY_EMOJIS.get(category, "📝")
+        date_str = datetime_str.split()[0] if ' ' in datetime_str else datetime_str
+        time_str = datetime_str.split()[1][:5] if ' ' in datetime_str else ""
+        blocks.append(
+            f"{i}. {emoji} <b>{escape(category)}</b>\n"
+            f"   {escape(shorten(text, text_limit))}\n"
+            f"   <i>{date_str} {time_str}</i>\n\n"
+        )
+    if len(entries) > max_results:
+        blocks.append(f"... и ещё {len(entries) - max_results} записей")
+    return pack_blocks(blocks)
+
+
+def render_similar_results(query: str, entries: Sequence[Tuple[str, str, str, float]], text_limit: int = 150) -> List[str]:
+    """Похожие записи (text, category, datetime, сходство) по убыванию сходства"""
+    blocks = [f"🔗 <b>Похожие записи на '{escape(shorten(query, 50))}':</b>\n\n"]
+    for i, (text, category, datetime_str, score) in enumerate(entries, 1):
+        emoji = CATEGORY_EMOJIS.get(category, "📝")
+        blocks.append(
+            f"{i}. {emoji} <b>{escape(category)}</b> <i>({round(score * 100)}%)</i>\n"
+            f"   {escape(shorten(text, text_limit))}\n"
+            f"   <i>{datetime_str[:16]}</i>\n\n"
+        )
+    return pack_blocks(blocks)
+
+
+def render_ingest_summary(entries: Sequence[Tuple[str, str, str, Optional[str]]], text_limit: int = 60) -> List[str]:
+    """Один ответ на пачку сохраненных записей (text, category, emoji, описание напоминания)"""
+    blocks = [f"✅ <b>Записано: {len(entries)}</b>\n\n"]
+    for text, category, emoji, reminder_description in entries:
+        line = f"{emoji} {escape(category)}: {escape(shorten(text, text_limit))}\n"
+        if reminder_description:
+            line += f"   ⏰ <i>{escape(reminder_description)}</i>\n"
+        blocks.append(line)
+    return pack_blocks(blocks)
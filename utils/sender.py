@@ -0,0 +1,281 @@
+"""
+Модуль для исходящих сообщений бота: общая очередь с ограничением частоты и приоритетами
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты: меньше - раньше
+INTERACTIVE = 0  # Ответы пользователю на его сообщение
+BULK = 1  # Массовые рассылки (напоминания)
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Методы Bot API, которые проходят через очередь (остальные - getUpdates, setWebhook и т.п. - напрямую)
+QUEUED_METHODS = ("copyMessage", "forwardMessage")
+
+OUTBOUND_QUEUE_DEPTH = REGISTRY.gauge(
+    "mindflow_outbound_queue_depth", "Исходящие сообщения, ожидающие отправки", ["priority"]
+)
+OUTBOUND_QUEUE_WAIT = REGISTRY.histogram(
+    "mindflow_outbound_queue_wait_seconds", "Время от постановки сообщения в очередь до отправки", ["priority"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+OUTBOUND_MESSAGES = REGISTRY.counter(
+    "mindflow_outbound_messages_total", "Исходящие сообщения по результату", ["priority", "status"]
+)
+OUTBOUND_RETRIES = REGISTRY.counter(
+    "mindflow_outbound_retries_total", "Повторные попытки отправки", ["reason"]
+)
+
+_PRIORITY: ContextVar[int] = ContextVar("outbound_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def send_priority(priority: int):
+    """Приоритет сообщений, отправленных внутри блока (в том числе из задач, созданных в нем)"""
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+    def reserve(self, rate: float, burst: float, now: float) -> float:
+        """Списание токена; возвращает, сколько секунд ждать до его появления (0 - сразу)"""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / rate
+
+
+class _Job:
+    __slots__ = ("priority", "chat_id", "make_request", "bot", "method", "future", "enqueued", "ready_at", "attempts")
+
+    def __init__(self, priority: int, chat_id, make_request, bot, method, future: asyncio.Future):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.future = future
+        self.enqueued = time.monotonic()
+        # Время, на которое для чата зарезервирован слот (None - еще не резервировался)
+        self.ready_at: Optional[float] = None
+        self.attempts = 0
+
+
+class OutboundSender(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: все отправки сообщений (send*, copyMessage, forwardMessage) идут через одну очередь
+
+    Ограничения Telegram соблюдаются на стороне бота:
+    - не больше global_rate сообщений в секунду на весь бот;
+    - не больше chat_rate сообщений в секунду в один чат (chat_burst подряд без ожидания);
+    - ответ 429 (retry_after) приостанавливает все отправки на указанное время, после чего
+      сообщение отправляется повторно; сетевые ошибки и 5xx повторяются с нарастающей паузой.
+    Сообщения с приоритетом INTERACTIVE обгоняют BULK (см. send_priority). Ожидание
+    слота для одного чата не задерживает сообщения в другие чаты. Лимит 0 отключает ограничение.
+
+    До start() и после stop() запросы выполняются напрямую.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: int = 5,
+                 workers: int = 8, max_retries: int = 3, max_chats: int = 10000):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._global_bucket = _Bucket(global_rate, time.monotonic())
+        self._chat_buckets: "OrderedDict[object, _Bucket]" = OrderedDict()
+        # До этого момента (retry_after) отправки приостановлены
+        self._paused_until = 0.0
+        # Отложенные задания: (время готовности, номер, задание)
+        self._delayed: List[tuple] = []
+        self._delayed_wakeup: Optional[asyncio.TimerHandle] = None
+        self._unfinished = 0
+        self._idle = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Очередь исходящих сообщений запущена: {self.workers} обработчиков, "
+                    f"{self.global_rate or 'без лимита'} сообщ./с на бот, {self.chat_rate or 'без лимита'} сообщ./с на чат")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Остановка: дожидаемся отправки поставленных сообщений (не дольше drain_timeout), затем отменяем обработчики"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не все исходящие сообщения отправлены за {drain_timeout} с: осталось {self._unfinished}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._delayed_wakeup:
+            self._delayed_wakeup.cancel()
+        for _, _, job in self._delayed:
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Очередь исходящих сообщений остановлена"))
+        self._delayed.clear()
+        while not self._queue.empty():
+            job = self._queue.get_nowait()[2]
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Очередь исходящих сообщений остановлена"))
+
+    async def __call__(self, make_request, bot, method):
+        api_method = type(method).__api_method__
+        if not self._tasks or not (api_method.startswith("send") or api_method in QUEUED_METHODS):
+            return await make_request(bot, method)
+
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(_PRIORITY.get(), getattr(method, "chat_id", None), make_request, bot, method, future)
+        self._unfinished += 1
+        self._idle.clear()
+        self._put(job)
+        return await future
+
+    # --- очередь ---
+
+    def _put(self, job: _Job):
+        self._queue.put_nowait((job.priority, next(self._sequence), job))
+        OUTBOUND_QUEUE_DEPTH.inc(priority=PRIORITY_NAMES[job.priority])
+
+    def _put_later(self, job: _Job, ready_at: float):
+        """Вернуть задание в очередь в момент ready_at, не занимая обработчик ожиданием"""
+        heapq.heappush(self._delayed, (ready_at, next(self._sequence), job))
+        OUTBOUND_QUEUE_DEPTH.inc(priority=PRIORITY_NAMES[job.priority])
+        self._schedule_wakeup()
+
+    def _schedule_wakeup(self):
+        if self._delayed_wakeup:
+            self._delayed_wakeup.cancel()
+            self._delayed_wakeup = None
+        if self._delayed:
+            delay = max(0.0, self._delayed[0][0] - time.monotonic())
+            self._delayed_wakeup = asyncio.get_running_loop().call_later(delay, self._release_delayed)
+
+    def _release_delayed(self):
+        self._delayed_wakeup = None
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            job = heapq.heappop(self._delayed)[2]
+            OUTBOUND_QUEUE_DEPTH.dec(priority=PRIORITY_NAMES[job.priority])
+            self._put(job)
+        self._schedule_wakeup()
+
+    def _finish(self, job: _Job, status: str):
+        OUTBOUND_MESSAGES.inc(priority=PRIORITY_NAMES[job.priority], status=status)
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._idle.set()
+
+    def _chat_wait(self, chat_id, now: float) -> float:
+        if not self.chat_rate or chat_id is None:
+            return 0.0
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = _Bucket(self.chat_burst, now)
+            if len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket.reserve(self.chat_rate, self.chat_burst, now)
+
+    async def _worker(self):
+        while True:
+            _, _, job = await self._queue.get()
+            OUTBOUND_QUEUE_DEPTH.dec(priority=PRIORITY_NAMES[job.priority])
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError("Очередь исходящих сообщений остановлена"))
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка в очереди исходящих сообщений: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+                    self._finish(job, "error")
+
+    async def _process(self, job: _Job):
+        if job.future.done():
+            # Отправитель больше не ждет ответа (отменен)
+            self._finish(job, "cancelled")
+            return
+
+        now = time.monotonic()
+        if job.ready_at is None:
+            wait = self._chat_wait(job.chat_id, now)
+            job.ready_at = now + wait
+            if wait > 0:
+                self._put_later(job, job.ready_at)
+                return
+
+        # Общий лимит бота и пауза после 429: ждут все обработчики одинаково
+        wait = max(self._paused_until - now, 0.0)
+        if self.global_rate:
+            wait = max(wait, self._global_bucket.reserve(self.global_rate, self.global_rate, now))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        if job.attempts == 0:
+            OUTBOUND_QUEUE_WAIT.observe(time.monotonic() - job.enqueued, priority=PRIORITY_NAMES[job.priority])
+        job.attempts += 1
+        try:
+            result = await job.make_request(job.bot, job.method)
+        except TelegramRetryAfter as e:
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            self._retry(job, e, "retry_after", e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            self._retry(job, e, "network", min(2 ** (job.attempts - 1), 30))
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            self._finish(job, "error")
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+            self._finish(job, "ok")
+
+    def _retry(self, job: _Job, error: Exception, reason: str, delay: float):
+        if job.attempts > self.max_retries or job.future.done():
+            if not job.future.done():
+                job.future.set_exception(error)
+            self._finish(job, "error")
+            return
+        OUTBOUND_RETRIES.inc(reason=reason)
+        logger.warning(f"Повтор отправки в чат {job.chat_id} через {delay} с: {reason}")
+        self._put_later(job, time.monotonic() + delay)
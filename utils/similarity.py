@@ -0,0 +1,298 @@
+"""
+Модуль для поиска похожих записей (/similar): TF-IDF индекс записей каждого пользователя на диске
+"""
+
+import asyncio
+import logging
+import os
+import re
+import shutil
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SIMILAR_QUERY_DURATION = REGISTRY.histogram(
+    "mindflow_similar_query_seconds", "Время поиска похожих записей по индексу",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+)
+SIMILAR_INDEX_BUILDS = REGISTRY.counter("mindflow_similar_index_builds_total", "Построения индекса пользователя по записям из базы")
+
+_WORD_RE = re.compile(r"[^\W\d_]{3,}")
+
+# Слова сравниваются по первым буквам: "проект", "проекта" и "проектом" дают один термин
+STEM_LENGTH = 6
+
+# Файлы индекса пользователя: все дописываются в конец, ids.i64 пишется последним и
+# подтверждает строку (после сбоя недописанный хвост отбрасывается при открытии)
+_VOCAB_FILE = "vocab.txt"
+_ARRAY_FILES = {
+    "terms": ("terms.i32", np.int32),     # номера терминов всех записей подряд
+    "counts": ("counts.u16", np.uint16),  # сколько раз термин встретился в записи
+    "lengths": ("lengths.i32", np.int32), # число разных терминов в записи
+    "ids": ("ids.i64", np.int64),         # id записей
+}
+_WRITE_ORDER = ("terms", "counts", "lengths", "ids")
+
+
+def tokenize(text: str) -> List[str]:
+    """Термины текста: слова от трех букв в нижнем регистре, ё -> е, обрезанные до STEM_LENGTH"""
+    return [word[:STEM_LENGTH] for word in _WORD_RE.findall(text.lower().replace("ё", "е"))]
+
+
+def _map(path: str, dtype, length: int) -> np.ndarray:
+    """Массив из файла только для чтения; пустой файл memmap не открывает"""
+    if length == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(length,))
+
+
+class _Shard:
+    """
+    Индекс одного пользователя: разреженная матрица записей x терминов в формате CSR
+
+    Массивы лежат в файлах и отображаются в память (np.memmap), в памяти процесса -
+    только словарь терминов и веса, посчитанные для последнего поиска.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.vocab: Dict[str, int] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+        # Веса TF-IDF и нормы строк; пересчитываются после добавления записей (меняется IDF)
+        self._weights: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None
+        self._load()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        """Чтение словаря и отображение массивов; недописанный после сбоя хвост обрезается"""
+        self._load_vocab()
+        self._map_arrays()
+        terms = self.arrays["terms"]
+        if len(terms) and int(terms.max()) >= len(self.vocab):
+            raise ValueError(f"индекс {self.path} поврежден: термин вне словаря")
+
+    def _load_vocab(self):
+        """Словарь терминов: номер термина - номер строки в vocab.txt"""
+        vocab_path = self._file(_VOCAB_FILE)
+        with open(vocab_path, "rb") as f:
+            data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            os.truncate(vocab_path, complete)
+        terms = data[:complete].decode("utf-8").splitlines()
+        self.vocab = {term: number for number, term in enumerate(terms)}
+
+    def _map_arrays(self):
+        """Отображение массивов в память с обрезкой до последней подтвержденной строки"""
+        sizes = {
+            key: os.path.getsize(self._file(filename)) // np.dtype(dtype).itemsize
+            for key, (filename, dtype) in _ARRAY_FILES.items()
+        }
+        rows = min(sizes["lengths"], sizes["ids"])
+        lengths = _map(self._file(_ARRAY_FILES["lengths"][0]), np.int32, rows)
+        values = int(lengths.sum())
+        if min(sizes["terms"], sizes["counts"]) < values:
+            raise ValueError(f"индекс {self.path} поврежден: не хватает терминов")
+
+        expected = {"terms": values, "counts": values, "lengths": rows, "ids": rows}
+        for key, (filename, dtype) in _ARRAY_FILES.items():
+            if sizes[key] != expected[key]:
+                os.truncate(self._file(filename), expected[key] * np.dtype(dtype).itemsize)
+            self.arrays[key] = _map(self._file(filename), dtype, expected[key])
+        self._weights = None
+
+    @staticmethod
+    def create(path: str):
+        """Пустые файлы индекса"""
+        os.makedirs(path, exist_ok=True)
+        for filename in [_VOCAB_FILE] + [filename for filename, _ in _ARRAY_FILES.values()]:
+            open(os.path.join(path, filename), "wb").close()
+
+    @property
+    def rows(self) -> int:
+        return len(self.arrays["ids"])
+
+    def contains(self, entry_id: int) -> bool:
+        return bool(np.any(self.arrays["ids"] == entry_id))
+
+    def append(self, entries: Iterable[Tuple[int, str]]):
+        """Дописывание записей (id, text) в конец индекса"""
+        new_terms: List[str] = []
+        columns: Dict[str, list] = {key: [] for key in _WRITE_ORDER}
+        for entry_id, text in entries:
+            counter = Counter(tokenize(text))
+            for term in counter:
+                if term not in self.vocab:
+                    self.vocab[term] = len(self.vocab)
+                    new_terms.append(term)
+            columns["terms"].extend(self.vocab[term] for term in counter)
+            columns["counts"].extend(min(count, 65535) for count in counter.values())
+            columns["lengths"].append(len(counter))
+            columns["ids"].append(entry_id)
+        if not columns["ids"]:
+            return
+
+        if new_terms:
+            with open(self._file(_VOCAB_FILE), "ab") as f:
+                f.write("".join(term + "\n" for term in new_terms).encode("utf-8"))
+        for key in _WRITE_ORDER:
+            filename, dtype = _ARRAY_FILES[key]
+            with open(self._file(filename), "ab") as f:
+                f.write(np.asarray(columns[key], dtype=dtype).tobytes())
+        self._map_arrays()
+
+    def _prepare(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Номер строки каждого значения, веса терминов в записях, нормы строк и IDF"""
+        if self._weights is None:
+            terms = self.arrays["terms"]
+            lengths = self.arrays["lengths"]
+            rows = self.rows
+            row_of = np.repeat(np.arange(rows, dtype=np.int32), lengths)
+            # Каждый термин входит в строку один раз, поэтому частота по массиву терминов - это DF
+            df = np.bincount(terms, minlength=len(self.vocab)).astype(np.float32)
+            idf = np.log((1 + rows) / (1 + df)).astype(np.float32) + 1
+            weights = (1 + np.log(self.arrays["counts"].astype(np.float32))) * idf[terms]
+            norms = np.sqrt(np.bincount(row_of, weights=weights * weights, minlength=rows))
+            self._weights = (row_of, weights, norms, idf)
+        return self._weights
+
+    def search(self, text: str, limit: int) -> List[Tuple[int, float]]:
+        """Записи с наибольшим косинусным сходством с текстом: (id, сходство) по убыванию"""
+        counter = Counter(term for term in tokenize(text) if term in self.vocab)
+        if not counter or not self.rows:
+            return []
+        row_of, weights, norms, idf = self._prepare()
+
+        query = np.zeros(len(self.vocab), dtype=np.float32)
+        numbers = np.fromiter((self.vocab[term] for term in counter), dtype=np.int64, count=len(counter))
+        counts = np.fromiter(counter.values(), dtype=np.float32, count=len(counter))
+        query[numbers] = (1 + np.log(counts)) * idf[numbers]
+
+        # Скалярные произведения со всеми строками сразу: значения, не совпавшие с запросом, дают ноль
+        products = query[self.arrays["terms"]] * weights
+        matched = np.flatnonzero(products)
+        dots = np.bincount(row_of[matched], weights=products[matched], minlength=self.rows)
+        scores = np.divide(dots, norms * float(np.linalg.norm(query)), out=np.zeros(self.rows), where=norms > 0)
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        ids = self.arrays["ids"]
+        return [(int(ids[row]), float(scores[row])) for row in candidates]
+
+
+class SimilarityIndex:
+    """
+    Поиск похожих записей пользователя по TF-IDF
+
+    Индекс каждого пользователя - отдельный каталог в index_dir. Он строится из базы
+    при первом /similar и дальше пополняется при каждой сохраненной записи (add), без
+    перестроения. Открытыми держится не больше cache_users индексов; файловые операции
+    и вычисления выполняются в потоке, не блокируя цикл событий.
+
+    Индекс локальный: при нескольких экземплярах бота у каждого свой каталог, и записи,
+    сохраненные другим экземпляром, в него не попадают.
+    """
+
+    def __init__(self, database, index_dir: str, cache_users: int = 100, batch_size: int = 1000):
+        self.database = database
+        self.index_dir = index_dir
+        self.cache_users = cache_users
+        self.batch_size = batch_size
+        self._shards: "OrderedDict[int, _Shard]" = OrderedDict()
+        # Операции с индексом одного пользователя идут по очереди (блокировки - по остатку от id)
+        self._locks = [asyncio.Lock() for _ in range(64)]
+
+    def _path(self, user_id: int) -> str:
+        return os.path.join(self.index_dir, str(user_id))
+
+    def _lock(self, user_id: int) -> asyncio.Lock:
+        return self._locks[user_id % len(self._locks)]
+
+    def _remember(self, user_id: int, shard: _Shard) -> _Shard:
+        self._shards[user_id] = shard
+        self._shards.move_to_end(user_id)
+        while len(self._shards) > self.cache_users:
+            self._shards.popitem(last=False)
+        return shard
+
+    async def _open(self, user_id: int) -> Optional[_Shard]:
+        """Открытый индекс пользователя; None - индекс еще не построен или поврежден"""
+        shard = self._shards.get(user_id)
+        if shard is not None:
+            self._shards.move_to_end(user_id)
+            return shard
+        if not os.path.isdir(self._path(user_id)):
+            return None
+        try:
+            return self._remember(user_id, await asyncio.to_thread(_Shard, self._path(user_id)))
+        except Exception as e:
+            logger.error(f"Индекс похожих записей пользователя {user_id} будет перестроен: {e}")
+            return None
+
+    async def _build(self, user_id: int) -> _Shard:
+        """Построение индекса по всем записям пользователя из базы (во временном каталоге)"""
+        started = time.perf_counter()
+        path = self._path(user_id)
+        building_path = path + ".building"
+        await asyncio.to_thread(shutil.rmtree, building_path, True)
+        await asyncio.to_thread(_Shard.create, building_path)
+        shard = await asyncio.to_thread(_Shard, building_path)
+
+        batch = []
+        async for entry_id, text, _, _ in self.database.iter_entries(user_id, self.batch_size):
+            batch.append((entry_id, text))
+            if len(batch) >= self.batch_size:
+                await asyncio.to_thread(shard.append, batch)
+                batch = []
+        await asyncio.to_thread(shard.append, batch)
+
+        await asyncio.to_thread(shutil.rmtree, path, True)
+        os.replace(building_path, path)
+        shard = self._remember(user_id, await asyncio.to_thread(_Shard, path))
+        SIMILAR_INDEX_BUILDS.inc()
+        logger.info(f"Индекс похожих записей пользователя {user_id} построен: {shard.rows} записей, "
+                    f"{len(shard.vocab)} терминов, {time.perf_counter() - started:.2f} с")
+        return shard
+
+    async def add(self, user_id: int, entry_id: int, text: str) -> bool:
+        """Добавление новой записи в индекс; если индекса еще нет, запись войдет в него при построении"""
+        return await self.add_many(user_id, [(entry_id, text)])
+
+    async def add_many(self, user_id: int, entries: List[Tuple[int, str]]) -> bool:
+        """Добавление нескольких новых записей (id, text) одной дозаписью файлов"""
+        try:
+            async with self._lock(user_id):
+                shard = await self._open(user_id)
+                if shard is None:
+                    return True
+                new_entries = [(entry_id, text) for entry_id, text in entries if not shard.contains(entry_id)]
+                if new_entries:
+                    await asyncio.to_thread(shard.append, new_entries)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка добавления записей в индекс похожих записей: {e}")
+            self._shards.pop(user_id, None)
+            return False
+
+    async def search(self, user_id: int, text: str, limit: int = 5) -> List[Tuple[int, float]]:
+        """Самые похожие на text записи пользователя: (id, сходство от 0 до 1) по убыванию"""
+        try:
+            async with self._lock(user_id):
+                shard = await self._open(user_id) or await self._build(user_id)
+                started = time.perf_counter()
+                results = await asyncio.to_thread(shard.search, text, limit)
+            SIMILAR_QUERY_DURATION.observe(time.perf_counter() - started)
+            return results
+        except Exception as e:
+            logger.error(f"Ошибка поиска похожих записей: {e}")
+            return []
@@ -0,0 +1,38 @@
+"""
+Модуль для замера длительности этапов запуска бота
+"""
+
+import logging
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    def __init__(self, started_at: Optional[float] = None):
+        # Отсчет ведется от started_at (time.perf_counter()), например от начала импорта модулей
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self._last_mark = self.started_at
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str):
+        """Завершение этапа: длительность считается от предыдущей отметки"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last_mark))
+        self._last_mark = now
+
+    @property
+    def total(self) -> float:
+        return self._last_mark - self.started_at
+
+    def report(self) -> str:
+        """Отчет о запуске: общая длительность и длительность каждого этапа"""
+        lines = [f"Запуск занял {self.total:.3f} с:"]
+        for phase, duration in self.phases:
+            share = duration / self.total * 100 if self.total else 0.0
+            lines.append(f"  {phase:<28} {duration:>8.3f} с {share:>5.1f}%")
+        return "\n".join(lines)
+
+    def log_report(self):
+        logger.info(self.report())
@@ -0,0 +1,36 @@
+"""
+Модуль для фонового обслуживания хранилища (секции, архив)
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StorageMaintenance:
+    def __init__(self, database, interval: int = 6 * 3600):
+        self.database = database
+        self.interval = interval
+        self.is_running = False
+
+    async def start(self):
+        """Запуск периодического обслуживания хранилища"""
+        if not hasattr(self.database, "run_maintenance"):
+            logger.info("Бэкенд базы данных не требует обслуживания")
+            return
+
+        self.is_running = True
+        logger.info("Обслуживание хранилища запущено")
+
+        while self.is_running:
+            try:
+                await self.database.run_maintenance()
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания хранилища: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        """Остановка обслуживания хранилища"""
+        self.is_running = False
+        logger.info("Обслуживание хранилища остановлено")
@@ -0,0 +1,168 @@
+"""
+Модуль для ограничения частоты обновлений от одного пользователя (token bucket)
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_MODES = ("queue", "coalesce", "reject")
+
+THROTTLED_UPDATES = REGISTRY.counter(
+    "mindflow_throttled_updates_total", "Обновления, превысившие лимит частоты пользователя", ["action"]
+)
+THROTTLE_DELAY = REGISTRY.histogram(
+    "mindflow_throttle_delay_seconds", "Задержка обновления, отложенного ограничением частоты",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+THROTTLE_TRACKED_USERS = REGISTRY.gauge("mindflow_throttle_tracked_users", "Пользователи в таблице ограничения частоты")
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "buffer", "notified")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        # Тексты, ожидающие объединения (режим coalesce)
+        self.buffer: Optional[List[str]] = None
+        # Пользователь уже получил предупреждение о лимите в текущей серии
+        self.notified = False
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware: не больше burst обновлений подряд и rate обновлений в секунду на пользователя
+
+    Корзины пользователей хранятся в OrderedDict не больше max_users штук; при переполнении
+    вытесняется корзина, к которой дольше всего не обращались. Обновление сверх лимита:
+    - queue - ждет своей очереди (не дольше max_wait секунд, иначе отклоняется);
+    - coalesce - тексты, пришедшие за время ожидания, объединяются в одно сообщение
+      (команды и прочие обновления ждут как в queue);
+    - reject - отклоняется; пользователь один раз за серию получает reject_text.
+
+    Отложенное обновление ждет в отдельной задаче, а middleware сразу возвращает управление:
+    обработчик очереди вебхука не простаивает, пока один пользователь присылает сообщения
+    быстрее лимита. Задачи, не дождавшиеся своей очереди к остановке бота, дорабатываются
+    в shutdown() не дольше max_wait секунд.
+    """
+
+    def __init__(self, rate: float, burst: int, mode: str = "queue", max_users: int = 10000,
+                 max_wait: float = 10.0, reject_text: str = "Слишком много сообщений подряд, подождите немного."):
+        super().__init__()
+        if mode not in THROTTLE_MODES:
+            raise ValueError(f"Неизвестный режим ограничения частоты: {mode}")
+        self.rate = rate
+        self.burst = burst
+        self.mode = mode
+        self.max_users = max_users
+        self.max_wait = max_wait
+        self.reject_text = reject_text
+        self._buckets: "OrderedDict[int, _Bucket]" = OrderedDict()
+        self._deferred: Set[asyncio.Task] = set()
+
+    def _bucket(self, user_id: int, now: float) -> _Bucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = _Bucket(self.burst, now)
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+            THROTTLE_TRACKED_USERS.set(len(self._buckets))
+        else:
+            self._buckets.move_to_end(user_id)
+        return bucket
+
+    def _reserve(self, bucket: _Bucket, now: float) -> float:
+        """Списание токена; возвращает, сколько секунд ждать до его появления (0 - сразу)"""
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+        bucket.tokens -= 1
+        return 0.0 if bucket.tokens >= 0 else -bucket.tokens / self.rate
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        bucket = self._bucket(user.id, time.monotonic())
+        wait = self._reserve(bucket, time.monotonic())
+        if wait == 0.0:
+            bucket.notified = False
+            return await handler(event, data)
+
+        if self.mode == "reject" or wait > self.max_wait:
+            # Токен не использован - возвращаем его
+            bucket.tokens += 1
+            THROTTLED_UPDATES.inc(action="rejected")
+            await self._notify(bucket, event)
+            return None
+
+        if self.mode == "coalesce" and _is_plain_text(event):
+            if bucket.buffer is not None:
+                # Текст войдет в уже ожидающее сообщение и отдельного токена не требует
+                bucket.tokens += 1
+                bucket.buffer.append(event.text)
+                THROTTLED_UPDATES.inc(action="coalesced")
+                return None
+
+            bucket.buffer = [event.text]
+            self._defer(wait, self._flush_buffer, bucket, handler, event, data)
+            return None
+
+        self._defer(wait, handler, event, data)
+        return None
+
+    def _defer(self, wait: float, handler, *args):
+        """Обработка обновления через wait секунд в отдельной задаче, не занимая вызывающего"""
+        THROTTLED_UPDATES.inc(action="queued")
+        THROTTLE_DELAY.observe(wait)
+        task = asyncio.create_task(self._run_deferred(wait, handler, *args))
+        self._deferred.add(task)
+        task.add_done_callback(self._deferred.discard)
+
+    @staticmethod
+    async def _run_deferred(wait: float, handler, *args):
+        await asyncio.sleep(wait)
+        try:
+            await handler(*args)
+        except Exception as e:
+            logger.error(f"Ошибка обработки отложенного обновления: {e}")
+
+    @staticmethod
+    async def _flush_buffer(bucket: _Bucket, handler, event, data):
+        texts, bucket.buffer = bucket.buffer, None
+        if len(texts) > 1:
+            event = event.model_copy(update={"text": "\n".join(texts)})
+        return await handler(event, data)
+
+    async def shutdown(self):
+        """Дождаться отложенных обновлений (не дольше max_wait секунд), оставшиеся отменить"""
+        if not self._deferred:
+            return
+        _, pending = await asyncio.wait(set(self._deferred), timeout=self.max_wait)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Остановка: отменено отложенных ограничением частоты обновлений: {len(pending)}")
+
+    async def _notify(self, bucket: _Bucket, event):
+        if bucket.notified:
+            return
+        bucket.notified = True
+        try:
+            await event.answer(self.reject_text)
+        except Exception as e:
+            logger.error(f"Ошибка отправки предупреждения о лимите сообщений: {e}")
+
+
+def _is_plain_text(event) -> bool:
+    return isinstance(event, Message) and bool(event.text) and not event.text.startswith('/')
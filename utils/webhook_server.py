@@ -0,0 +1,166 @@
+"""
+Модуль для приема обновлений Telegram через вебхук (aiohttp) с ограниченной очередью обработки
+"""
+
+import asyncio
+import hmac
+import logging
+import time
+from contextlib import suppress
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+WEBHOOK_RECEIVED = REGISTRY.counter(
+    "mindflow_webhook_requests_total", "Запросы к вебхуку", ["status"]
+)
+WEBHOOK_QUEUE_DEPTH = REGISTRY.gauge("mindflow_webhook_queue_depth", "Обновления в очереди вебхука")
+WEBHOOK_QUEUE_WAIT = REGISTRY.histogram(
+    "mindflow_webhook_queue_wait_seconds", "Время ожидания обновления в очереди вебхука до начала обработки"
+)
+
+
+class WebhookServer:
+    """
+    Прием обновлений через вебхук
+
+    Запрос проверяется по секретному заголовку, тело кладется в очередь и сразу
+    подтверждается ответом 200 - обработка идет в фоне, в workers задачах,
+    которые передают обновления диспетчеру. Очередь ограничена: если она заполнена,
+    вебхук отвечает 503, и Telegram повторит доставку позже, а не копит
+    необработанные обновления в памяти процесса.
+    """
+
+    FULL_WARNING_INTERVAL = 10.0
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, path: str, secret_token: str,
+                 host: str = "0.0.0.0", port: int = 8080, queue_size: int = 1000, workers: int = 32,
+                 webhook_url: Optional[str] = None):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.workers = workers
+        # Публичный адрес для setWebhook; без него вебхук считается уже зарегистрированным
+        self.webhook_url = webhook_url
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._runner: Optional[web.AppRunner] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._stop_event = asyncio.Event()
+        self._last_full_warning = float("-inf")
+        self._rejected_since_warning = 0
+
+    def _check_secret(self, request: web.Request) -> bool:
+        received = request.headers.get(SECRET_HEADER, "")
+        return hmac.compare_digest(received.encode(), self.secret_token.encode())
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        if not self._check_secret(request):
+            WEBHOOK_RECEIVED.inc(status="unauthorized")
+            return web.Response(status=401)
+
+        try:
+            update = await request.json()
+        except ValueError:
+            WEBHOOK_RECEIVED.inc(status="bad_request")
+            return web.Response(status=400)
+
+        try:
+            self.queue.put_nowait((update, time.perf_counter()))
+        except asyncio.QueueFull:
+            WEBHOOK_RECEIVED.inc(status="rejected")
+            self._warn_queue_full()
+            return web.Response(status=503, headers={"Retry-After": "1"})
+
+        WEBHOOK_RECEIVED.inc(status="accepted")
+        WEBHOOK_QUEUE_DEPTH.set(self.queue.qsize())
+        return web.Response()
+
+    def _warn_queue_full(self):
+        # При перегрузке отказов много - пишем в лог не чаще раза в FULL_WARNING_INTERVAL секунд
+        self._rejected_since_warning += 1
+        now = time.monotonic()
+        if now - self._last_full_warning >= self.FULL_WARNING_INTERVAL:
+            logger.warning(
+                f"Очередь вебхука заполнена ({self.queue.maxsize}), отклонено обновлений: {self._rejected_since_warning}"
+            )
+            self._last_full_warning = now
+            self._rejected_since_warning = 0
+
+    async def _worker(self):
+        while True:
+            update, received_at = await self.queue.get()
+            WEBHOOK_QUEUE_DEPTH.set(self.queue.qsize())
+            WEBHOOK_QUEUE_WAIT.observe(time.perf_counter() - received_at)
+            try:
+                await self.dispatcher.feed_raw_update(self.bot, update)
+            except Exception as e:
+                logger.error(f"Ошибка обработки обновления {update.get('update_id')} из вебхука: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def start(self):
+        """Запуск обработчиков очереди и HTTP-сервера; при заданном webhook_url - регистрация вебхука"""
+        self._stop_event.clear()
+        await self.dispatcher.emit_startup(bot=self.bot, dispatcher=self.dispatcher, **self.dispatcher.workflow_data)
+
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # При port=0 порт выбирает система
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"Вебхук принимает обновления на http://{self.host}:{self.port}{self.path}")
+
+        if self.webhook_url:
+            await self.bot.set_webhook(
+                url=self.webhook_url.rstrip("/") + self.path,
+                secret_token=self.secret_token,
+                allowed_updates=self.dispatcher.resolve_used_update_types(),
+            )
+            logger.info("Вебхук зарегистрирован в Telegram")
+
+    def request_stop(self):
+        """Сигнал остановки для run_forever (например, из обработчика SIGTERM)"""
+        self._stop_event.set()
+
+    async def run_forever(self):
+        """Запуск и работа до request_stop() или отмены задачи"""
+        await self.start()
+        try:
+            await self._stop_event.wait()
+        finally:
+            await self.stop()
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Остановка: новые запросы не принимаются, очередь дорабатывается не дольше drain_timeout секунд"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+        if self._worker_tasks:
+            try:
+                await asyncio.wait_for(self.queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Остановка вебхука: в очереди осталось {self.queue.qsize()} необработанных обновлений")
+            for task in self._worker_tasks:
+                task.cancel()
+            for task in self._worker_tasks:
+                with suppress(asyncio.CancelledError):
+                    await task
+            self._worker_tasks = []
+            await self.dispatcher.emit_shutdown(bot=self.bot, dispatcher=self.dispatcher, **self.dispatcher.workflow_data)
+            logger.info("Прием обновлений через вебхук остановлен")